@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -36,12 +37,15 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'core.apps.CoreConfig',
+    'rest_framework',
     'crispy_forms',
     'crispy_bootstrap5'
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',  # En premier: mesure toute la chaîne
     'django.middleware.security.SecurityMiddleware',
+    'core.replicas.ReplicaRoutingMiddleware',  # Avant les sessions: leur enregistrement est une écriture
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -54,7 +58,8 @@ ROOT_URLCONF = 'GestionSalute.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates avec mesure du temps de rendu (core/metrics.py)
+        'BACKEND': 'core.metrics.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'core/templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -80,6 +85,29 @@ DATABASES = {
     }
 }
 
+# Profil SQLite de production (core/sqlite/base.py): WAL, PRAGMA, transactions IMMEDIATE, voie d'écriture.
+# Sur demande seulement (DJANGO_SQLITE_PROFILE=production): le passage en WAL est définitif pour le fichier et
+# crée db.sqlite3-wal / db.sqlite3-shm, la base de développement garde donc le moteur d'origine
+if os.environ.get('DJANGO_SQLITE_PROFILE') == 'production':
+    DATABASES['default'].update({
+        'ENGINE': 'core.sqlite',
+        # Connexions persistantes (une par thread), vérifiées avant d'être réutilisées
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        # PRAGMA remplaçant ceux du profil, attente maximale dans la voie d'écriture (secondes)
+        'OPTIONS': {'pragmas': {}, 'write_lane_timeout': 10},
+    })
+
+# Réplicas en lecture (alias de DATABASES), utilisés par les requêtes GET/HEAD (voir core/replicas.py).
+# Essai en local avec des copies SQLite rafraîchies par « python manage.py sync_replicas »:
+# DATABASES['replica1'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'replica1.sqlite3',
+#                          'TEST': {'MIRROR': 'default'}}
+# DATABASE_REPLICAS = ['replica1']
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+# Après une écriture, durée (secondes) pendant laquelle l'utilisateur lit la base principale
+REPLICA_STICKY_SECONDS = 15
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -136,3 +164,64 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 # Protection des fichiers sensibles
 FILE_UPLOAD_PERMISSIONS = 0o640
+
+# Délégation de l'envoi des fichiers médicaux au proxy frontal après contrôle d'accès:
+# None (Django diffuse lui-même), 'nginx' (X-Accel-Redirect) ou 'apache' (X-Sendfile)
+MEDICAL_FILES_OFFLOAD = None
+# Emplacement interne nginx correspondant à MEDIA_ROOT (location internal)
+MEDICAL_FILES_ACCEL_PREFIX = '/protected-media/'
+
+# Durée d'un créneau de rendez-vous (minutes)
+SLOT_DURATION_MINUTES = 30
+
+# Taille des cellules de l'index spatial des pharmacies (degrés)
+PHARMACY_GRID_DEGREES = 0.05
+
+# Moteur de recherche plein texte (core.search.IcontainsBackend hors SQLite)
+SEARCH_BACKEND = 'core.search.SQLiteFTSBackend'
+
+# Conservation (heures) des exports de dossiers produits en tâche de fond, supprimés ensuite (tâche exports.purge)
+EXPORT_RETENTION_HOURS = 24
+
+# Index compilés en mémoire par chaque processus (médicaments, allergènes, créneaux, pharmacies): intervalle
+# (secondes) entre deux lectures de leur version en base, modifiée par les autres processus (voir core/versions.py)
+INDEX_VERSION_CHECK_SECONDS = 1.0
+
+# Cache (annuaire des médecins). Pour partager le cache entre plusieurs processus:
+# 'django.core.cache.backends.filebased.FileBasedCache' avec 'LOCATION': BASE_DIR / 'cache'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'unisalute',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# Durée de vie des pages et données de l'annuaire en cache (secondes)
+DIRECTORY_CACHE_TIMEOUT = 300
+
+# Mesures par vue exposées sur /metrics (format Prometheus)
+METRICS_ENABLED = True
+# Adresses autorisées à lire /metrics. Derrière un proxy inverse sur la même machine, toutes les requêtes
+# viennent de 127.0.0.1: l'accès exige donc aussi un administrateur connecté ou le jeton ci-dessous
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+# Jeton du collecteur Prometheus (Authorization: Bearer <jeton>); None: administrateurs connectés seulement
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+# Journalise (logger core.metrics) les requêtes plus lentes que ce seuil avec leur SQL; None pour désactiver
+METRICS_SLOW_REQUEST_MS = 500
+
+# API JSON (core/api.py): session (navigateur) ou HTTP Basic (clients mobiles), lecture authentifiée par défaut
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated'],
+}
+
+# Emails (rappels de rendez-vous): affichés dans la console en local; SMTP en production
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'rendez-vous@unisalute.local'
+
+# Délai entre l'envoi du rappel et le rendez-vous (heures)
+REMINDER_HOURS_BEFORE = 24
@@ -0,0 +1,80 @@
+"""
+Contrôle d'accès aux dossiers médicaux
+
+Un médecin accède aux dossiers d'un patient s'il existe une relation de soins
+(CareRelationship) entre eux. La vérification est un EXISTS sur l'index unique
+(médecin, patient), et les résultats sont mémorisés pour la durée de la requête
+HTTP : une page de dossiers coûte au plus une requête de permission.
+"""
+from .models import CareRelationship
+
+
+def link_doctor_patient(doctor_id, patient_id):
+    """Crée la relation de soins si elle n'existe pas encore (INSERT OR IGNORE)"""
+    if doctor_id and patient_id:
+        CareRelationship.objects.bulk_create(
+            [CareRelationship(doctor_id=doctor_id, patient_id=patient_id)], ignore_conflicts=True,
+        )
+
+
+def link_pairs(pairs):
+    """Version par lot de link_doctor_patient: couples (médecin, patient) en un INSERT OR IGNORE"""
+    CareRelationship.objects.bulk_create(
+        [CareRelationship(doctor_id=doctor_id, patient_id=patient_id) for doctor_id, patient_id in pairs],
+        batch_size=1000, ignore_conflicts=True,
+    )
+
+
+class CareAccess:
+    """Droits d'accès d'un utilisateur aux patients, mémorisés pour une requête"""
+
+    def __init__(self, user):
+        self.user = user
+        self._allowed = {}
+
+    @property
+    def doctor_id(self):
+        profile = getattr(self.user, 'doctor_profile', None)
+        return profile.pk if profile else None
+
+    def prefetch(self, patient_ids):
+        """Charge en une requête les droits du médecin sur plusieurs patients"""
+        if self.user.role != 'DOCTOR':
+            return
+        missing = {pk for pk in patient_ids if pk not in self._allowed}
+        if not missing:
+            return
+        allowed = set(CareRelationship.objects
+                      .filter(doctor_id=self.doctor_id, patient_id__in=missing)
+                      .values_list('patient_id', flat=True))
+        for pk in missing:
+            self._allowed[pk] = pk in allowed
+
+    def can_view_patient(self, patient_id):
+        """Vérifie que l'utilisateur peut consulter les dossiers de ce patient"""
+        role = self.user.role
+        if role == 'ADMIN':
+            return True
+        if role == 'PATIENT':
+            profile = getattr(self.user, 'patient_profile', None)
+            return profile is not None and profile.pk == patient_id
+        if role == 'DOCTOR':
+            if patient_id not in self._allowed:
+                self._allowed[patient_id] = CareRelationship.objects.filter(
+                    doctor_id=self.doctor_id, patient_id=patient_id,
+                ).exists()
+            return self._allowed[patient_id]
+        return False
+
+    def can_view_record(self, record):
+        """Vérifie l'accès à un dossier médical (sans charger le patient)"""
+        return self.can_view_patient(record.patient_id)
+
+
+def care_access(request):
+    """Renvoie le CareAccess mémorisé sur la requête courante"""
+    access = getattr(request, '_care_access', None)
+    if access is None or access.user is not request.user:
+        access = CareAccess(request.user)
+        request._care_access = access
+    return access
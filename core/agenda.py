@@ -0,0 +1,156 @@
+"""
+Flux iCalendar (RFC 5545) de l'agenda des médecins et des patients
+
+Chaque utilisateur obtient une URL secrète (jeton de CalendarFeed) à donner à
+son application d'agenda, qui la relit toutes les quelques minutes. Le flux
+couvre une fenêtre bornée (PAST_DAYS avant aujourd'hui, FUTURE_DAYS après).
+
+CalendarFeed.changed_at est avancé par les signaux de Appointment (création,
+modification, suppression) pour le médecin et le patient concernés. Une
+relecture coûte donc une seule recherche indexée (le jeton unique) : elle
+donne l'ETag et le Last-Modified, et un client à jour reçoit 304 sans qu'aucun
+rendez-vous ne soit lu. Sinon le corps est servi depuis le cache, sous une clé
+qui contient changed_at : il n'est régénéré qu'après un changement.
+"""
+import hashlib
+import secrets
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .directory import get_or_compute
+from .models import Appointment, CalendarFeed
+from .slots import SLOT_MINUTES
+
+PREFIX = 'agenda'
+PRODID = '-//UniSalute//Agenda//FR'
+
+# Fenêtre du flux autour d'aujourd'hui (jours)
+PAST_DAYS = getattr(settings, 'AGENDA_PAST_DAYS', 30)
+FUTURE_DAYS = getattr(settings, 'AGENDA_FUTURE_DAYS', 180)
+# Durée de vie d'un corps en cache (secondes); une modification le rend de toute façon obsolète
+TIMEOUT = 24 * 3600
+# Intervalle de relecture suggéré aux clients
+REFRESH_INTERVAL = 'PT15M'
+
+
+def feed_for(user, rotate=False):
+    """Flux de l'utilisateur, créé au premier appel; rotate: nouveau jeton (l'ancienne URL ne répond plus)"""
+    feed, created = CalendarFeed.objects.get_or_create(user=user, defaults={'token': secrets.token_urlsafe(32)})
+    if rotate and not created:
+        feed.token = secrets.token_urlsafe(32)
+        feed.save(update_fields=['token'])
+    return feed
+
+
+def touch(doctor_id, patient_id):
+    """Un rendez-vous du médecin et du patient a changé: leurs flux seront régénérés (une requête)"""
+    touch_many([doctor_id], [patient_id])
+
+
+def touch_many(doctor_ids, patient_ids):
+    """Version par lot de touch (import en masse, sans signaux): une requête pour tous les flux concernés"""
+    CalendarFeed.objects.filter(
+        Q(user__doctor_profile__in=doctor_ids) | Q(user__patient_profile__in=patient_ids)
+    ).update(changed_at=timezone.now())
+
+
+def window(today=None):
+    """Bornes (datetimes) des rendez-vous du flux"""
+    today = today or timezone.localdate()
+    tz = timezone.get_current_timezone()
+    start = datetime.combine(today - timedelta(days=PAST_DAYS), time.min, tzinfo=tz)
+    return start, datetime.combine(today + timedelta(days=FUTURE_DAYS + 1), time.min, tzinfo=tz)
+
+
+def etag(feed, today=None):
+    """ETag du flux: changement d'un rendez-vous ou de fenêtre (nouveau jour)"""
+    today = today or timezone.localdate()
+    return f'"{feed.changed_at.timestamp():.6f}-{today:%Y%m%d}"'
+
+
+def last_modified(feed, today=None):
+    """Date de dernière modification du flux (timestamp): la fenêtre avance aussi chaque jour à minuit"""
+    today = today or timezone.localdate()
+    midnight = datetime.combine(today, time.min, tzinfo=timezone.get_current_timezone())
+    return int(max(feed.changed_at, midnight).timestamp())
+
+
+def escape(text):
+    """Échappement d'une valeur TEXT"""
+    return (text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def fold(line):
+    """Coupe une ligne en segments de 75 octets au plus (continuation: CRLF + espace)"""
+    data = line.encode()
+    if len(data) <= 75:
+        return line
+    parts = []
+    while data:
+        size = 75 if not parts else 74
+        # Ne coupe pas au milieu d'un caractère UTF-8
+        while size < len(data) and (data[size] & 0xC0) == 0x80:
+            size -= 1
+        parts.append(data[:size].decode())
+        data = data[size:]
+    return '\r\n '.join(parts)
+
+
+def stamp(value):
+    """Horodatage UTC au format iCalendar"""
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def appointments(user, start, end):
+    """Rendez-vous (non annulés) de l'agenda de l'utilisateur dans la fenêtre"""
+    queryset = (Appointment.objects.filter(date_time__gte=start, date_time__lt=end)
+                .exclude(status='CANCELLED').order_by('date_time'))
+    if user.role == 'DOCTOR':
+        return queryset.filter(doctor__user=user).select_related('patient__user')
+    return queryset.filter(patient__user=user).select_related('doctor__user')
+
+
+def render(user, start, end, host):
+    """Corps iCalendar de l'agenda (CRLF entre les lignes)"""
+    doctor_view = user.role == 'DOCTOR'
+    lines = [
+        'BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}', 'CALSCALE:GREGORIAN', 'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape("Agenda " + (user.get_full_name() or user.username))}',
+        f'REFRESH-INTERVAL;VALUE=DURATION:{REFRESH_INTERVAL}', f'X-PUBLISHED-TTL:{REFRESH_INTERVAL}',
+    ]
+    for appointment in appointments(user, start, end):
+        if doctor_view:
+            summary = f"RDV {appointment.patient.user.get_full_name()}"
+        else:
+            doctor = appointment.doctor.user
+            summary = f"RDV Dr {doctor.get_full_name() or doctor.username}"
+        description = appointment.get_appointment_type_display()
+        if doctor_view and appointment.notes:
+            description += '\n' + appointment.notes
+        lines += [
+            'BEGIN:VEVENT',
+            f'UID:appointment-{appointment.pk}@{host}',
+            f'DTSTAMP:{stamp(appointment.updated_at)}',
+            f'LAST-MODIFIED:{stamp(appointment.updated_at)}',
+            f'DTSTART:{stamp(appointment.date_time)}',
+            f'DTEND:{stamp(appointment.date_time + timedelta(minutes=SLOT_MINUTES))}',
+            f'SUMMARY:{escape(summary)}',
+            f'DESCRIPTION:{escape(description)}',
+            f"STATUS:{'CONFIRMED' if appointment.status == 'CONFIRMED' else 'TENTATIVE'}",
+            'END:VEVENT',
+        ]
+    lines.append('END:VCALENDAR')
+    return ('\r\n'.join(fold(line) for line in lines) + '\r\n').encode()
+
+
+def body(feed, host, today=None):
+    """Corps du flux depuis le cache (clé: jeton, dernière modification, jour)"""
+    today = today or timezone.localdate()
+    key = hashlib.md5(f'{feed.token}:{feed.changed_at.isoformat()}:{today}:{host}'.encode(),
+                      usedforsecurity=False).hexdigest()
+    start, end = window(today)
+    return get_or_compute(f'{PREFIX}:{key}', lambda: render(feed.user, start, end, host), TIMEOUT)
@@ -0,0 +1,223 @@
+"""
+Contrôle des ordonnances contre les allergies actives des patients
+
+Les correspondances allergène -> substance (DrugAllergen) sont compilées une
+fois en un dictionnaire terme normalisé -> groupes d'allergènes, invalidé par
+les signaux lorsqu'elles changent. Les autres processus rechargent le leur
+dès qu'ils voient la nouvelle version partagée (voir versions.py) : une
+correspondance ajoutée ailleurs ne laisse pas passer une ordonnance. Un médicament est contre-indiqué si l'un
+de ses termes (nom sans accents, mots consécutifs) partage un groupe avec
+l'allergie, ou contient directement le nom de l'allergie ("Arachide" dans
+"Huile d'arachide").
+
+Deux usages :
+- PrescriptionForm.clean_medications refuse une ordonnance en conflit ;
+- screen() contrôle en lot les ordonnances en cours de validité (à la saisie
+  d'une allergie, ou pour toute la base avec screen_prescriptions) et crée
+  des PrescriptionAlert. Allergies et ordonnances sont lues en deux requêtes
+  triées par patient puis fusionnées en mémoire.
+"""
+import threading
+from itertools import groupby
+
+from django.utils import timezone
+
+from .medications import fold
+from .replicas import primary
+from .versions import SharedVersion
+
+# Mots sans valeur pour l'identification d'un allergène
+STOPWORDS = {'allergie', 'allergique', 'intolerance', 'hypersensibilite', 'aux', 'les', 'des', 'une', 'avec',
+             'sans', 'sur', 'par', 'pour'}
+
+# Alertes insérées par requête
+ALERT_BATCH_SIZE = 1000
+# Nom de la version partagée de l'index (voir versions.py)
+VERSION_NAME = 'allergens'
+
+
+def tokens(text):
+    """Mots normalisés: minuscules, sans accents, sans mots vides ni pluriel final"""
+    words = []
+    for word in fold(text).split():
+        if len(word) < 3 or word in STOPWORDS:
+            continue
+        # "Sulfamides" et "sulfamide" désignent le même allergène
+        words.append(word[:-1] if len(word) > 4 and word.endswith('s') else word)
+    return words
+
+
+def normalize(text):
+    return ' '.join(tokens(text))
+
+
+def terms(text):
+    """Toutes les suites de mots consécutifs du texte (les noms de médicaments sont courts)"""
+    words = tokens(text)
+    return {' '.join(words[i:j]) for i in range(len(words)) for j in range(i + 1, len(words) + 1)}
+
+
+class AllergenIndex:
+    """
+    Dictionnaire terme normalisé -> groupes d'allergènes auxquels il appartient
+    Un allergène appartient à son propre groupe; une substance à son groupe et à ceux de ses allergènes
+    Chargé à la demande, invalidé par les signaux de DrugAllergen (voir signals.py)
+    et rechargé lorsqu'un autre processus a incrémenté sa version partagée
+    """
+
+    def __init__(self):
+        self._groups = None
+        self._lock = threading.Lock()
+        self.shared = SharedVersion(VERSION_NAME)
+
+    def clear(self):
+        """Vide l'index du processus (rechargé au prochain usage)"""
+        with self._lock:
+            self._groups = None
+
+    def invalidate(self):
+        """Les correspondances ont changé: index vidé ici, rechargé par les autres processus"""
+        self.clear()
+        self.shared.bump()
+
+    def groups(self):
+        groups = self._groups
+        if groups is None or self.shared.check() is not None:
+            from .models import DrugAllergen
+
+            with primary():
+                # Version lue avant les lignes: une modification pendant le chargement provoquera un nouveau chargement
+                version = self.shared.current()
+                groups = {}
+                for allergen, substance in DrugAllergen.objects.values_list('allergen', 'substance'):
+                    allergen, substance = normalize(allergen), normalize(substance)
+                    groups.setdefault(allergen, {allergen})
+                    groups.setdefault(substance, {substance}).add(allergen)
+            groups = {term: frozenset(members) for term, members in groups.items()}
+            with self._lock:
+                self._groups = groups
+            self.shared.mark(version)
+        return groups
+
+    def allergy_key(self, name):
+        """(nom normalisé, groupes connus) d'une allergie"""
+        groups = self.groups()
+        found = frozenset().union(*(groups[term] for term in terms(name) if term in groups))
+        return normalize(name), found
+
+    def medication_key(self, name):
+        """(termes, groupes connus) d'un médicament"""
+        groups = self.groups()
+        names = terms(name)
+        return names, frozenset().union(*(groups[term] for term in names if term in groups))
+
+
+# Index partagé par le processus
+allergen_index = AllergenIndex()
+
+
+def medication_names(medications):
+    """Noms des médicaments d'une ordonnance (liste de dictionnaires {"name": ...})"""
+    if not isinstance(medications, list):
+        return []
+    return [item['name'] for item in medications if isinstance(item, dict) and item.get('name')]
+
+
+class Screener:
+    """Détection des conflits, avec les clés des noms déjà vus mémorisées (les noms se répètent beaucoup)"""
+
+    def __init__(self, index=allergen_index):
+        self.index = index
+        self._allergies = {}
+        self._medications = {}
+
+    def conflicts(self, allergies, medications):
+        """
+        Couples (nom du médicament, allergie) en conflit
+        allergies: objets ayant un attribut name (Allergy ou AllergyRow)
+        """
+        found = []
+        for name in medication_names(medications):
+            key = self._medications.get(name)
+            if key is None:
+                key = self._medications[name] = self.index.medication_key(name)
+            names, groups = key
+            for allergy in allergies:
+                allergy_key = self._allergies.get(allergy.name)
+                if allergy_key is None:
+                    allergy_key = self._allergies[allergy.name] = self.index.allergy_key(allergy.name)
+                full_name, allergy_groups = allergy_key
+                if (full_name and full_name in names) or not allergy_groups.isdisjoint(groups):
+                    found.append((name, allergy))
+        return found
+
+
+def patient_conflicts(patient_id, medications):
+    """Conflits d'une ordonnance avec les allergies actives du patient (une requête indexée)"""
+    from .models import Allergy
+
+    allergies = list(Allergy.objects.filter(patient_id=patient_id, active=True).only('pk', 'name', 'severity'))
+    if not allergies:
+        return []
+    return Screener().conflicts(allergies, medications)
+
+
+class AllergyRow:
+    """Allergie lue en lot (sans instancier de modèle)"""
+    __slots__ = ('pk', 'name')
+
+    def __init__(self, pk, name):
+        self.pk = pk
+        self.name = name
+
+
+def screen(patient_ids=None, allergy_ids=None, today=None, chunk_size=2000):
+    """
+    Contrôle les ordonnances en cours de validité contre les allergies actives et crée les alertes manquantes
+    patient_ids / allergy_ids limitent le contrôle (tous les patients par défaut)
+    Renvoie {'patients', 'prescriptions', 'conflicts'} (conflits détectés, déjà enregistrés compris)
+    """
+    from .models import Allergy, Prescription, PrescriptionAlert
+
+    today = today or timezone.localdate()
+    allergies = Allergy.objects.filter(active=True)
+    if patient_ids is not None:
+        allergies = allergies.filter(patient_id__in=patient_ids)
+    if allergy_ids is not None:
+        allergies = allergies.filter(pk__in=allergy_ids)
+    prescriptions = Prescription.objects.filter(
+        valid_until__gte=today, medical_record__patient_id__in=allergies.values('patient_id'),
+    )
+    # Deux flux triés par patient, fusionnés sans rien garder d'autre que le patient courant
+    allergy_rows = (allergies.order_by('patient_id', 'pk').values_list('patient_id', 'pk', 'name')
+                    .iterator(chunk_size=chunk_size))
+    prescription_rows = (prescriptions.order_by('medical_record__patient_id', 'pk')
+                         .values_list('medical_record__patient_id', 'pk', 'medications')
+                         .iterator(chunk_size=chunk_size))
+    prescription_groups = groupby(prescription_rows, key=lambda row: row[0])
+    current = next(prescription_groups, None)
+
+    screener = Screener()
+    stats = {'patients': 0, 'prescriptions': 0, 'conflicts': 0}
+    alerts = []
+    for patient_id, rows in groupby(allergy_rows, key=lambda row: row[0]):
+        patient_allergies = [AllergyRow(pk, name) for _, pk, name in rows]
+        stats['patients'] += 1
+        while current is not None and current[0] < patient_id:
+            current = next(prescription_groups, None)
+        if current is None or current[0] != patient_id:
+            continue
+        for _, prescription_id, medications in current[1]:
+            stats['prescriptions'] += 1
+            for medication, allergy in screener.conflicts(patient_allergies, medications):
+                alerts.append(PrescriptionAlert(prescription_id=prescription_id, allergy_id=allergy.pk,
+                                                medication=medication[:200]))
+        current = next(prescription_groups, None)
+        if len(alerts) >= ALERT_BATCH_SIZE:
+            stats['conflicts'] += len(alerts)
+            # Les alertes déjà enregistrées sont ignorées (contrainte unique)
+            PrescriptionAlert.objects.bulk_create(alerts, ignore_conflicts=True)
+            alerts = []
+    stats['conflicts'] += len(alerts)
+    PrescriptionAlert.objects.bulk_create(alerts, ignore_conflicts=True)
+    return stats
@@ -0,0 +1,210 @@
+"""
+API JSON en lecture (Django REST framework) pour les clients mobiles
+
+- Médecins (public), rendez-vous, dossiers médicaux et ordonnances, filtrés par
+  rôle et protégés par les permissions de permissions.py
+- Pagination par curseur sur un ordre total (même mécanisme que les listes HTML,
+  voir pagination.py) : ?cursor=... ; ?page_size= jusqu'à MAX_PAGE_SIZE
+- Projection ?fields=id,date_time,... (voir serializers.py)
+- GET conditionnels : chaque réponse porte un ETag ; If-None-Match identique
+  renvoie 304 sans corps. Pour l'annuaire des médecins, l'ETag est dérivé des
+  versions du cache (directory.py) : le 304 est servi sans requête SQL.
+"""
+import hashlib
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, set_response_etag
+from django.utils.dateparse import parse_date
+from rest_framework import viewsets
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from . import directory
+from .models import Appointment, Doctor, MedicalRecord, Prescription
+from .pagination import keyset_page
+from .permissions import IsAdminRole, IsDoctorForPatient, IsDoctorOrAdmin, IsPatientOwner
+from .serializers import AppointmentSerializer, DoctorSerializer, MedicalRecordSerializer, PrescriptionSerializer
+from .views import filter_by_name
+
+PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+
+class KeysetCursorPagination(BasePagination):
+    """Pagination par curseur opaque sur view.keyset_ordering (ordre total, terminé par un champ unique)"""
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            page_size = min(int(request.query_params.get(self.page_size_query_param, PAGE_SIZE)), MAX_PAGE_SIZE)
+        except ValueError:
+            page_size = PAGE_SIZE
+        try:
+            rows, self.next_cursor = keyset_page(queryset, view.keyset_ordering,
+                                                 request.query_params.get(self.cursor_query_param),
+                                                 max(page_size, 1))
+        except ValueError:
+            raise NotFound("Curseur de pagination invalide")
+        return rows
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+
+def make_etag(*parts):
+    """ETag faible à partir de valeurs quelconques"""
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode(), usedforsecurity=False).hexdigest()
+    return f'W/"{digest}"'
+
+
+class ConditionalGetMixin:
+    """
+    ETag et réponses 304 pour les lectures
+    get_etag() peut fournir un validateur calculé sans construire la réponse;
+    sinon l'ETag est l'empreinte du contenu JSON (le client économise transfert et décodage)
+    """
+
+    def get_etag(self, request, *args, **kwargs):
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return self.not_modified(request, *args, **kwargs) or super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.not_modified(request, *args, **kwargs) or super().retrieve(request, *args, **kwargs)
+
+    def not_modified(self, request, *args, **kwargs):
+        """Réponse 304 si le validateur bon marché correspond à If-None-Match, None sinon"""
+        self._etag = self.get_etag(request, *args, **kwargs)
+        if self._etag is None:
+            return None
+        return get_conditional_response(request, etag=self._etag)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+            return response
+        etag = getattr(self, '_etag', None)
+        if etag is not None:
+            response['ETag'] = etag
+        else:
+            response.render()
+            set_response_etag(response)
+        return get_conditional_response(request, etag=response['ETag'], response=response)
+
+
+class DoctorViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    """Annuaire public des médecins, filtrable par nom (?q=) et spécialité (?speciality=id)"""
+    serializer_class = DoctorSerializer
+    pagination_class = KeysetCursorPagination
+    permission_classes = [AllowAny]
+    keyset_ordering = ('user__last_name', 'user__first_name', 'user__username')
+
+    def get_queryset(self):
+        queryset = Doctor.objects.select_related('user', 'speciality')
+        speciality = self.request.query_params.get('speciality')
+        if speciality and speciality.isdigit():
+            queryset = queryset.filter(speciality_id=speciality)
+        return filter_by_name(queryset, self.request.query_params.get('q'))
+
+    def get_object(self):
+        """Fiche lue depuis le cache de l'annuaire (mémorisée: l'ETag et la réponse la demandent)"""
+        if not hasattr(self, '_doctor'):
+            self._doctor = directory.get_doctor(self.kwargs['pk'])
+        if self._doctor is None:
+            raise NotFound("Médecin introuvable")
+        return self._doctor
+
+    def get_etag(self, request, *args, **kwargs):
+        # Versions du cache de l'annuaire, incrémentées à chaque modification (signals.py)
+        if 'pk' in kwargs:
+            doctor = self.get_object()
+            return make_etag('doctor', *directory.doctor_versions(doctor), request.get_full_path())
+        return make_etag('doctors', *directory.versions(directory.LIST), request.get_full_path())
+
+
+class AppointmentViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Rendez-vous de l'utilisateur: ceux du patient, ceux du médecin, tous pour un admin
+    Filtres: ?status=, ?from=AAAA-MM-JJ
+    """
+    serializer_class = AppointmentSerializer
+    pagination_class = KeysetCursorPagination
+    permission_classes = [IsAuthenticated, IsPatientOwner | IsDoctorOrAdmin]
+    keyset_ordering = ('date_time', 'pk')
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = Appointment.objects.select_related('patient__user', 'doctor__user')
+        if user.role == 'PATIENT':
+            queryset = queryset.filter(patient__user=user)
+        elif user.role == 'DOCTOR':
+            queryset = queryset.filter(doctor__user=user)
+        elif user.role != 'ADMIN':
+            return queryset.none()
+        status = self.request.query_params.get('status')
+        if status:
+            queryset = queryset.filter(status=status)
+        try:
+            start = parse_date(self.request.query_params.get('from', ''))
+        except ValueError:
+            # Date bien formée mais inexistante (2025-02-30)
+            raise ValidationError({'from': "Date AAAA-MM-JJ valide requise"})
+        if start:
+            queryset = queryset.filter(date_time__gte=timezone.make_aware(datetime.combine(start, time.min)))
+        return queryset
+
+
+class MedicalRecordViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Dossiers médicaux, du plus récent au plus ancien
+    Patient: les siens; médecin: ceux des patients suivis (relation de soins); admin: tous
+    Filtre: ?patient=id
+    """
+    serializer_class = MedicalRecordSerializer
+    pagination_class = KeysetCursorPagination
+    permission_classes = [IsAuthenticated, IsPatientOwner | IsDoctorForPatient | IsAdminRole]
+    keyset_ordering = ('-date', '-created_at', '-pk')
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = MedicalRecord.objects.select_related('doctor__user', 'prescription')
+        if user.role == 'PATIENT':
+            queryset = queryset.filter(patient__user=user)
+        elif user.role == 'DOCTOR':
+            # Jointure sur l'index unique (médecin, patient) de la relation de soins
+            queryset = queryset.filter(patient__care_relationships__doctor__user=user)
+        elif user.role != 'ADMIN':
+            return queryset.none()
+        patient = self.request.query_params.get('patient')
+        if patient and patient.isdigit():
+            queryset = queryset.filter(patient_id=patient)
+        return queryset
+
+
+class PrescriptionViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    """Ordonnances, rattachées aux dossiers médicaux visibles par l'utilisateur"""
+    serializer_class = PrescriptionSerializer
+    pagination_class = KeysetCursorPagination
+    permission_classes = [IsAuthenticated, IsPatientOwner | IsDoctorForPatient | IsAdminRole]
+    keyset_ordering = ('-valid_until', '-pk')
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = Prescription.objects.select_related('medical_record__doctor__user')
+        if user.role == 'PATIENT':
+            return queryset.filter(medical_record__patient__user=user)
+        if user.role == 'DOCTOR':
+            return queryset.filter(medical_record__patient__care_relationships__doctor__user=user)
+        return queryset if user.role == 'ADMIN' else queryset.none()
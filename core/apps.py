@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Branche les récepteurs de signaux (index en mémoire, compteurs...)
+        from . import signals  # noqa: F401
+        # Enregistre les tâches de fond (jobs.TASKS)
+        from . import tasks  # noqa: F401
@@ -0,0 +1,185 @@
+"""
+Réservation atomique des créneaux de rendez-vous
+
+L'horaire demandé doit être un créneau futur de la grille du médecin
+(Doctor.availability, voir slots.py) : un horaire passé ou hors grille lève
+InvalidSlot, un créneau déjà occupé (ou chevauché) SlotUnavailable.
+
+L'unicité (médecin, horaire) des rendez-vous actifs est garantie par la base
+(contrainte unique_active_doctor_slot) : la vérification ci-dessus ne fait que
+filtrer les demandes, l'insertion se fait dans une transaction courte et c'est
+la contrainte qui tranche les courses. Le perdant reçoit une erreur
+SlotUnavailable accompagnée de créneaux alternatifs.
+
+Les vues asynchrones (ASGI) utilisent areserve/abook : transaction.atomic n'a
+pas d'équivalent asynchrone, la transaction s'exécute donc dans un thread.
+"""
+import random
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, OperationalError, transaction
+from django.utils import timezone
+
+from .models import Appointment
+from .slots import slot_index
+
+# Contrainte d'unicité des créneaux actifs: nom (PostgreSQL) et colonnes (SQLite) cités par l'erreur d'intégrité
+SLOT_CONSTRAINT = 'unique_active_doctor_slot'
+SLOT_COLUMNS = '{0}.doctor_id, {0}.date_time'.format(Appointment._meta.db_table)
+
+# Nombre de tentatives lorsque la base est momentanément verrouillée
+LOCK_RETRIES = 5
+# Délai initial (secondes) avant une nouvelle tentative, doublé à chaque essai
+LOCK_BACKOFF = 0.01
+# Fenêtre (jours) dans laquelle chercher des créneaux alternatifs
+ALTERNATIVES_WINDOW_DAYS = 14
+
+
+class SlotUnavailable(Exception):
+    """Levée quand le créneau demandé est déjà pris par un autre rendez-vous actif"""
+
+    def __init__(self, doctor, date_time, alternatives=()):
+        self.doctor = doctor
+        self.date_time = date_time
+        self.alternatives = list(alternatives)
+        super().__init__(f"Créneau du {date_time} indisponible pour {doctor}")
+
+
+class InvalidSlot(SlotUnavailable):
+    """Levée quand l'horaire demandé est passé ou ne correspond à aucun créneau du médecin"""
+
+    def __init__(self, doctor, date_time, alternatives=()):
+        super().__init__(doctor, date_time, alternatives)
+        self.args = (f"Le {date_time} n'est pas un créneau à venir de {doctor}",)
+
+
+def _alternatives_window(date_time):
+    """Horaire de référence (pas avant maintenant) et jours où chercher des créneaux alternatifs"""
+    date_time = max(date_time, timezone.now())
+    start = timezone.localtime(date_time).date()
+    return date_time, start, start + timedelta(days=ALTERNATIVES_WINDOW_DAYS)
+
+
+def alternative_slots(doctor, date_time, limit=3):
+    """Propose les prochains créneaux libres du médecin après l'horaire demandé (et après maintenant)"""
+    date_time, start, end = _alternatives_window(date_time)
+    slots = slot_index.free_slots([doctor.pk], start, end).get(doctor.pk, [])
+    return [slot for slot in slots if slot > date_time][:limit]
+
+
+async def aalternative_slots(doctor, date_time, limit=3):
+    """Version asynchrone de alternative_slots"""
+    date_time, start, end = _alternatives_window(date_time)
+    slots = (await slot_index.afree_slots([doctor.pk], start, end)).get(doctor.pk, [])
+    return [slot for slot in slots if slot > date_time][:limit]
+
+
+def is_slot_conflict(exc):
+    """L'erreur d'intégrité vient de la contrainte unique_active_doctor_slot (et pas d'une clé étrangère...)"""
+    message = str(exc)
+    return SLOT_CONSTRAINT in message or SLOT_COLUMNS in message
+
+
+def on_grid(week, date_time):
+    """L'horaire tombe exactement sur un créneau de la semaine compilée du médecin"""
+    local = timezone.localtime(date_time)
+    return (week is not None and not local.second and not local.microsecond
+            and local.hour * 60 + local.minute in week[local.weekday()])
+
+
+def slot_error(date_time, free, week):
+    """
+    Erreur à lever pour un horaire à venir, d'après les créneaux libres de son jour et la semaine du médecin
+    None si le créneau est libre, SlotUnavailable s'il est occupé (ou chevauché), InvalidSlot s'il est hors grille
+    """
+    if date_time in free:
+        return None
+    return SlotUnavailable if on_grid(week, date_time) else InvalidSlot
+
+
+def check_slot(doctor, date_time):
+    """
+    Vérifie que l'horaire est un créneau futur et libre de la grille du médecin
+    Lève InvalidSlot (passé ou hors grille) ou SlotUnavailable (créneau occupé ou chevauché)
+    """
+    error = InvalidSlot
+    if date_time > timezone.now():
+        day = timezone.localtime(date_time).date()
+        free = slot_index.free_slots([doctor.pk], day, day + timedelta(days=1)).get(doctor.pk, ())
+        error = slot_error(date_time, free, slot_index.weeks([doctor.pk]).get(doctor.pk))
+    if error is not None:
+        raise error(doctor, date_time, alternative_slots(doctor, date_time))
+
+
+async def acheck_slot(doctor, date_time):
+    """Version asynchrone de check_slot (lectures par l'ORM asynchrone, voir SlotIndex.afree_slots)"""
+    error = InvalidSlot
+    if date_time > timezone.now():
+        day = timezone.localtime(date_time).date()
+        free = (await slot_index.afree_slots([doctor.pk], day, day + timedelta(days=1))).get(doctor.pk, ())
+        error = slot_error(date_time, free, (await slot_index.aweeks([doctor.pk])).get(doctor.pk))
+    if error is not None:
+        raise error(doctor, date_time, await aalternative_slots(doctor, date_time))
+
+
+def reserve(appointment):
+    """
+    Enregistre un rendez-vous en réservant atomiquement son créneau
+    Réessaie avec attente exponentielle si la base est verrouillée
+    Lève InvalidSlot si l'horaire n'est pas un créneau à venir du médecin,
+    SlotUnavailable si un rendez-vous actif occupe déjà le créneau
+    """
+    check_slot(appointment.doctor, appointment.date_time)
+    return _insert(appointment)
+
+
+def _insert(appointment):
+    """Insertion d'un rendez-vous au créneau déjà vérifié: la contrainte unique tranche les courses"""
+    delay = LOCK_BACKOFF
+    for attempt in range(LOCK_RETRIES):
+        try:
+            with transaction.atomic():
+                appointment.save()
+            return appointment
+        except IntegrityError as exc:
+            appointment.pk = None
+            if not is_slot_conflict(exc):
+                raise
+            # La contrainte unique a tranché : un autre patient a gagné la course
+            raise SlotUnavailable(
+                appointment.doctor, appointment.date_time,
+                alternative_slots(appointment.doctor, appointment.date_time),
+            )
+        except OperationalError:
+            appointment.pk = None
+            if attempt == LOCK_RETRIES - 1:
+                raise
+            time.sleep(delay * (1 + random.random()))
+            delay *= 2
+
+
+def book(patient, doctor, date_time, appointment_type, notes=''):
+    """Raccourci: crée et réserve un rendez-vous en attente de confirmation"""
+    return reserve(Appointment(
+        patient=patient, doctor=doctor, date_time=date_time,
+        appointment_type=appointment_type, notes=notes,
+    ))
+
+
+async def areserve(appointment):
+    """
+    Version asynchrone de reserve: vérification du créneau par l'ORM asynchrone,
+    puis transaction et attentes dans un thread, hors de la boucle d'événements
+    """
+    await acheck_slot(appointment.doctor, appointment.date_time)
+    return await sync_to_async(_insert)(appointment)
+
+
+async def abook(patient, doctor, date_time, appointment_type, notes=''):
+    """Version asynchrone de book"""
+    return await areserve(Appointment(
+        patient=patient, doctor=doctor, date_time=date_time,
+        appointment_type=appointment_type, notes=notes,
+    ))
@@ -0,0 +1,125 @@
+"""
+Compteurs matérialisés pour le tableau de bord administrateur
+
+Les totaux (médecins, patients, rendez-vous, rendez-vous par statut) et leurs
+variations journalières sont stockés dans StatCounter et tenus à jour par les
+signaux post_save/post_delete, une fois la transaction de l'écriture validée
+(hors de ses verrous). Le tableau de bord les lit en une seule requête
+au lieu de lancer un COUNT(*) par table. La commande reconcile_counters
+recalcule les totaux si des écritures ont contourné les signaux
+(bulk_create, QuerySet.update...) ou si un processus s'est arrêté entre la
+validation d'une écriture et la mise à jour de ses compteurs.
+"""
+import logging
+import random
+import time
+
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import Appointment, Doctor, Patient, StatCounter
+
+DOCTORS = 'doctors'
+PATIENTS = 'patients'
+APPOINTMENTS = 'appointments'
+
+# Tentatives et attente initiale (secondes) si la base est verrouillée, comme pour les réservations
+LOCK_RETRIES = 5
+LOCK_BACKOFF = 0.01
+
+logger = logging.getLogger(__name__)
+
+
+def status_key(status):
+    """Nom du compteur de rendez-vous pour un statut donné"""
+    return f'{APPOINTMENTS}.{status}'
+
+
+def _add(key, delta, day):
+    """Ajoute delta à une ligne de compteur, en la créant si besoin"""
+    updated = StatCounter.objects.filter(key=key, day=day).update(value=F('value') + delta)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            StatCounter.objects.create(key=key, day=day, value=delta)
+    except IntegrityError:
+        # Créée entre-temps par une autre écriture concurrente
+        StatCounter.objects.filter(key=key, day=day).update(value=F('value') + delta)
+
+
+def _apply(key, delta, day):
+    """
+    Ajoute delta au total et à la variation du jour, dans une transaction courte
+    Réessaie si la base est verrouillée; l'écriture comptée est déjà validée et ne doit pas échouer pour autant
+    (dernier recours: le compteur dérive et reconcile_counters le corrige)
+    """
+    delay = LOCK_BACKOFF
+    for attempt in range(LOCK_RETRIES):
+        try:
+            with transaction.atomic():
+                _add(key, delta, None)
+                _add(key, delta, day)
+            return
+        except OperationalError:
+            if attempt == LOCK_RETRIES - 1:
+                logger.warning("Compteur %s non mis à jour (base verrouillée): lancer reconcile_counters", key)
+                return
+            time.sleep(delay * (1 + random.random()))
+            delay *= 2
+
+
+def increment(key, delta=1):
+    """
+    Met à jour le total et la variation du jour d'un compteur, après la validation de la transaction courante
+    Les lignes de compteur sont communes à toutes les écritures: les verrouiller dans la transaction
+    de l'écriture (réservation...) mettrait toutes les écritures en file derrière elles
+    """
+    if delta:
+        day = timezone.localdate()
+        transaction.on_commit(lambda: _apply(key, delta, day))
+
+
+def snapshot(day=None):
+    """
+    Lit tous les totaux et les variations d'un jour (aujourd'hui par défaut) en une requête
+    Renvoie (totaux, variations) sous forme de dictionnaires {clé: valeur}
+    """
+    day = day or timezone.localdate()
+    totals, deltas = {}, {}
+    rows = StatCounter.objects.filter(Q(day__isnull=True) | Q(day=day)).values_list('key', 'day', 'value')
+    for key, row_day, value in rows:
+        (totals if row_day is None else deltas)[key] = value
+    return totals, deltas
+
+
+def actual_counts():
+    """Recalcule les valeurs exactes depuis les tables sources"""
+    counts = {
+        DOCTORS: Doctor.objects.count(),
+        PATIENTS: Patient.objects.count(),
+        APPOINTMENTS: 0,
+    }
+    for status, _ in Appointment.STATUS_CHOICES:
+        counts[status_key(status)] = 0
+    for status, total in Appointment.objects.order_by().values_list('status').annotate(n=Count('id')):
+        counts[status_key(status)] = total
+        counts[APPOINTMENTS] += total
+    return counts
+
+
+@transaction.atomic
+def reconcile():
+    """
+    Corrige la dérive des totaux
+    Renvoie {clé: (ancienne valeur, nouvelle valeur)} pour les compteurs modifiés
+    """
+    totals = dict(StatCounter.objects.select_for_update()
+                  .filter(day__isnull=True).values_list('key', 'value'))
+    fixed = {}
+    for key, value in actual_counts().items():
+        if totals.get(key) != value:
+            fixed[key] = (totals.get(key), value)
+            StatCounter.objects.update_or_create(key=key, day=None, defaults={'value': value})
+    return fixed
@@ -0,0 +1,193 @@
+"""
+Cache de l'annuaire public des médecins (liste et fiches)
+
+Les données et les pages rendues sont mises en cache sous des clés versionnées :
+chaque médecin, chaque spécialité et la liste ont un numéro de version, et une
+modification (signals.py) incrémente simplement le numéro concerné. Les anciennes
+entrées ne sont plus jamais lues et expirent d'elles-mêmes, sans balayage du cache.
+
+Lors d'un défaut de cache, un seul processus recalcule la valeur (verrou posé
+avec cache.add) pendant que les autres attendent brièvement le résultat.
+Fonctionne avec les caches locmem, fichiers ou partagés (Redis/Memcached).
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from .replicas import primary
+
+PREFIX = 'directory'
+
+# Durée de vie des données et pages en cache (secondes)
+TIMEOUT = getattr(settings, 'DIRECTORY_CACHE_TIMEOUT', 300)
+
+# Durée maximale d'un recalcul protégé par le verrou, et attente des autres requêtes
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 2.0
+POLL_INTERVAL = 0.01
+
+LIST = 'list'
+
+# Colonnes publiques d'une fiche (page HTML et API): le cache partagé ne reçoit ni le mot de passe haché,
+# ni l'email, ni les autres champs de l'utilisateur
+PUBLIC_DOCTOR_FIELDS = ('pk', 'speciality', 'availability', 'user__username', 'user__first_name',
+                        'user__last_name', 'user__phone', 'user__address')
+
+
+def doctor_version_name(pk):
+    return f'doctor:{pk}'
+
+
+def speciality_version_name(pk):
+    return f'speciality:{pk}'
+
+
+def _version_key(name):
+    return f'{PREFIX}:v:{name}'
+
+
+def versions(*names):
+    """
+    Lit les versions courantes (une seule lecture du cache)
+    Une version absente (jamais créée ou évincée) est initialisée avec l'horloge en ns:
+    elle ne peut pas retomber sur une version déjà utilisée
+    """
+    keys = [_version_key(name) for name in names]
+    found = cache.get_many(keys)
+    result = []
+    for key in keys:
+        value = found.get(key)
+        if value is None:
+            cache.add(key, time.time_ns(), None)
+            value = cache.get(key)
+        result.append(value)
+    return result
+
+
+def _bump(names):
+    for name in names:
+        key = _version_key(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Version absente: une nouvelle valeur suffit à invalider
+            cache.set(key, time.time_ns(), None)
+
+
+def bump(*names):
+    """
+    Invalide les entrées dépendant de ces versions
+    Incrémenté tout de suite puis à nouveau après le commit: une valeur recalculée
+    pendant la transaction (donc avec les anciennes données) ne survit pas
+    """
+    _bump(names)
+    transaction.on_commit(lambda: _bump(names))
+
+
+def get_or_compute(key, compute, timeout=TIMEOUT):
+    """Lit key dans le cache ou la calcule, une seule fois même sous charge concurrente"""
+    value = cache.get(key)
+    if value is not None:
+        return value
+    lock = f'{key}:lock'
+    if cache.add(lock, 1, LOCK_TIMEOUT):
+        try:
+            # Calcul sur la base principale: un réplica en retard figerait l'ancienne valeur sous la nouvelle version
+            with primary():
+                value = compute()
+            cache.set(key, value, timeout)
+        finally:
+            cache.delete(lock)
+        return value
+    # Un autre processus recalcule: on attend son résultat plutôt que de refaire la requête
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    # Verrou abandonné ou calcul trop long: on calcule sans mettre en cache
+    with primary():
+        return compute()
+
+
+class Uncacheable(Exception):
+    """Levée par un calcul dont le résultat (réponse d'erreur...) ne doit pas être mis en cache"""
+
+    def __init__(self, value):
+        super().__init__(value)
+        self.value = value
+
+
+def _digest(text):
+    return hashlib.md5(text.encode(), usedforsecurity=False).hexdigest()
+
+
+def get_doctor(pk):
+    """
+    Médecin (avec utilisateur et spécialité) depuis le cache, None s'il n'existe pas
+    La fiche (colonnes publiques seulement) et la spécialité sont mises en cache séparément, chacune sous sa version
+    """
+    from .models import Doctor, Speciality
+
+    doctor_version, = versions(doctor_version_name(pk))
+    doctor = get_or_compute(
+        f'{PREFIX}:doctor:{pk}:{doctor_version}',
+        lambda: Doctor.objects.select_related('user').only(*PUBLIC_DOCTOR_FIELDS).filter(pk=pk).first() or False,
+    )
+    if not doctor:
+        return None
+    if doctor.speciality_id is not None:
+        speciality_version, = versions(speciality_version_name(doctor.speciality_id))
+        speciality = get_or_compute(
+            f'{PREFIX}:speciality:{doctor.speciality_id}:{speciality_version}',
+            lambda: Speciality.objects.filter(pk=doctor.speciality_id).first() or False,
+        )
+        # Spécialité supprimée entre-temps: fiche affichée sans spécialité
+        doctor.speciality = speciality or None
+    return doctor
+
+
+def doctor_versions(doctor):
+    """Versions dont dépend la fiche d'un médecin"""
+    names = [doctor_version_name(doctor.pk)]
+    if doctor.speciality_id is not None:
+        names.append(speciality_version_name(doctor.speciality_id))
+    return versions(*names)
+
+
+def list_key(part, params=''):
+    """Clé d'une donnée de la liste (params: paramètres GET dont elle dépend)"""
+    list_version, = versions(LIST)
+    return f'{PREFIX}:{LIST}:{list_version}:{part}:{_digest(params)}'
+
+
+def cached_page(request, version_values, render):
+    """
+    Sert une page publique depuis le cache pour les visiteurs anonymes
+    Les utilisateurs connectés (en-tête personnalisé) ont une page rendue à partir des données en cache
+    """
+    if request.method != 'GET' or request.user.is_authenticated or len(getattr(request, '_messages', ())):
+        # Les messages flash en attente seraient figés dans la page en cache
+        return render()
+    key = (f"{PREFIX}:page:{':'.join(str(v) for v in version_values)}:"
+           f"{_digest(request.get_full_path())}")
+
+    def compute():
+        response = render()
+        if hasattr(response, 'render'):
+            response.render()
+        if response.status_code != 200:
+            # Pas de mise en cache des redirections et erreurs
+            raise Uncacheable(response)
+        return {'content': response.content, 'content_type': response['Content-Type']}
+
+    try:
+        page = get_or_compute(key, compute)
+    except Uncacheable as exc:
+        return exc.value
+    return HttpResponse(page['content'], content_type=page['content_type'])
@@ -0,0 +1,139 @@
+"""
+Diffusion en flux des fichiers des dossiers médicaux
+
+Les fichiers ne sont jamais lus en entier en mémoire : FileResponse permet au
+serveur WSGI d'utiliser sendfile (wsgi.file_wrapper), les requêtes Range sont
+servies par blocs, et un proxy frontal peut prendre le relais via X-Accel-Redirect
+(nginx) ou X-Sendfile (Apache) après le contrôle d'accès Django.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+# Taille des blocs lus pour les réponses partielles
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Types affichés dans le navigateur; tout autre fichier (HTML, SVG...) est téléchargé, sans quoi il
+# s'exécuterait dans l'origine du site
+INLINE_CONTENT_TYPES = {'application/pdf', 'image/png', 'image/jpeg', 'image/gif', 'image/webp', 'text/plain'}
+
+
+def file_etag(stat):
+    """ETag calculé sans lire le fichier (taille + date de modification en ns)"""
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """
+    Analyse un en-tête Range à intervalle unique
+    Renvoie (début, fin incluse), None si l'en-tête est absent ou ignoré,
+    ou lève ValueError si l'intervalle est insatisfiable
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        # Absent, mal formé ou multi-intervalles: on sert le fichier entier
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffixe: les N derniers octets
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def range_reader(handle, start, length, chunk_size=CHUNK_SIZE):
+    """Générateur qui lit `length` octets à partir de `start`, bloc par bloc"""
+    try:
+        handle.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = handle.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        handle.close()
+
+
+def if_range_matches(request, etag, last_modified):
+    """Vérifie la précondition If-Range (ETag ou date)"""
+    value = request.headers.get('If-Range')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/"')):
+        return value == etag
+    date = parse_http_date_safe(value)
+    return date is not None and int(last_modified) <= date
+
+
+def serve_file(request, path, filename=None, content_type=None, offload_name=None):
+    """
+    Sert un fichier du disque avec ETag/Last-Modified, Range et délégation au proxy
+    offload_name: chemin relatif au stockage, utilisé pour X-Accel-Redirect
+    """
+    stat = os.stat(path)
+    etag = file_etag(stat)
+    last_modified = stat.st_mtime
+    filename = filename or os.path.basename(path)
+    content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    # 304 Not Modified / 412 sans ouvrir le fichier
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+    if response is not None:
+        return response
+
+    offload = getattr(settings, 'MEDICAL_FILES_OFFLOAD', None)
+    if offload:
+        response = HttpResponse(content_type=content_type)
+        if offload == 'nginx':
+            prefix = getattr(settings, 'MEDICAL_FILES_ACCEL_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = prefix + quote(offload_name or os.path.basename(path))
+        else:
+            response['X-Sendfile'] = os.fspath(path)
+    else:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+        if byte_range and if_range_matches(request, etag, last_modified):
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                range_reader(open(path, 'rb'), start, length), status=206, content_type=content_type,
+            )
+            response['Content-Length'] = str(length)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        else:
+            # FileResponse laisse le serveur utiliser sendfile (copie zéro) si disponible
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            response.block_size = CHUNK_SIZE
+            response['Content-Length'] = str(stat.st_size)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    disposition = 'inline' if content_type in INLINE_CONTENT_TYPES else 'attachment'
+    response['Content-Disposition'] = f"{disposition}; filename*=UTF-8''{quote(filename)}"
+    # Le navigateur s'en tient au type annoncé (pas de détection de HTML dans une image)
+    response['X-Content-Type-Options'] = 'nosniff'
+    return response
@@ -0,0 +1,214 @@
+"""
+Export en flux du dossier complet des patients (transfert vers un autre praticien)
+
+Le dossier d'un patient (dossiers médicaux, ordonnances, allergies, rendez-vous)
+est émis en NDJSON, une ligne par objet, par des générateurs : la mémoire
+utilisée ne dépend pas de la taille de l'historique. Chaque table est lue par
+une seule requête triée par patient (iterator(chunk_size=...)) puis fusionnée
+avec le flux des patients : exporter toute la base coûte cinq requêtes.
+
+Le format zip contient export.ndjson et les fichiers joints (files/...) ; il
+est lui aussi produit au fil de l'eau, sans fichier temporaire.
+
+Les exports produits par la file de tâches (tâche exports.patients) sont
+écrits dans le stockage sous EXPORT_DIR. Ils contiennent des données de
+patients : purge_expired() les supprime passé EXPORT_RETENTION (tâche
+exports.purge, planifiée après chaque export).
+"""
+import os
+import time
+import zipfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import Allergy, Appointment, MedicalRecord, Patient, Prescription
+from .storage import content_addressed_storage
+
+# Lignes lues par aller-retour avec la base
+CHUNK_SIZE = 2000
+
+# Taille des blocs envoyés au client
+BUFFER_SIZE = 64 * 1024
+
+NDJSON_NAME = 'export.ndjson'
+
+# Répertoire des exports produits en tâche de fond (stockage par défaut, non publié) et durée de conservation
+EXPORT_DIR = 'exports'
+EXPORT_RETENTION = timedelta(hours=getattr(settings, 'EXPORT_RETENTION_HOURS', 24))
+
+PATIENT_FIELDS = ('id', 'user__username', 'user__first_name', 'user__last_name', 'user__email',
+                  'user__phone', 'user__address', 'birth_date', 'blood_group', 'medical_history')
+
+# (type de ligne, modèle, chemin vers le patient, tri au sein du patient, champs exportés)
+# Le tri suit l'index (patient, ...) de chaque table: la requête est lue dans l'ordre de l'index, sans tri
+# (medical_record__id deviendrait la clé de Prescription, hors de l'index: les ex aequo suivent l'ordre de l'index)
+SECTIONS = (
+    ('record', MedicalRecord, 'patient_id', ('-date', '-created_at', '-id'),
+     ('id', 'doctor_id', 'record_type', 'title', 'description', 'date', 'file', 'is_emergency',
+      'confidential', 'created_at', 'updated_at')),
+    ('prescription', Prescription, 'medical_record__patient_id',
+     ('-medical_record__date', '-medical_record__created_at'),
+     ('medical_record_id', 'medications', 'instructions', 'valid_until')),
+    ('allergy', Allergy, 'patient_id', ('id',),
+     ('id', 'name', 'severity', 'reaction', 'onset_date', 'active')),
+    ('appointment', Appointment, 'patient_id', ('date_time', 'id'),
+     ('id', 'doctor_id', 'date_time', 'status', 'appointment_type', 'notes')),
+)
+
+encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+
+def attachment_name(record_id, file_name):
+    """Nom du fichier joint dans l'archive zip"""
+    return f'files/{record_id}{os.path.splitext(file_name)[1].lower()}'
+
+
+class Peekable:
+    """Itérateur qui permet de regarder l'élément suivant sans le consommer"""
+    _empty = object()
+
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+        self.head = next(self.iterator, self._empty)
+
+    def take_while(self, key, value):
+        """Consomme les éléments dont row[key] == value (entrées triées par key)"""
+        while self.head is not self._empty and self.head[key] == value:
+            row, self.head = self.head, next(self.iterator, self._empty)
+            yield row
+
+
+def export_rows(patients, chunk_size=CHUNK_SIZE):
+    """
+    Génère les lignes (dictionnaires) de l'export des patients donnés (queryset)
+    Chaque patient est suivi de tous ses objets, section par section
+    """
+    patient_ids = patients.values('pk')
+    sections = []
+    for kind, model, patient_path, ordering, fields in SECTIONS:
+        # Une requête par table, triée comme les patients: fusion sans rien garder en mémoire
+        rows = (model.objects.filter(**{f'{patient_path}__in': patient_ids})
+                .order_by(patient_path, *ordering).values(patient_path, *fields).iterator(chunk_size=chunk_size))
+        sections.append((kind, patient_path, Peekable(rows)))
+
+    for patient in patients.order_by('pk').values(*PATIENT_FIELDS).iterator(chunk_size=chunk_size):
+        line = {'type': 'patient'}
+        line.update((field.removeprefix('user__'), value) for field, value in patient.items())
+        yield line
+        for kind, patient_path, rows in sections:
+            for row in rows.take_while(patient_path, patient['id']):
+                line = {'type': kind, 'patient': row.pop(patient_path)}
+                line.update(row)
+                if kind == 'record':
+                    line['file'] = attachment_name(row['id'], row['file']) if row['file'] else None
+                yield line
+
+
+def ndjson_chunks(rows, buffer_size=BUFFER_SIZE):
+    """Encode les lignes en NDJSON, regroupées en blocs d'environ buffer_size octets"""
+    buffer, size = [], 0
+    for row in rows:
+        data = (encoder.encode(row) + '\n').encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= buffer_size:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def attachments(patients, chunk_size=CHUNK_SIZE):
+    """Itère sur (nom dans l'archive, chemin sur disque) des fichiers joints"""
+    rows = (MedicalRecord.objects.filter(patient_id__in=patients.values('pk')).exclude(file='')
+            .exclude(file__isnull=True).order_by('patient_id', 'pk').values_list('pk', 'file')
+            .iterator(chunk_size=chunk_size))
+    for record_id, name in rows:
+        yield attachment_name(record_id, name), content_addressed_storage.path(name)
+
+
+class ZipSink:
+    """Flux d'écriture non positionnable pour ZipFile: les octets sont relayés au fur et à mesure"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offset = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Renvoie et vide les octets en attente"""
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def zip_chunks(patients, chunk_size=CHUNK_SIZE, buffer_size=BUFFER_SIZE):
+    """
+    Archive zip produite en flux: export.ndjson (compressé) puis les fichiers joints (stockés tels quels)
+    Sans seek, ZipFile écrit les tailles après chaque entrée (descripteurs de données)
+    """
+    sink = ZipSink()
+    with zipfile.ZipFile(sink, 'w') as archive:
+        info = zipfile.ZipInfo(NDJSON_NAME, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        # Taille inconnue à l'avance: ZIP64 forcé pour les très gros exports
+        with archive.open(info, 'w', force_zip64=True) as entry:
+            for data in ndjson_chunks(export_rows(patients, chunk_size), buffer_size):
+                entry.write(data)
+                if len(sink.buffer) >= buffer_size:
+                    yield sink.drain()
+        for name, path in attachments(patients, chunk_size):
+            try:
+                source = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            with source:
+                info = zipfile.ZipInfo.from_file(path, name)
+                # Les pièces jointes (PDF, images) sont déjà compressées
+                info.compress_type = zipfile.ZIP_STORED
+                with archive.open(info, 'w', force_zip64=info.file_size >= zipfile.ZIP64_LIMIT) as entry:
+                    while data := source.read(buffer_size):
+                        entry.write(data)
+                        if len(sink.buffer) >= buffer_size:
+                            yield sink.drain()
+    # Répertoire central écrit à la fermeture
+    yield sink.drain()
+
+
+def export_stream(patients=None, fmt='ndjson', chunk_size=CHUNK_SIZE):
+    """Flux d'octets de l'export (tous les patients par défaut)"""
+    if patients is None:
+        patients = Patient.objects.all()
+    if fmt == 'zip':
+        return zip_chunks(patients, chunk_size)
+    return ndjson_chunks(export_rows(patients, chunk_size))
+
+
+def purge_expired(now=None):
+    """Supprime les exports plus anciens que EXPORT_RETENTION; renvoie le nombre de fichiers supprimés"""
+    expired = (now or timezone.now()) - EXPORT_RETENTION
+    try:
+        _, names = default_storage.listdir(EXPORT_DIR)
+    except FileNotFoundError:
+        return 0
+    deleted = 0
+    for name in names:
+        path = f'{EXPORT_DIR}/{name}'
+        if default_storage.get_modified_time(path) < expired:
+            default_storage.delete(path)
+            deleted += 1
+    return deleted
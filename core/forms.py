@@ -3,6 +3,8 @@ from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from .models import MedicalRecord, Prescription, Allergy
 from django.utils import timezone
 from .models import *  # Importe tous les modèles depuis models.py
+from .allergies import patient_conflicts
+from .medications import medication_catalogue
 
 
 class UserRegistrationForm(UserCreationForm):
@@ -112,13 +114,42 @@ class PrescriptionForm(forms.ModelForm):
             'instructions': forms.Textarea(attrs={'rows': 3}),
         }
 
+    def __init__(self, *args, patient_id=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Patient de l'ordonnance: ses allergies actives sont contrôlées
+        self.patient_id = patient_id
+
     def clean_medications(self):
         """
         Validation personnalisée pour le champ medications (format JSON)
+        Chaque médicament doit avoir un nom présent au catalogue (s'il a été importé), écrit comme au catalogue;
+        refuse ceux contre-indiqués par une allergie active du patient
         """
         medications = self.cleaned_data.get('medications')
-        # Ici vous pourriez ajouter une validation du format JSON
-        # Par exemple vérifier que chaque médicament a bien un nom et un dosage
+        if not isinstance(medications, list) or not medications:
+            raise forms.ValidationError("Indiquez une liste de médicaments.")
+        if not all(isinstance(item, dict) and str(item.get('name', '')).strip() for item in medications):
+            raise forms.ValidationError("Chaque médicament doit avoir un nom.")
+        # Sans catalogue importé, la saisie reste libre
+        if medication_catalogue:
+            unknown = []
+            for item in medications:
+                medication = medication_catalogue.lookup(item['name'])
+                if medication is None:
+                    suggestions = ', '.join(entry.name for entry in medication_catalogue.search(item['name'], 3))
+                    unknown.append(f"{item['name']}: absent du catalogue"
+                                   + (f" (suggestions: {suggestions})" if suggestions else ''))
+                else:
+                    item['name'] = medication.name
+            if unknown:
+                raise forms.ValidationError(unknown)
+        if self.patient_id is not None:
+            conflicts = patient_conflicts(self.patient_id, medications)
+            if conflicts:
+                raise forms.ValidationError([
+                    f"{medication}: contre-indiqué, allergie {allergy.name} ({allergy.get_severity_display()})"
+                    for medication, allergy in conflicts
+                ])
         return medications
 
 
@@ -135,4 +166,18 @@ class AllergyForm(forms.ModelForm):
             'onset_date': forms.DateInput(attrs={'type': 'date'}),
             # Zone de texte pour décrire la réaction
             'reaction': forms.Textarea(attrs={'rows': 3}),
-        }
\ No newline at end of file
+        }
+
+class UserImportForm(forms.ModelForm):
+    """
+    Formulaire de validation des comptes lors des imports en masse
+    L'unicité du nom d'utilisateur est vérifiée par l'import lui-même (table en mémoire)
+    """
+
+    class Meta:
+        model = User  # Utilise notre modèle User personnalisé
+        fields = ['username', 'first_name', 'last_name', 'email', 'phone', 'address']
+
+    def validate_unique(self):
+        """Pas de requête d'unicité par ligne: voir core/importers.py"""
+        pass
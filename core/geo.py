@@ -0,0 +1,212 @@
+"""
+Index spatial des pharmacies
+
+Grille régulière en degrés (latitude, longitude) conservée en mémoire :
+chaque cellule contient les pharmacies qui s'y trouvent. Une recherche des
+k plus proches parcourt des anneaux de cellules autour du point demandé et
+s'arrête dès que plus aucune cellule non visitée ne peut contenir un point
+plus proche. L'index est mis à jour pharmacie par pharmacie par les signaux ;
+les autres processus le rechargent dès qu'ils voient sa nouvelle version
+partagée (voir versions.py).
+"""
+import heapq
+import math
+import threading
+
+from django.conf import settings
+
+from .replicas import primary
+from .versions import SharedVersion
+
+# Rayon moyen de la Terre en kilomètres
+EARTH_RADIUS_KM = 6371.0088
+# Longueur d'un degré de latitude en kilomètres
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# Taille d'une cellule de la grille en degrés (~5,5 km en latitude)
+CELL_DEGREES = getattr(settings, 'PHARMACY_GRID_DEGREES', 0.05)
+# Nom de la version partagée de l'index (voir versions.py)
+VERSION_NAME = 'pharmacies'
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distance orthodromique entre deux points, en kilomètres"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class PharmacyIndex:
+    """
+    Grille spatiale des pharmacies: {cellule: {pk: (lat, lon, is_on_duty)}}
+    Chargée en une requête au premier usage, puis maintenue par signals.py
+    Rechargée lorsqu'un autre processus a incrémenté sa version partagée
+    """
+
+    def __init__(self, cell_degrees=CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._cells = {}
+        self._where = {}
+        # Étendue (i_min, i_max, j_min, j_max) des cellules déjà occupées
+        self._extent = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.shared = SharedVersion(VERSION_NAME)
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._where)
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees))
+
+    def _ensure_loaded(self):
+        """Charge toutes les pharmacies au premier accès, et de nouveau si un autre processus les a modifiées"""
+        if self._loaded and self.shared.check() is None:
+            return
+        from .models import Pharmacy
+
+        # Base principale: un réplica en retard figerait les anciennes positions sous la nouvelle version
+        with primary():
+            self.load(Pharmacy.objects.values_list('pk', 'latitude', 'longitude', 'is_on_duty'))
+
+    def _insert(self, pk, lat, lon, on_duty):
+        self._remove(pk)
+        cell = self._cell(lat, lon)
+        self._cells.setdefault(cell, {})[pk] = (lat, lon, on_duty)
+        self._where[pk] = cell
+        i, j = cell
+        if self._extent is None:
+            self._extent = (i, i, j, j)
+        else:
+            i_min, i_max, j_min, j_max = self._extent
+            self._extent = (min(i, i_min), max(i, i_max), min(j, j_min), max(j, j_max))
+
+    def _remove(self, pk):
+        cell = self._where.pop(pk, None)
+        if cell is not None:
+            bucket = self._cells[cell]
+            del bucket[pk]
+            if not bucket:
+                del self._cells[cell]
+
+    def upsert(self, pk, lat, lon, on_duty):
+        """Ajoute ou déplace une pharmacie (sans effet tant que l'index n'est pas chargé)"""
+        with self._lock:
+            if self._loaded:
+                self._insert(pk, lat, lon, on_duty)
+
+    def remove(self, pk):
+        """Retire une pharmacie de l'index"""
+        with self._lock:
+            self._remove(pk)
+
+    def clear(self):
+        """Vide l'index (il sera rechargé au prochain accès)"""
+        with self._lock:
+            self._cells.clear()
+            self._where.clear()
+            self._extent = None
+            self._loaded = False
+
+    def invalidate(self):
+        """Les pharmacies ont changé en masse: index vidé ici et rechargé par les autres processus"""
+        self.clear()
+        self.shared.bump()
+
+    def load(self, rows):
+        """Remplace le contenu de l'index par des tuples (pk, lat, lon, is_on_duty)"""
+        # Version lue avant les lignes: une modification pendant le chargement provoquera un nouveau chargement
+        version = self.shared.current()
+        with self._lock:
+            self._cells.clear()
+            self._where.clear()
+            self._extent = None
+            for row in rows:
+                self._insert(*row)
+            self._loaded = True
+        self.shared.mark(version)
+
+    def _rings(self, lat, lon):
+        """
+        Parcourt les anneaux de cellules autour du point
+        Produit (distance minimale en km des cellules non encore visitées, pharmacies de l'anneau)
+        """
+        ci, cj = self._cell(lat, lon)
+        cells = self._cells
+        if not cells:
+            return
+        # Au-delà de cet anneau, plus aucune cellule occupée
+        i_min, i_max, j_min, j_max = self._extent
+        max_ring = max(ci - i_min, i_max - ci, cj - j_min, j_max - cj)
+        ring = 0
+        while True:
+            entries = []
+            if ring == 0:
+                bucket = cells.get((ci, cj))
+                if bucket:
+                    entries.extend(bucket.items())
+            else:
+                for j in range(cj - ring, cj + ring + 1):
+                    for i in (ci - ring, ci + ring):
+                        bucket = cells.get((i, j))
+                        if bucket:
+                            entries.extend(bucket.items())
+                for i in range(ci - ring + 1, ci + ring):
+                    for j in (cj - ring, cj + ring):
+                        bucket = cells.get((i, j))
+                        if bucket:
+                            entries.extend(bucket.items())
+            # Toute cellule hors des anneaux visités est à au moins ring * taille degrés
+            gap = ring * self.cell_degrees
+            farthest_lat = min(89.9, abs(lat) + gap + self.cell_degrees)
+            bound = gap * KM_PER_DEGREE * math.cos(math.radians(farthest_lat))
+            yield bound, entries
+            ring += 1
+            if ring > max_ring:
+                return
+
+    def nearest(self, lat, lon, k=5, on_duty=None, radius_km=None):
+        """
+        Renvoie les k pharmacies les plus proches: liste triée de (distance_km, pk)
+        on_duty: filtre sur is_on_duty si non None ; radius_km: distance maximale
+        """
+        if k <= 0:
+            return []
+        self._ensure_loaded()
+        best = []  # tas max (distances négatives) des k meilleurs
+        for bound, entries in self._rings(lat, lon):
+            for pk, (plat, plon, duty) in entries:
+                if on_duty is not None and duty != on_duty:
+                    continue
+                distance = haversine_km(lat, lon, plat, plon)
+                if radius_km is not None and distance > radius_km:
+                    continue
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, pk))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, pk))
+            if len(best) == k and bound >= -best[0][0]:
+                break
+            if radius_km is not None and bound > radius_km:
+                break
+        return sorted((-distance, pk) for distance, pk in best)
+
+    def within(self, lat, lon, radius_km, on_duty=None):
+        """Toutes les pharmacies à moins de radius_km, triées par distance"""
+        self._ensure_loaded()
+        found = []
+        for bound, entries in self._rings(lat, lon):
+            for pk, (plat, plon, duty) in entries:
+                if on_duty is not None and duty != on_duty:
+                    continue
+                distance = haversine_km(lat, lon, plat, plon)
+                if distance <= radius_km:
+                    found.append((distance, pk))
+            if bound > radius_km:
+                break
+        return sorted(found)
+
+
+# Index partagé par le processus
+pharmacy_index = PharmacyIndex()
@@ -0,0 +1,269 @@
+"""
+Import en masse de patients, médecins, rendez-vous et du catalogue des médicaments
+
+Les fichiers CSV ou NDJSON sont lus ligne à ligne (mémoire constante), chaque
+ligne est validée par les règles des formulaires existants, puis les objets
+sont écrits par lots avec bulk_create dans des transactions courtes. Les clés
+étrangères (nom d'utilisateur -> patient/médecin, nom -> spécialité) sont
+résolues via des tables de correspondance chargées une seule fois.
+
+bulk_create ne déclenche pas les signaux : les relations de soins et les flux
+d'agenda des rendez-vous sont mis à jour dans la transaction de chaque lot (un
+import interrompu ne laisse pas de rendez-vous sans relation de soins), puis
+finalize() remet à niveau les compteurs et l'index des créneaux après l'import.
+"""
+import csv
+import json
+
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from django.forms import modelform_factory
+
+from . import agenda, counters
+from .access import link_pairs
+from .forms import AppointmentForm, DoctorForm, PatientForm, UserImportForm
+from .medications import medication_catalogue
+from .models import Appointment, Doctor, Medication, Patient, Speciality, User
+from .slots import slot_index
+
+
+def read_rows(handle, fmt):
+    """
+    Itère sur (numéro de ligne, dictionnaire) d'un fichier CSV ou NDJSON
+    Les lignes NDJSON illisibles sont renvoyées avec un dictionnaire None
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(handle)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(handle, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_num, json.loads(line)
+            except ValueError:
+                yield line_num, None
+
+
+def form_data(row, json_fields=()):
+    """Prépare une ligne pour un formulaire (les champs JSON doivent être du texte)"""
+    data = {}
+    for key, value in row.items():
+        if key in json_fields and not isinstance(value, str):
+            value = json.dumps(value)
+        data[key] = '' if value is None else value
+    return data
+
+
+def form_errors(*forms):
+    """Concatène les erreurs de plusieurs formulaires en une ligne lisible"""
+    errors = []
+    for form in forms:
+        for field, messages in form.errors.items():
+            errors.append(f"{field}: {' '.join(messages)}")
+    return '; '.join(errors)
+
+
+class BaseImporter:
+    """
+    Importeur générique: prepare() valide un lot de lignes, save() l'écrit
+    Les sous-classes définissent build() (une ligne -> objets) et save()
+    """
+
+    def __init__(self):
+        self.usernames = None
+
+    def known_usernames(self):
+        """Noms d'utilisateur existants, chargés une fois"""
+        if self.usernames is None:
+            self.usernames = set(User.objects.values_list('username', flat=True).iterator())
+        return self.usernames
+
+    def prepare(self, rows):
+        """Valide un lot: renvoie (objets valides, [(ligne, erreur)])"""
+        valid, errors = [], []
+        for line_num, row in rows:
+            if row is None:
+                errors.append((line_num, "JSON invalide"))
+                continue
+            result = self.build(row)
+            if isinstance(result, str):
+                errors.append((line_num, result))
+            else:
+                valid.append((line_num, result))
+        return valid, errors
+
+    def build(self, row):
+        raise NotImplementedError
+
+    def save(self, items):
+        """Écrit un lot validé [(ligne, objets)]; renvoie (nombre écrit, [(ligne, erreur)])"""
+        raise NotImplementedError
+
+    def finalize(self):
+        """Remet à niveau ce que les signaux auraient maintenu"""
+        counters.reconcile()
+
+
+class ProfileImporter(BaseImporter):
+    """Base commune des patients et des médecins: un User + un profil"""
+    role = None
+    profile_form = None
+    json_fields = ()
+
+    def build(self, row):
+        user_form = UserImportForm(form_data(row))
+        profile_form = self.profile_form(form_data(row, self.json_fields))
+        if not (user_form.is_valid() & profile_form.is_valid()):
+            return form_errors(user_form, profile_form)
+        username = user_form.cleaned_data['username']
+        if username in self.known_usernames():
+            return f"username: « {username} » existe déjà"
+        self.known_usernames().add(username)
+        user = user_form.save(commit=False)
+        user.role = self.role
+        user.password = self.unusable_password
+        profile = profile_form.save(commit=False)
+        error = self.resolve(row, profile)
+        return error or (user, profile)
+
+    def resolve(self, row, profile):
+        """Résout les clés étrangères du profil; renvoie un message d'erreur éventuel"""
+        return None
+
+    @property
+    def unusable_password(self):
+        # Les comptes importés devront passer par la réinitialisation du mot de passe
+        if not hasattr(self, '_unusable_password'):
+            self._unusable_password = make_password(None)
+        return self._unusable_password
+
+    def save(self, items):
+        # bulk_create renvoie les clés primaires (RETURNING) sur SQLite/PostgreSQL
+        users = User.objects.bulk_create([user for _, (user, _) in items])
+        profiles = []
+        for user, (_, (_, profile)) in zip(users, items):
+            profile.user_id = user.pk
+            profiles.append(profile)
+        type(profiles[0]).objects.bulk_create(profiles)
+        return len(profiles), []
+
+
+class PatientImporter(ProfileImporter):
+    """Colonnes: username, first_name, last_name, email, phone, address, birth_date, blood_group, medical_history"""
+    role = 'PATIENT'
+    profile_form = PatientForm
+
+
+class DoctorImporter(ProfileImporter):
+    """Colonnes: username, first_name, last_name, email, phone, address, speciality (nom), license_number,
+    availability (JSON)"""
+    role = 'DOCTOR'
+    profile_form = modelform_factory(Doctor, form=DoctorForm, fields=['license_number', 'availability'])
+    json_fields = ('availability',)
+
+    def __init__(self):
+        super().__init__()
+        self.specialities = {name.lower(): pk for pk, name in Speciality.objects.values_list('pk', 'name')}
+
+    def resolve(self, row, profile):
+        name = (row.get('speciality') or '').strip()
+        if name:
+            pk = self.specialities.get(name.lower())
+            if pk is None:
+                pk = Speciality.objects.create(name=name).pk
+                self.specialities[name.lower()] = pk
+            profile.speciality_id = pk
+        return None
+
+    def finalize(self):
+        super().finalize()
+        slot_index.invalidate()
+
+
+class AppointmentImporter(BaseImporter):
+    """Colonnes: patient (username), doctor (username), date_time, status, appointment_type, notes"""
+    form_class = modelform_factory(Appointment, form=AppointmentForm,
+                                   fields=['date_time', 'status', 'appointment_type', 'notes'])
+
+    def __init__(self):
+        super().__init__()
+        self.patients = dict(Patient.objects.values_list('user__username', 'pk').iterator())
+        self.doctors = dict(Doctor.objects.values_list('user__username', 'pk').iterator())
+
+    def build(self, row):
+        data = form_data(row)
+        if not data.get('status'):
+            data['status'] = 'PENDING'
+        form = self.form_class(data)
+        if not form.is_valid():
+            return form_errors(form)
+        patient_id = self.patients.get(row.get('patient'))
+        doctor_id = self.doctors.get(row.get('doctor'))
+        if patient_id is None:
+            return f"patient: « {row.get('patient')} » inconnu"
+        if doctor_id is None:
+            return f"doctor: « {row.get('doctor')} » inconnu"
+        appointment = form.save(commit=False)
+        appointment.patient_id = patient_id
+        appointment.doctor_id = doctor_id
+        return appointment
+
+    def save(self, items):
+        """Écrit le lot, ses relations de soins et l'invalidation des flux d'agenda (transaction du lot)"""
+        errors = []
+        try:
+            with transaction.atomic():
+                Appointment.objects.bulk_create([appointment for _, appointment in items])
+        except IntegrityError:
+            # Créneau déjà pris (dans le lot ou en base): on isole les lignes fautives
+            saved = []
+            for line_num, appointment in items:
+                appointment.pk = None
+                try:
+                    with transaction.atomic():
+                        Appointment.objects.bulk_create([appointment])
+                    saved.append((line_num, appointment))
+                except IntegrityError:
+                    errors.append((line_num, "date_time: créneau déjà réservé pour ce médecin"))
+            items = saved
+        pairs = {(a.doctor_id, a.patient_id) for _, a in items}
+        if pairs:
+            link_pairs(pairs)
+            agenda.touch_many({d for d, _ in pairs}, {p for _, p in pairs})
+        return len(items), errors
+
+
+class MedicationImporter(BaseImporter):
+    """Colonnes: name, ingredient, form (un médicament déjà au catalogue sous ce nom est mis à jour)"""
+    fields = ('name', 'ingredient', 'form')
+
+    def build(self, row):
+        values = {field: str(row.get(field) or '').strip() for field in self.fields}
+        if not values['name']:
+            return "name: Ce champ est obligatoire."
+        for field, value in values.items():
+            max_length = Medication._meta.get_field(field).max_length
+            if len(value) > max_length:
+                return f"{field}: {max_length} caractères au maximum"
+        return Medication(**values)
+
+    def save(self, items):
+        # Un nom répété dans le lot: la dernière ligne l'emporte
+        medications = {medication.name: medication for _, medication in items}
+        Medication.objects.bulk_create(medications.values(), update_conflicts=True, unique_fields=['name'],
+                                       update_fields=['ingredient', 'form'])
+        return len(items), []
+
+    def finalize(self):
+        # Aucun compteur concerné; le catalogue en mémoire sera recompilé
+        medication_catalogue.invalidate()
+
+
+IMPORTERS = {
+    'patients': PatientImporter,
+    'doctors': DoctorImporter,
+    'appointments': AppointmentImporter,
+    'medications': MedicationImporter,
+}
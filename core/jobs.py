@@ -0,0 +1,204 @@
+"""
+File de tâches de fond stockée dans la base (modèle Job), sans courtier externe
+
+enqueue() insère une ligne dans la transaction courante : la tâche n'est
+visible des travailleurs qu'après le commit de la requête qui l'a créée.
+Les travailleurs (commande run_jobs) réservent par lots les tâches dues, par
+priorité décroissante puis échéance (index partiel job_queue) :
+- si la base le permet (PostgreSQL, MySQL 8), SELECT ... FOR UPDATE SKIP
+  LOCKED : chaque travailleur saute les lignes verrouillées par un autre ;
+- sinon (SQLite), réservation optimiste en une seule instruction : UPDATE
+  des premières tâches encore QUEUED avec un jeton propre au lot, puis
+  relecture par jeton. Une tâche ne peut être réservée qu'une fois.
+Les tâches sont exécutées dans un pool de threads ou de processus. Une tâche
+en échec est replanifiée avec un délai exponentiel jusqu'à max_attempts ;
+une tâche restée RUNNING au-delà de STALE_AFTER (travailleur tué) est remise
+en file par reap(), ou abandonnée si elle a épuisé ses tentatives : une tâche
+qui tue son travailleur n'est pas relancée indéfiniment.
+"""
+import logging
+import time
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import timedelta
+from multiprocessing import get_context
+
+import django
+from django.db import OperationalError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Tâches connues: nom -> fonction (voir tasks.py)
+TASKS = {}
+# Délai avant la n-ième nouvelle tentative: BACKOFF_BASE * 2^(n - 1), plafonné
+BACKOFF_BASE = timedelta(seconds=10)
+MAX_BACKOFF = timedelta(hours=1)
+# Une tâche réservée depuis plus longtemps est considérée comme abandonnée
+STALE_AFTER = timedelta(minutes=30)
+# Écritures d'état réessayées si la base est verrouillée par un autre écrivain (SQLite)
+WRITE_RETRIES = 5
+
+
+def register(name):
+    """Décorateur: enregistre une fonction comme tâche sous ce nom (arguments nommés sérialisables en JSON)"""
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, priority=0, delay=None, max_attempts=3, unique=False):
+    """
+    Ajoute une tâche à la file; renvoie le Job créé
+    unique: ne crée rien (renvoie None) si la même tâche avec les mêmes arguments attend déjà
+    """
+    if name not in TASKS:
+        raise ValueError(f"Tâche inconnue: {name}")
+    payload = payload or {}
+    if unique and Job.objects.filter(name=name, payload=payload, status='QUEUED').exists():
+        return None
+    return Job.objects.create(name=name, payload=payload, priority=priority, max_attempts=max_attempts,
+                              run_at=timezone.now() + (delay or timedelta()))
+
+
+def backoff(attempts):
+    """Délai avant la tentative suivante"""
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), MAX_BACKOFF)
+
+
+def claim(limit, now=None):
+    """Réserve jusqu'à limit tâches dues; renvoie leurs identifiants dans l'ordre de priorité"""
+    now = now or timezone.now()
+    token = uuid.uuid4().hex
+    queued = Job.objects.filter(status='QUEUED', run_at__lte=now).order_by('-priority', 'run_at', 'pk')
+    changes = {'status': 'RUNNING', 'locked_by': token, 'locked_at': now, 'attempts': F('attempts') + 1}
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pks = list(queued.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Job.objects.filter(pk__in=pks).update(**changes)
+        return pks
+    # Une seule instruction (UPDATE ... WHERE id IN (SELECT ... LIMIT)): pas de verrou de lecture à
+    # promouvoir en écriture au milieu d'une transaction, que SQLite refuse sans attendre
+    Job.objects.filter(pk__in=queued.values('pk')[:limit], status='QUEUED').update(**changes)
+    return list(Job.objects.filter(locked_by=token).order_by('-priority', 'run_at', 'pk').values_list('pk', flat=True))
+
+
+def update(queryset, **changes):
+    """UPDATE d'état d'une tâche, réessayé tant que la base est verrouillée par un autre écrivain"""
+    for attempt in range(WRITE_RETRIES):
+        try:
+            return queryset.update(**changes)
+        except OperationalError:
+            if attempt == WRITE_RETRIES - 1:
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+
+
+def execute(pk):
+    """Exécute une tâche réservée (dans un thread ou un processus du pool); renvoie son statut final"""
+    try:
+        job = Job.objects.get(pk=pk)
+        handler = TASKS.get(job.name)
+        try:
+            if handler is None:
+                raise LookupError(f"Tâche inconnue: {job.name}")
+            result = handler(**job.payload)
+        except Exception:
+            return fail(job, traceback.format_exc())
+        # Le jeton protège d'une tâche remise en file par reap() entre-temps
+        update(Job.objects.filter(pk=job.pk, locked_by=job.locked_by),
+               status='DONE', result=result, locked_by='', finished_at=timezone.now())
+        return 'DONE'
+    finally:
+        close_old_connections()
+
+
+def fail(job, error):
+    """Replanifie la tâche avec un délai croissant, ou l'abandonne après max_attempts"""
+    now = timezone.now()
+    logger.warning("Tâche %s #%s en échec (tentative %d/%d)", job.name, job.pk, job.attempts, job.max_attempts)
+    if job.attempts >= job.max_attempts:
+        changes = {'status': 'FAILED', 'finished_at': now}
+    else:
+        changes = {'status': 'QUEUED', 'run_at': now + backoff(job.attempts)}
+    update(Job.objects.filter(pk=job.pk, locked_by=job.locked_by), locked_by='', last_error=error, **changes)
+    return changes['status']
+
+
+def reap(now=None):
+    """
+    Remet en file les tâches réservées par un travailleur disparu, ou les abandonne (FAILED)
+    si elles ont épuisé leurs tentatives; renvoie leur nombre
+    """
+    now = now or timezone.now()
+    stale = Job.objects.filter(status='RUNNING', locked_at__lt=now - STALE_AFTER)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='FAILED', locked_by='', finished_at=now, last_error="Travailleur disparu pendant l'exécution")
+    return failed + stale.update(status='QUEUED', locked_by='', run_at=now)
+
+
+class Worker:
+    """
+    Boucle de réservation et pool d'exécution
+    pool: 'thread' (tâches d'attente: E/S, base, emails) ou 'process' (calcul Python)
+    """
+
+    def __init__(self, concurrency=4, pool='thread', poll_interval=1.0):
+        self.concurrency = concurrency
+        self.pool = pool
+        self.poll_interval = poll_interval
+        self.stats = {'DONE': 0, 'QUEUED': 0, 'FAILED': 0}
+
+    def executor(self):
+        if self.pool == 'process':
+            # spawn: aucune connexion héritée du processus parent; chaque processus initialise Django
+            # avant de charger ce module (qui importe les modèles)
+            return ProcessPoolExecutor(self.concurrency, mp_context=get_context('spawn'), initializer=django.setup)
+        return ThreadPoolExecutor(self.concurrency, thread_name_prefix='job')
+
+    def run(self, burst=False, stop=None):
+        """
+        Exécute les tâches jusqu'à stop() (ou jusqu'à épuisement de la file avec burst)
+        Renvoie les statistiques {statut final: nombre}
+        """
+        running = set()
+        next_reap = time.monotonic()
+        with self.executor() as executor:
+            while not (stop and stop()):
+                if time.monotonic() >= next_reap:
+                    if reap():
+                        logger.warning("Tâches abandonnées remises en file")
+                    next_reap = time.monotonic() + STALE_AFTER.total_seconds() / 2
+                free = self.concurrency - len(running)
+                try:
+                    pks = claim(free) if free else []
+                except OperationalError:
+                    # Base verrouillée par les écritures des tâches en cours: nouvel essai au prochain relevé
+                    logger.warning("Réservation impossible, base verrouillée")
+                    time.sleep(self.poll_interval)
+                    continue
+                running.update(executor.submit(execute, pk) for pk in pks)
+                if not running:
+                    if burst:
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+                # Réveil dès qu'une tâche se termine (place libre dans le pool) ou au prochain relevé
+                done, running = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.collect(future)
+            for future in running:
+                self.collect(future)
+        return self.stats
+
+    def collect(self, future):
+        try:
+            self.stats[future.result()] += 1
+        except Exception:
+            # Erreur hors de la tâche (base indisponible...): la réservation expirera et reap() la remettra en file
+            logger.exception("Erreur du travailleur")
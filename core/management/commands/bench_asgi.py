@@ -0,0 +1,356 @@
+import asyncio
+import json
+import logging
+import socket
+import threading
+import time
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.test import Client
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from core.management.commands.bench_views import Result, sample_objects
+from core.synthetic import PRESETS, Generator, finalize
+
+HOST = '127.0.0.1'
+# Hôte autorisé par setup_test_environment
+SERVER_NAME = 'testserver'
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    """Gestionnaire de runserver sans journal d'accès"""
+
+    def log_message(self, format, *args):
+        pass
+
+
+class BenchWSGIServer(ThreadedWSGIServer):
+    """Serveur WSGI multi-thread de runserver (un thread par connexion), file d'attente élargie"""
+    request_queue_size = 4096
+
+
+class WSGIServerThread(threading.Thread):
+    """Sert l'application WSGI dans un thread"""
+
+    def __init__(self, app):
+        super().__init__(daemon=True)
+        self.server = BenchWSGIServer((HOST, 0), QuietWSGIRequestHandler)
+        self.server.set_app(app)
+        self.port = self.server.server_address[1]
+
+    def run(self):
+        self.server.serve_forever(poll_interval=0.05)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ASGIServerThread(threading.Thread):
+    """
+    Serveur HTTP/1.1 asyncio minimal pour l'application ASGI (boucle d'événements dédiée)
+    Connexions persistantes; la réponse est envoyée d'un bloc avec Content-Length
+    """
+
+    def __init__(self, app):
+        super().__init__(daemon=True)
+        self.app = app
+        self.ready = threading.Event()
+        self.loop = None
+        self.stopping = None
+        self.port = None
+        self.tasks = set()
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        server = await asyncio.start_server(self.handle, HOST, 0, backlog=4096)
+        self.port = server.sockets[0].getsockname()[1]
+        self.ready.set()
+        await self.stopping.wait()
+        server.close()
+        # Connexions encore ouvertes (clients partis sans fermer): abandonnées proprement
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await server.wait_closed()
+
+    def start(self):
+        super().start()
+        self.ready.wait()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.stopping.set)
+        self.join()
+
+    async def handle(self, reader, writer):
+        """Une connexion: requêtes successives tant que le client la garde ouverte"""
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        disconnected = asyncio.Event()
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                request_line, *lines = head.decode('latin-1').split('\r\n')[:-2]
+                method, target, _ = request_line.split(' ', 2)
+                headers = [(name.strip().lower().encode('latin-1'), value.strip().encode('latin-1'))
+                           for name, value in (line.split(':', 1) for line in lines)]
+                header_map = dict(headers)
+                length = int(header_map.get(b'content-length', 0))
+                body = await reader.readexactly(length) if length else b''
+                path, _, query = target.partition('?')
+                scope = {
+                    'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                    'method': method, 'scheme': 'http', 'path': unquote(path), 'raw_path': path.encode(),
+                    'query_string': query.encode(), 'root_path': '', 'headers': headers,
+                    'client': writer.get_extra_info('peername')[:2], 'server': (HOST, self.port),
+                }
+                await self.respond(scope, body, writer, disconnected)
+                if header_map.get(b'connection', b'').lower() == b'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Client parti, ou arrêt du serveur
+            pass
+        finally:
+            disconnected.set()
+            writer.close()
+            self.tasks.discard(task)
+
+    async def respond(self, scope, body, writer, disconnected):
+        """Appelle l'application ASGI et écrit la réponse"""
+        request = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        status, headers, chunks = 500, [], []
+
+        async def receive():
+            if request:
+                return request.pop()
+            # Django écoute la déconnexion du client pendant le traitement
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            nonlocal status, headers
+            if message['type'] == 'http.response.start':
+                status, headers = message['status'], message.get('headers', [])
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+
+        await self.app(scope, receive, send)
+        content = b''.join(chunks)
+        lines = [f'HTTP/1.1 {status} X'.encode()]
+        lines += [name + b': ' + value for name, value in headers if name.lower() != b'content-length']
+        lines.append(b'Content-Length: ' + str(len(content)).encode())
+        writer.write(b'\r\n'.join(lines) + b'\r\n\r\n' + content)
+        await writer.drain()
+
+
+class UvicornServerThread(threading.Thread):
+    """Sert l'application ASGI avec uvicorn, s'il est installé"""
+
+    def __init__(self, app):
+        import uvicorn
+
+        super().__init__(daemon=True)
+        self.socket = socket.socket()
+        self.socket.bind((HOST, 0))
+        self.port = self.socket.getsockname()[1]
+        config = uvicorn.Config(app, log_level='warning', lifespan='off', backlog=4096)
+        self.server = uvicorn.Server(config)
+
+    def run(self):
+        self.server.run(sockets=[self.socket])
+
+    def start(self):
+        super().start()
+        while not self.server.started:
+            time.sleep(0.01)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.join()
+
+
+# Serveur: (classe, type d'application)
+SERVERS = {'wsgi': (WSGIServerThread, 'wsgi'), 'asgi': (ASGIServerThread, 'asgi'),
+           'uvicorn': (UvicornServerThread, 'asgi')}
+
+
+def encode_request(method, path, cookies='', body=b'', csrf_token=''):
+    """Requête HTTP/1.1 brute (connexion persistante)"""
+    lines = [f'{method} {path} HTTP/1.1', f'Host: {SERVER_NAME}']
+    if cookies:
+        lines.append(f'Cookie: {cookies}')
+    if csrf_token:
+        lines.append(f'X-CSRFToken: {csrf_token}')
+    if method == 'POST':
+        lines += ['Content-Type: application/x-www-form-urlencoded', f'Content-Length: {len(body)}']
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+
+async def read_response(reader):
+    """Lit une réponse; renvoie (statut, connexion réutilisable)"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    headers = {name.strip().lower(): value.strip() for name, value in
+               (line.split(':', 1) for line in lines[1:] if line)}
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding', '').lower() == 'chunked':
+        while size := int((await reader.readuntil(b'\r\n')).split(b';')[0], 16):
+            await reader.readexactly(size + 2)
+        await reader.readuntil(b'\r\n')
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def connection_worker(port, request, deadline, result):
+    """Un client: requêtes en boucle sur sa connexion, reconnexion si le serveur la ferme"""
+    writer = None
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(HOST, port)
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            # Connexion refusée ou coupée: comptée comme erreur (statut 0)
+            status, keep_alive = 0, False
+        result.add(time.perf_counter() - started, status)
+        if not keep_alive and writer is not None:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def drive(port, request, connections, duration):
+    """connections clients simultanés pendant duration secondes"""
+    result = Result()
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(connection_worker(port, request, deadline, result) for _ in range(connections)))
+    return result
+
+
+def run_load(port, request, connections, duration):
+    """Charge sur un serveur: débit, latences et statuts"""
+    started = time.perf_counter()
+    result = asyncio.run(drive(port, request, connections, duration))
+    elapsed = time.perf_counter() - started
+    summary = result.summary()
+    # Les échecs de connexion (statut 0) sont des erreurs au même titre que les 5xx
+    summary['errors'] += result.statuses.get(0, 0)
+    summary['requests_per_s'] = round(summary['requests'] / elapsed, 1)
+    return summary
+
+
+def build_requests(objects):
+    """Requêtes des routes comparées: créneaux (lecture) et réservation (écriture)"""
+    doctor = objects['doctor']
+    client = Client()
+    client.force_login(objects['patient'].user)
+    csrf_token = get_random_string(32)
+    cookies = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}; " \
+              f"{settings.CSRF_COOKIE_NAME}={csrf_token}"
+    # Créneau déjà pris: chaque tentative va jusqu'à la contrainte unique et renvoie 409
+    body = f"date_time={objects['booked_slot'].replace('+', '%2B')}&appointment_type=IN_PERSON".encode()
+    return {
+        'slots': encode_request('GET', reverse('doctor_slots', args=[doctor.pk])),
+        'book': encode_request('POST', reverse('doctor_book', args=[doctor.pk]), cookies, body, csrf_token),
+    }
+
+
+class Command(BaseCommand):
+    """
+    Compare le service des créneaux et des réservations sous WSGI et ASGI à forte concurrence
+    Exemples:
+      python manage.py bench_asgi --preset 1k --connections 50 --connections 500
+      python manage.py bench_asgi --server wsgi --server uvicorn --route slots
+    Sans --preset, la base courante est utilisée (voir generate_data)
+    Serveurs et générateur de charge partagent le processus: comparer les serveurs entre eux,
+    pas les débits absolus
+    """
+    help = "Débit et latences des vues créneaux/réservation: WSGI multi-thread contre ASGI"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preset', choices=sorted(PRESETS),
+                            help="Génère ce jeu de données dans une base de test jetable")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--server', action='append', choices=sorted(SERVERS),
+                            help="Serveurs comparés (répétable, défaut: wsgi et asgi)")
+        parser.add_argument('--route', action='append', choices=('slots', 'book'),
+                            help="Routes mesurées (répétable, défaut: toutes)")
+        parser.add_argument('--connections', action='append', type=int,
+                            help="Connexions simultanées (répétable, défaut: 50 et 200)")
+        parser.add_argument('--duration', type=float, default=5.0, help="Durée de chaque mesure (s)")
+        parser.add_argument('--output', help="Enregistre les résultats (JSON)")
+
+    def handle(self, *args, **options):
+        servers = options['server'] or ['wsgi', 'asgi']
+        if 'uvicorn' in servers:
+            try:
+                import uvicorn  # noqa: F401
+            except ImportError:
+                raise CommandError("uvicorn n'est pas installé (pip install uvicorn)")
+        # Avant de réduire les journaux: django.setup() y reconfigure le logging
+        applications = {'wsgi': get_wsgi_application(), 'asgi': get_asgi_application()}
+        loggers = [logging.getLogger(name) for name in ('django.request', 'core.metrics')]
+        previous_levels = [logger.level for logger in loggers]
+        for logger in loggers:
+            logger.setLevel(logging.CRITICAL)
+        setup_test_environment()
+        old_config = None
+        if options['preset']:
+            old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            if options['preset']:
+                Generator(PRESETS[options['preset']], seed=options['seed']).run()
+                finalize()
+            report = self.run_suite(servers, applications, options)
+        finally:
+            for logger, level in zip(loggers, previous_levels):
+                logger.setLevel(level)
+            teardown_test_environment()
+            if old_config is not None:
+                teardown_databases(old_config, verbosity=0)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(f"Résultats enregistrés dans {options['output']}")
+
+    def run_suite(self, servers, applications, options):
+        requests = build_requests(sample_objects())
+        routes = options['route'] or list(requests)
+        levels = options['connections'] or [50, 200]
+        report = []
+        self.stdout.write(f"{'route':<8}{'conn.':>6}  {'serveur':<9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+                          f"{'erreurs':>9}  statuts")
+        for route in routes:
+            for connections in levels:
+                for name in servers:
+                    server_class, kind = SERVERS[name]
+                    server = server_class(applications[kind])
+                    server.start()
+                    try:
+                        summary = run_load(server.port, requests[route], connections, options['duration'])
+                    finally:
+                        server.stop()
+                    report.append({'route': route, 'connections': connections, 'server': name, **summary})
+                    self.stdout.write(f"{route:<8}{connections:>6}  {name:<9}{summary['requests_per_s']:>9}"
+                                      f"{summary['p50_ms']:>9}{summary['p95_ms']:>9}{summary['errors']:>9}  "
+                                      f"{summary['statuses']}")
+        return report
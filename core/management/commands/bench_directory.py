@@ -0,0 +1,49 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from core.models import Doctor
+
+DUMMY_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class Command(BaseCommand):
+    """
+    Compare le débit de l'annuaire public des médecins avec et sans cache
+    Exemple: python manage.py bench_directory --requests 2000
+    """
+    help = "Benchmark requêtes/s de la liste et des fiches médecins (cache vs sans cache)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help="Requêtes par scénario")
+        parser.add_argument('--doctors', type=int, default=50, help="Fiches différentes visitées")
+
+    def handle(self, *args, **options):
+        doctor_ids = list(Doctor.objects.order_by('pk').values_list('pk', flat=True)[:options['doctors']])
+        if not doctor_ids:
+            raise CommandError("Aucun médecin en base (voir import_data)")
+        urls = {
+            'liste': [reverse('doctor_list')],
+            'fiches': [reverse('doctor_detail', args=[pk]) for pk in doctor_ids],
+        }
+        for label, paths in urls.items():
+            with override_settings(CACHES=DUMMY_CACHE):
+                uncached = self.run(paths, options['requests'])
+            cache.clear()
+            cached = self.run(paths, options['requests'])
+            self.stdout.write(f"{label}: sans cache {uncached:.0f} req/s, avec cache {cached:.0f} req/s "
+                              f"(x{cached / uncached:.1f})")
+
+    @staticmethod
+    def run(paths, count):
+        """Requêtes anonymes en boucle sur les chemins donnés; renvoie le débit"""
+        client = Client(SERVER_NAME='localhost')
+        started = time.perf_counter()
+        for i in range(count):
+            response = client.get(paths[i % len(paths)])
+            if response.status_code != 200:
+                raise CommandError(f"{paths[i % len(paths)]}: HTTP {response.status_code}")
+        return count / (time.perf_counter() - started)
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from core.downloads import serve_file
+
+
+class Command(BaseCommand):
+    """
+    Mesure la mémoire et le débit de la diffusion des fichiers médicaux
+    Exemple: python manage.py bench_downloads --size-mb 500
+    """
+    help = "Benchmark mémoire des téléchargements complets et partiels (Range)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=300)
+
+    def handle(self, *args, **options):
+        size = options['size_mb'] * 1024 * 1024
+        factory = RequestFactory()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'scan.dcm')
+            with open(path, 'wb') as handle:
+                block = os.urandom(1024 * 1024)
+                for _ in range(options['size_mb']):
+                    handle.write(block)
+
+            cases = [
+                ('complet', {}),
+                ('Range 2e moitié', {'HTTP_RANGE': f'bytes={size // 2}-'}),
+                ('Range 1 Mo', {'HTTP_RANGE': 'bytes=1048576-2097151'}),
+            ]
+            for label, headers in cases:
+                tracemalloc.start()
+                started = time.perf_counter()
+                response = serve_file(factory.get('/', **headers), path)
+                sent = sum(len(chunk) for chunk in response)
+                response.close()
+                elapsed = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                self.stdout.write(
+                    f"{label}: {response.status_code}, {sent / 1024 / 1024:.0f} Mo en {elapsed:.2f} s "
+                    f"({sent / 1024 / 1024 / max(elapsed, 1e-9):.0f} Mo/s), pic mémoire {peak / 1024:.0f} Ko"
+                )
+
+            etag = serve_file(factory.get('/'), path)['ETag']
+            response = serve_file(factory.get('/', HTTP_IF_NONE_MATCH=etag), path)
+            self.stdout.write(f"If-None-Match: {response.status_code}")
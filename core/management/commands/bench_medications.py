@@ -0,0 +1,81 @@
+import difflib
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.medications import MedicationCatalogue, fold
+
+STEMS = ['amoxi', 'ome', 'panto', 'ator', 'rosuva', 'simva', 'ami', 'ena', 'rami', 'losa', 'valsa', 'metro',
+         'cipro', 'levo', 'clari', 'azi', 'doxy', 'fluco', 'keto', 'para', 'ibu', 'napro', 'tra', 'cita', 'sertra']
+SUFFIXES = ['cilline', 'prazole', 'statine', 'lodipine', 'pril', 'sartan', 'nidazole', 'floxacine', 'mycine',
+            'cycline', 'conazole', 'cétamol', 'profène', 'madol', 'lopram', 'line', 'thyroxine', 'formine']
+FORMS = ['comprimé', 'gélule', 'sirop', 'solution injectable', 'comprimé effervescent', 'suppositoire']
+DOSES = ['5 mg', '10 mg', '20 mg', '40 mg', '100 mg', '250 mg', '500 mg', '1 g']
+
+
+class Command(BaseCommand):
+    """
+    Benchmark du catalogue des médicaments (autocomplétion) sur des données synthétiques
+    Exemple: python manage.py bench_medications --medications 50000 --queries 5000
+    """
+    help = "Mesure l'autocomplétion des médicaments (préfixes et fautes de frappe)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--medications', type=int, default=20000)
+        parser.add_argument('--queries', type=int, default=5000)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        names = set()
+        while len(names) < options['medications']:
+            stem = rng.choice(STEMS) + rng.choice(SUFFIXES)
+            brand = ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 4)))
+            names.add(f"{stem.capitalize()} {brand.upper()} {rng.choice(DOSES)} {rng.choice(FORMS)}")
+        rows = [(pk, name, name.split()[0], name.split(' ', 3)[-1]) for pk, name in enumerate(sorted(names), 1)]
+        catalogue = MedicationCatalogue()
+        started = time.perf_counter()
+        compiled = catalogue.load(rows)
+        self.stdout.write(f"Compilation de {len(rows)} médicaments ({len(compiled.keys)} clés): "
+                          f"{(time.perf_counter() - started) * 1000:.1f} ms")
+
+        prefixes = [rng.choice(rows)[1][:rng.randint(3, 8)] for _ in range(options['queries'])]
+        typos = [self.typo(rng, rng.choice(rows)[1][:rng.randint(5, 9)]) for _ in range(options['queries'])]
+        for label, queries in (('préfixe', prefixes), ('une faute', typos)):
+            started = time.perf_counter()
+            empty = sum(not catalogue.search(query, options['limit']) for query in queries)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{label}: {elapsed / len(queries) * 10**6:.1f} µs/requête "
+                              f"({empty} sans résultat sur {len(queries)})")
+
+        # Références naïves: balayage de tous les noms, distance de difflib
+        folded = [fold(name) for _, name, _, _ in rows]
+        sample = prefixes[:200]
+        started = time.perf_counter()
+        for query in sample:
+            query = fold(query)
+            [name for name in folded if name.startswith(query) or f' {query}' in name][:options['limit']]
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"Balayage naïf (préfixe): {elapsed / len(sample) * 10**6:.1f} µs/requête")
+        sample = typos[:20]
+        started = time.perf_counter()
+        for query in sample:
+            query = fold(query)
+            difflib.get_close_matches(query, [name[:len(query)] for name in folded], n=options['limit'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"difflib (une faute): {elapsed / len(sample) * 10**6:.1f} µs/requête")
+
+    @staticmethod
+    def typo(rng, text):
+        """Une faute de frappe avant la dernière lettre: omission, ajout, remplacement ou inversion"""
+        i = rng.randrange(1, len(text) - 1)
+        char = rng.choice(string.ascii_lowercase)
+        return rng.choice([
+            text[:i] + text[i + 1:],
+            text[:i] + char + text[i:],
+            text[:i] + char + text[i + 1:],
+            text[:i] + text[i + 1] + text[i] + text[i + 2:],
+        ])
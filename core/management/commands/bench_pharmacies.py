@@ -0,0 +1,55 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.geo import PharmacyIndex, haversine_km
+
+
+class Command(BaseCommand):
+    """
+    Benchmark de l'index spatial des pharmacies sur des données synthétiques
+    Exemple: python manage.py bench_pharmacies --pharmacies 50000 --queries 5000
+    """
+    help = "Mesure les recherches de pharmacies les plus proches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pharmacies', type=int, default=50000)
+        parser.add_argument('--queries', type=int, default=5000)
+        parser.add_argument('--k', type=int, default=5)
+        parser.add_argument('--on-duty-ratio', type=float, default=0.1)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Zone d'environ 600 km x 700 km
+        rows = [
+            (pk, rng.uniform(12.3, 16.7), rng.uniform(-17.5, -11.4), rng.random() < options['on_duty_ratio'])
+            for pk in range(1, options['pharmacies'] + 1)
+        ]
+        index = PharmacyIndex()
+        started = time.perf_counter()
+        index.load(rows)
+        self.stdout.write(f"Chargement de {len(rows)} pharmacies: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        points = [(rng.uniform(12.3, 16.7), rng.uniform(-17.5, -11.4)) for _ in range(options['queries'])]
+        for label, on_duty in (('toutes', None), ('de garde', True)):
+            started = time.perf_counter()
+            for lat, lon in points:
+                index.nearest(lat, lon, k=options['k'], on_duty=on_duty)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"k={options['k']} ({label}): {elapsed / len(points) * 1000:.3f} ms/requête")
+
+        started = time.perf_counter()
+        for lat, lon in points:
+            index.within(lat, lon, 5)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"Rayon 5 km: {elapsed / len(points) * 1000:.3f} ms/requête")
+
+        # Référence naïve: distance à toutes les pharmacies
+        sample = points[:50]
+        started = time.perf_counter()
+        for lat, lon in sample:
+            sorted(haversine_km(lat, lon, plat, plon) for _, plat, plon, _ in rows)[:options['k']]
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"Balayage naïf: {elapsed / len(sample) * 1000:.3f} ms/requête")
@@ -0,0 +1,149 @@
+import logging
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from core.booking import SlotUnavailable, book
+from core.management.commands.bench_views import build_scenarios, fetch, make_client, percentile, sample_objects
+from core.models import Appointment, Doctor, Patient
+from core.replicas import copy_primary, replicas
+from core.slots import slot_index
+
+# Lectures de la charge: listes et fiches non mises en cache, servies par l'ORM
+READ_SCENARIOS = ('doctor_slots', 'patient_list', 'medical_record_detail', 'api_doctor_list', 'api_appointment_list',
+                  'api_record_list', 'api_prescription_list')
+
+
+def run_mixed(scenarios, objects, readers, writers, duration, seed):
+    """
+    `readers` clients HTTP parcourent les scénarios de lecture pendant que `writers` threads réservent
+    des rendez-vous (base principale); renvoie les mesures et les rendez-vous créés
+    """
+    # Médecins complets (disponibilités: créneaux alternatifs d'un conflit), patients par clé
+    doctors = list(Doctor.objects.all())
+    patients = list(Patient.objects.values_list('pk', flat=True))
+    start = timezone.localdate() + timedelta(days=400)
+    lock = threading.Lock()
+    reads, created = [], []
+    stats = {'read_errors': 0, 'writes': 0, 'write_conflicts': 0, 'write_errors': 0}
+    clients = [[make_client(scenario, objects) for scenario in scenarios] for _ in range(readers)]
+    deadline = time.perf_counter() + duration
+
+    def reader(offset):
+        latencies, errors, i = [], 0, offset
+        try:
+            while time.perf_counter() < deadline:
+                index = i % len(scenarios)
+                started = time.perf_counter()
+                status = fetch(clients[offset][index], scenarios[index].url)
+                latencies.append(time.perf_counter() - started)
+                errors += status >= 500
+                i += 1
+        finally:
+            connections.close_all()
+        with lock:
+            reads.extend(latencies)
+            stats['read_errors'] += errors
+
+    def writer(offset):
+        rng = random.Random(seed + offset)
+        local = {'writes': 0, 'write_conflicts': 0, 'write_errors': 0}
+        pks = []
+        try:
+            while time.perf_counter() < deadline:
+                # Créneau libre de la grille du médecin (un horaire hors grille serait refusé par book)
+                doctor, day = rng.choice(doctors), start + timedelta(days=rng.randrange(400))
+                free = slot_index.free_slots([doctor.pk], day, day + timedelta(days=1)).get(doctor.pk)
+                if not free:
+                    continue
+                try:
+                    appointment = book(Patient(pk=rng.choice(patients)), doctor, rng.choice(free), 'IN_PERSON')
+                    pks.append(appointment.pk)
+                    local['writes'] += 1
+                except SlotUnavailable:
+                    local['write_conflicts'] += 1
+                except OperationalError:
+                    local['write_errors'] += 1
+        finally:
+            connections.close_all()
+        with lock:
+            created.extend(pks)
+            for key, value in local.items():
+                stats[key] += value
+
+    pool = ([threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+            + [threading.Thread(target=writer, args=(n,)) for n in range(writers)])
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    reads.sort()
+    stats.update({
+        'reads': len(reads), 'reads_per_s': len(reads) / elapsed, 'writes_per_s': stats['writes'] / elapsed,
+        'read_p50_ms': percentile(reads, 50) * 1000, 'read_p95_ms': percentile(reads, 95) * 1000,
+    })
+    return stats, created
+
+
+class Command(BaseCommand):
+    """
+    Débit des lectures avec et sans réplicas, sous une charge d'écriture concurrente
+    Les réplicas (DATABASE_REPLICAS) sont d'abord recopiés depuis la base principale, puis la même charge
+    mixte est lancée deux fois: toutes les lectures sur la base principale, puis lectures sur les réplicas
+    Les rendez-vous réservés par la charge sont supprimés à la fin de chaque passe
+    Exemple: python manage.py bench_replicas --readers 4 --writers 2 --duration 10
+    """
+    help = "Compare le débit des lectures servies par la base principale et par les réplicas"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=10.0, help="Durée de chaque passe (s)")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--no-sync', action='store_true', help="Utilise les réplicas sans les recopier")
+
+    def handle(self, *args, **options):
+        aliases = replicas()
+        if not aliases:
+            raise CommandError("Aucun réplica configuré (DATABASE_REPLICAS dans settings.py)")
+        if not options['no_sync']:
+            for alias in aliases:
+                copy_primary(alias)
+        # Erreurs 500 et requêtes lentes comptées dans les résultats, pas journalisées une à une
+        loggers = [logging.getLogger(name) for name in ('django.request', 'core.metrics')]
+        previous_levels = [logger.level for logger in loggers]
+        for logger in loggers:
+            logger.setLevel(logging.CRITICAL)
+        setup_test_environment()
+        try:
+            objects = sample_objects()
+            scenarios = [scenario for scenario in build_scenarios(objects)
+                         if scenario.name in READ_SCENARIOS and scenario.data is None]
+            results = {}
+            for label, configured in (('principale', []), ('réplicas', aliases)):
+                with override_settings(DATABASE_REPLICAS=configured):
+                    stats, created = run_mixed(scenarios, objects, options['readers'], options['writers'],
+                                               options['duration'], options['seed'])
+                Appointment.objects.filter(pk__in=created).delete()
+                results[label] = stats
+        finally:
+            for logger, level in zip(loggers, previous_levels):
+                logger.setLevel(level)
+            teardown_test_environment()
+
+        self.stdout.write(f"{options['readers']} lecteurs, {options['writers']} écrivains, "
+                          f"{options['duration']:.0f} s par passe, réplicas: {', '.join(aliases)}")
+        self.stdout.write(f"{'lectures sur':<14}{'lect./s':>9}{'p50 ms':>9}{'p95 ms':>9}{'err.':>6}"
+                          f"{'écr./s':>9}{'err.':>6}")
+        for label, stats in results.items():
+            self.stdout.write(f"{label:<14}{stats['reads_per_s']:>9.1f}{stats['read_p50_ms']:>9.2f}"
+                              f"{stats['read_p95_ms']:>9.2f}{stats['read_errors']:>6}"
+                              f"{stats['writes_per_s']:>9.1f}{stats['write_errors']:>6}")
@@ -0,0 +1,112 @@
+import itertools
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.search import SQLiteFTSBackend, SearchDocument
+
+SYLLABLES = ('ba', 'ce', 'di', 'fo', 'gu', 'la', 'me', 'ni', 'po', 'ru', 'sa', 'te', 'vi', 'zo', 'cho', 'gra')
+
+MEDICAL_WORDS = ('amoxicilline paracétamol ibuprofène IRM genou épaule radiographie thorax bilan sanguin '
+         'glycémie cholestérol hypertension asthme allergie pénicilline arachide urticaire '
+         'consultation suivi douleur fièvre toux vaccin échographie abdominale scanner cérébral').split()
+
+
+class RawCursor:
+    """Adapte un curseur sqlite3 aux paramètres %s utilisés par le moteur"""
+
+    def __init__(self, connection):
+        self.cursor = connection.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cursor.close()
+
+    def execute(self, sql, params=()):
+        return self.cursor.execute(sql.replace('%s', '?'), params)
+
+    def executemany(self, sql, rows):
+        return self.cursor.executemany(sql.replace('%s', '?'), rows)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+
+class BenchBackend(SQLiteFTSBackend):
+    """Moteur FTS5 sur une base SQLite temporaire"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def cursor(self):
+        return RawCursor(self.connection)
+
+
+class Command(BaseCommand):
+    """
+    Benchmark de l'index FTS5 sur des documents synthétiques
+    Exemple: python manage.py bench_search --documents 1000000
+    """
+    help = "Mesure l'indexation et les recherches plein texte"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=200000)
+        parser.add_argument('--patients', type=int, default=20000)
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Vocabulaire à distribution de Zipf: quelques mots fréquents, beaucoup de mots rares
+        vocabulary = list(MEDICAL_WORDS) + list({
+            ''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(20000)
+        })
+        rng.shuffle(vocabulary)
+        cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+
+        def words(count):
+            return ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=count))
+
+        with tempfile.TemporaryDirectory() as directory:
+            connection = sqlite3.connect(os.path.join(directory, 'search.sqlite3'))
+            connection.execute(SQLiteFTSBackend.create_sql())
+            backend = BenchBackend(connection)
+
+            # Seul le temps passé dans l'index est mesuré (pas la génération des données)
+            elapsed = 0.0
+            batch = []
+            for pk in range(1, options['documents'] + 1):
+                batch.append(SearchDocument('record', pk, rng.randint(1, options['patients']),
+                                            words(4), words(40)))
+                if len(batch) == 5000 or pk == options['documents']:
+                    started = time.perf_counter()
+                    backend.index_many(batch)
+                    elapsed += time.perf_counter() - started
+                    batch = []
+            started = time.perf_counter()
+            backend.optimize()
+            connection.commit()
+            elapsed += time.perf_counter() - started
+            self.stdout.write(f"Indexation: {options['documents']} documents en {elapsed:.1f} s "
+                              f"({options['documents'] / elapsed:.0f}/s)")
+
+            # Requêtes sur des mots assez fréquents pour renvoyer des résultats
+            frequent = vocabulary[:300]
+            for label, scope in (
+                ('un patient', lambda: {'patient_ids': [rng.randint(1, options['patients'])]}),
+                ('50 patients', lambda: {'patient_ids': rng.sample(range(1, options['patients']), 50)}),
+            ):
+                started = time.perf_counter()
+                hits = 0
+                for _ in range(options['queries']):
+                    hits += len(backend.search(rng.choice(frequent), **scope()))
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"Recherche ({label}): {elapsed / options['queries'] * 1000:.2f} ms/requête, "
+                                  f"{hits / options['queries']:.1f} résultats en moyenne")
+            connection.close()
@@ -0,0 +1,70 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.slots import SLOT_MINUTES, compile_availability, free_slots_for_week
+
+DAYS = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi']
+
+
+class Command(BaseCommand):
+    """
+    Benchmark du moteur de créneaux sur des données synthétiques en mémoire
+    Exemple: python manage.py bench_slots --doctors 10000 --days 90
+    """
+    help = "Mesure la compilation des disponibilités et le calcul des créneaux libres"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=10000)
+        parser.add_argument('--days', type=int, default=90)
+        parser.add_argument('--booked-ratio', type=float, default=0.3,
+                            help="Proportion des créneaux déjà réservés")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        doctors, days = options['doctors'], options['days']
+        start = timezone.localdate()
+        end = start + timedelta(days=days)
+
+        # Disponibilités synthétiques: mélange d'heures isolées et de plages
+        availabilities = []
+        for _ in range(doctors):
+            availability = {}
+            for day in rng.sample(DAYS, rng.randint(2, 5)):
+                if rng.random() < 0.5:
+                    availability[day] = ['08:30-12:00', '14:00-17:30']
+                else:
+                    availability[day] = ['%02d:00' % hour for hour in sorted(rng.sample(range(8, 18), 5))]
+            availabilities.append(availability)
+
+        started = time.perf_counter()
+        weeks = [compile_availability(availability) for availability in availabilities]
+        compile_time = time.perf_counter() - started
+
+        # Rendez-vous synthétiques placés sur des créneaux existants
+        booked_maps = []
+        for week in weeks:
+            booked = {}
+            day = start
+            while day < end:
+                minutes = [m for m in week[day.weekday()] if rng.random() < options['booked_ratio']]
+                if minutes:
+                    booked[day] = minutes
+                day += timedelta(days=1)
+            booked_maps.append(booked)
+
+        started = time.perf_counter()
+        total = 0
+        for week, booked in zip(weeks, booked_maps):
+            total += len(free_slots_for_week(week, booked, start, end, SLOT_MINUTES))
+        query_time = time.perf_counter() - started
+
+        self.stdout.write(f"Médecins: {doctors}, jours: {days}")
+        self.stdout.write(f"Compilation: {compile_time * 1000:.1f} ms "
+                          f"({compile_time / doctors * 1e6:.1f} µs/médecin)")
+        self.stdout.write(f"Créneaux libres: {total} en {query_time:.2f} s "
+                          f"({query_time / doctors * 1000:.3f} ms/médecin)")
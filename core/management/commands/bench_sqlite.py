@@ -0,0 +1,133 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing, contextmanager
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, OperationalError, connections, transaction
+from django.utils import timezone
+
+from core.models import Appointment, Doctor, Patient
+
+# Configurations comparées: moteur Django d'origine (journal rollback, transactions DEFERRED, une connexion
+# par requête) et profil de production de core.sqlite (WAL, PRAGMA, IMMEDIATE, voie d'écriture, persistance)
+PROFILES = {
+    'origine': {'ENGINE': 'django.db.backends.sqlite3', 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False,
+                'OPTIONS': {'init_command': 'PRAGMA journal_mode = DELETE'}},
+    'production': {'ENGINE': 'core.sqlite', 'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True, 'OPTIONS': {}},
+}
+
+
+def forget_connection():
+    """Ferme la connexion du thread: la suivante est recréée depuis la configuration courante"""
+    connections[DEFAULT_DB_ALIAS].close()
+    del connections[DEFAULT_DB_ALIAS]
+
+
+def run_writes(doctors, patients, slots, threads, attempts):
+    """
+    `attempts` transactions réparties sur `threads` threads, sans nouvelle tentative applicative (voir
+    booking.reserve): lecture de l'agenda du jour du médecin puis insertion du rendez-vous
+    """
+    stats = {'attempts': attempts, 'booked': 0, 'conflicts': 0, 'errors': 0}
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(count, seed):
+        rng = random.Random(seed)
+        local = {'booked': 0, 'conflicts': 0, 'errors': 0}
+        barrier.wait()
+        try:
+            for _ in range(count):
+                doctor, slot = rng.choice(doctors), rng.choice(slots)
+                try:
+                    with transaction.atomic():
+                        # Lecture puis écriture: en DEFERRED, la transaction doit promouvoir son verrou
+                        Appointment.objects.filter(doctor=doctor, date_time__date=slot.date()).count()
+                        Appointment.objects.create(patient=rng.choice(patients), doctor=doctor, date_time=slot,
+                                                   appointment_type='IN_PERSON')
+                    local['booked'] += 1
+                except IntegrityError:
+                    local['conflicts'] += 1
+                except OperationalError:
+                    local['errors'] += 1
+        finally:
+            connections.close_all()
+        with lock:
+            for key, value in local.items():
+                stats[key] += value
+
+    shares = [attempts // threads + (1 if i < attempts % threads else 0) for i in range(threads)]
+    pool = [threading.Thread(target=worker, args=(share, i)) for i, share in enumerate(shares)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    stats['elapsed'] = time.perf_counter() - started
+    return stats
+
+
+@contextmanager
+def database_profile(profile, name):
+    """Les connexions ouvertes dans le bloc (tous threads) utilisent ce profil et cette base"""
+    forget_connection()
+    settings_dict = connections.settings[DEFAULT_DB_ALIAS]
+    saved = dict(settings_dict)
+    settings_dict.update(profile, NAME=name)
+    try:
+        yield
+    finally:
+        forget_connection()
+        settings_dict.clear()
+        settings_dict.update(saved)
+
+
+class Command(BaseCommand):
+    """
+    Réservations concurrentes sur une copie de la base courante, avec le moteur SQLite d'origine puis avec
+    le profil de production: débit des écritures et erreurs « database is locked »
+    Chaque passe part d'une copie neuve; la base courante n'est pas modifiée
+    Exemple: python manage.py bench_sqlite --threads 32 --attempts 3000
+    """
+    help = "Compare le débit d'écriture et les erreurs de verrouillage des profils SQLite"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--attempts', type=int, default=3000, help="Réservations tentées par passe")
+        parser.add_argument('--doctors', type=int, default=20)
+        parser.add_argument('--slots', type=int, default=200, help="Créneaux disputés par médecin")
+
+    def handle(self, *args, **options):
+        if connections[DEFAULT_DB_ALIAS].vendor != 'sqlite' or connections[DEFAULT_DB_ALIAS].is_in_memory_db():
+            raise CommandError("La base courante doit être un fichier SQLite")
+        first = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=500)
+        slots = [first + timedelta(minutes=30 * i) for i in range(options['slots'])]
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for label, profile in PROFILES.items():
+                name = os.path.join(directory, f'{label}.sqlite3')
+                source = connections[DEFAULT_DB_ALIAS]
+                source.ensure_connection()
+                with closing(sqlite3.connect(name)) as destination:
+                    source.connection.backup(destination)
+                with database_profile(profile, name):
+                    doctors = list(Doctor.objects.order_by('pk')[:options['doctors']])
+                    patients = list(Patient.objects.order_by('pk')[:200])
+                    if not doctors or not patients:
+                        raise CommandError("Base vide: lancer generate_data")
+                    results[label] = run_writes(doctors, patients, slots, options['threads'], options['attempts'])
+
+        self.stdout.write(f"{options['threads']} threads, {options['attempts']} réservations par passe, "
+                          f"{len(slots)} créneaux x {options['doctors']} médecins")
+        self.stdout.write(f"{'profil':<12}{'tent./s':>9}{'écrit./s':>10}{'réservées':>11}{'conflits':>10}"
+                          f"{'erreurs':>9}{'taux':>8}")
+        for label, stats in results.items():
+            self.stdout.write(f"{label:<12}{stats['attempts'] / stats['elapsed']:>9.0f}"
+                              f"{stats['booked'] / stats['elapsed']:>10.0f}{stats['booked']:>11}"
+                              f"{stats['conflicts']:>10}{stats['errors']:>9}"
+                              f"{stats['errors'] / stats['attempts']:>8.1%}")
@@ -0,0 +1,333 @@
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext, setup_databases, setup_test_environment, teardown_databases,
+                               teardown_test_environment)
+from django.urls import reverse
+from django.utils import timezone
+
+from core import waitlist
+from core.agenda import feed_for
+from core.jobs import enqueue
+from core.models import Appointment, CareRelationship, Job, MedicalRecord, Pharmacy, Prescription, User
+from core.synthetic import PRESETS, Generator, finalize
+
+
+@dataclass
+class Scenario:
+    """Une route de core/urls.py appelée par un utilisateur d'un rôle donné"""
+    name: str
+    role: str  # 'anonymous', 'PATIENT', 'DOCTOR' ou 'ADMIN'
+    url: str
+    data: dict = None  # Corps d'un POST (None: requête GET)
+
+
+@dataclass
+class Result:
+    """Mesures d'un scénario"""
+    latencies: list = field(default_factory=list)
+    queries: list = field(default_factory=list)
+    statuses: dict = field(default_factory=dict)
+
+    def add(self, elapsed, status, queries=None):
+        self.latencies.append(elapsed)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if queries is not None:
+            self.queries.append(queries)
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        return {
+            'requests': len(latencies),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'queries': max(self.queries) if self.queries else None,
+            'errors': sum(count for status, count in self.statuses.items() if status >= 500),
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items())},
+        }
+
+
+def percentile(values, p):
+    """Percentile (méthode du rang le plus proche) d'une liste triée"""
+    if not values:
+        return 0.0
+    rank = max(int(round(p / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def sample_objects():
+    """Objets réels utilisés par les scénarios (médecin suivant un patient qui a un dossier...)"""
+    relation = (CareRelationship.objects.filter(patient__medical_records__isnull=False)
+                .select_related('doctor__user', 'patient__user').first())
+    if relation is None:
+        raise CommandError("Base vide: lancer generate_data ou utiliser --preset")
+    record = MedicalRecord.objects.filter(patient=relation.patient).order_by('pk').first()
+    prescription = Prescription.objects.select_related('medical_record').first()
+    pharmacy = Pharmacy.objects.first()
+    # Créneau déjà pris: la réservation répétée reste idempotente (409 avec alternatives)
+    appointment = (Appointment.objects.filter(doctor=relation.doctor, status__in=Appointment.ACTIVE_STATUSES)
+                   .order_by('pk').first())
+    patient_appointment = Appointment.objects.filter(patient=relation.patient).order_by('pk').first()
+    patient_prescription = Prescription.objects.filter(medical_record__patient=relation.patient).first()
+    # Export du patient demandé une seule fois: les scénarios mesurent le suivi de la tâche, pas sa création
+    export_payload = {'patient_ids': [relation.patient.pk], 'fmt': 'ndjson'}
+    export = (Job.objects.filter(name='exports.patients', payload=export_payload).first()
+              or enqueue('exports.patients', export_payload))
+    # Administrateur du tableau de bord et de /metrics, créé une fois si la base n'en a pas
+    admin = (User.objects.filter(role='ADMIN').order_by('pk').first()
+             or User.objects.create(username='bench-admin', role='ADMIN'))
+    today = timezone.localdate()
+    entry = waitlist.join(relation.patient, relation.doctor, today, today + timedelta(days=30))
+    return {
+        'doctor': relation.doctor,
+        'patient': relation.patient,
+        'record': record,
+        'prescription_record': prescription.medical_record_id if prescription else record.pk,
+        'pharmacy': pharmacy,
+        'admin': admin,
+        'booked_slot': appointment.date_time.isoformat() if appointment else '',
+        'patient_appointment': patient_appointment.pk if patient_appointment else 0,
+        'patient_prescription': patient_prescription.pk if patient_prescription else record.pk,
+        'agenda_token': feed_for(relation.doctor.user).token,
+        'export_job': export.pk,
+        'waitlist_entry': entry.pk,
+    }
+
+
+def build_scenarios(objects):
+    """Un ou plusieurs scénarios par route de core/urls.py"""
+    doctor, patient, record = objects['doctor'], objects['patient'], objects['record']
+    pharmacy = objects['pharmacy']
+    lat, lng = (pharmacy.latitude, pharmacy.longitude) if pharmacy else (48.8566, 2.3522)
+    scenarios = [
+        Scenario('home', 'anonymous', reverse('home')),
+        Scenario('login', 'anonymous', reverse('login')),
+        Scenario('register', 'anonymous', reverse('register')),
+        Scenario('dashboard_patient', 'PATIENT', reverse('dashboard')),
+        Scenario('dashboard_doctor', 'DOCTOR', reverse('dashboard')),
+        Scenario('dashboard_admin', 'ADMIN', reverse('dashboard')),
+        Scenario('doctor_list', 'anonymous', reverse('doctor_list')),
+        Scenario('doctor_list_filtered', 'anonymous', f"{reverse('doctor_list')}?q={doctor.user.last_name[:3]}"),
+        Scenario('doctor_detail', 'anonymous', reverse('doctor_detail', args=[doctor.pk])),
+        Scenario('doctor_slots', 'anonymous', reverse('doctor_slots', args=[doctor.pk])),
+        Scenario('doctor_book', 'PATIENT', reverse('doctor_book', args=[doctor.pk]),
+                 {'date_time': objects['booked_slot'], 'appointment_type': 'IN_PERSON'}),
+        Scenario('doctor_waitlist', 'PATIENT', reverse('doctor_waitlist', args=[doctor.pk]),
+                 {'date_to': (timezone.localdate() + timedelta(days=30)).isoformat()}),
+        Scenario('waitlist_urgency', 'DOCTOR', reverse('waitlist_urgency', args=[objects['waitlist_entry']]),
+                 {'urgency': '1'}),
+        Scenario('patient_list', 'DOCTOR', reverse('patient_list')),
+        Scenario('patient_export', 'PATIENT', reverse('patient_export', args=[patient.pk])),
+        Scenario('export_download', 'PATIENT', reverse('export_download', args=[objects['export_job']])),
+        Scenario('medication_autocomplete', 'anonymous', f"{reverse('medication_autocomplete')}?q=amox"),
+        Scenario('pharmacy_nearest', 'anonymous', f"{reverse('pharmacy_nearest')}?lat={lat}&lng={lng}&k=5"),
+        Scenario('appointment_create', 'PATIENT', reverse('appointment_create')),
+        Scenario('agenda_feed_url', 'DOCTOR', reverse('agenda_feed_url')),
+        Scenario('agenda_feed', 'anonymous', reverse('agenda_feed', args=[objects['agenda_token']])),
+        Scenario('medical_record_list', 'DOCTOR', reverse('medical_record_list', args=[patient.pk])),
+        Scenario('medical_record_create', 'DOCTOR', reverse('medical_record_create', args=[patient.pk])),
+        Scenario('medical_record_detail', 'DOCTOR', reverse('medical_record_detail', args=[record.pk])),
+        Scenario('medical_record_file', 'PATIENT', reverse('medical_record_file', args=[record.pk])),
+        Scenario('search_doctor', 'DOCTOR', f"{reverse('medical_record_search')}?q=bilan"),
+        Scenario('search_patient', 'PATIENT', f"{reverse('medical_record_search')}?q=traitement"),
+        Scenario('prescription_create', 'DOCTOR',
+                 reverse('prescription_create', args=[objects['prescription_record']])),
+        # Réservé aux administrateurs (ou au jeton METRICS_TOKEN du collecteur)
+        Scenario('metrics', 'ADMIN', reverse('metrics')),
+        Scenario('api_doctor_list', 'anonymous', f"{reverse('api-doctor-list')}?page_size=50"),
+        Scenario('api_doctor_detail', 'anonymous', reverse('api-doctor-detail', args=[doctor.pk])),
+        Scenario('api_appointment_list', 'PATIENT', reverse('api-appointment-list')),
+        Scenario('api_appointment_detail', 'PATIENT',
+                 reverse('api-appointment-detail', args=[objects['patient_appointment']])),
+        Scenario('api_record_list', 'DOCTOR', f"{reverse('api-record-list')}?page_size=100"),
+        Scenario('api_record_detail', 'DOCTOR', reverse('api-record-detail', args=[record.pk])),
+        Scenario('api_prescription_list', 'DOCTOR', reverse('api-prescription-list')),
+        Scenario('api_prescription_detail', 'DOCTOR',
+                 reverse('api-prescription-detail', args=[objects['patient_prescription']])),
+        # En dernier: la déconnexion ferme la session du client
+        Scenario('logout', 'PATIENT', reverse('logout')),
+    ]
+    return scenarios
+
+
+def make_client(scenario, objects):
+    """Client de test connecté selon le rôle du scénario"""
+    client = Client(raise_request_exception=False)
+    users = {'PATIENT': objects['patient'].user, 'DOCTOR': objects['doctor'].user, 'ADMIN': objects['admin']}
+    if scenario.role != 'anonymous':
+        client.force_login(users[scenario.role])
+    return client
+
+
+def fetch(client, url, data=None):
+    """Requête complète (contenu en flux compris); renvoie le statut"""
+    response = client.get(url) if data is None else client.post(url, data)
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    response.close()
+    return response.status_code
+
+
+def run_sequential(scenarios, objects, iterations, warmup=2):
+    """Chaque scénario seul: latences et nombre de requêtes SQL"""
+    results = {}
+    for scenario in scenarios:
+        client = make_client(scenario, objects)
+        for _ in range(warmup):
+            fetch(client, scenario.url, scenario.data)
+        result = Result()
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                status = fetch(client, scenario.url, scenario.data)
+                elapsed = time.perf_counter() - started
+            result.add(elapsed, status, len(captured))
+        results[scenario.name] = result.summary()
+    return results
+
+
+def run_load(scenarios, objects, threads, duration):
+    """Charge mixte: `threads` clients parcourent tous les scénarios en boucle pendant `duration` secondes"""
+    results = {scenario.name: Result() for scenario in scenarios if scenario.name != 'logout'}
+    active = [scenario for scenario in scenarios if scenario.name in results]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    # Connexions ouvertes d'avance: écrire les sessions depuis les threads bloquerait SQLite
+    clients = [[make_client(scenario, objects) for scenario in active] for _ in range(threads)]
+
+    def worker(offset):
+        i = offset
+        try:
+            while time.perf_counter() < deadline:
+                index = i % len(active)
+                started = time.perf_counter()
+                status = fetch(clients[offset][index], active[index].url, active[index].data)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    results[active[index].name].add(elapsed, status)
+                i += 1
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    summaries = {name: result.summary() for name, result in results.items()}
+    total = sum(summary['requests'] for summary in summaries.values())
+    return {'threads': threads, 'duration_s': round(elapsed, 2), 'requests': total,
+            'requests_per_s': round(total / elapsed, 1), 'scenarios': summaries}
+
+
+def compare(current, baseline, tolerance, floor_ms):
+    """Régressions par rapport à la référence: latence p95, requêtes SQL et erreurs"""
+    regressions = []
+    for name, result in current.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        limit = max(base['p95_ms'] * (1 + tolerance), base['p95_ms'] + floor_ms)
+        if result['p95_ms'] > limit:
+            regressions.append(f"{name}: p95 {result['p95_ms']} ms > {base['p95_ms']} ms")
+        if base.get('queries') is not None and (result['queries'] or 0) > base['queries']:
+            regressions.append(f"{name}: {result['queries']} requêtes SQL > {base['queries']}")
+        if result['errors'] > base.get('errors', 0):
+            regressions.append(f"{name}: {result['errors']} erreur(s) serveur > {base.get('errors', 0)}")
+    return regressions
+
+
+class Command(BaseCommand):
+    """
+    Benchmark de toutes les routes de core/urls.py via le client de test
+    Exemples:
+      python manage.py bench_views --preset 1k --save-baseline bench.json
+      python manage.py bench_views --preset 1k --baseline bench.json --fail-on-regression
+    Sans --preset, la base courante est utilisée (voir generate_data)
+    """
+    help = "Latences p50/p95, requêtes SQL et charge multi-thread par vue, comparées à une référence"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preset', choices=sorted(PRESETS),
+                            help="Génère ce jeu de données dans une base de test jetable")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--iterations', type=int, default=30, help="Requêtes mesurées par scénario")
+        parser.add_argument('--threads', type=int, default=4, help="Clients simultanés de la charge mixte")
+        parser.add_argument('--duration', type=float, default=10.0, help="Durée de la charge mixte (s), 0 pour aucune")
+        parser.add_argument('--only', action='append', help="Limite aux scénarios nommés (répétable)")
+        parser.add_argument('--save-baseline', help="Enregistre les résultats comme référence (JSON)")
+        parser.add_argument('--baseline', help="Compare à une référence enregistrée")
+        parser.add_argument('--tolerance', type=float, default=0.25, help="Hausse de p95 tolérée (0.25 = +25 %%)")
+        parser.add_argument('--floor-ms', type=float, default=2.0, help="Hausse de p95 toujours tolérée (ms)")
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        # Erreurs 500 et requêtes lentes sont comptées dans les résultats, pas journalisées une à une
+        loggers = [logging.getLogger(name) for name in ('django.request', 'core.metrics')]
+        previous_levels = [logger.level for logger in loggers]
+        for logger in loggers:
+            logger.setLevel(logging.CRITICAL)
+        # Environnement du client de test (hôte « testserver », e-mails en mémoire)
+        setup_test_environment()
+        old_config = None
+        if options['preset']:
+            old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            if options['preset']:
+                Generator(PRESETS[options['preset']], seed=options['seed']).run()
+                finalize()
+            report = self.run_suite(options)
+        finally:
+            for logger, level in zip(loggers, previous_levels):
+                logger.setLevel(level)
+            teardown_test_environment()
+            if old_config is not None:
+                teardown_databases(old_config, verbosity=0)
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as handle:
+                json.dump(report, handle, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Référence enregistrée dans {options['save_baseline']}")
+        if options['baseline']:
+            with open(options['baseline']) as handle:
+                baseline = json.load(handle)
+            regressions = compare(report['sequential'], baseline.get('sequential', {}),
+                                  options['tolerance'], options['floor_ms'])
+            for line in regressions:
+                self.stdout.write(self.style.ERROR(f"Régression {line}"))
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS("Aucune régression par rapport à la référence"))
+            elif options['fail_on_regression']:
+                raise CommandError(f"{len(regressions)} régression(s)")
+
+    def run_suite(self, options):
+        objects = sample_objects()
+        scenarios = build_scenarios(objects)
+        if options['only']:
+            scenarios = [scenario for scenario in scenarios if scenario.name in options['only']]
+
+        sequential = run_sequential(scenarios, objects, options['iterations'])
+        self.stdout.write(f"{'scénario':<24}{'p50 ms':>9}{'p95 ms':>9}{'SQL':>6}  statuts")
+        for name, result in sequential.items():
+            self.stdout.write(f"{name:<24}{result['p50_ms']:>9}{result['p95_ms']:>9}{result['queries']:>6}  "
+                              f"{result['statuses']}")
+
+        load = None
+        if options['duration'] > 0:
+            load = run_load(scenarios, objects, options['threads'], options['duration'])
+            self.stdout.write(f"Charge mixte: {load['threads']} threads, {load['requests']} requêtes en "
+                              f"{load['duration_s']} s ({load['requests_per_s']} req/s)")
+            for name, result in load['scenarios'].items():
+                self.stdout.write(f"  {name:<22}{result['p50_ms']:>9}{result['p95_ms']:>9}")
+        return {'sequential': sequential, 'load': load}
@@ -0,0 +1,85 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.management.commands.bench_views import percentile
+from core.models import Appointment, Patient, WaitlistEntry
+
+
+class Command(BaseCommand):
+    """
+    Benchmark de la réattribution des créneaux annulés sur la base courante (generate_data au préalable)
+    Inscrit des patients sur les listes d'attente des médecins les plus chargés, annule en rafale des
+    rendez-vous à venir puis mesure chaque annulation (réattribution comprise)
+    Toutes les écritures sont annulées à la fin
+    Exemple: python manage.py bench_waitlist --doctors 20 --waiters 5000 --cancellations 2000
+    """
+    help = "Mesure le coût d'une annulation avec réattribution depuis la liste d'attente"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=20)
+        parser.add_argument('--waiters', type=int, default=5000, help="Inscriptions par médecin")
+        parser.add_argument('--cancellations', type=int, default=2000)
+        parser.add_argument('--window-days', type=int, default=14, help="Largeur des fenêtres d'attente")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        now = timezone.now()
+        doctors = list(Appointment.objects.filter(status__in=Appointment.ACTIVE_STATUSES, date_time__gt=now)
+                       .values('doctor').annotate(n=Count('id')).order_by('-n')
+                       .values_list('doctor', flat=True)[:options['doctors']])
+        patients = list(Patient.objects.values_list('pk', flat=True))
+        if not doctors or len(patients) < 2:
+            raise CommandError("Aucun rendez-vous à venir: lancer generate_data")
+        upcoming = list(Appointment.objects.filter(doctor__in=doctors, status__in=Appointment.ACTIVE_STATUSES,
+                                                   date_time__gt=now))
+        rng.shuffle(upcoming)
+        upcoming = upcoming[:options['cancellations']]
+        last_day = timezone.localdate(max(appointment.date_time for appointment in upcoming))
+        days = max((last_day - timezone.localdate(now)).days, 1)
+
+        latencies, queries = [], []
+        reallocated = 0
+        with transaction.atomic():
+            started = time.perf_counter()
+            entries = []
+            for doctor in doctors:
+                # Une inscription par patient et par médecin (contrainte unique_waiting_patient)
+                for patient in rng.sample(patients, min(options['waiters'], len(patients))):
+                    date_from = timezone.localdate(now) + timedelta(days=rng.randrange(days))
+                    entries.append(WaitlistEntry(
+                        patient_id=patient, doctor_id=doctor, date_from=date_from,
+                        date_to=date_from + timedelta(days=rng.randrange(options['window_days'])),
+                        urgency=rng.choices((0, 1, 2), weights=(80, 15, 5))[0],
+                        created_at=now - timedelta(seconds=rng.randrange(86400 * 30)),
+                    ))
+            WaitlistEntry.objects.bulk_create(entries, batch_size=1000)
+            self.stdout.write(f"{len(entries)} inscriptions créées en {time.perf_counter() - started:.2f} s")
+
+            started = time.perf_counter()
+            for appointment in upcoming:
+                appointment.status = 'CANCELLED'
+                reset_queries()
+                with CaptureQueriesContext(connection) as captured:
+                    begin = time.perf_counter()
+                    appointment.save()
+                    latencies.append(time.perf_counter() - begin)
+                queries.append(len(captured))
+            elapsed = time.perf_counter() - started
+            reallocated = WaitlistEntry.objects.filter(status='BOOKED').count()
+            transaction.set_rollback(True)
+
+        latencies.sort()
+        self.stdout.write(f"Médecins: {len(doctors)}, annulations: {len(upcoming)} en {elapsed:.2f} s "
+                          f"({len(upcoming) / elapsed:.0f}/s)")
+        self.stdout.write(f"Créneaux réattribués: {reallocated} ({reallocated / len(upcoming):.0%})")
+        self.stdout.write(f"Annulation: p50 {percentile(latencies, 50) * 1000:.2f} ms, "
+                          f"p95 {percentile(latencies, 95) * 1000:.2f} ms, "
+                          f"{max(queries)} requêtes au plus")
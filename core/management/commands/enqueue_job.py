@@ -0,0 +1,35 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.jobs import TASKS, enqueue
+
+
+class Command(BaseCommand):
+    """
+    Ajoute une tâche à la file (tâches planifiées par cron, reprises manuelles)
+    Exemple: python manage.py enqueue_job exports.patients --payload '{"fmt": "zip"}' --priority 5
+    Purge horaire des exports expirés (cron): python manage.py enqueue_job exports.purge
+    """
+    help = "Met une tâche de fond en file d'attente"
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help="Nom de la tâche")
+        parser.add_argument('--payload', default='{}', help="Arguments nommés (objet JSON)")
+        parser.add_argument('--priority', type=int, default=0)
+        parser.add_argument('--delay', type=int, default=0, help="Délai avant exécution (secondes)")
+        parser.add_argument('--max-attempts', type=int, default=3)
+
+    def handle(self, *args, **options):
+        if options['name'] not in TASKS:
+            raise CommandError(f"Tâche inconnue: {options['name']} (connues: {', '.join(sorted(TASKS))})")
+        try:
+            payload = json.loads(options['payload'])
+        except ValueError:
+            raise CommandError("--payload doit être un objet JSON")
+        if not isinstance(payload, dict):
+            raise CommandError("--payload doit être un objet JSON")
+        job = enqueue(options['name'], payload, priority=options['priority'],
+                      delay=timedelta(seconds=options['delay']), max_attempts=options['max_attempts'])
+        self.stdout.write(self.style.SUCCESS(f"Tâche #{job.pk} ({job.name}) en file"))
@@ -0,0 +1,55 @@
+import sys
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.exports import CHUNK_SIZE, export_stream
+from core.models import Patient
+
+
+class Command(BaseCommand):
+    """
+    Exporte en flux le dossier complet de patients (tous par défaut) en NDJSON ou en zip
+    Exemple: python manage.py export_patients --format zip -o export.zip
+    """
+    help = "Export NDJSON/zip en mémoire constante des dossiers patients"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patient', type=int, action='append', dest='patients',
+                            help="Identifiant d'un patient (répétable); tous les patients par défaut")
+        parser.add_argument('--format', choices=['ndjson', 'zip'], default='ndjson')
+        parser.add_argument('-o', '--output', default='-', help="Fichier de sortie ('-' pour la sortie standard)")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Lignes lues par aller-retour")
+        parser.add_argument('--trace-memory', action='store_true', help="Affiche le pic mémoire Python")
+
+    def handle(self, *args, **options):
+        patients = Patient.objects.all()
+        if options['patients']:
+            patients = patients.filter(pk__in=options['patients'])
+        if options['format'] == 'zip' and options['output'] == '-':
+            raise CommandError("Le format zip nécessite --output")
+
+        if options['trace_memory']:
+            tracemalloc.start()
+        started = time.perf_counter()
+        written = 0
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for chunk in export_stream(patients, options['format'], options['chunk_size']):
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        elapsed = time.perf_counter() - started
+
+        # Statistiques sur stderr pour ne pas polluer un export vers la sortie standard
+        count = patients.count()
+        report = (f"{count} patient(s), {written / 1024 / 1024:.1f} Mo en {elapsed:.2f} s "
+                  f"({count / max(elapsed, 1e-9):.0f} patients/s, {written / 1024 / 1024 / max(elapsed, 1e-9):.1f} Mo/s)")
+        if options['trace_memory']:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            report += f", pic mémoire {peak / 1024 / 1024:.1f} Mo"
+        self.stderr.write(report)
@@ -0,0 +1,90 @@
+import os
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from core.models import MedicalRecord, StoredBlob
+from core.storage import BLOB_PREFIX, content_addressed_storage, verify_blob
+
+
+class Command(BaseCommand):
+    """
+    Ramasse-miettes du stockage adressé par contenu
+    - recalcule les compteurs de références depuis MedicalRecord (--reconcile)
+    - supprime les blobs sans référence depuis plus de --grace-hours
+    - supprime les fichiers présents sur disque mais inconnus de la base
+    - vérifie les empreintes (--verify)
+    """
+    help = "Supprime les fichiers médicaux orphelins et vérifie l'intégrité des blobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24)
+        parser.add_argument('--reconcile', action='store_true')
+        parser.add_argument('--verify', action='store_true')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        storage = content_addressed_storage
+        grace = timedelta(hours=options['grace_hours'])
+        dry_run = options['dry_run']
+
+        if options['reconcile']:
+            self.reconcile()
+
+        # Blobs sans référence depuis la période de grâce
+        removed = 0
+        expired = timezone.now() - grace
+        stale = StoredBlob.objects.filter(refcount__lte=0, updated_at__lt=expired)
+        for blob in stale.iterator():
+            if not dry_run:
+                # Suppression conditionnelle: un nouvel envoi a pu le référencer ou le réutiliser entre-temps
+                # (storage._save rafraîchit la ligne); le fichier est supprimé avant la validation, si bien
+                # qu'un envoi qui attend la ligne le réécrit ensuite
+                with transaction.atomic():
+                    if StoredBlob.objects.filter(pk=blob.pk, refcount__lte=0, updated_at__lt=expired).delete()[0]:
+                        storage.delete(blob.name)
+            removed += 1
+
+        # Fichiers sur disque sans ligne StoredBlob (envoi interrompu, etc.)
+        known = set(StoredBlob.objects.values_list('name', flat=True))
+        orphans = 0
+        root = storage.path(BLOB_PREFIX)
+        cutoff = time.time() - grace.total_seconds()
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+                if name not in known and os.path.getmtime(path) < cutoff:
+                    orphans += 1
+                    if not dry_run:
+                        os.remove(path)
+
+        self.stdout.write(f"Blobs supprimés: {removed}, fichiers orphelins: {orphans}")
+
+        if options['verify']:
+            corrupted = [name for name in StoredBlob.objects.filter(refcount__gt=0)
+                         .values_list('name', flat=True).iterator() if not verify_blob(name)]
+            for name in corrupted:
+                self.stderr.write(f"Empreinte invalide: {name}")
+            self.stdout.write(f"Blobs corrompus: {len(corrupted)}")
+
+    def reconcile(self):
+        """Recalcule refcount à partir des dossiers médicaux"""
+        counts = dict(MedicalRecord.objects.filter(file__startswith=BLOB_PREFIX)
+                      .order_by().values_list('file').annotate(n=Count('pk')))
+        fixed = 0
+        for blob in StoredBlob.objects.iterator():
+            expected = counts.pop(blob.name, 0)
+            if blob.refcount != expected:
+                StoredBlob.objects.filter(pk=blob.pk).update(refcount=expected, updated_at=timezone.now())
+                fixed += 1
+        for name, count in counts.items():
+            StoredBlob.objects.create(name=name, refcount=count,
+                                      size=content_addressed_storage.size(name)
+                                      if content_addressed_storage.exists(name) else 0)
+            fixed += 1
+        self.stdout.write(f"Compteurs corrigés: {fixed}")
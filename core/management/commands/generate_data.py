@@ -0,0 +1,41 @@
+import time
+from dataclasses import replace
+
+from django.core.management.base import BaseCommand
+
+from core.synthetic import PRESETS, Generator, finalize
+
+
+class Command(BaseCommand):
+    """
+    Génère un jeu de données synthétiques réaliste (préréglages 1k, 100k, 1m patients)
+    Exemple: python manage.py generate_data --preset 100k --seed 42
+    Tous les comptes ont le mot de passe --password (défaut « bench »)
+    """
+    help = "Remplit la base avec des utilisateurs, médecins, patients, rendez-vous, dossiers et pharmacies"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preset', choices=sorted(PRESETS), default='1k')
+        parser.add_argument('--patients', type=int, help="Remplace le nombre de patients du préréglage")
+        parser.add_argument('--doctors', type=int, help="Remplace le nombre de médecins du préréglage")
+        parser.add_argument('--pharmacies', type=int, help="Remplace le nombre de pharmacies du préréglage")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', default='bench')
+        parser.add_argument('--prefix', default='', help="Préfixe des noms d'utilisateur (générations successives)")
+        parser.add_argument('--no-search-index', action='store_true', help="Ne reconstruit pas l'index plein texte")
+
+    def handle(self, *args, **options):
+        overrides = {name: options[name] for name in ('patients', 'doctors', 'pharmacies')
+                     if options[name] is not None}
+        volume = replace(PRESETS[options['preset']], **overrides)
+        generator = Generator(volume, seed=options['seed'], batch_size=options['batch_size'],
+                              password=options['password'], prefix=options['prefix'], stdout=self.stdout)
+        started = time.perf_counter()
+        generator.run()
+        finalize(index_search=not options['no_search_index'], stdout=self.stdout)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{volume.patients} patients, {volume.doctors} médecins, {generator.appointment_number} rendez-vous "
+            f"générés en {elapsed:.1f} s"
+        ))
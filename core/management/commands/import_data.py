@@ -0,0 +1,93 @@
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.importers import IMPORTERS, read_rows
+
+
+class Command(BaseCommand):
+    """
+    Importe en masse des patients, médecins, rendez-vous ou médicaments depuis un CSV ou un NDJSON
+    Le fichier est lu en flux et écrit par lots (une transaction par lot); avec
+    --checkpoint, la dernière ligne validée est enregistrée pour reprendre un
+    import interrompu sans dupliquer les lignes déjà écrites.
+    """
+    help = "Import en masse (CSV/NDJSON) de patients, médecins, rendez-vous ou médicaments"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS), help="Type d'objets importés")
+        parser.add_argument('path', help="Fichier à importer")
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help="Format du fichier (déduit de l'extension par défaut)")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Lignes par transaction")
+        parser.add_argument('--checkpoint', help="Fichier JSON de reprise (dernière ligne écrite)")
+        parser.add_argument('--max-errors', type=int, default=100, help="Erreurs affichées au maximum")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size doit être positif")
+        if not os.path.exists(path):
+            raise CommandError(f"Fichier introuvable: {path}")
+
+        # Reprise: les lignes déjà écrites lors d'une exécution précédente sont sautées
+        checkpoint = options['checkpoint']
+        resume_after = self.read_checkpoint(checkpoint, path)
+        if resume_after:
+            self.stdout.write(f"Reprise après la ligne {resume_after}")
+
+        importer = IMPORTERS[options['kind']]()
+        imported, errors, shown = 0, 0, 0
+        started = time.perf_counter()
+        with open(path, newline='', encoding='utf-8') as handle:
+            rows = ((line_num, row) for line_num, row in read_rows(handle, fmt) if line_num > resume_after)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                valid, invalid = importer.prepare(batch)
+                with transaction.atomic():
+                    written, rejected = importer.save(valid) if valid else (0, [])
+                imported += written
+                # Le point de reprise n'avance qu'une fois le lot validé en base
+                self.write_checkpoint(checkpoint, path, batch[-1][0])
+                for line_num, message in sorted(invalid + rejected):
+                    errors += 1
+                    if shown < options['max_errors']:
+                        shown += 1
+                        self.stderr.write(f"Ligne {line_num}: {message}")
+
+        # Les signaux n'ont pas été émis par bulk_create
+        importer.finalize()
+        elapsed = time.perf_counter() - started
+        rate = imported / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{imported} ligne(s) importée(s), {errors} rejetée(s) en {elapsed:.2f}s ({rate:.0f} lignes/s)"
+        ))
+
+    @staticmethod
+    def read_checkpoint(checkpoint, path):
+        """Dernière ligne écrite pour ce fichier (0 si aucun point de reprise)"""
+        if not checkpoint or not os.path.exists(checkpoint):
+            return 0
+        with open(checkpoint) as handle:
+            state = json.load(handle)
+        if state.get('path') != os.path.abspath(path):
+            raise CommandError(f"Le point de reprise {checkpoint} concerne un autre fichier")
+        return state.get('line', 0)
+
+    @staticmethod
+    def write_checkpoint(checkpoint, path, line_num):
+        if not checkpoint:
+            return
+        tmp = f'{checkpoint}.tmp'
+        with open(tmp, 'w') as handle:
+            json.dump({'path': os.path.abspath(path), 'line': line_num}, handle)
+        # Remplacement atomique: un arrêt brutal laisse l'ancien point de reprise intact
+        os.replace(tmp, checkpoint)
@@ -0,0 +1,110 @@
+import random
+import threading
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Count
+from django.utils import timezone
+
+from core.booking import SlotUnavailable, book
+from core.models import Appointment, Doctor, Patient, User
+
+PREFIX = 'loadtest_'
+# Médecins disponibles à toute heure: chaque créneau disputé est sur leur grille (voir booking.check_slot)
+AVAILABILITY = {day: ['00:00-24:00'] for day in ('lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi',
+                                                 'dimanche')}
+
+
+class Command(BaseCommand):
+    """
+    Harnais de charge multi-thread pour la réservation de rendez-vous
+    Crée des médecins/patients temporaires, lance des réservations concurrentes
+    sur un petit nombre de créneaux puis vérifie l'absence de double réservation
+    Exemple: python manage.py loadtest_booking --threads 32 --attempts 2000
+    """
+    help = "Vérifie sous charge qu'aucun créneau n'est réservé deux fois"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--attempts', type=int, default=2000, help="Nombre total de tentatives")
+        parser.add_argument('--doctors', type=int, default=5)
+        parser.add_argument('--patients', type=int, default=50)
+        parser.add_argument('--slots', type=int, default=20, help="Créneaux disputés par médecin")
+        parser.add_argument('--keep', action='store_true', help="Conserve les données créées")
+
+    def handle(self, *args, **options):
+        doctors, patients = self.setup_data(options['doctors'], options['patients'])
+        first = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        slots = [first + timedelta(minutes=30 * i) for i in range(options['slots'])]
+        try:
+            stats = run_load(doctors, patients, slots, options['threads'], options['attempts'])
+            duplicates = (Appointment.objects
+                          .filter(doctor__in=doctors, status__in=Appointment.ACTIVE_STATUSES)
+                          .values('doctor', 'date_time')
+                          .annotate(n=Count('id'))
+                          .filter(n__gt=1)
+                          .count())
+        finally:
+            if not options['keep']:
+                User.objects.filter(username__startswith=PREFIX).delete()
+
+        self.stdout.write(f"Tentatives: {stats['attempts']} en {stats['elapsed']:.2f} s "
+                          f"({stats['attempts'] / stats['elapsed']:.0f}/s)")
+        self.stdout.write(f"Réservées: {stats['booked']}, conflits: {stats['conflicts']}, "
+                          f"erreurs: {stats['errors']}")
+        if duplicates:
+            raise CommandError(f"{duplicates} créneau(x) réservé(s) plusieurs fois")
+        self.stdout.write(self.style.SUCCESS("Aucune double réservation"))
+
+    def setup_data(self, doctor_count, patient_count):
+        """Crée les utilisateurs, médecins et patients temporaires"""
+        doctors = []
+        for i in range(doctor_count):
+            user = User.objects.create(username=f'{PREFIX}doc{i}', role='DOCTOR')
+            doctors.append(Doctor.objects.create(user=user, license_number=f'LT{i}', availability=AVAILABILITY))
+        patients = []
+        for i in range(patient_count):
+            user = User.objects.create(username=f'{PREFIX}pat{i}', role='PATIENT')
+            patients.append(Patient.objects.create(user=user, birth_date=date(1980, 1, 1), blood_group='O+'))
+        return doctors, patients
+
+
+def run_load(doctors, patients, slots, threads, attempts):
+    """
+    Lance `attempts` réservations réparties sur `threads` threads
+    Chaque thread utilise sa propre connexion à la base
+    """
+    stats = {'attempts': attempts, 'booked': 0, 'conflicts': 0, 'errors': 0}
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(count, seed):
+        rng = random.Random(seed)
+        local = {'booked': 0, 'conflicts': 0, 'errors': 0}
+        barrier.wait()
+        try:
+            for _ in range(count):
+                try:
+                    book(rng.choice(patients), rng.choice(doctors), rng.choice(slots), 'IN_PERSON')
+                    local['booked'] += 1
+                except SlotUnavailable:
+                    local['conflicts'] += 1
+                except OperationalError:
+                    local['errors'] += 1
+        finally:
+            connection.close()
+        with lock:
+            for key, value in local.items():
+                stats[key] += value
+
+    shares = [attempts // threads + (1 if i < attempts % threads else 0) for i in range(threads)]
+    pool = [threading.Thread(target=worker, args=(share, i)) for i, share in enumerate(shares)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    stats['elapsed'] = time.perf_counter() - started
+    return stats
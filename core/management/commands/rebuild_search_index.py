@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import search
+from core.models import Allergy, MedicalRecord, Prescription
+
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    """
+    Reconstruit entièrement l'index plein texte
+    À lancer après une migration, un import en masse ou un changement de moteur
+    """
+    help = "Réindexe les dossiers médicaux, ordonnances et allergies"
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        sources = [
+            (MedicalRecord.objects.all(), search.record_document),
+            (Prescription.objects.select_related('medical_record'), search.prescription_document),
+            (Allergy.objects.all(), search.allergy_document),
+        ]
+        with transaction.atomic():
+            backend.clear()
+            total = 0
+            for queryset, to_document in sources:
+                batch = []
+                for obj in queryset.order_by().iterator(chunk_size=BATCH_SIZE):
+                    batch.append(to_document(obj))
+                    if len(batch) >= BATCH_SIZE:
+                        backend.index_many(batch)
+                        total += len(batch)
+                        batch = []
+                backend.index_many(batch)
+                total += len(batch)
+            backend.optimize()
+        self.stdout.write(self.style.SUCCESS(f"{total} document(s) indexé(s)"))
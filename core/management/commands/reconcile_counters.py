@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core import counters
+
+
+class Command(BaseCommand):
+    """
+    Recalcule les compteurs du tableau de bord depuis les tables sources
+    À lancer périodiquement (cron) ou après des imports en masse
+    """
+    help = "Corrige la dérive des compteurs matérialisés (StatCounter)"
+
+    def handle(self, *args, **options):
+        fixed = counters.reconcile()
+        for key, (old, new) in sorted(fixed.items()):
+            self.stdout.write(f"{key}: {old} -> {new}")
+        self.stdout.write(self.style.SUCCESS(f"{len(fixed)} compteur(s) corrigé(s)"))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.jobs import Worker
+
+
+class Command(BaseCommand):
+    """
+    Travailleur de la file de tâches de fond (voir core/jobs.py)
+    Exemple: python manage.py run_jobs --concurrency 8 --pool thread
+    Plusieurs travailleurs peuvent tourner en parallèle: les réservations ne se chevauchent pas
+    """
+    help = "Exécute les tâches de fond en file d'attente"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help="Tâches exécutées simultanément")
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help="thread pour les tâches d'entrées/sorties, process pour le calcul")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Attente entre deux relevés de la file vide (secondes)")
+        parser.add_argument('--burst', action='store_true', help="S'arrête quand la file est vide")
+
+    def handle(self, *args, **options):
+        worker = Worker(options['concurrency'], options['pool'], options['poll_interval'])
+        started = time.perf_counter()
+        try:
+            stats = worker.run(burst=options['burst'])
+        except KeyboardInterrupt:
+            stats = worker.stats
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['DONE']} tâche(s) terminée(s), {stats['QUEUED']} replanifiée(s), "
+            f"{stats['FAILED']} abandonnée(s) en {elapsed:.2f}s"
+        ))
@@ -0,0 +1,40 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.allergies import screen
+from core.models import PrescriptionAlert
+
+
+class Command(BaseCommand):
+    """
+    Contrôle toutes les ordonnances en cours de validité contre les allergies actives
+    À lancer après un import en masse d'allergies ou une modification des correspondances allergène -> substance
+    """
+    help = "Crée les alertes allergie/ordonnance manquantes (--reset pour repartir de zéro)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patient', type=int, action='append', help="Limite au patient (répétable)")
+        parser.add_argument('--reset', action='store_true',
+                            help="Supprime d'abord les alertes existantes (correspondances modifiées)")
+        parser.add_argument('--date', type=date.fromisoformat,
+                            help="Date de référence AAAA-MM-JJ pour la validité des ordonnances (défaut: aujourd'hui)")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with transaction.atomic():
+            if options['reset']:
+                alerts = PrescriptionAlert.objects.all()
+                if options['patient']:
+                    alerts = alerts.filter(allergy__patient_id__in=options['patient'])
+                alerts.delete()
+            stats = screen(patient_ids=options['patient'], today=options['date'], chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        rate = stats['patients'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['patients']} patient(s) allergique(s), {stats['prescriptions']} ordonnance(s) contrôlée(s), "
+            f"{stats['conflicts']} conflit(s) en {elapsed:.2f} s ({rate:.0f} patients/s)"
+        ))
@@ -0,0 +1,51 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.reminders import REMINDER_HOURS_BEFORE, ReminderScheduler
+
+
+class Command(BaseCommand):
+    """
+    Travailleur d'envoi des rappels de rendez-vous par email (voir core/reminders.py)
+    Exemple: python manage.py send_reminders --hours-before 24
+    Avec --once, un seul passage (tâche planifiée) au lieu d'un processus permanent
+    """
+    help = "Envoie les rappels de rendez-vous à leur échéance, par lots"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours-before', type=float, default=REMINDER_HOURS_BEFORE,
+                            help="Délai entre le rappel et le rendez-vous (heures)")
+        parser.add_argument('--horizon-minutes', type=int, default=360,
+                            help="Rappels chargés en mémoire à l'avance (minutes)")
+        parser.add_argument('--refresh-minutes', type=int, default=15,
+                            help="Relecture complète de la fenêtre (horaires modifiés, annulations)")
+        parser.add_argument('--poll-seconds', type=int, default=60,
+                            help="Lecture des rendez-vous créés depuis le dernier passage")
+        parser.add_argument('--batch-size', type=int, default=500, help="Emails envoyés par connexion")
+        parser.add_argument('--once', action='store_true', help="Un seul passage puis arrêt")
+
+    def handle(self, *args, **options):
+        scheduler = ReminderScheduler(
+            hours_before=options['hours_before'], horizon=timedelta(minutes=options['horizon_minutes']),
+            refresh=timedelta(minutes=options['refresh_minutes']), poll=timedelta(seconds=options['poll_seconds']),
+            batch_size=options['batch_size'],
+        )
+        total = 0
+        try:
+            while True:
+                started = time.perf_counter()
+                sent = scheduler.tick(timezone.now())
+                total += sent
+                if sent:
+                    self.stdout.write(f"{sent} rappel(s) envoyé(s) en {time.perf_counter() - started:.2f}s "
+                                      f"({len(scheduler)} en attente)")
+                if options['once']:
+                    break
+                # Sommeil jusqu'à la prochaine échéance ou lecture: aucune requête entre les deux
+                time.sleep(max(0.0, (scheduler.next_wakeup() - timezone.now()).total_seconds()))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"{total} rappel(s) envoyé(s)"))
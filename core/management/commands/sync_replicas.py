@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.replicas import copy_primary, replicas
+
+
+class Command(BaseCommand):
+    """
+    Recopie la base principale SQLite dans chaque réplica de DATABASE_REPLICAS
+    Réplicas locaux pour essayer le routage des lectures (voir core/replicas.py et settings.py);
+    à relancer périodiquement (cron): les réplicas ont le retard de la dernière copie
+    """
+    help = "Copie la base principale dans les réplicas SQLite"
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help="Réplicas à copier (tous par défaut)")
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or replicas()
+        if not aliases:
+            raise CommandError("Aucun réplica configuré (DATABASE_REPLICAS dans settings.py)")
+        unknown = set(aliases) - set(replicas())
+        if unknown:
+            raise CommandError(f"Réplica(s) inconnu(s): {', '.join(sorted(unknown))}")
+        for alias in aliases:
+            started = time.perf_counter()
+            try:
+                copy_primary(alias)
+            except ValueError as exc:
+                raise CommandError(str(exc)) from exc
+            self.stdout.write(f"{alias}: copié en {time.perf_counter() - started:.2f} s")
+        self.stdout.write(self.style.SUCCESS(f"{len(aliases)} réplica(s) à jour"))
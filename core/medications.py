@@ -0,0 +1,224 @@
+"""
+Catalogue des médicaments en mémoire: autocomplétion et validation des ordonnances
+
+Le catalogue (modèle Medication, importé avec `import_data medications`) est
+compilé au premier usage en tableaux triés :
+- pour chaque type de clé (début du nom, début d'un autre mot du nom, début
+  d'un mot de la substance active), une liste triée de clés repliées
+  (minuscules, sans accents) et le tableau parallèle des médicaments. Toutes
+  les clés d'un même préfixe forment un intervalle contigu trouvé par
+  dichotomie : un trie sans un objet par nœud. Les listes étant parcourues
+  dans l'ordre de pertinence, une recherche s'arrête dès `limit` résultats ;
+- un dictionnaire nom replié -> médicament pour la validation exacte.
+
+Sans assez de résultats par préfixe, la recherche approchée essaie les
+variantes du préfixe à une faute près (lettre omise, en trop, remplacée ou
+inversée, sauf la première). Les lettres essayées à une position sont celles qui suivent
+réellement le début de la saisie dans le catalogue, comme dans un parcours
+de trie : quelques dichotomies par position plutôt que tout l'alphabet.
+Le catalogue est invalidé par les signaux de Medication (voir signals.py) et
+après un import, qui incrémentent aussi sa version en base (voir versions.py) :
+les autres processus rechargent alors leur catalogue.
+"""
+import hashlib
+import re
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+from .replicas import primary
+from .versions import SharedVersion
+
+# Types de clés, par ordre de pertinence des résultats
+NAME, WORD, INGREDIENT = range(3)
+# Longueur minimale d'une saisie, et d'une saisie corrigée par la recherche approchée
+MIN_QUERY = 2
+MIN_FUZZY_QUERY = 4
+# Clés parcourues au plus par préfixe (préfixes courts et très fréquents)
+MAX_SCAN = 500
+# Borne supérieure des clés repliées (caractères [a-z0-9 ])
+_AFTER = '\x7f'
+# Nom de la version partagée du catalogue (voir versions.py)
+VERSION_NAME = 'medications'
+
+_SEPARATORS = re.compile(r'[^a-z0-9]+')
+
+Entry = namedtuple('Entry', ['pk', 'name', 'ingredient', 'form'])
+
+
+def fold(text):
+    """Minuscules sans accents, mots séparés par une seule espace"""
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode().lower()
+    return _SEPARATORS.sub(' ', text).strip()
+
+
+def word_starts(folded):
+    """
+    Suffixes commençant à chaque mot, le texte entier d'abord
+    Les mots de moins de 3 caractères ou commençant par un chiffre (dosages, unités) sont ignorés
+    ("doliprane 500 mg sirop" -> "doliprane 500 mg sirop", "sirop")
+    """
+    if not folded:
+        return []
+    words = folded.split()
+    return [folded] + [' '.join(words[i:]) for i in range(1, len(words))
+                       if len(words[i]) >= 3 and words[i][0].isalpha()]
+
+
+class Compiled:
+    """Catalogue compilé, immuable: remplacé en bloc lorsqu'il est rechargé"""
+    __slots__ = ('entries', 'keys', 'owners', 'all_keys', 'by_name', 'version')
+
+    def __init__(self, rows):
+        self.entries = [Entry(*row) for row in rows]
+        keyed = ([], [], [])
+        for position, entry in enumerate(self.entries):
+            starts = word_starts(fold(entry.name))
+            keyed[NAME].extend((key, position) for key in starts[:1])
+            keyed[WORD].extend((key, position) for key in starts[1:])
+            keyed[INGREDIENT].extend((key, position) for key in word_starts(fold(entry.ingredient)))
+        # Une liste triée de clés et un tableau de positions par type de clé
+        self.keys, self.owners = [], []
+        for pairs in keyed:
+            pairs.sort()
+            self.keys.append([key for key, _ in pairs])
+            self.owners.append(array('I', (position for _, position in pairs)))
+        # Toutes les clés distinctes, pour énumérer les lettres possibles (recherche approchée)
+        self.all_keys = sorted(set().union(*self.keys))
+        self.by_name = {fold(entry.name): entry for entry in self.entries}
+        # Empreinte du contenu: identique d'un processus à l'autre (ETag)
+        digest = hashlib.md5(usedforsecurity=False)
+        for entry in sorted(self.entries):
+            digest.update(repr(tuple(entry)).encode())
+        self.version = digest.hexdigest()[:16]
+
+    def collect(self, prefix, found, limit):
+        """
+        Ajoute à found (dictionnaire ordonné des positions) les médicaments ayant une clé
+        commençant par prefix, par type de clé puis par ordre alphabétique, jusqu'à limit
+        """
+        for keys, owners in zip(self.keys, self.owners):
+            start = bisect_left(keys, prefix)
+            for i in range(start, min(start + MAX_SCAN, len(keys))):
+                if len(found) >= limit or not keys[i].startswith(prefix):
+                    break
+                found.setdefault(owners[i])
+
+    def next_chars(self, prefix):
+        """Caractères qui suivent prefix dans les clés (une dichotomie par caractère distinct)"""
+        keys = self.all_keys
+        size = len(prefix)
+        lo, hi = bisect_left(keys, prefix), bisect_left(keys, prefix + _AFTER)
+        chars = []
+        while lo < hi:
+            key = keys[lo]
+            if len(key) == size:
+                lo += 1
+                continue
+            char = key[size]
+            chars.append(char)
+            lo = bisect_left(keys, prefix + chr(ord(char) + 1), lo, hi)
+        return chars
+
+    def exists(self, prefix):
+        keys = self.all_keys
+        i = bisect_left(keys, prefix)
+        return i < len(keys) and keys[i].startswith(prefix)
+
+    def variants(self, query):
+        """
+        Préfixes à une faute de query qui existent dans le catalogue
+        La première lettre est supposée juste (l'alphabet entier serait essayé à cette position)
+        """
+        found = set()
+        for i in range(1, len(query)):
+            chars = self.next_chars(query[:i])
+            if not chars:
+                # Aucune clé ne commence par query[:i]: les corrections plus loin sont inutiles
+                break
+            head, char, tail = query[:i], query[i], query[i + 1:]
+            for other in chars:
+                if other != char:
+                    found.add(head + other + tail)
+                found.add(head + other + char + tail)
+            # La dernière lettre omise donnerait un préfixe de la saisie elle-même
+            if tail:
+                found.add(head + tail)
+                found.add(head + tail[0] + char + tail[1:])
+        found.discard(query)
+        return sorted(variant for variant in found if self.exists(variant))
+
+
+class MedicationCatalogue:
+    """
+    Catalogue partagé par le processus, chargé en une requête au premier usage
+    Invalidé par les signaux de Medication et après un import en masse, rechargé
+    lorsqu'un autre processus a incrémenté sa version partagée (voir versions.py)
+    """
+
+    def __init__(self):
+        self._compiled = None
+        self._lock = threading.Lock()
+        self.shared = SharedVersion(VERSION_NAME)
+
+    def __len__(self):
+        return len(self.compiled().entries)
+
+    def clear(self):
+        """Vide le catalogue du processus (rechargé au prochain usage)"""
+        with self._lock:
+            self._compiled = None
+
+    def invalidate(self):
+        """Le catalogue a changé: vidé ici, rechargé par les autres processus (version partagée)"""
+        self.clear()
+        self.shared.bump()
+
+    def load(self, rows):
+        """Compile le catalogue depuis des tuples (pk, nom, substance, forme)"""
+        # Version lue avant les lignes: une modification pendant le chargement provoquera un nouveau chargement
+        version = self.shared.current()
+        compiled = Compiled(rows)
+        with self._lock:
+            self._compiled = compiled
+        self.shared.mark(version)
+        return compiled
+
+    def compiled(self):
+        compiled = self._compiled
+        if compiled is None or self.shared.check() is not None:
+            from .models import Medication
+
+            with primary():
+                compiled = self.load(Medication.objects.values_list('pk', 'name', 'ingredient', 'form').iterator())
+        return compiled
+
+    @property
+    def version(self):
+        return self.compiled().version
+
+    def lookup(self, name):
+        """Médicament de ce nom (casse et accents ignorés), None s'il n'est pas au catalogue"""
+        return self.compiled().by_name.get(fold(name))
+
+    def search(self, query, limit=10):
+        """
+        Médicaments correspondant à la saisie, les plus pertinents d'abord:
+        début du nom, début d'un mot du nom, substance active, puis à une faute près
+        """
+        compiled = self.compiled()
+        query = fold(query)
+        if len(query) < MIN_QUERY:
+            return []
+        found = {}
+        compiled.collect(query, found, limit)
+        if len(found) < limit and len(query) >= MIN_FUZZY_QUERY:
+            for variant in compiled.variants(query):
+                compiled.collect(variant, found, limit)
+        return [compiled.entries[position] for position in found]
+
+
+# Catalogue partagé par le processus
+medication_catalogue = MedicationCatalogue()
@@ -0,0 +1,306 @@
+"""
+Instrumentation des vues et point de collecte Prometheus
+
+MetricsMiddleware mesure chaque requête et l'attribue au nom d'URL résolu
+(core/urls.py) : latence, nombre et durée des requêtes SQL, requêtes SQL
+répétées à l'identique (empreinte = SQL paramétré, signe typique d'un N+1) et
+temps de rendu des templates (moteur InstrumentedDjangoTemplates). Les mesures
+sont agrégées en mémoire, par processus, et exposées au format texte Prometheus
+par la vue metrics (/metrics).
+
+Le coût par requête reste faible : un wrapper d'exécution SQL posé une fois par
+connexion (signal connection_created) qui ne mesure que lorsqu'une requête HTTP
+est en cours, un dictionnaire d'empreintes et un seul verrou pris en fin de
+requête. La requête en cours est portée par une ContextVar : les vues
+asynchrones (ASGI), dont l'ORM s'exécute dans des threads, sont mesurées
+aussi. Les requêtes lentes peuvent être journalisées avec le SQL fautif
+(réglage METRICS_SLOW_REQUEST_MS).
+
+La vue metrics n'est servie qu'aux adresses de METRICS_ALLOWED_IPS, et en plus
+aux administrateurs connectés ou au collecteur qui présente METRICS_TOKEN :
+derrière un proxy inverse, l'adresse seule ne protège rien.
+"""
+import heapq
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = 'unisalute'
+
+# Bornes des histogrammes (secondes, puis nombre de requêtes SQL)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# Requêtes SQL les plus lentes conservées pour le journal des requêtes lentes
+SLOW_SQL_KEPT = 5
+
+UNRESOLVED = '<unresolved>'
+
+_current = ContextVar('metrics_request_stats', default=None)
+
+
+class RequestStats:
+    """Mesures d'une requête HTTP en cours"""
+    __slots__ = ('queries', 'sql_time', 'fingerprints', 'slowest', 'template_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.fingerprints = Counter()
+        self.slowest = []
+        self.template_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Wrapper d'exécution SQL (connection.execute_wrapper)"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.sql_time += elapsed
+            # SQL paramétré (%s): la même requête répétée avec d'autres valeurs a la même empreinte
+            self.fingerprints[sql] += 1
+            if len(self.slowest) < SLOW_SQL_KEPT:
+                heapq.heappush(self.slowest, (elapsed, sql))
+            elif elapsed > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (elapsed, sql))
+
+    def duplicates(self):
+        """Empreintes exécutées plusieurs fois: {sql: nombre d'exécutions}"""
+        return {sql: count for sql, count in self.fingerprints.items() if count > 1}
+
+
+def record_query(execute, sql, params, many, context):
+    """Wrapper d'exécution SQL permanent: mesure pour la requête HTTP en cours, s'il y en a une"""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection):
+    """Pose record_query sur une connexion (une seule fois, même après reconnexion)"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Histogram:
+    """Histogramme cumulatif au format Prometheus, par valeur d'étiquettes"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        counts, total = self.series.get(labels, (None, None))
+        if counts is None:
+            counts = [0] * (len(self.buckets) + 1)
+            total = [0.0, 0]
+            self.series[labels] = (counts, total)
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+        total[1] += 1
+
+
+class Registry:
+    """Agrégats de toutes les requêtes du processus"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = Counter()
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.query_count = Histogram(QUERY_COUNT_BUCKETS)
+        self.sql_seconds = Counter()
+        self.duplicate_queries = Counter()
+        self.duplicate_fingerprints = {}
+        self.template_seconds = Counter()
+
+    def record(self, view, method, status, duration, stats):
+        duplicates = stats.duplicates()
+        with self.lock:
+            self.requests[(view, method, str(status))] += 1
+            self.latency.observe((view,), duration)
+            self.query_count.observe((view,), stats.queries)
+            self.sql_seconds[(view,)] += stats.sql_time
+            self.template_seconds[(view,)] += stats.template_time
+            if duplicates:
+                self.duplicate_queries[(view,)] += sum(count - 1 for count in duplicates.values())
+                # Pire empreinte observée par vue (nombre de répétitions dans une requête)
+                sql, count = max(duplicates.items(), key=lambda item: item[1])
+                if count > self.duplicate_fingerprints.get(view, (None, 0))[1]:
+                    self.duplicate_fingerprints[view] = (sql, count)
+
+    def render(self):
+        """Export au format texte Prometheus (version 0.0.4)"""
+        with self.lock:
+            lines = []
+            self._counter(lines, 'http_requests_total', "Requêtes HTTP par vue, méthode et statut",
+                          ('view', 'method', 'status'), self.requests)
+            self._histogram(lines, 'http_request_duration_seconds', "Latence des requêtes HTTP par vue",
+                            self.latency)
+            self._histogram(lines, 'db_queries_per_request', "Requêtes SQL par requête HTTP", self.query_count)
+            self._counter(lines, 'db_query_seconds_total', "Temps passé en SQL par vue", ('view',),
+                          self.sql_seconds)
+            self._counter(lines, 'db_duplicate_queries_total',
+                          "Requêtes SQL répétées à l'identique dans une même requête HTTP (N+1)", ('view',),
+                          self.duplicate_queries)
+            self._counter(lines, 'template_render_seconds_total', "Temps de rendu des templates par vue",
+                          ('view',), self.template_seconds)
+            name = f'{NAMESPACE}_db_duplicate_query_max'
+            lines.append(f'# HELP {name} Plus grand nombre de répétitions d\'une même requête SQL, par empreinte')
+            lines.append(f'# TYPE {name} gauge')
+            for view, (sql, count) in sorted(self.duplicate_fingerprints.items()):
+                lines.append(f'{name}{_labels(("view", "sql"), (view, _shorten(sql)))} {count}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _counter(lines, name, help_text, label_names, values):
+        name = f'{NAMESPACE}_{name}'
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for labels, value in sorted(values.items()):
+            lines.append(f'{name}{_labels(label_names, labels)} {_number(value)}')
+
+    @staticmethod
+    def _histogram(lines, name, help_text, histogram):
+        name = f'{NAMESPACE}_{name}'
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, (counts, (total, count)) in sorted(histogram.series.items()):
+            cumulative = 0
+            for bound, bucket in zip(histogram.buckets + ('+Inf',), counts):
+                cumulative += bucket
+                lines.append(f'{name}_bucket{_labels(("view", "le"), labels + (_number(bound),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(("view",), labels)} {_number(total)}')
+            lines.append(f'{name}_count{_labels(("view",), labels)} {count}')
+
+
+def _number(value):
+    return value if isinstance(value, str) else repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _shorten(sql, length=200):
+    sql = ' '.join(sql.split())
+    return sql if len(sql) <= length else sql[:length] + '…'
+
+
+registry = Registry()
+
+
+def view_name(request):
+    """Nom de l'URL résolue (cardinalité bornée par core/urls.py)"""
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None and match.view_name else UNRESOLVED
+
+
+class MetricsMiddleware:
+    """
+    Mesure chaque requête (à placer en tête de MIDDLEWARE)
+    Compatible WSGI et ASGI: aucune adaptation sync/async n'est imposée aux vues
+    Désactivable avec METRICS_ENABLED = False
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'METRICS_ENABLED', True)
+        self.slow_ms = getattr(settings, 'METRICS_SLOW_REQUEST_MS', None)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        stats = RequestStats()
+        # Copiée dans le contexte des threads de sync_to_async: l'ORM y est mesuré
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, time.perf_counter() - started, stats)
+        return response
+
+    def finish(self, request, response, duration, stats):
+        """Enregistre les mesures et journalise la requête si elle est lente"""
+        view = view_name(request)
+        registry.record(view, request.method, response.status_code, duration, stats)
+        if self.slow_ms is not None and duration * 1000 >= self.slow_ms:
+            self.log_slow(request, view, duration, stats)
+
+    @staticmethod
+    def log_slow(request, view, duration, stats):
+        """Journalise une requête lente avec ses requêtes SQL les plus coûteuses et répétées"""
+        details = [f"{elapsed * 1000:.1f} ms: {_shorten(sql, 500)}"
+                   for elapsed, sql in sorted(stats.slowest, reverse=True)]
+        details += [f"x{count}: {_shorten(sql, 500)}"
+                    for sql, count in sorted(stats.duplicates().items(), key=lambda item: -item[1])[:SLOW_SQL_KEPT]]
+        logger.warning(
+            "Requête lente %s %s (%s): %.0f ms, %d requêtes SQL (%.0f ms), templates %.0f ms\n%s",
+            request.method, request.path, view, duration * 1000, stats.queries, stats.sql_time * 1000,
+            stats.template_time * 1000, '\n'.join(details),
+        )
+
+
+class TimedTemplate(Template):
+    """Template qui ajoute son temps de rendu aux mesures de la requête en cours"""
+
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """Moteur DjangoTemplates dont les templates mesurent leur temps de rendu"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
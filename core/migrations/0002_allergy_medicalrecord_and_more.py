@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:37
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Allergy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('severity', models.CharField(choices=[('MILD', 'Léger'), ('MODERATE', 'Modéré'), ('SEVERE', 'Sévère'), ('LIFE_THREATENING', 'Menace vitale')], max_length=17)),
+                ('reaction', models.TextField()),
+                ('onset_date', models.DateField()),
+                ('active', models.BooleanField(default=True)),
+            ],
+            options={
+                'verbose_name': 'Allergie',
+                'verbose_name_plural': 'Allergies',
+            },
+        ),
+        migrations.CreateModel(
+            name='MedicalRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('record_type', models.CharField(choices=[('CONSULT', 'Consultation'), ('LAB', 'Résultat de laboratoire'), ('IMAGING', 'Imagerie médicale'), ('PRESCRIPTION', 'Ordonnance'), ('OTHER', 'Autre')], max_length=12)),
+                ('title', models.CharField(max_length=200)),
+                ('description', models.TextField()),
+                ('date', models.DateField(default=django.utils.timezone.now)),
+                ('file', models.FileField(blank=True, null=True, upload_to='medical_records/%Y/%m/%d/')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_emergency', models.BooleanField(default=False)),
+                ('confidential', models.BooleanField(default=False)),
+            ],
+            options={
+                'verbose_name': 'Dossier Médical',
+                'verbose_name_plural': 'Dossiers Médicaux',
+                'ordering': ['-date', '-created_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['PENDING', 'CONFIRMED'])), fields=('doctor', 'date_time'), name='unique_active_doctor_slot'),
+        ),
+        migrations.AddField(
+            model_name='allergy',
+            name='patient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allergies', to='core.patient'),
+        ),
+        migrations.CreateModel(
+            name='Prescription',
+            fields=[
+                ('medical_record', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='core.medicalrecord')),
+                ('medications', models.JSONField()),
+                ('instructions', models.TextField(blank=True)),
+                ('valid_until', models.DateField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='doctor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.doctor'),
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='patient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='medical_records', to='core.patient'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:40
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def seed_counters(apps, schema_editor):
+    """Initialise les totaux depuis les tables existantes (même calcul que counters.reconcile)"""
+    Appointment = apps.get_model('core', 'Appointment')
+    Doctor = apps.get_model('core', 'Doctor')
+    Patient = apps.get_model('core', 'Patient')
+    StatCounter = apps.get_model('core', 'StatCounter')
+    counts = {'doctors': Doctor.objects.count(), 'patients': Patient.objects.count(), 'appointments': 0}
+    for status, _ in Appointment._meta.get_field('status').choices:
+        counts[f'appointments.{status}'] = 0
+    for status, total in Appointment.objects.order_by().values_list('status').annotate(n=Count('id')):
+        counts[f'appointments.{status}'] = total
+        counts['appointments'] += total
+    StatCounter.objects.bulk_create([StatCounter(key=key, day=None, value=value) for key, value in counts.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_allergy_medicalrecord_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50)),
+                ('day', models.DateField(blank=True, null=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('key', 'day'), name='unique_daily_counter'), models.UniqueConstraint(condition=models.Q(('day__isnull', True)), fields=('key',), name='unique_total_counter')],
+            },
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
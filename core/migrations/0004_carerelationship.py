@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_care_relationships(apps, schema_editor):
+    """Crée les liens médecin-patient à partir de l'historique existant"""
+    Appointment = apps.get_model('core', 'Appointment')
+    MedicalRecord = apps.get_model('core', 'MedicalRecord')
+    CareRelationship = apps.get_model('core', 'CareRelationship')
+    pairs = set(Appointment.objects.values_list('doctor_id', 'patient_id').distinct())
+    pairs |= set(MedicalRecord.objects.filter(doctor__isnull=False)
+                 .values_list('doctor_id', 'patient_id').distinct())
+    CareRelationship.objects.bulk_create(
+        [CareRelationship(doctor_id=doctor_id, patient_id=patient_id) for doctor_id, patient_id in pairs],
+        batch_size=500, ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_statcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CareRelationship',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='care_relationships', to='core.doctor')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='care_relationships', to='core.patient')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='patients',
+            field=models.ManyToManyField(related_name='doctors', through='core.CareRelationship', to='core.patient'),
+        ),
+        migrations.AddConstraint(
+            model_name='carerelationship',
+            constraint=models.UniqueConstraint(fields=('doctor', 'patient'), name='unique_care_relationship'),
+        ),
+        migrations.RunPython(backfill_care_relationships, migrations.RunPython.noop),
+    ]
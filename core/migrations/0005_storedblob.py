@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:46
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_carerelationship'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('refcount', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='medicalrecord',
+            name='file',
+            field=models.FileField(blank=True, null=True, storage=core.storage.medical_record_storage, upload_to='medical_records/%Y/%m/%d/'),
+        ),
+    ]
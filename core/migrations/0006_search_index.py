@@ -0,0 +1,25 @@
+from django.db import migrations
+
+from core.search import SQLiteFTSBackend
+
+
+def create_fts_table(apps, schema_editor):
+    """Crée la table virtuelle FTS5 (SQLite uniquement)"""
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(SQLiteFTSBackend.create_sql())
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SQLiteFTSBackend.table}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_storedblob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
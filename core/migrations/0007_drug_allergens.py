@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Correspondances initiales (classes d'allergènes courantes, principes actifs et noms commerciaux)
+DRUG_ALLERGENS = {
+    'Pénicilline': ['Amoxicilline', 'Ampicilline', 'Augmentin', 'Benzylpénicilline', 'Phénoxyméthylpénicilline',
+                    'Oxacilline', 'Cloxacilline', 'Pipéracilline', 'Ticarcilline', 'Clamoxyl', 'Extencilline'],
+    'Céphalosporine': ['Céfalexine', 'Céfuroxime', 'Ceftriaxone', 'Céfixime', 'Céfotaxime', 'Cefpodoxime',
+                       'Rocéphine', 'Zinnat'],
+    'Sulfamides': ['Sulfaméthoxazole', 'Cotrimoxazole', 'Bactrim', 'Sulfadiazine', 'Sulfasalazine'],
+    'AINS': ['Ibuprofène', 'Kétoprofène', 'Naproxène', 'Diclofénac', 'Célécoxib', 'Aspirine',
+             'Acide acétylsalicylique', 'Advil', 'Nurofen', 'Voltarène', 'Profénid'],
+    'Aspirine': ['Acide acétylsalicylique', 'Kardégic', 'Aspégic', 'Ibuprofène', 'Kétoprofène', 'Naproxène',
+                 'Diclofénac'],
+    'Macrolides': ['Azithromycine', 'Clarithromycine', 'Érythromycine', 'Zithromax'],
+    'Quinolones': ['Ciprofloxacine', 'Lévofloxacine', 'Ofloxacine', 'Moxifloxacine'],
+    'Opiacés': ['Codéine', 'Morphine', 'Tramadol', 'Oxycodone', 'Fentanyl'],
+    'Codéine': ['Morphine', 'Dafalgan codéiné', 'Codoliprane'],
+    'Iode': ['Povidone iodée', 'Bétadine', 'Amiodarone', 'Produit de contraste iodé'],
+    'Paracétamol': ['Doliprane', 'Dafalgan', 'Efferalgan', 'Codoliprane'],
+    'Lactose': ['Lactose monohydraté'],
+    'Arachide': ["Huile d'arachide"],
+}
+
+
+def seed_drug_allergens(apps, schema_editor):
+    """Charge les correspondances initiales (table modifiable ensuite)"""
+    DrugAllergen = apps.get_model('core', 'DrugAllergen')
+    DrugAllergen.objects.bulk_create(
+        [DrugAllergen(allergen=allergen, substance=substance)
+         for allergen, substances in DRUG_ALLERGENS.items() for substance in substances],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DrugAllergen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('allergen', models.CharField(max_length=100)),
+                ('substance', models.CharField(max_length=100)),
+            ],
+            options={
+                'verbose_name': 'Allergène médicamenteux',
+                'verbose_name_plural': 'Allergènes médicamenteux',
+                'constraints': [models.UniqueConstraint(fields=('allergen', 'substance'), name='unique_drug_allergen')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PrescriptionAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('medication', models.CharField(max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('allergy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='core.allergy')),
+                ('prescription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='core.prescription')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('prescription', 'allergy', 'medication'), name='unique_prescription_alert')],
+            },
+        ),
+        migrations.RunPython(seed_drug_allergens, migrations.RunPython.noop),
+    ]
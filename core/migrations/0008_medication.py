@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_drug_allergens'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Medication',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True)),
+                ('ingredient', models.CharField(blank=True, max_length=200)),
+                ('form', models.CharField(blank=True, max_length=100)),
+            ],
+            options={
+                'verbose_name': 'Médicament',
+                'ordering': ['name'],
+            },
+        ),
+    ]
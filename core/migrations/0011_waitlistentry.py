@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_from', models.DateField()),
+                ('date_to', models.DateField()),
+                ('urgency', models.PositiveSmallIntegerField(choices=[(0, 'Normale'), (1, 'Prioritaire'), (2, 'Urgente')], default=0)),
+                ('appointment_type', models.CharField(choices=[('IN_PERSON', 'Présentiel'), ('REMOTE', 'Téléconsultation')], default='IN_PERSON', max_length=10)),
+                ('status', models.CharField(choices=[('WAITING', 'En attente'), ('BOOKED', 'Rendez-vous attribué'), ('WITHDRAWN', 'Retiré')], default='WAITING', max_length=10)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('appointment', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='waitlist_entry', to='core.appointment')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='core.doctor')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='core.patient')),
+            ],
+            options={
+                'verbose_name': "Inscription en liste d'attente",
+                'indexes': [models.Index(condition=models.Q(('status', 'WAITING')), fields=['doctor', '-urgency', 'created_at', 'id'], name='waitlist_queue')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'WAITING')), fields=('patient', 'doctor'), name='unique_waiting_patient')],
+            },
+        ),
+    ]
@@ -3,6 +3,8 @@ from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 
+from .storage import medical_record_storage
+
 
 # Modèle utilisateur personnalisé héritant de AbstractUser
 class User(AbstractUser):
@@ -28,6 +30,10 @@ class User(AbstractUser):
     class Meta:
         verbose_name = _('user')  # Nom singulier dans l'admin
         verbose_name_plural = _('users')  # Nom pluriel dans l'admin
+        indexes = [
+            # Annuaires des médecins et des patients, triés par nom et prénom (username: départage unique)
+            models.Index(fields=['last_name', 'first_name', 'username'], name='user_name'),
+        ]
 
 
 # Modèle pour les spécialités médicales
@@ -35,7 +41,7 @@ class Speciality(models.Model):
     """
     Représente une spécialité médicale (ex: Cardiologie, Pédiatrie)
     """
-    name = models.CharField(max_length=100)  # Nom de la spécialité
+    name = models.CharField(max_length=100, db_index=True)  # Nom de la spécialité (liste triée par nom)
     description = models.TextField(blank=True)  # Description détaillée
 
     def __str__(self):
@@ -55,6 +61,8 @@ class Doctor(models.Model):
     license_number = models.CharField(max_length=50)
     # Disponibilités stockées en JSON (ex: {"Lundi": ["09:00", "10:00"]})
     availability = models.JSONField(default=dict)
+    # Patients suivis, déduits des rendez-vous et dossiers médicaux (voir CareRelationship)
+    patients = models.ManyToManyField('Patient', through='CareRelationship', related_name='doctors')
 
     def __str__(self):
         return f"Dr. {self.user.get_full_name()}"  # Représentation textuelle
@@ -105,10 +113,10 @@ class Appointment(models.Model):
         ('REMOTE', 'Téléconsultation'),
     ]
 
-    # Patient associé au rendez-vous
-    patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
-    # Médecin associé au rendez-vous
-    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
+    # Patient associé au rendez-vous (index composite appointment_patient_date)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, db_index=False)
+    # Médecin associé au rendez-vous (index composite appointment_doctor_date)
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, db_index=False)
     # Date et heure du rendez-vous
     date_time = models.DateTimeField()
     # Statut actuel du rendez-vous
@@ -117,14 +125,65 @@ class Appointment(models.Model):
     appointment_type = models.CharField(max_length=10, choices=TYPE_CHOICES)
     # Notes supplémentaires (optionnelles)
     notes = models.TextField(blank=True)
+    # Envoi du rappel par email (voir reminders.py); vide tant qu'il n'est pas parti
+    reminder_sent_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Dernière modification (LAST-MODIFIED des flux iCalendar, voir agenda.py)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Statuts qui occupent effectivement le créneau du médecin
+    ACTIVE_STATUSES = ['PENDING', 'CONFIRMED']
 
     class Meta:
         ordering = ['date_time']  # Tri par défaut par date/heure
+        constraints = [
+            # Un seul rendez-vous actif par médecin et par horaire (garanti par la base)
+            models.UniqueConstraint(
+                fields=['doctor', 'date_time'],
+                condition=models.Q(status__in=['PENDING', 'CONFIRMED']),
+                name='unique_active_doctor_slot',
+            ),
+        ]
+        indexes = [
+            # Rendez-vous actifs en attente de rappel, par date (fenêtres lues par reminders.py)
+            models.Index(
+                fields=['date_time'],
+                condition=models.Q(status__in=['PENDING', 'CONFIRMED'], reminder_sent_at__isnull=True),
+                name='appointment_reminder_due',
+            ),
+            # Agenda du médecin et rendez-vous du patient, dans l'ordre chronologique
+            models.Index(fields=['doctor', 'date_time'], name='appointment_doctor_date'),
+            models.Index(fields=['patient', 'date_time'], name='appointment_patient_date'),
+            # Prochains rendez-vous actifs du patient (tableau de bord); côté médecin: unique_active_doctor_slot
+            models.Index(fields=['patient', 'date_time'], condition=models.Q(status__in=['PENDING', 'CONFIRMED']),
+                         name='appointment_patient_active'),
+        ]
 
     def __str__(self):
         return f"RDV {self.patient} avec {self.doctor} le {self.date_time}"
 
 
+# Modèle pour la relation de soins médecin-patient
+class CareRelationship(models.Model):
+    """
+    Lien entre un médecin et un patient qu'il suit
+    Créé automatiquement à partir des rendez-vous et des dossiers médicaux (signals.py)
+    Sert aux contrôles d'accès aux dossiers: une recherche indexée par (médecin, patient)
+    """
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='care_relationships')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='care_relationships')
+    # Date de création du lien
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # L'index unique sert aussi aux vérifications d'accès
+            models.UniqueConstraint(fields=['doctor', 'patient'], name='unique_care_relationship'),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor} suit {self.patient}"
+
+
 # Modèle pour les pharmacies
 class Pharmacy(models.Model):
     """
@@ -156,8 +215,8 @@ class MedicalRecord(models.Model):
         ('OTHER', 'Autre'),
     ]
 
-    # Patient associé au dossier
-    patient = models.ForeignKey('Patient', on_delete=models.CASCADE, related_name='medical_records')
+    # Patient associé au dossier (index composite medicalrecord_patient_date)
+    patient = models.ForeignKey('Patient', on_delete=models.CASCADE, related_name='medical_records', db_index=False)
     # Médecin associé (peut être null)
     doctor = models.ForeignKey('Doctor', on_delete=models.SET_NULL, null=True, blank=True)
     # Type de dossier médical
@@ -168,8 +227,9 @@ class MedicalRecord(models.Model):
     description = models.TextField()
     # Date du dossier (par défaut aujourd'hui)
     date = models.DateField(default=timezone.now)
-    # Fichier associé (scans, résultats, etc.)
-    file = models.FileField(upload_to='medical_records/%Y/%m/%d/', null=True, blank=True)
+    # Fichier associé (scans, résultats, etc.), dédupliqué par empreinte (voir storage.py)
+    file = models.FileField(upload_to='medical_records/%Y/%m/%d/', storage=medical_record_storage,
+                            null=True, blank=True)
     # Date de création (auto)
     created_at = models.DateTimeField(auto_now_add=True)
     # Date de mise à jour (auto)
@@ -183,11 +243,34 @@ class MedicalRecord(models.Model):
         ordering = ['-date', '-created_at']  # Tri par date décroissante
         verbose_name = 'Dossier Médical'
         verbose_name_plural = 'Dossiers Médicaux'
+        indexes = [
+            # Dossier d'un patient dans l'ordre de Meta.ordering (id: départage de la pagination)
+            models.Index(fields=['patient', '-date', '-created_at', '-id'], name='medicalrecord_patient_date'),
+        ]
 
     def __str__(self):
         return f"{self.get_record_type_display()} - {self.patient.user.get_full_name()} ({self.date})"
 
 
+# Modèle pour les fichiers stockés par empreinte
+class StoredBlob(models.Model):
+    """
+    Fichier unique du stockage adressé par contenu, partagé entre dossiers médicaux
+    refcount compte les dossiers qui le référencent; à zéro il est supprimé par gc_blobs
+    """
+    # Chemin relatif du blob dans le stockage (contient l'empreinte SHA-256)
+    name = models.CharField(max_length=255, unique=True)
+    # Taille en octets
+    size = models.BigIntegerField(default=0)
+    # Nombre de dossiers médicaux qui référencent ce fichier
+    refcount = models.IntegerField(default=0)
+    # Dernière modification du compteur
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} réf.)"
+
+
 # Modèle pour les ordonnances
 class Prescription(models.Model):
     """
@@ -237,4 +320,214 @@ class Allergy(models.Model):
         verbose_name_plural = 'Allergies'
 
     def __str__(self):
-        return f"{self.name} ({self.get_severity_display()})"
\ No newline at end of file
+        return f"{self.name} ({self.get_severity_display()})"
+
+
+class DrugAllergen(models.Model):
+    """
+    Correspondance allergène -> substance (médicament, principe actif, nom commercial ou excipient)
+    Compilée en mémoire par allergies.py: une allergie à l'allergène contre-indique la substance
+    """
+    # Allergène ou classe (ex: "Pénicilline", "AINS")
+    allergen = models.CharField(max_length=100)
+    # Substance concernée (ex: "Amoxicilline", "Augmentin")
+    substance = models.CharField(max_length=100)
+
+    class Meta:
+        verbose_name = 'Allergène médicamenteux'
+        verbose_name_plural = 'Allergènes médicamenteux'
+        constraints = [
+            models.UniqueConstraint(fields=['allergen', 'substance'], name='unique_drug_allergen'),
+        ]
+
+    def __str__(self):
+        return f"{self.allergen} -> {self.substance}"
+
+
+class PrescriptionAlert(models.Model):
+    """
+    Conflit entre une ordonnance en cours de validité et une allergie active du patient
+    Créée par le dépistage (allergies.py) à la saisie d'une allergie ou en lot (screen_prescriptions)
+    """
+    # Ordonnance concernée
+    prescription = models.ForeignKey(Prescription, on_delete=models.CASCADE, related_name='alerts')
+    # Allergie en conflit
+    allergy = models.ForeignKey(Allergy, on_delete=models.CASCADE, related_name='alerts')
+    # Nom du médicament contre-indiqué, tel que prescrit
+    medication = models.CharField(max_length=200)
+    # Date de détection
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['prescription', 'allergy', 'medication'], name='unique_prescription_alert'),
+        ]
+
+    def __str__(self):
+        return f"{self.medication} / {self.allergy}"
+
+
+class Medication(models.Model):
+    """
+    Entrée du catalogue des médicaments (autocomplétion et validation des ordonnances, voir medications.py)
+    Importé depuis un CSV: python manage.py import_data medications catalogue.csv
+    """
+    # Nom prescrit (ex: "Amoxicilline 500 mg")
+    name = models.CharField(max_length=200, unique=True)
+    # Substance active (ex: "Amoxicilline")
+    ingredient = models.CharField(max_length=200, blank=True)
+    # Forme (ex: "gélule", "sirop")
+    form = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        verbose_name = 'Médicament'
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class WaitlistEntry(models.Model):
+    """
+    Inscription d'un patient sur la liste d'attente d'un médecin (voir waitlist.py)
+    Un créneau libéré par une annulation est attribué au premier patient éligible
+    """
+    STATUS_CHOICES = [
+        ('WAITING', 'En attente'),
+        ('BOOKED', 'Rendez-vous attribué'),
+        ('WITHDRAWN', 'Retiré'),
+    ]
+
+    URGENCY_CHOICES = [
+        (0, 'Normale'),
+        (1, 'Prioritaire'),
+        (2, 'Urgente'),
+    ]
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='waitlist_entries')
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='waitlist_entries')
+    # Jours acceptés par le patient (bornes incluses)
+    date_from = models.DateField()
+    date_to = models.DateField()
+    # Les plus urgents d'abord, puis par ancienneté d'inscription
+    urgency = models.PositiveSmallIntegerField(choices=URGENCY_CHOICES, default=0)
+    appointment_type = models.CharField(max_length=10, choices=Appointment.TYPE_CHOICES, default='IN_PERSON')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='WAITING')
+    # Rendez-vous attribué depuis la liste d'attente
+    appointment = models.OneToOneField(Appointment, on_delete=models.SET_NULL, null=True, blank=True,
+                                       related_name='waitlist_entry')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Inscription en liste d'attente"
+        constraints = [
+            # Une seule inscription en attente par patient et par médecin
+            models.UniqueConstraint(fields=['patient', 'doctor'], condition=models.Q(status='WAITING'),
+                                    name='unique_waiting_patient'),
+        ]
+        indexes = [
+            # Liste d'attente d'un médecin, dans l'ordre d'attribution
+            models.Index(fields=['doctor', '-urgency', 'created_at', 'id'], condition=models.Q(status='WAITING'),
+                         name='waitlist_queue'),
+        ]
+
+    def __str__(self):
+        return f"{self.patient} en attente chez {self.doctor} ({self.date_from} - {self.date_to})"
+
+
+class CalendarFeed(models.Model):
+    """
+    Flux iCalendar de l'agenda d'un utilisateur (voir agenda.py), accessible sans session par son jeton
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='calendar_feed')
+    # Jeton secret de l'URL du flux (renouvelable)
+    token = models.CharField(max_length=64, unique=True)
+    # Dernière modification d'un rendez-vous de l'utilisateur (Last-Modified et ETag du flux)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Flux agenda'
+
+    def __str__(self):
+        return f"Agenda de {self.user}"
+
+
+class Job(models.Model):
+    """
+    Tâche de fond stockée en base (voir jobs.py), exécutée par la commande run_jobs
+    """
+    STATUS_CHOICES = [
+        ('QUEUED', 'En attente'),
+        ('RUNNING', 'En cours'),
+        ('DONE', 'Terminée'),
+        ('FAILED', 'Échouée'),
+    ]
+
+    # Nom de la tâche enregistrée (ex: "allergies.screen")
+    name = models.CharField(max_length=100)
+    # Arguments nommés de la tâche
+    payload = models.JSONField(default=dict, blank=True)
+    # Les plus prioritaires d'abord
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='QUEUED')
+    # Pas d'exécution avant cette date (tâches différées et nouvelles tentatives)
+    run_at = models.DateTimeField(default=timezone.now)
+    # Tentatives commencées, et nombre maximal avant abandon
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    # Jeton du lot qui a réservé la tâche, et date de réservation
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    # Valeur renvoyée (JSON) ou trace de la dernière erreur
+    result = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # File d'attente, dans l'ordre de réservation
+            models.Index(fields=['-priority', 'run_at', 'id'], condition=models.Q(status='QUEUED'),
+                         name='job_queue'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.get_status_display()})"
+
+
+# Modèle pour les compteurs statistiques matérialisés
+class StatCounter(models.Model):
+    """
+    Compteur maintenu par les signaux (voir counters.py)
+    day vide: valeur totale ; day renseigné: variation nette de ce jour
+    """
+    # Nom du compteur (ex: "doctors", "appointments.PENDING")
+    key = models.CharField(max_length=50)
+    # Jour concerné (null pour le total)
+    day = models.DateField(null=True, blank=True)
+    # Valeur du compteur
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'day'], name='unique_daily_counter'),
+            models.UniqueConstraint(fields=['key'], condition=models.Q(day__isnull=True),
+                                    name='unique_total_counter'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.day or 'total'}) = {self.value}"
+
+# Modèle pour les versions des index en mémoire
+class IndexVersion(models.Model):
+    """
+    Version d'un index compilé en mémoire par chaque processus (voir versions.py)
+    Incrémentée dans la transaction qui modifie les données de l'index
+    """
+    # Nom de l'index (ex: "medications", "slots")
+    name = models.CharField(max_length=50, unique=True)
+    # Numéro de version, croissant
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.value}"
@@ -0,0 +1,135 @@
+"""
+Pagination par curseur (keyset) pour les vues liste
+
+Au lieu d'un OFFSET qui relit toutes les lignes précédentes et se décale lors
+d'insertions, chaque page est lue avec « WHERE (clés de tri) > (dernière ligne) »
+sur un ordre total (un champ unique, en général la clé primaire, sert de
+départage). Le curseur de la page suivante encode les valeurs de tri de la
+dernière ligne affichée.
+
+Utilisé par les vues HTML (KeysetPaginationMixin) et par l'API (api.py).
+"""
+import base64
+import json
+from datetime import date, datetime
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from django.http import Http404
+
+
+def _json_value(value):
+    """Dates au format ISO complet (microsecondes comprises: le curseur doit rester exact)"""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Valeur de curseur non sérialisable: {value!r}")
+
+
+def encode_cursor(values):
+    """Encode les valeurs de tri en un curseur opaque pour l'URL"""
+    return base64.urlsafe_b64encode(json.dumps(values, default=_json_value).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Décode un curseur; lève ValueError s'il est invalide"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (TypeError, ValueError, UnicodeDecodeError) as exc:
+        raise ValueError(cursor) from exc
+    if not isinstance(values, list):
+        raise ValueError(cursor)
+    return values
+
+
+def after(fields, values):
+    """
+    Construit le filtre « strictement après » pour le tri fields ('-champ' pour un tri descendant):
+    (a > x) OU (a = x ET b > y) OU ...
+    La borne a >= x, redondante, permet à la base de démarrer la lecture de l'index au curseur
+    """
+    clauses = []
+    for i, field in enumerate(fields):
+        equal = {f.lstrip('-'): v for f, v in zip(fields[:i], values[:i])}
+        lookup = f'{field[1:]}__lt' if field.startswith('-') else f'{field}__gt'
+        clauses.append(Q(**equal, **{lookup: values[i]}))
+    first = fields[0]
+    bound = Q(**{f'{first[1:]}__lte' if first.startswith('-') else f'{first}__gte': values[0]})
+    return bound & reduce(or_, clauses)
+
+
+def cursor_value(obj, field):
+    """Lit la valeur d'un champ de tri (éventuellement à travers des relations)"""
+    for part in field.lstrip('-').split('__'):
+        obj = getattr(obj, part)
+    return obj
+
+
+def keyset_page(queryset, fields, cursor, page_size):
+    """
+    Lit une page après le curseur (None pour la première page)
+    Renvoie (lignes, curseur de la page suivante ou None); lève ValueError si le curseur est invalide
+    """
+    fields = list(fields)
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(fields):
+            raise ValueError(cursor)
+        queryset = queryset.filter(after(fields, values))
+
+    # Une ligne de plus pour savoir s'il existe une page suivante
+    rows = list(queryset.order_by(*fields)[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor([cursor_value(last, field) for field in fields])
+    return rows, next_cursor
+
+
+class KeysetPage:
+    """Page de résultats, exposée au template sous le nom page_obj"""
+
+    def __init__(self, object_list, cursor, next_cursor):
+        self.object_list = object_list
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginationMixin:
+    """
+    Remplace la pagination par numéro de page de ListView
+    keyset_ordering doit définir un ordre total (terminer par 'pk')
+    """
+    keyset_ordering = ('pk',)
+    paginate_by = 25
+    cursor_kwarg = 'cursor'
+
+    def get_ordering(self):
+        return self.keyset_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        """Renvoie (paginator, page, object_list, is_paginated) comme ListView l'attend"""
+        cursor = self.request.GET.get(self.cursor_kwarg) or None
+        try:
+            rows, next_cursor = keyset_page(queryset, self.keyset_ordering, cursor, page_size)
+        except ValueError:
+            raise Http404("Curseur de pagination invalide")
+        page = KeysetPage(rows, cursor, next_cursor)
+        return None, page, rows, page.has_other_pages()
@@ -1,16 +1,35 @@
 from rest_framework.permissions import BasePermission
 
+from .access import care_access
+
+
+def patient_id_of(obj):
+    """Patient concerné par un objet (rendez-vous, dossier médical ou ordonnance)"""
+    if hasattr(obj, 'patient_id'):
+        return obj.patient_id
+    return obj.medical_record.patient_id
+
 
 class IsDoctorOrAdmin(BasePermission):
     def has_permission(self, request, view):
         return request.user.role in ['DOCTOR', 'ADMIN']
 
 
+class IsAdminRole(BasePermission):
+    def has_permission(self, request, view):
+        return request.user.role == 'ADMIN'
+
+
 class IsPatientOwner(BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj.patient.user == request.user
+        if request.user.role != 'PATIENT':
+            return False
+        # Compare les identifiants: pas de chargement du patient de l'objet
+        profile = getattr(request.user, 'patient_profile', None)
+        return profile is not None and patient_id_of(obj) == profile.pk
 
 
 class IsDoctorForPatient(BasePermission):
     def has_object_permission(self, request, view, obj):
-        return request.user.doctor_profile.patients.filter(id=obj.patient.id).exists()
\ No newline at end of file
+        # EXISTS indexé sur CareRelationship, mémorisé pour la durée de la requête
+        return request.user.role == 'DOCTOR' and care_access(request).can_view_patient(patient_id_of(obj))
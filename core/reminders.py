@@ -0,0 +1,164 @@
+"""
+Rappels de rendez-vous par email
+
+Le travailleur (commande send_reminders) garde en mémoire un tas des rappels
+ordonnés par échéance (rendez-vous - REMINDER_HOURS_BEFORE) et ne lit la base
+que par fenêtres, sur l'index partiel des rendez-vous actifs sans rappel :
+- toutes les `refresh`, les rendez-vous dont le rappel tombe dans les
+  prochaines `horizon` (changements d'horaire et annulations compris) ;
+- entre deux, toutes les `poll`, seulement les rendez-vous créés depuis la
+  dernière lecture (clé primaire supérieure à la dernière vue).
+Entre deux lectures, il dort jusqu'à la prochaine échéance.
+
+Les rappels dus sont réservés par lot en une requête UPDATE (reminder_sent_at
+encore vide -> horodatage du lot), puis envoyés sur une seule connexion du
+backend email. Un rappel réservé n'est plus jamais relu : un redémarrage ne
+renvoie rien (un arrêt brutal pendant l'envoi perd au pire les rappels du lot
+en cours, sans doublon). Si l'envoi échoue, la réservation des rappels non
+partis est annulée et ils sont réessayés plus tard.
+"""
+import heapq
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from .models import Appointment
+
+logger = logging.getLogger(__name__)
+
+REMINDER_HOURS_BEFORE = getattr(settings, 'REMINDER_HOURS_BEFORE', 24)
+# Délai avant de réessayer un lot dont l'envoi a échoué
+RETRY_DELAY = timedelta(minutes=5)
+
+
+def reminder_message(appointment):
+    """Email de rappel (patient, médecin et utilisateurs chargés par select_related)"""
+    when = timezone.localtime(appointment.date_time)
+    doctor = appointment.doctor.user.get_full_name() or appointment.doctor.user.username
+    body = (
+        f"Bonjour {appointment.patient.user.get_full_name()},\n\n"
+        f"Nous vous rappelons votre rendez-vous ({appointment.get_appointment_type_display().lower()}) "
+        f"avec le Dr {doctor} le {when:%d/%m/%Y} à {when:%H:%M}.\n"
+        f"En cas d'empêchement, merci d'annuler le rendez-vous pour libérer le créneau.\n"
+    )
+    return EmailMessage(f"Rappel: rendez-vous le {when:%d/%m/%Y} à {when:%H:%M}", body,
+                        to=[appointment.patient.user.email])
+
+
+class ReminderScheduler:
+    """
+    Tas des rappels à venir et lectures par fenêtres
+    Toutes les méthodes reçoivent l'heure courante (now) pour être testables
+    """
+
+    def __init__(self, hours_before=REMINDER_HOURS_BEFORE, horizon=timedelta(hours=6),
+                 refresh=timedelta(minutes=15), poll=timedelta(minutes=1), batch_size=500):
+        self.lead = timedelta(hours=hours_before)
+        self.horizon = horizon
+        self.refresh_every = refresh
+        self.poll_every = poll
+        self.batch_size = batch_size
+        # (échéance, pk, date du rendez-vous); les entrées dont la date a changé sont ignorées au dépilage
+        self._heap = []
+        self._scheduled = {}
+        self.last_pk = 0
+        self.loaded_until = None
+        self.next_refresh = None
+        self.next_poll = None
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    @staticmethod
+    def pending():
+        return Appointment.objects.filter(status__in=Appointment.ACTIVE_STATUSES, reminder_sent_at__isnull=True)
+
+    def push(self, pk, date_time, due=None):
+        if self._scheduled.get(pk) == date_time and due is None:
+            return
+        self._scheduled[pk] = date_time
+        heapq.heappush(self._heap, (due or date_time - self.lead, pk, date_time))
+
+    def refresh(self, now):
+        """Recharge toute la fenêtre: rendez-vous dont le rappel est dû avant now + horizon"""
+        # Lu avant la fenêtre: un rendez-vous créé entre les deux requêtes sera vu par poll()
+        self.last_pk = Appointment.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        self.loaded_until = now + self.lead + self.horizon
+        window = self.pending().filter(date_time__gt=now, date_time__lte=self.loaded_until)
+        for pk, date_time in window.values_list('pk', 'date_time').iterator(chunk_size=self.batch_size):
+            self.push(pk, date_time)
+        self.next_refresh = now + self.refresh_every
+        self.next_poll = now + self.poll_every
+
+    def poll(self, now):
+        """Ajoute les rendez-vous créés depuis la dernière lecture (parcours de l'index de la clé primaire)"""
+        new = Appointment.objects.filter(pk__gt=self.last_pk).values_list('pk', 'date_time', 'status')
+        for pk, date_time, status in new.iterator(chunk_size=self.batch_size):
+            self.last_pk = max(self.last_pk, pk)
+            if status in Appointment.ACTIVE_STATUSES and now < date_time <= self.loaded_until:
+                self.push(pk, date_time)
+        self.next_poll = now + self.poll_every
+
+    def pop_due(self, now):
+        """Dépile jusqu'à batch_size rappels dus"""
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            _, pk, date_time = heapq.heappop(self._heap)
+            if self._scheduled.get(pk) == date_time:
+                del self._scheduled[pk]
+                due.append(pk)
+        return due
+
+    def send(self, pks, now):
+        """Réserve puis envoie un lot de rappels; renvoie le nombre d'emails envoyés"""
+        claim = timezone.now()
+        # Toujours actifs, sans rappel et dus à leur date actuelle (un rendez-vous déplacé plus tard attend)
+        claimed = self.pending().filter(pk__in=pks, date_time__gt=now, date_time__lte=now + self.lead)
+        if not claimed.update(reminder_sent_at=claim):
+            return 0
+        appointments = list(Appointment.objects.filter(pk__in=pks, reminder_sent_at=claim)
+                            .select_related('patient__user', 'doctor__user'))
+        # Patient sans adresse: le rappel est considéré comme traité
+        mails = [(appointment, reminder_message(appointment)) for appointment in appointments
+                 if appointment.patient.user.email]
+        delivered = 0
+        try:
+            # Une seule connexion au serveur pour tout le lot
+            with get_connection() as connection:
+                for _, message in mails:
+                    connection.send_messages([message])
+                    delivered += 1
+        except Exception:
+            failed = [appointment for appointment, _ in mails[delivered:]]
+            logger.exception("Échec de l'envoi de %d rappel(s), nouvel essai dans %s", len(failed), RETRY_DELAY)
+            Appointment.objects.filter(pk__in=[appointment.pk for appointment in failed]).update(
+                reminder_sent_at=None)
+            for appointment in failed:
+                self.push(appointment.pk, appointment.date_time, due=now + RETRY_DELAY)
+        return delivered
+
+    def tick(self, now):
+        """Lectures échues puis envoi de tous les rappels dus; renvoie le nombre d'emails envoyés"""
+        if self.next_refresh is None or now >= self.next_refresh:
+            self.refresh(now)
+        elif now >= self.next_poll:
+            self.poll(now)
+        sent = 0
+        while True:
+            pks = self.pop_due(now)
+            if not pks:
+                return sent
+            sent += self.send(pks, now)
+
+    def next_wakeup(self):
+        """Prochain instant où tick() a quelque chose à faire"""
+        wakeup = min(self.next_refresh, self.next_poll)
+        # Les entrées périmées en tête du tas ne doivent pas réveiller le travailleur
+        while self._heap and self._scheduled.get(self._heap[0][1]) != self._heap[0][2]:
+            heapq.heappop(self._heap)
+        if self._heap:
+            wakeup = min(wakeup, self._heap[0][0])
+        return wakeup
@@ -0,0 +1,214 @@
+"""
+Lectures sur des réplicas, écritures sur la base principale
+
+ReplicaRouter (DATABASE_ROUTERS) envoie toutes les écritures sur 'default'.
+Les lectures ne partent vers un réplica (alias de DATABASE_REPLICAS) que pendant
+une requête HTTP GET/HEAD, choisi par ReplicaRoutingMiddleware pour toute la
+requête (le même pour toute une session) : commandes, tâches de fond et
+formulaires POST lisent la base principale, comme les lectures faites dans une
+transaction.
+
+Lecture de ses propres écritures : dès qu'une requête écrit, ses lectures
+suivantes passent sur la base principale et la réponse pose un cookie qui y
+maintient l'utilisateur pendant REPLICA_STICKY_SECONDS, le temps que les
+réplicas rattrapent leur retard (un rendez-vous qui vient d'être pris apparaît
+tout de suite). Les sessions sont toujours lues sur la base principale.
+
+Une vue peut imposer sa base : décorateurs use_primary / use_replica, ou
+attribut db_routing ('primary' ou 'replica') d'une vue classe. Le bloc
+`with primary():` force la base principale pour une portion de code.
+
+En local, les réplicas peuvent être de simples copies SQLite de la base
+principale, rafraîchies par la commande sync_replicas (voir settings.py).
+"""
+import random
+import sqlite3
+import time
+import zlib
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Cookie de la fenêtre de lecture sur la base principale (valeur: fin de la fenêtre, timestamp)
+STICKY_COOKIE = 'db_primary_until'
+STICKY_SECONDS = getattr(settings, 'REPLICA_STICKY_SECONDS', 15)
+
+# Applications toujours lues sur la base principale: une connexion doit être valable dès la requête suivante
+PRIMARY_APPS = {'sessions'}
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+_current = ContextVar('replica_routing', default=None)
+
+
+class Routing:
+    """Routage de la requête en cours: réplica des lectures (None: base principale)"""
+    __slots__ = ('replica', 'sticky', 'wrote')
+
+    def __init__(self, replica, sticky):
+        self.replica = replica
+        self.sticky = sticky
+        self.wrote = False
+
+
+def replicas():
+    """Alias des réplicas configurés (lu à chaque appel: modifiable par override_settings)"""
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def is_sticky(request):
+    """L'utilisateur a écrit récemment (cookie encore valable)"""
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def choose(request, aliases):
+    """
+    Réplica de la requête: toujours le même pour une session (lectures monotones: un utilisateur ne
+    passe pas d'un réplica à jour à un réplica en retard), au hasard pour les visiteurs anonymes
+    """
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if session_key:
+        return aliases[zlib.crc32(session_key.encode()) % len(aliases)]
+    return random.choice(aliases)
+
+
+def copy_primary(alias):
+    """Copie la base principale SQLite dans le réplica (API de sauvegarde: copie cohérente, base en service)"""
+    source, target = connections[DEFAULT_DB_ALIAS], connections[alias]
+    if source.vendor != 'sqlite' or target.vendor != 'sqlite':
+        raise ValueError(f"Copie possible entre bases SQLite uniquement ({alias})")
+    source.ensure_connection()
+    # Les connexions ouvertes sur l'ancienne copie la reliraient depuis leur cache
+    target.close()
+    with closing(sqlite3.connect(target.settings_dict['NAME'])) as destination:
+        source.connection.backup(destination)
+
+
+@contextmanager
+def primary():
+    """Bloc dont les lectures se font sur la base principale"""
+    state = _current.get()
+    if state is None:
+        yield
+        return
+    replica, state.replica = state.replica, None
+    try:
+        yield
+    finally:
+        # Une écriture faite dans le bloc garde la suite de la requête sur la base principale
+        if not state.wrote:
+            state.replica = replica
+
+
+def use_primary(view):
+    """Décorateur: toutes les lectures de la vue se font sur la base principale"""
+    view.db_routing = 'primary'
+    return view
+
+
+def use_replica(view):
+    """Décorateur: la vue lit un réplica quelle que soit la méthode HTTP (hors fenêtre de stickiness)"""
+    view.db_routing = 'replica'
+    return view
+
+
+class ReplicaRouter:
+    """Routeur de bases: écritures sur 'default', lectures des requêtes GET/HEAD sur un réplica"""
+
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if state is None:
+            # Hors requête HTTP: comportement par défaut de Django
+            return None
+        if state.replica is None or model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Transaction en cours: ses lectures doivent voir ses propres écritures
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None:
+            state.replica = None
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Les réplicas sont des copies de la base principale: jamais migrés directement
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Choisit la base des lectures de chaque requête et pose le cookie de stickiness après une écriture
+    À placer avant SessionMiddleware: l'enregistrement de la session compte comme une écriture
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = self.routing(request)
+        token = _current.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        state = self.routing(request)
+        # Objet partagé avec les threads de sync_to_async: les écritures de l'ORM y sont vues
+        token = _current.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(state, response)
+
+    def routing(self, request):
+        aliases = replicas()
+        sticky = bool(aliases) and is_sticky(request)
+        replica = choose(request, aliases) if aliases and not sticky and request.method in SAFE_METHODS else None
+        return Routing(replica, sticky)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _current.get()
+        if state is None or state.wrote:
+            return None
+        # Vue fonction (décorateurs), vue classe Django (view_class) ou viewset DRF (cls)
+        view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+        routing = getattr(view_func, 'db_routing', None) or getattr(view_class, 'db_routing', None)
+        if routing == 'primary':
+            state.replica = None
+        elif routing == 'replica' and state.replica is None and not state.sticky and replicas():
+            state.replica = choose(request, replicas())
+        return None
+
+    def finish(self, state, response):
+        if state.wrote and replicas():
+            response.set_cookie(STICKY_COOKIE, f'{time.time() + STICKY_SECONDS:.0f}', max_age=STICKY_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
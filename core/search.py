@@ -0,0 +1,260 @@
+"""
+Recherche plein texte dans l'historique des patients
+
+Les dossiers médicaux, ordonnances et allergies sont indexés au fil des
+enregistrements (signals.py) dans un index plein texte. Le moteur est choisi
+par le réglage SEARCH_BACKEND :
+- SQLiteFTSBackend: table virtuelle FTS5, classement BM25 et surlignage
+- IcontainsBackend: repli par icontains pour les autres bases
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+
+RECORD, PRESCRIPTION, ALLERGY = 'record', 'prescription', 'allergy'
+KIND_CODES = {RECORD: 1, PRESCRIPTION: 2, ALLERGY: 3}
+
+# Marqueurs de surlignage (remplacés par <mark> après échappement HTML)
+MARK_START, MARK_END = '\x02', '\x03'
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Au-delà, le filtrage par patient se fait hors de l'expression FTS (sous-requête)
+MAX_PATIENT_TOKENS = 500
+
+
+@dataclass
+class SearchHit:
+    """Résultat de recherche"""
+    kind: str
+    object_id: int
+    patient_id: int
+    title: str
+    snippet: str
+    rank: float
+
+
+@dataclass
+class SearchDocument:
+    """Document à indexer"""
+    kind: str
+    object_id: int
+    patient_id: int
+    title: str
+    body: str
+
+
+def _flatten(value):
+    """Concatène les chaînes contenues dans une structure JSON"""
+    if isinstance(value, dict):
+        return ' '.join(_flatten(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return ' '.join(_flatten(v) for v in value)
+    return '' if value is None else str(value)
+
+
+def record_document(record):
+    return SearchDocument(RECORD, record.pk, record.patient_id, record.title,
+                          f"{record.get_record_type_display()} {record.description}")
+
+
+def prescription_document(prescription):
+    medications = prescription.medications
+    names = [m.get('name', '') for m in medications if isinstance(m, dict)] if isinstance(medications, list) else []
+    return SearchDocument(PRESCRIPTION, prescription.pk, prescription.medical_record.patient_id,
+                          f"Ordonnance - {', '.join(filter(None, names))}",
+                          f"{_flatten(medications)} {prescription.instructions}")
+
+
+def allergy_document(allergy):
+    return SearchDocument(ALLERGY, allergy.pk, allergy.patient_id, allergy.name,
+                          f"{allergy.get_severity_display()} {allergy.reaction}")
+
+
+def highlight(text):
+    """Échappe le texte et transforme les marqueurs de surlignage en <mark>"""
+    return escape(text).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+class SearchBackend:
+    """Interface commune des moteurs de recherche"""
+
+    def index(self, document):
+        raise NotImplementedError
+
+    def remove(self, kind, object_id):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def search(self, query, patient_ids=None, doctor_id=None, limit=20):
+        """
+        Recherche `query` dans les documents des patients autorisés:
+        patient_ids (liste) ou patients suivis par doctor_id
+        """
+        raise NotImplementedError
+
+    def index_many(self, documents):
+        for document in documents:
+            self.index(document)
+
+    def optimize(self):
+        """Compacte l'index si le moteur le permet"""
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """Index FTS5 stocké dans la base SQLite de l'application"""
+    table = 'core_search_fts'
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    def cursor(self):
+        return connections[self.using].cursor()
+
+    @staticmethod
+    def rowid(kind, object_id):
+        """Identifiant de ligne unique par (type, objet)"""
+        return object_id * 4 + KIND_CODES[kind]
+
+    @classmethod
+    def create_sql(cls):
+        # patient_tag ("p<id>") est indexé: le filtre par patient se résout dans l'index FTS
+        return (f"CREATE VIRTUAL TABLE IF NOT EXISTS {cls.table} USING fts5("
+                "kind UNINDEXED, object_id UNINDEXED, patient_id UNINDEXED, patient_tag, title, body, "
+                "tokenize = 'unicode61 remove_diacritics 2')")
+
+    @staticmethod
+    def match_expression(query, patient_ids=None):
+        """
+        Transforme une saisie libre en requête FTS5 sûre
+        restreinte, si fournis, aux patients donnés
+        """
+        words = WORD_RE.findall(query)
+        if not words:
+            return ''
+        # Seul le dernier mot (en cours de saisie) est cherché par préfixe
+        terms = ' '.join([f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*'])
+        expression = f'{{title body}} : ({terms})'
+        if patient_ids is not None:
+            tags = ' OR '.join(f'p{int(pk)}' for pk in patient_ids)
+            expression = f'patient_tag : ({tags}) AND {expression}'
+        return expression
+
+    def index(self, document):
+        self.index_many([document])
+
+    def index_many(self, documents):
+        rows = [(self.rowid(d.kind, d.object_id), d.kind, d.object_id, d.patient_id, f'p{d.patient_id}',
+                 d.title, d.body)
+                for d in documents]
+        with self.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [(row[0],) for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, kind, object_id, patient_id, patient_tag, title, body) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s)", rows,
+            )
+
+    def remove(self, kind, object_id):
+        with self.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [self.rowid(kind, object_id)])
+
+    def clear(self):
+        with self.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def optimize(self):
+        """Fusionne les segments de l'index (après un chargement en masse)"""
+        with self.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+
+    def search(self, query, patient_ids=None, doctor_id=None, limit=20):
+        if patient_ids is None and doctor_id is None:
+            return []
+        scope, scope_params = '', []
+        if doctor_id is not None:
+            from .models import CareRelationship
+
+            patient_ids = list(CareRelationship.objects.filter(doctor_id=doctor_id)
+                               .values_list('patient_id', flat=True)[:MAX_PATIENT_TOKENS + 1])
+            if len(patient_ids) > MAX_PATIENT_TOKENS:
+                # Trop de patients pour l'expression FTS: filtrage par sous-requête
+                patient_ids = None
+                scope = (f" AND patient_id IN (SELECT patient_id FROM {CareRelationship._meta.db_table}"
+                         " WHERE doctor_id = %s)")
+                scope_params = [doctor_id]
+        if patient_ids is not None:
+            patient_ids = list(patient_ids)
+            if not patient_ids:
+                return []
+        expression = self.match_expression(query, patient_ids)
+        if not expression:
+            return []
+        params = [MARK_START, MARK_END, MARK_START, MARK_END, expression, *scope_params, limit]
+        sql = (
+            f"SELECT kind, object_id, patient_id, "
+            f"highlight({self.table}, 4, %s, %s), "
+            f"snippet({self.table}, 5, %s, %s, '…', 16), "
+            f"bm25({self.table}, 0, 0, 0, 0, 5.0, 1.0) AS rank "
+            f"FROM {self.table} WHERE {self.table} MATCH %s{scope} "
+            f"ORDER BY rank LIMIT %s"
+        )
+        with self.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        return [SearchHit(kind, int(object_id), int(patient_id), highlight(title), highlight(snippet), rank)
+                for kind, object_id, patient_id, title, snippet, rank in rows]
+
+
+class IcontainsBackend(SearchBackend):
+    """
+    Moteur de repli sans index: requêtes icontains sur les tables sources
+    À réserver aux petites bases ou aux moteurs sans FTS
+    """
+
+    def index(self, document):
+        pass
+
+    def remove(self, kind, object_id):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, query, patient_ids=None, doctor_id=None, limit=20):
+        from .models import Allergy, MedicalRecord, Prescription
+
+        words = WORD_RE.findall(query)
+        if not words or (patient_ids is None and doctor_id is None):
+            return []
+        scope = Q(patient_id__in=patient_ids) if doctor_id is None else Q(patient__doctors=doctor_id)
+        record_q, allergy_q = Q(), Q()
+        for word in words:
+            record_q &= Q(title__icontains=word) | Q(description__icontains=word)
+            allergy_q &= Q(name__icontains=word) | Q(reaction__icontains=word)
+        prescription_scope = (Q(medical_record__patient_id__in=patient_ids) if doctor_id is None
+                              else Q(medical_record__patient__doctors=doctor_id))
+        prescription_q = Q()
+        for word in words:
+            prescription_q &= Q(medications__icontains=word) | Q(instructions__icontains=word)
+
+        documents = [record_document(r) for r in MedicalRecord.objects.filter(scope, record_q)[:limit]]
+        documents += [prescription_document(p) for p in Prescription.objects.select_related('medical_record')
+                      .filter(prescription_scope, prescription_q)[:limit]]
+        documents += [allergy_document(a) for a in Allergy.objects.filter(scope, allergy_q)[:limit]]
+        return [SearchHit(d.kind, d.object_id, d.patient_id, escape(d.title), escape(d.body[:200]), 0.0)
+                for d in documents[:limit]]
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    """Instancie le moteur configuré par SEARCH_BACKEND"""
+    path = getattr(settings, 'SEARCH_BACKEND', 'core.search.SQLiteFTSBackend')
+    return import_string(path)()
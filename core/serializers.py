@@ -0,0 +1,95 @@
+"""
+Sérialiseurs de l'API JSON (voir api.py)
+
+Les noms affichés (médecin, patient) sont lus à travers les relations chargées
+par select_related dans les vues : aucune requête supplémentaire par objet.
+"""
+from django.urls import reverse
+from rest_framework import serializers
+
+from .models import Appointment, Doctor, MedicalRecord, Prescription
+
+
+class SparseFieldsSerializer(serializers.ModelSerializer):
+    """
+    Ne renvoie que les champs demandés par ?fields=a,b,c (tous par défaut)
+    Un nom de champ inconnu est une erreur 400 plutôt qu'une réponse silencieusement incomplète
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        fields = request.query_params.get('fields') if request is not None else None
+        if not fields:
+            return
+        wanted = {name.strip() for name in fields.split(',') if name.strip()}
+        if not wanted:
+            # ?fields=, ne doit pas renvoyer des objets vides
+            raise serializers.ValidationError({'fields': "Au moins un nom de champ requis"})
+        unknown = wanted - set(self.fields)
+        if unknown:
+            raise serializers.ValidationError({'fields': f"Champs inconnus: {', '.join(sorted(unknown))}"})
+        for name in set(self.fields) - wanted:
+            self.fields.pop(name)
+
+
+class DoctorSerializer(SparseFieldsSerializer):
+    """Fiche publique d'un médecin (mêmes informations que l'annuaire HTML)"""
+    first_name = serializers.CharField(source='user.first_name')
+    last_name = serializers.CharField(source='user.last_name')
+    phone = serializers.CharField(source='user.phone')
+    address = serializers.CharField(source='user.address')
+    speciality = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Doctor
+        fields = ['id', 'first_name', 'last_name', 'speciality', 'phone', 'address', 'availability']
+
+    def get_speciality(self, doctor):
+        return doctor.speciality.name if doctor.speciality else None
+
+
+class AppointmentSerializer(SparseFieldsSerializer):
+    patient_name = serializers.CharField(source='patient.user.get_full_name')
+    doctor_name = serializers.CharField(source='doctor.user.get_full_name')
+
+    class Meta:
+        model = Appointment
+        fields = ['id', 'patient', 'patient_name', 'doctor', 'doctor_name', 'date_time', 'status',
+                  'appointment_type', 'notes']
+
+
+class MedicalRecordSerializer(SparseFieldsSerializer):
+    doctor_name = serializers.SerializerMethodField()
+    file = serializers.SerializerMethodField()
+    has_prescription = serializers.SerializerMethodField()
+
+    class Meta:
+        model = MedicalRecord
+        fields = ['id', 'patient', 'doctor', 'doctor_name', 'record_type', 'title', 'description', 'date',
+                  'is_emergency', 'confidential', 'file', 'has_prescription', 'created_at', 'updated_at']
+
+    def get_doctor_name(self, record):
+        return record.doctor.user.get_full_name() if record.doctor_id else None
+
+    def get_file(self, record):
+        """URL de téléchargement contrôlée (pas le chemin de stockage)"""
+        if not record.file:
+            return None
+        return self.context['request'].build_absolute_uri(reverse('medical_record_file', args=[record.pk]))
+
+    def get_has_prescription(self, record):
+        return hasattr(record, 'prescription')
+
+
+class PrescriptionSerializer(SparseFieldsSerializer):
+    patient = serializers.IntegerField(source='medical_record.patient_id')
+    doctor_name = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Prescription
+        fields = ['medical_record', 'patient', 'doctor_name', 'medications', 'instructions', 'valid_until']
+
+    def get_doctor_name(self, prescription):
+        doctor = prescription.medical_record.doctor
+        return doctor.user.get_full_name() if doctor else None
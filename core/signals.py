@@ -0,0 +1,242 @@
+"""
+Récepteurs de signaux de l'application core
+Maintiennent à jour les index en mémoire et les compteurs lorsque les modèles changent
+"""
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import agenda, counters, directory, jobs, search, waitlist
+from .allergies import allergen_index, screen
+from .access import link_doctor_patient
+from .geo import pharmacy_index
+from .medications import medication_catalogue
+from .metrics import install_query_recorder
+from .models import (Allergy, Appointment, Doctor, DrugAllergen, MedicalRecord, Medication, Patient, Pharmacy,
+                     Prescription, PrescriptionAlert, Speciality, User)
+from .slots import slot_index
+from .storage import add_reference, release_reference
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """Mesure les requêtes SQL de chaque connexion ouverte (voir metrics.py)"""
+    install_query_recorder(connection)
+
+
+@receiver(post_save, sender=Doctor)
+def refresh_doctor_slots(sender, instance, **kwargs):
+    """Recompile les disponibilités du médecin modifié; les autres processus videront leur index"""
+    slot_index.update(instance.pk, instance.availability)
+    slot_index.shared.bump()
+
+
+@receiver(post_delete, sender=Doctor)
+def drop_doctor_slots(sender, instance, **kwargs):
+    """Retire le médecin supprimé de l'index des créneaux"""
+    slot_index.discard(instance.pk)
+    slot_index.shared.bump()
+
+
+@receiver(post_save, sender=Doctor)
+def count_new_doctor(sender, instance, created, **kwargs):
+    """Incrémente le compteur de médecins"""
+    if created:
+        counters.increment(counters.DOCTORS)
+
+
+@receiver(post_delete, sender=Doctor)
+def count_deleted_doctor(sender, instance, **kwargs):
+    """Décrémente le compteur de médecins"""
+    counters.increment(counters.DOCTORS, -1)
+
+
+@receiver([post_save, post_delete], sender=Doctor)
+def invalidate_doctor_directory(sender, instance, **kwargs):
+    """Invalide la fiche du médecin (disponibilités comprises) et la liste de l'annuaire"""
+    directory.bump(directory.doctor_version_name(instance.pk), directory.LIST)
+
+
+@receiver(post_save, sender=User)
+def invalidate_doctor_user(sender, instance, update_fields=None, **kwargs):
+    """Nom, téléphone, adresse... d'un médecin: invalide sa fiche et la liste"""
+    # La mise à jour de last_login à chaque connexion ne change pas l'annuaire
+    if instance.role != 'DOCTOR' or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    for pk in Doctor.objects.filter(user_id=instance.pk).values_list('pk', flat=True):
+        directory.bump(directory.doctor_version_name(pk), directory.LIST)
+
+
+@receiver([post_save, post_delete], sender=Speciality)
+def invalidate_speciality_directory(sender, instance, **kwargs):
+    """Invalide la spécialité (partagée par toutes les fiches concernées) et la liste"""
+    directory.bump(directory.speciality_version_name(instance.pk), directory.LIST)
+
+
+@receiver(post_save, sender=Patient)
+def count_new_patient(sender, instance, created, **kwargs):
+    """Incrémente le compteur de patients"""
+    if created:
+        counters.increment(counters.PATIENTS)
+
+
+@receiver(post_delete, sender=Patient)
+def count_deleted_patient(sender, instance, **kwargs):
+    """Décrémente le compteur de patients"""
+    counters.increment(counters.PATIENTS, -1)
+
+
+@receiver(post_init, sender=Appointment)
+def remember_appointment_status(sender, instance, **kwargs):
+    """Mémorise le statut chargé pour détecter les changements de statut"""
+    # Évite de déclencher une requête si le champ a été différé (only/defer)
+    instance._counted_status = instance.__dict__.get('status')
+
+
+# Enregistré avant count_appointment, qui remplace le statut mémorisé par le nouveau
+@receiver(post_save, sender=Appointment)
+def reallocate_cancelled_slot(sender, instance, created, **kwargs):
+    """Un rendez-vous vient d'être annulé: son créneau est attribué au premier patient en liste d'attente"""
+    if not created and instance.status == 'CANCELLED' and instance._counted_status in Appointment.ACTIVE_STATUSES:
+        waitlist.reallocate(instance)
+
+
+@receiver(post_save, sender=Appointment)
+def count_appointment(sender, instance, created, **kwargs):
+    """Tient à jour le total de rendez-vous et les compteurs par statut"""
+    if created:
+        counters.increment(counters.APPOINTMENTS)
+        counters.increment(counters.status_key(instance.status))
+    elif instance._counted_status and instance.status != instance._counted_status:
+        counters.increment(counters.status_key(instance._counted_status), -1)
+        counters.increment(counters.status_key(instance.status))
+    instance._counted_status = instance.status
+
+
+@receiver(post_delete, sender=Appointment)
+def count_deleted_appointment(sender, instance, **kwargs):
+    """Décrémente le total et le compteur du statut du rendez-vous supprimé"""
+    counters.increment(counters.APPOINTMENTS, -1)
+    counters.increment(counters.status_key(instance._counted_status or instance.status), -1)
+
+
+@receiver([post_save, post_delete], sender=Appointment)
+def touch_agenda_feeds(sender, instance, **kwargs):
+    """Les flux iCalendar du médecin et du patient seront régénérés à la prochaine lecture"""
+    agenda.touch(instance.doctor_id, instance.patient_id)
+
+
+@receiver(post_save, sender=Pharmacy)
+def refresh_pharmacy_position(sender, instance, **kwargs):
+    """Met à jour la position et le statut de garde dans l'index spatial; les autres processus le rechargeront"""
+    pharmacy_index.upsert(instance.pk, instance.latitude, instance.longitude, instance.is_on_duty)
+    pharmacy_index.shared.bump()
+
+
+@receiver(post_delete, sender=Pharmacy)
+def drop_pharmacy_position(sender, instance, **kwargs):
+    """Retire la pharmacie supprimée de l'index spatial"""
+    pharmacy_index.remove(instance.pk)
+    pharmacy_index.shared.bump()
+
+
+@receiver(post_save, sender=Appointment)
+def link_appointment_care(sender, instance, created, **kwargs):
+    """Un rendez-vous établit une relation de soins entre le médecin et le patient"""
+    if created:
+        link_doctor_patient(instance.doctor_id, instance.patient_id)
+
+
+@receiver(post_save, sender=MedicalRecord)
+def link_record_care(sender, instance, **kwargs):
+    """Le médecin auteur d'un dossier suit le patient concerné"""
+    link_doctor_patient(instance.doctor_id, instance.patient_id)
+
+
+def _file_name(value):
+    """Nom d'un FieldFile ou de la valeur brute stockée sur l'instance"""
+    return getattr(value, 'name', value) or None
+
+
+@receiver(post_init, sender=MedicalRecord)
+def remember_record_file(sender, instance, **kwargs):
+    """Mémorise le fichier chargé pour suivre les références aux blobs"""
+    instance._stored_file = _file_name(instance.__dict__.get('file'))
+
+
+@receiver(post_save, sender=MedicalRecord)
+def count_record_file(sender, instance, **kwargs):
+    """Met à jour les compteurs de références quand le fichier du dossier change"""
+    if 'file' not in instance.__dict__:
+        return
+    current = _file_name(instance.file)
+    if current != instance._stored_file:
+        add_reference(current)
+        release_reference(instance._stored_file)
+        instance._stored_file = current
+
+
+@receiver(post_delete, sender=MedicalRecord)
+def release_record_file(sender, instance, **kwargs):
+    """Libère le blob du dossier supprimé"""
+    release_reference(instance._stored_file or _file_name(instance.__dict__.get('file')))
+
+
+@receiver(post_save, sender=MedicalRecord)
+def index_record(sender, instance, **kwargs):
+    """Indexe le dossier médical pour la recherche plein texte"""
+    search.get_backend().index(search.record_document(instance))
+
+
+@receiver(post_delete, sender=MedicalRecord)
+def unindex_record(sender, instance, **kwargs):
+    search.get_backend().remove(search.RECORD, instance.pk)
+
+
+@receiver(post_save, sender=Prescription)
+def index_prescription(sender, instance, **kwargs):
+    """Indexe l'ordonnance (médicaments et instructions)"""
+    search.get_backend().index(search.prescription_document(instance))
+
+
+@receiver(post_delete, sender=Prescription)
+def unindex_prescription(sender, instance, **kwargs):
+    search.get_backend().remove(search.PRESCRIPTION, instance.pk)
+
+
+@receiver(post_save, sender=Allergy)
+def index_allergy(sender, instance, **kwargs):
+    """Indexe l'allergie (nom, sévérité, réaction)"""
+    search.get_backend().index(search.allergy_document(instance))
+
+
+@receiver(post_delete, sender=Allergy)
+def unindex_allergy(sender, instance, **kwargs):
+    search.get_backend().remove(search.ALLERGY, instance.pk)
+
+
+@receiver(post_save, sender=Allergy)
+def screen_allergy(sender, instance, **kwargs):
+    """Contrôle les ordonnances en cours du patient contre l'allergie saisie; retire ses alertes si inactive"""
+    if instance.active:
+        screen(patient_ids=[instance.patient_id], allergy_ids=[instance.pk])
+    else:
+        PrescriptionAlert.objects.filter(allergy=instance).delete()
+
+
+@receiver(post_save, sender=DrugAllergen)
+@receiver(post_delete, sender=DrugAllergen)
+def refresh_allergen_index(sender, **kwargs):
+    """
+    Les correspondances allergène -> substance ont changé: l'index sera recompilé
+    et les alertes de toutes les ordonnances en cours recalculées en tâche de fond
+    """
+    allergen_index.invalidate()
+    jobs.enqueue('allergies.screen', {'reset': True}, unique=True)
+
+
+@receiver(post_save, sender=Medication)
+@receiver(post_delete, sender=Medication)
+def refresh_medication_catalogue(sender, **kwargs):
+    """Le catalogue des médicaments a changé: il sera recompilé au prochain usage"""
+    medication_catalogue.invalidate()
@@ -0,0 +1,249 @@
+"""
+Moteur de créneaux disponibles
+
+Compile les disponibilités hebdomadaires des médecins (Doctor.availability)
+en un index compact par médecin, puis en retire les rendez-vous existants
+pour répondre à « créneaux libres du médecin X (ou de N médecins) entre D1 et D2 ».
+
+Une modification des disponibilités incrémente la version partagée de l'index
+(voir versions.py) : les autres processus vident leurs semaines compilées et
+les rechargent à la demande.
+"""
+import threading
+from bisect import bisect_left
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .replicas import primary
+from .versions import SharedVersion
+
+# Durée d'un créneau en minutes (utilisée pour les plages "09:00-12:00")
+SLOT_MINUTES = getattr(settings, 'SLOT_DURATION_MINUTES', 30)
+
+# Correspondance des noms de jours (français et anglais) vers weekday()
+WEEKDAYS = {
+    'lundi': 0, 'mardi': 1, 'mercredi': 2, 'jeudi': 3,
+    'vendredi': 4, 'samedi': 5, 'dimanche': 6,
+    'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
+    'friday': 4, 'saturday': 5, 'sunday': 6,
+}
+
+# Statuts qui n'occupent plus de créneau
+FREE_STATUSES = ('CANCELLED',)
+
+# Nom de la version partagée de l'index (voir versions.py)
+VERSION_NAME = 'slots'
+
+
+def _parse_minutes(value):
+    """Convertit "HH:MM" en minutes depuis minuit"""
+    hours, minutes = value.strip().split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def compile_availability(availability, slot_minutes=SLOT_MINUTES):
+    """
+    Compile le JSON de disponibilités en 7 tuples triés de minutes (lundi..dimanche)
+    Accepte des heures de début ("09:00") ou des plages ("09:00-12:00")
+    Les entrées illisibles sont ignorées
+    """
+    week = [set() for _ in range(7)]
+    for day, slots in (availability or {}).items():
+        weekday = WEEKDAYS.get(str(day).strip().lower())
+        if weekday is None or not isinstance(slots, (list, tuple)):
+            continue
+        for slot in slots:
+            try:
+                if '-' in slot:
+                    start, end = (_parse_minutes(part) for part in slot.split('-', 1))
+                    week[weekday].update(range(start, end - slot_minutes + 1, slot_minutes))
+                else:
+                    week[weekday].add(_parse_minutes(slot))
+            except (TypeError, ValueError):
+                continue
+    return tuple(tuple(sorted(minutes)) for minutes in week)
+
+
+def _as_date(value):
+    """Accepte une date ou un datetime"""
+    return value.date() if isinstance(value, datetime) else value
+
+
+def free_slots_for_week(week, booked, start, end, slot_minutes=SLOT_MINUTES, tz=None):
+    """
+    Calcule les créneaux libres d'un médecin entre les dates start (incluse) et end (exclue)
+    booked: dict {date: liste triée des minutes de début des rendez-vous}
+    """
+    tz = tz or timezone.get_current_timezone()
+    free = []
+    day = _as_date(start)
+    end = _as_date(end)
+    while day < end:
+        minutes = week[day.weekday()]
+        if minutes:
+            taken = booked.get(day, ())
+            # Heure locale murale: l'ajout d'un timedelta conserve le fuseau
+            midnight = datetime.combine(day, time.min, tzinfo=tz)
+            for minute in minutes:
+                # Un créneau est occupé si un rendez-vous commence dans ]s - durée, s + durée[
+                if taken:
+                    i = bisect_left(taken, minute - slot_minutes + 1)
+                    if i < len(taken) and taken[i] < minute + slot_minutes:
+                        continue
+                free.append(midnight + timedelta(minutes=minute))
+        day += timedelta(days=1)
+    return free
+
+
+class SlotIndex:
+    """
+    Index des disponibilités hebdomadaires compilées, par identifiant de médecin
+    Mis à jour de façon incrémentale par les signaux de Doctor (voir signals.py),
+    vidé lorsqu'un autre processus a incrémenté sa version partagée
+    """
+
+    def __init__(self, slot_minutes=SLOT_MINUTES):
+        self.slot_minutes = slot_minutes
+        self._weeks = {}
+        self._lock = threading.Lock()
+        self.shared = SharedVersion(VERSION_NAME)
+
+    def __len__(self):
+        return len(self._weeks)
+
+    def update(self, doctor_id, availability):
+        """(Re)compile les disponibilités d'un seul médecin"""
+        week = compile_availability(availability, self.slot_minutes)
+        with self._lock:
+            self._weeks[doctor_id] = week
+
+    def discard(self, doctor_id):
+        """Retire un médecin de l'index"""
+        with self._lock:
+            self._weeks.pop(doctor_id, None)
+
+    def clear(self):
+        """Vide l'index (il sera reconstruit à la demande)"""
+        with self._lock:
+            self._weeks.clear()
+
+    def invalidate(self):
+        """Des disponibilités ont changé en masse (import): index vidé ici et dans les autres processus"""
+        self.clear()
+        self.shared.bump()
+
+    def _refresh(self, version):
+        """Nouvelle version partagée: les semaines compilées avant elle sont abandonnées"""
+        if version is not None:
+            self.clear()
+            self.shared.mark(version)
+
+    def _missing(self, doctor_ids):
+        """Requête des disponibilités des médecins absents de l'index (None si tous présents)"""
+        from .models import Doctor
+
+        missing = [pk for pk in doctor_ids if pk not in self._weeks]
+        if missing:
+            return Doctor.objects.filter(pk__in=missing).values_list('pk', 'availability')
+        return None
+
+    def weeks(self, doctor_ids):
+        """Renvoie les semaines compilées, en chargeant les médecins absents en une requête"""
+        self._refresh(self.shared.check())
+        rows = self._missing(doctor_ids)
+        if rows is not None:
+            # Base principale: un réplica en retard figerait les anciennes disponibilités sous la nouvelle version
+            with primary():
+                for pk, availability in rows:
+                    self.update(pk, availability)
+        return {pk: self._weeks[pk] for pk in doctor_ids if pk in self._weeks}
+
+    async def aweeks(self, doctor_ids):
+        """Version asynchrone de weeks (ORM asynchrone)"""
+        self._refresh(await self.shared.acheck())
+        rows = self._missing(doctor_ids)
+        if rows is not None:
+            with primary():
+                async for pk, availability in rows:
+                    self.update(pk, availability)
+        return {pk: self._weeks[pk] for pk in doctor_ids if pk in self._weeks}
+
+    @staticmethod
+    def _booked_rows(doctor_ids, start, end):
+        """Requête des rendez-vous actifs des médecins entre start (inclus) et end (exclu)"""
+        from .models import Appointment
+
+        tz = timezone.get_current_timezone()
+        start_dt = timezone.make_aware(datetime.combine(_as_date(start), time.min), tz)
+        end_dt = timezone.make_aware(datetime.combine(_as_date(end), time.min), tz)
+        return (Appointment.objects
+                .filter(doctor_id__in=doctor_ids, date_time__gte=start_dt, date_time__lt=end_dt)
+                .exclude(status__in=FREE_STATUSES)
+                .order_by()
+                .values_list('doctor_id', 'date_time'))
+
+    @staticmethod
+    def _group_booked(rows):
+        """Regroupe les rendez-vous en {doctor_id: {date: [minutes triées]}}"""
+        tz = timezone.get_current_timezone()
+        booked = {}
+        for doctor_id, date_time in rows:
+            local = timezone.localtime(date_time, tz)
+            days = booked.setdefault(doctor_id, {})
+            days.setdefault(local.date(), []).append(local.hour * 60 + local.minute)
+        for days in booked.values():
+            for minutes in days.values():
+                minutes.sort()
+        return booked
+
+    def booked(self, doctor_ids, start, end):
+        """
+        Charge les rendez-vous actifs de tous les médecins du lot en une seule requête
+        Renvoie {doctor_id: {date: [minutes triées]}}
+        """
+        return self._group_booked(self._booked_rows(doctor_ids, start, end))
+
+    async def abooked(self, doctor_ids, start, end):
+        """Version asynchrone de booked (ORM asynchrone)"""
+        return self._group_booked([row async for row in self._booked_rows(doctor_ids, start, end)])
+
+    def free_slots(self, doctor_ids, start, end):
+        """
+        Créneaux libres pour un ou plusieurs médecins entre start (inclus) et end (exclu)
+        Renvoie {doctor_id: [datetime, ...]}
+        """
+        if isinstance(doctor_ids, int):
+            doctor_ids = [doctor_ids]
+        doctor_ids = list(doctor_ids)
+        weeks = self.weeks(doctor_ids)
+        booked = self.booked(list(weeks), start, end) if weeks else {}
+        return {
+            pk: free_slots_for_week(week, booked.get(pk, {}), start, end, self.slot_minutes)
+            for pk, week in weeks.items()
+        }
+
+    async def afree_slots(self, doctor_ids, start, end):
+        """
+        Version asynchrone de free_slots pour les vues async (ASGI)
+        Seules les lectures passent par l'ORM asynchrone, le calcul reste en mémoire
+        """
+        if isinstance(doctor_ids, int):
+            doctor_ids = [doctor_ids]
+        doctor_ids = list(doctor_ids)
+        weeks = await self.aweeks(doctor_ids)
+        booked = await self.abooked(list(weeks), start, end) if weeks else {}
+        return {
+            pk: free_slots_for_week(week, booked.get(pk, {}), start, end, self.slot_minutes)
+            for pk, week in weeks.items()
+        }
+
+
+# Index partagé par le processus
+slot_index = SlotIndex()
+
+
+def free_slots(doctor_ids, start, end):
+    """Raccourci vers l'index partagé"""
+    return slot_index.free_slots(doctor_ids, start, end)
@@ -0,0 +1,3 @@
+"""
+Moteur de base de données SQLite de production (DATABASES ENGINE 'core.sqlite'), voir base.py
+"""
@@ -0,0 +1,103 @@
+"""
+Moteur SQLite de production : PRAGMA de connexion et voie d'écriture sérialisée
+
+Extension du moteur django.db.backends.sqlite3 (ENGINE 'core.sqlite') :
+
+- PRAGMA appliqués à chaque nouvelle connexion (PRAGMAS, complétés ou remplacés
+  par OPTIONS['pragmas']) : journal WAL (les lecteurs ne bloquent plus
+  l'écrivain et inversement), synchronous=NORMAL (sûr en WAL : un fsync par
+  point de contrôle au lieu d'un par commit), busy_timeout, mmap et cache ;
+- transactions en BEGIN IMMEDIATE par défaut (OPTIONS['transaction_mode']) : le
+  verrou d'écriture est pris dès le début de la transaction. Une transaction
+  DEFERRED qui lit puis écrit ne peut pas attendre le verrou : SQLite lui
+  renvoie « database is locked » immédiatement, sans tenir compte de
+  busy_timeout ;
+- voie d'écriture : dans un processus, les transactions d'une même base
+  s'exécutent une à la fois, en file sur un verrou Python. Les écrivains
+  attendent leur tour (au plus OPTIONS['write_lane_timeout'] secondes) au lieu
+  de se disputer le verrou SQLite par attentes et réessais. Les écritures hors
+  transaction et celles des autres processus restent arbitrées par
+  busy_timeout.
+
+Les bases en mémoire (tests) n'ont ni WAL ni voie d'écriture.
+"""
+import threading
+
+from django.db import OperationalError
+from django.db.backends.sqlite3 import base
+
+# PRAGMA par défaut des nouvelles connexions
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # ms
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # négatif: en Kio (64 Mio)
+}
+
+# Attente maximale (secondes) d'une transaction dans la voie d'écriture
+WRITE_LANE_TIMEOUT = 10.0
+
+_lanes = {}
+_lanes_lock = threading.Lock()
+
+
+def write_lane(name):
+    """Verrou partagé par toutes les connexions du processus à la base `name`"""
+    with _lanes_lock:
+        return _lanes.setdefault(str(name), threading.Lock())
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lane = None
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = {**PRAGMAS, **params.pop('pragmas', {})}
+        self.write_lane_timeout = params.pop('write_lane_timeout', WRITE_LANE_TIMEOUT)
+        self.transaction_mode = self.transaction_mode or 'IMMEDIATE'
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if not self.is_in_memory_db():
+            lane = write_lane(self.settings_dict['NAME'])
+            if not lane.acquire(timeout=self.write_lane_timeout):
+                raise OperationalError(
+                    f"database is locked: voie d'écriture occupée depuis plus de {self.write_lane_timeout} s")
+            self._lane = lane
+        try:
+            super()._start_transaction_under_autocommit()
+        except BaseException:
+            self._release_lane()
+            raise
+
+    def _release_lane(self):
+        lane, self._lane = self._lane, None
+        if lane is not None:
+            lane.release()
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self._release_lane()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self._release_lane()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self._release_lane()
@@ -0,0 +1,118 @@
+"""
+Stockage adressé par contenu des fichiers de dossiers médicaux
+
+Chaque fichier envoyé est haché (SHA-256) pendant sa copie sur disque, par
+blocs, puis rangé sous son empreinte : deux envois identiques partagent le
+même fichier. Les dossiers référencent ces blobs avec un compteur de
+références (StoredBlob) et la commande gc_blobs supprime les orphelins.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+# Sous-répertoire des blobs dans MEDIA_ROOT
+BLOB_PREFIX = 'medical_records/cas'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage qui range chaque fichier sous son empreinte SHA-256
+    Le chemin demandé (upload_to) n'est utilisé que pour son extension
+    """
+
+    def blob_name(self, digest, extension):
+        """Chemin relatif d'un blob: medical_records/cas/ab/cd/abcd...<ext>"""
+        return f'{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{extension.lower()}'
+
+    def get_available_name(self, name, max_length=None):
+        # Même nom = même contenu: pas de renommage en cas de collision
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1]
+        tmp_dir = self.path(os.path.join(BLOB_PREFIX, 'tmp'))
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        # Copie et hachage en une passe, sans charger le fichier en mémoire
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            name = self.blob_name(digest.hexdigest(), extension)
+            full_path = self.path(name)
+            with transaction.atomic():
+                # Ligne du blob rafraîchie (ou créée) avant de réutiliser le fichier: gc_blobs, qui supprime
+                # ligne et fichier dans une même transaction, ne le collecte plus pendant la période de grâce
+                _adjust(name, 0, size=os.path.getsize(tmp_path))
+                if os.path.exists(full_path):
+                    # Déjà stocké: on rafraîchit aussi la date du fichier (orphelins sur disque)
+                    os.utime(full_path)
+                else:
+                    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(tmp_path, self.file_permissions_mode)
+                    # Renommage atomique: un envoi concurrent du même contenu est sans danger
+                    os.replace(tmp_path, full_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return name.replace('\\', '/')
+
+
+content_addressed_storage = ContentAddressedStorage()
+
+
+def medical_record_storage():
+    """Stockage de MedicalRecord.file (callable pour les migrations)"""
+    return content_addressed_storage
+
+
+def _adjust(name, delta, size=None):
+    """Modifie le compteur de références d'un blob, en créant la ligne si besoin"""
+    from .models import StoredBlob
+
+    now = timezone.now()
+    if StoredBlob.objects.filter(name=name).update(refcount=F('refcount') + delta, updated_at=now):
+        return
+    if size is None:
+        try:
+            size = content_addressed_storage.size(name)
+        except OSError:
+            size = 0
+    try:
+        with transaction.atomic():
+            StoredBlob.objects.create(name=name, size=size, refcount=max(delta, 0))
+    except IntegrityError:
+        StoredBlob.objects.filter(name=name).update(refcount=F('refcount') + delta, updated_at=now)
+
+
+def add_reference(name):
+    """Un dossier de plus référence ce blob"""
+    if name:
+        _adjust(name, 1)
+
+
+def release_reference(name):
+    """Un dossier ne référence plus ce blob (supprimé plus tard par gc_blobs)"""
+    if name:
+        _adjust(name, -1)
+
+
+def verify_blob(name):
+    """Vérifie qu'un blob correspond toujours à son empreinte"""
+    expected = os.path.splitext(os.path.basename(name))[0]
+    digest = hashlib.sha256()
+    with content_addressed_storage.open(name, 'rb') as handle:
+        for chunk in handle.chunks():
+            digest.update(chunk)
+    return digest.hexdigest() == expected
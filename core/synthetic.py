@@ -0,0 +1,245 @@
+"""
+Générateur de données synthétiques réalistes (tests de charge et benchmarks)
+
+Les volumes sont définis par des préréglages (PRESETS) ou à la demande. Tout est
+inséré par bulk_create, lot par lot : les patients d'un lot sont créés avec
+leurs rendez-vous, dossiers, ordonnances et allergies, si bien que la mémoire
+ne dépend pas du volume total (1M de patients compris). Les signaux n'étant pas
+émis, finalize() remet à niveau compteurs, index en mémoire et index plein texte.
+"""
+import random
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import counters
+from .allergies import screen
+from .geo import pharmacy_index
+from .medications import medication_catalogue
+from .models import (Allergy, Appointment, CareRelationship, Doctor, MedicalRecord, Medication, Patient,
+                     Pharmacy, Prescription, Speciality, User)
+from .slots import SLOT_MINUTES, slot_index
+
+
+@dataclass
+class Volume:
+    """Nombre d'objets à générer"""
+    patients: int
+    doctors: int
+    pharmacies: int
+    appointments_per_patient: float = 3.0
+    records_per_patient: float = 2.0
+    prescription_rate: float = 0.3
+    allergy_rate: float = 0.2
+
+
+PRESETS = {
+    '1k': Volume(patients=1_000, doctors=20, pharmacies=50),
+    '100k': Volume(patients=100_000, doctors=1_000, pharmacies=2_000),
+    '1m': Volume(patients=1_000_000, doctors=5_000, pharmacies=20_000),
+}
+
+FIRST_NAMES = ['Marie', 'Jean', 'Sophie', 'Pierre', 'Camille', 'Lucas', 'Emma', 'Louis', 'Chloé', 'Hugo',
+               'Léa', 'Jules', 'Manon', 'Nathan', 'Inès', 'Thomas', 'Sarah', 'Paul', 'Julie', 'Karim']
+LAST_NAMES = ['Martin', 'Bernard', 'Dubois', 'Thomas', 'Robert', 'Richard', 'Petit', 'Durand', 'Leroy',
+              'Moreau', 'Simon', 'Laurent', 'Lefebvre', 'Michel', 'Garcia', 'David', 'Bertrand', 'Roux',
+              'Vincent', 'Fournier', 'Morel', 'Girard', 'André', 'Mercier', 'Dupont', 'Lambert', 'Bonnet']
+SPECIALITIES = ['Médecine générale', 'Cardiologie', 'Dermatologie', 'Pédiatrie', 'Gynécologie',
+                'Ophtalmologie', 'Neurologie', 'Psychiatrie', 'Rhumatologie', 'Endocrinologie',
+                'Gastro-entérologie', 'Pneumologie']
+WEEKDAYS = ['lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi']
+MEDICATIONS = ['Paracétamol', 'Ibuprofène', 'Amoxicilline', 'Oméprazole', 'Metformine', 'Lévothyroxine',
+               'Amlodipine', 'Atorvastatine', 'Salbutamol', 'Cétirizine', 'Prednisolone', 'Tramadol']
+ALLERGENS = ['Pénicilline', 'Arachide', 'Latex', 'Pollen', 'Aspirine', 'Lactose', 'Acariens', 'Sulfamides']
+RECORD_TITLES = {
+    'CONSULT': ['Consultation de suivi', 'Bilan annuel', 'Douleurs thoraciques', 'Céphalées persistantes'],
+    'LAB': ['Bilan sanguin', 'Glycémie à jeun', 'Bilan lipidique', 'Numération formule sanguine'],
+    'IMAGING': ['Radiographie thorax', 'IRM genou', 'Échographie abdominale', 'Scanner cérébral'],
+    'PRESCRIPTION': ['Renouvellement traitement', 'Traitement antibiotique'],
+    'OTHER': ['Certificat médical', 'Compte rendu opératoire'],
+}
+WORDS = ('patient examen douleur traitement suivi normal anomalie contrôle antécédents tension fièvre '
+         'toux fatigue résultat biologique imagerie recommandation repos hydratation surveillance').split()
+# Centres des zones où sont placées les pharmacies (lat, lon)
+CITIES = [(48.8566, 2.3522), (45.7640, 4.8357), (43.2965, 5.3698), (43.6047, 1.4442), (47.2184, -1.5536)]
+
+# Créneaux de rendez-vous par jour (9h-17h)
+SLOTS_PER_DAY = (17 - 9) * 60 // SLOT_MINUTES
+
+
+def _chunks(total, size):
+    """Découpe range(total) en intervalles [début, fin) de taille size"""
+    for start in range(0, total, size):
+        yield start, min(start + size, total)
+
+
+def _count(rng, mean):
+    """Nombre aléatoire de moyenne ~`mean` (loi exponentielle tronquée: quelques gros historiques)"""
+    if mean <= 0:
+        return 0
+    return min(int(rng.expovariate(1 / mean)), int(mean * 10))
+
+
+class Generator:
+    """Génère un jeu de données complet, reproductible via seed"""
+
+    def __init__(self, volume, seed=0, batch_size=5000, password='bench', prefix='', stdout=None):
+        self.volume = volume
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        # Un seul hachage pour tous les comptes: les benchmarks peuvent se connecter
+        self.password = make_password(password)
+        self.prefix = prefix
+        self.stdout = stdout
+        self.doctor_ids = []
+        self.appointment_number = 0
+        self.today = timezone.localdate()
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def user(self, username, role):
+        first, last = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+        return User(username=f'{self.prefix}{username}', first_name=first, last_name=last, role=role,
+                    email=f'{self.prefix}{username}@example.org', phone=f'06{self.rng.randrange(10**8):08d}',
+                    password=self.password)
+
+    def availability(self):
+        days = self.rng.sample(WEEKDAYS, self.rng.randint(3, 5))
+        hours = self.rng.choice([['09:00-12:00', '14:00-18:00'], ['08:30-12:30'], ['13:00-19:00'],
+                                 ['09:00-12:00', '13:30-17:00']])
+        return {day: hours for day in days}
+
+    def run(self):
+        """Génère tout le jeu de données"""
+        self.generate_doctors()
+        self.generate_pharmacies()
+        self.generate_medications()
+        for start, end in _chunks(self.volume.patients, self.batch_size):
+            with transaction.atomic():
+                self.generate_patients(start, end)
+            self.log(f"Patients {end}/{self.volume.patients}")
+
+    def generate_doctors(self):
+        specialities = []
+        for name in SPECIALITIES:
+            speciality, _ = Speciality.objects.get_or_create(name=name)
+            specialities.append(speciality.pk)
+        for start, end in _chunks(self.volume.doctors, self.batch_size):
+            with transaction.atomic():
+                users = User.objects.bulk_create([self.user(f'doctor{i}', 'DOCTOR') for i in range(start, end)])
+                doctors = Doctor.objects.bulk_create([
+                    Doctor(user_id=user.pk, speciality_id=self.rng.choice(specialities),
+                           license_number=f'RPPS{10**10 + i}', availability=self.availability())
+                    for i, user in zip(range(start, end), users)
+                ])
+            self.doctor_ids.extend(doctor.pk for doctor in doctors)
+        self.log(f"{len(self.doctor_ids)} médecin(s)")
+
+    def generate_pharmacies(self):
+        for start, end in _chunks(self.volume.pharmacies, self.batch_size):
+            pharmacies = []
+            for i in range(start, end):
+                lat, lon = self.rng.choice(CITIES)
+                pharmacies.append(Pharmacy(
+                    name=f'Pharmacie {self.rng.choice(LAST_NAMES)} {i}', address=f'{i} rue de la Santé',
+                    phone=f'01{self.rng.randrange(10**8):08d}', is_on_duty=self.rng.random() < 0.1,
+                    latitude=self.rng.gauss(lat, 0.08), longitude=self.rng.gauss(lon, 0.1),
+                ))
+            Pharmacy.objects.bulk_create(pharmacies)
+        self.log(f"{self.volume.pharmacies} pharmacie(s)")
+
+    def generate_medications(self):
+        """Catalogue des médicaments prescrits par le générateur"""
+        Medication.objects.bulk_create([Medication(name=name, ingredient=name) for name in MEDICATIONS],
+                                       ignore_conflicts=True)
+
+    def appointment_datetime(self):
+        """
+        Date du prochain rendez-vous: le numéro d'ordre fixe le médecin et le créneau,
+        si bien que (médecin, date) est unique par construction (contrainte unique_active_doctor_slot)
+        """
+        number = self.appointment_number
+        self.appointment_number += 1
+        doctor_id = self.doctor_ids[number % len(self.doctor_ids)]
+        slot = number // len(self.doctor_ids)
+        # Jours répartis sur un an glissant (10 mois d'historique, 2 mois à venir);
+        # 97 est premier avec 365: la permutation disperse les créneaux successifs
+        day = self.today - timedelta(days=300) + timedelta(days=slot % 365 * 97 % 365)
+        minutes = 9 * 60 + slot // 365 % SLOTS_PER_DAY * SLOT_MINUTES
+        when = datetime.combine(day, time.min, tzinfo=timezone.get_current_timezone()) + timedelta(minutes=minutes)
+        # Agenda d'un an complet: décalage d'une seconde par tour pour rester unique
+        when += timedelta(seconds=slot // (SLOTS_PER_DAY * 365))
+        return doctor_id, when
+
+    def generate_patients(self, start, end):
+        rng, volume = self.rng, self.volume
+        users = User.objects.bulk_create([self.user(f'patient{i}', 'PATIENT') for i in range(start, end)])
+        patients = Patient.objects.bulk_create([
+            Patient(user_id=user.pk, birth_date=date(1940, 1, 1) + timedelta(days=rng.randrange(80 * 365)),
+                    blood_group=rng.choice(['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']),
+                    medical_history=' '.join(rng.choices(WORDS, k=rng.randint(0, 12))))
+            for user in users
+        ])
+
+        appointments, records, allergies, pairs = [], [], [], set()
+        now = timezone.now()
+        for patient in patients:
+            for _ in range(_count(rng, volume.appointments_per_patient)):
+                doctor_id, when = self.appointment_datetime()
+                if when < now:
+                    status = 'CANCELLED' if rng.random() < 0.1 else 'COMPLETED'
+                else:
+                    status = 'PENDING' if rng.random() < 0.4 else 'CONFIRMED'
+                appointments.append(Appointment(patient_id=patient.pk, doctor_id=doctor_id, date_time=when,
+                                                status=status, appointment_type=rng.choice(['IN_PERSON', 'REMOTE']),
+                                                notes=' '.join(rng.choices(WORDS, k=rng.randint(0, 8)))))
+                pairs.add((doctor_id, patient.pk))
+            for _ in range(_count(rng, volume.records_per_patient)):
+                record_type = rng.choice(list(RECORD_TITLES))
+                doctor_id = rng.choice(self.doctor_ids)
+                records.append(MedicalRecord(
+                    patient_id=patient.pk, doctor_id=doctor_id, record_type=record_type,
+                    title=rng.choice(RECORD_TITLES[record_type]),
+                    description=' '.join(rng.choices(WORDS, k=rng.randint(10, 60))),
+                    date=self.today - timedelta(days=rng.randrange(3650)),
+                    is_emergency=rng.random() < 0.05, confidential=rng.random() < 0.1,
+                ))
+                pairs.add((doctor_id, patient.pk))
+            if rng.random() < volume.allergy_rate:
+                allergies.append(Allergy(patient_id=patient.pk, name=rng.choice(ALLERGENS),
+                                         severity=rng.choice(['MILD', 'MODERATE', 'SEVERE', 'LIFE_THREATENING']),
+                                         reaction=' '.join(rng.choices(WORDS, k=5)),
+                                         onset_date=self.today - timedelta(days=rng.randrange(7300))))
+
+        Appointment.objects.bulk_create(appointments)
+        records = MedicalRecord.objects.bulk_create(records)
+        Prescription.objects.bulk_create([
+            Prescription(medical_record_id=record.pk, valid_until=record.date + timedelta(days=90),
+                         medications=[{'name': name, 'dosage': rng.choice(['500mg', '1g', '20mg', '5mg']),
+                                       'frequency': rng.choice(['1/jour', '2/jour', '3/jour'])}
+                                      for name in rng.sample(MEDICATIONS, rng.randint(1, 3))],
+                         instructions=' '.join(rng.choices(WORDS, k=6)))
+            for record in records if rng.random() < volume.prescription_rate
+        ])
+        Allergy.objects.bulk_create(allergies)
+        CareRelationship.objects.bulk_create([CareRelationship(doctor_id=d, patient_id=p) for d, p in pairs],
+                                             ignore_conflicts=True)
+
+
+def finalize(index_search=True, stdout=None):
+    """Remet à niveau ce que les signaux auraient maintenu pendant la génération"""
+    from django.core.management import call_command
+
+    counters.reconcile()
+    slot_index.invalidate()
+    pharmacy_index.invalidate()
+    medication_catalogue.invalidate()
+    # Alertes allergie/ordonnance (signal de Allergy court-circuité par bulk_create)
+    screen()
+    if index_search:
+        call_command('rebuild_search_index', stdout=stdout)
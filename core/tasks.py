@@ -0,0 +1,96 @@
+"""
+Tâches de fond enregistrées dans la file (voir jobs.py)
+
+Chaque tâche reçoit des arguments nommés sérialisables en JSON; sa valeur de
+retour (JSON) est conservée dans Job.result.
+"""
+import logging
+import tempfile
+import uuid
+from datetime import timedelta
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from . import counters
+from .allergies import screen
+from .exports import EXPORT_DIR, EXPORT_RETENTION, export_stream, purge_expired
+from .jobs import enqueue, register
+from .models import Appointment, MedicalRecord, Patient, PrescriptionAlert
+from .storage import verify_blob
+from .waitlist import offer_message
+
+logger = logging.getLogger(__name__)
+
+
+@register('allergies.screen')
+def screen_prescriptions(patient_ids=None, reset=False):
+    """Contrôle les ordonnances en cours contre les allergies (reset: alertes recalculées de zéro)"""
+    with transaction.atomic():
+        if reset:
+            alerts = PrescriptionAlert.objects.all()
+            if patient_ids:
+                alerts = alerts.filter(allergy__patient_id__in=patient_ids)
+            alerts.delete()
+        return screen(patient_ids=patient_ids)
+
+
+@register('counters.reconcile')
+def reconcile_counters():
+    """Corrige la dérive des compteurs statistiques; renvoie les compteurs modifiés"""
+    return {key: list(values) for key, values in counters.reconcile().items()}
+
+
+@register('exports.patients')
+def export_patients(patient_ids=None, fmt='ndjson', requested_by=None):
+    """
+    Export des dossiers patients dans un fichier du stockage (MEDIA_ROOT/exports, non publié)
+    requested_by: utilisateur qui l'a demandé (une demande en cours est réutilisée, voir views.patient_export)
+    Le fichier est supprimé par la tâche exports.purge passé EXPORT_RETENTION
+    """
+    patients = Patient.objects.all()
+    if patient_ids:
+        patients = patients.filter(pk__in=patient_ids)
+    # Écrit d'abord dans un fichier temporaire: mémoire constante, pas de fichier partiel dans le stockage
+    with tempfile.TemporaryFile() as handle:
+        for chunk in export_stream(patients, fmt):
+            handle.write(chunk)
+        size = handle.tell()
+        handle.seek(0)
+        name = default_storage.save(
+            f'{EXPORT_DIR}/patients-{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}.{fmt}', File(handle))
+    # Purge planifiée juste après l'expiration de ce fichier (les plus anciens partent avec lui)
+    enqueue('exports.purge', delay=EXPORT_RETENTION + timedelta(minutes=1))
+    return {'path': name, 'size': size}
+
+
+@register('exports.purge')
+def purge_exports():
+    """Supprime les exports expirés (aussi planifiable par cron: enqueue_job exports.purge)"""
+    return {'deleted': purge_expired()}
+
+
+@register('records.verify_file')
+def verify_record_file(record_id):
+    """Relit le fichier joint d'un dossier après l'envoi et le compare à son empreinte (blob abîmé sur disque)"""
+    record = MedicalRecord.objects.only('pk', 'file').filter(pk=record_id).first()
+    # Dossier supprimé ou fichier retiré entre-temps: rien à vérifier
+    if record is None or not record.file:
+        return {'intact': None}
+    intact = verify_blob(record.file.name)
+    if not intact:
+        logger.error("Fichier %s du dossier #%s altéré: empreinte différente", record.file.name, record_id)
+    return {'file': record.file.name, 'intact': intact}
+
+
+@register('waitlist.notify')
+def notify_waitlist_offer(appointment_id):
+    """Prévient le patient du rendez-vous attribué depuis la liste d'attente"""
+    appointment = (Appointment.objects.select_related('patient__user', 'doctor__user')
+                   .filter(pk=appointment_id, status__in=Appointment.ACTIVE_STATUSES).first())
+    # Rendez-vous annulé entre-temps, ou patient sans adresse: rien à envoyer
+    if appointment is None or not appointment.patient.user.email:
+        return {'sent': 0}
+    return {'sent': offer_message(appointment).send()}
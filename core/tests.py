@@ -1,3 +1,1715 @@
-from django.test import TestCase
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import date, datetime, timedelta
+from importlib import import_module
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.apps import apps as django_apps
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.contrib.sessions.models import Session
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import models
+from django.urls import get_resolver, resolve, reverse
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from . import agenda, allergies, counters, directory, geo, jobs, medications, slots, versions, waitlist
+from .access import care_access
+from .allergies import AllergenIndex, Screener, allergen_index, screen
+from .booking import InvalidSlot, SlotUnavailable, book, reserve
+from .exports import EXPORT_RETENTION, export_rows, purge_expired
+from .importers import AppointmentImporter
+from .metrics import MetricsMiddleware, registry
+from .reminders import RETRY_DELAY, ReminderScheduler
+from .replicas import STICKY_COOKIE, ReplicaRouter, ReplicaRoutingMiddleware, primary, use_primary
+from .geo import PharmacyIndex, haversine_km, pharmacy_index
+from .jobs import Worker, claim, enqueue, execute, reap
+from .medications import MedicationCatalogue, medication_catalogue
+from .management.commands.bench_views import (build_scenarios, compare, fetch, make_client, run_sequential,
+                                              sample_objects)
+from .management.commands.loadtest_booking import run_load
+from .forms import PrescriptionForm
+from .models import (Allergy, Appointment, CalendarFeed, CareRelationship, Doctor, DrugAllergen, Job, MedicalRecord,
+                     Medication, Patient, Pharmacy, Prescription, PrescriptionAlert, Speciality, StatCounter,
+                     StoredBlob, User)
+from .storage import content_addressed_storage
+from .synthetic import Generator, Volume, finalize
+from .views import DoctorDetailView, MedicalRecordDetailView, MedicalRecordListView
+from .slots import SlotIndex, compile_availability, slot_index
+from .sqlite.base import DatabaseWrapper as ProductionSQLite
+
+
+def make_doctor(username='doc', availability=None, speciality=None):
+    """Crée un médecin de test avec son utilisateur"""
+    user = User.objects.create_user(username=username, password='pass', role='DOCTOR',
+                                    first_name='Jean', last_name=username.title())
+    return Doctor.objects.create(user=user, speciality=speciality, license_number='LIC-' + username,
+                                 availability=availability or {})
+
+
+def make_patient(username='pat'):
+    """Crée un patient de test avec son utilisateur"""
+    user = User.objects.create_user(username=username, password='pass', role='PATIENT',
+                                    first_name='Marie', last_name=username.title())
+    return Patient.objects.create(user=user, birth_date=date(1990, 1, 1), blood_group='O+')
+
+
+def aware(*args):
+    """Datetime conscient du fuseau courant"""
+    return timezone.make_aware(datetime(*args))
+
+
+def next_monday():
+    """Lundi de la semaine prochaine: ses créneaux sont à venir (réservation)"""
+    today = timezone.localdate()
+    return today + timedelta(days=7 - today.weekday())
+
+
+# Disponibilités couvrant toutes les heures de tous les jours, par créneaux de 30 minutes
+ALWAYS_AVAILABLE = {day: ['00:00-24:00'] for day in ('Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi',
+                                                   'Dimanche')}
+
+
+@jobs.register('tests.echo')
+def echo_task(**kwargs):
+    return kwargs
+
+
+@jobs.register('tests.sleep')
+def sleep_task(seconds):
+    time.sleep(seconds)
+    return threading.current_thread().name
+
+
+@jobs.register('tests.fail')
+def failing_task():
+    raise RuntimeError("panne")
+
+
+class SlotEngineTests(TestCase):
+    # Lundi 6 janvier 2025
+    monday = date(2025, 1, 6)
+
+    def setUp(self):
+        slot_index.clear()
+        self.doctor = make_doctor(availability={'Lundi': ['09:00', '10:00'], 'Mardi': ['14:00-15:00']})
+        self.patient = make_patient()
+
+    def test_compile_availability(self):
+        week = compile_availability({'lundi': ['10:00', '09:00'], 'Mardi': ['14:00-15:00'], 'Foo': ['x']})
+        self.assertEqual(week[0], (540, 600))
+        self.assertEqual(week[1], (840, 870))
+        self.assertEqual(week[2], ())
+
+    def test_free_slots_subtracts_active_appointments(self):
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor,
+                                   date_time=aware(2025, 1, 6, 9, 0), appointment_type='IN_PERSON')
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, status='CANCELLED',
+                                   date_time=aware(2025, 1, 7, 14, 0), appointment_type='IN_PERSON')
+        slots = slot_index.free_slots([self.doctor.pk], self.monday, self.monday + timedelta(days=2))
+        self.assertEqual(slots[self.doctor.pk], [
+            aware(2025, 1, 6, 10, 0), aware(2025, 1, 7, 14, 0), aware(2025, 1, 7, 14, 30),
+        ])
+
+    def test_batch_uses_one_query_per_batch(self):
+        other = make_doctor('doc2', availability={'Lundi': ['08:00']})
+        slot_index.free_slots([self.doctor.pk, other.pk], self.monday, self.monday + timedelta(days=1))
+        # Index chaud: une seule requête sur les rendez-vous pour tout le lot (version partagée non relue)
+        with self.settings(INDEX_VERSION_CHECK_SECONDS=3600), self.assertNumQueries(1):
+            slots = slot_index.free_slots([self.doctor.pk, other.pk], self.monday,
+                                          self.monday + timedelta(days=7))
+        self.assertEqual(len(slots[other.pk]), 1)
+
+    def test_index_follows_doctor_saves(self):
+        slot_index.free_slots([self.doctor.pk], self.monday, self.monday + timedelta(days=1))
+        self.doctor.availability = {'Lundi': ['11:00']}
+        self.doctor.save()
+        slots = slot_index.free_slots([self.doctor.pk], self.monday, self.monday + timedelta(days=1))
+        self.assertEqual(slots[self.doctor.pk], [aware(2025, 1, 6, 11, 0)])
+
+    def test_other_processes_drop_changed_weeks(self):
+        # Index d'un autre processus; disponibilités modifiées sans passer par les signaux de celui-ci
+        other = SlotIndex()
+        other.weeks([self.doctor.pk])
+        Doctor.objects.filter(pk=self.doctor.pk).update(availability={'Lundi': ['11:00']})
+        with self.settings(INDEX_VERSION_CHECK_SECONDS=0):
+            self.assertEqual(other.weeks([self.doctor.pk])[self.doctor.pk][0], (540, 600))
+            versions.bump(slots.VERSION_NAME)
+            self.assertEqual(other.weeks([self.doctor.pk])[self.doctor.pk][0], (660,))
+            self.assertEqual(async_to_sync(other.aweeks)([self.doctor.pk])[self.doctor.pk][0], (660,))
+
+    def test_slots_endpoint(self):
+        response = self.client.get(reverse('doctor_slots', args=[self.doctor.pk]),
+                                   {'start': '2025-01-06', 'end': '2025-01-07'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['slots']), 2)
+        response = self.client.get(reverse('doctor_slots', args=[self.doctor.pk]), {'start': '2025-02-30'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BookingTests(TestCase):
+    def setUp(self):
+        slot_index.clear()
+        self.doctor = make_doctor(availability={'Lundi': ['09:00', '09:30', '10:00']})
+        self.patient = make_patient()
+        self.other = make_patient('pat2')
+        self.monday = next_monday()
+        # Lundi 09:00 sur la grille mais toujours passé (le lundi à venir est aujourd'hui + 7 jours un lundi)
+        self.past = aware(2020, 1, 6, 9)
+
+    def at(self, hour, minute=0):
+        """Horaire du lundi à venir"""
+        return timezone.make_aware(datetime.combine(self.monday, datetime.min.time()).replace(hour=hour,
+                                                                                               minute=minute))
+
+    def test_second_booking_gets_alternatives(self):
+        slot = self.at(9)
+        book(self.patient, self.doctor, slot, 'IN_PERSON')
+        with self.assertRaises(SlotUnavailable) as ctx:
+            book(self.other, self.doctor, slot, 'REMOTE')
+        self.assertNotIsInstance(ctx.exception, InvalidSlot)
+        self.assertEqual(ctx.exception.alternatives[:2], [self.at(9, 30), self.at(10)])
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_past_and_off_grid_times_are_refused(self):
+        # Deux horaires voisins hors grille ne passent pas la contrainte d'unicité exacte: refusés avant l'insertion
+        for slot in (self.at(9, 17), self.at(9, 18), self.at(11), self.past):
+            with self.assertRaises(InvalidSlot) as ctx:
+                book(self.patient, self.doctor, slot, 'IN_PERSON')
+            self.assertTrue(ctx.exception.alternatives)
+            self.assertTrue(all(alternative > timezone.now() for alternative in ctx.exception.alternatives))
+        # Rendez-vous importé hors grille: le créneau qu'il chevauche n'est plus libre
+        Appointment.objects.create(patient=self.other, doctor=self.doctor, date_time=self.at(9, 15),
+                                   appointment_type='IN_PERSON')
+        with self.assertRaises(SlotUnavailable):
+            book(self.patient, self.doctor, self.at(9, 30), 'IN_PERSON')
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_only_the_slot_constraint_is_a_conflict(self):
+        appointment = Appointment(patient=self.patient, doctor=self.doctor, date_time=self.at(9), appointment_type=None)
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                reserve(appointment)
+
+    def test_form_redirects_to_dashboard_and_refuses_off_grid_times(self):
+        self.client.force_login(self.patient.user)
+        url = reverse('appointment_create')
+        data = {'doctor': self.doctor.pk, 'appointment_type': 'IN_PERSON', 'notes': ''}
+        response = self.client.post(url, {**data, 'date_time': self.at(9, 17).strftime('%Y-%m-%dT%H:%M')})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {**data, 'date_time': self.at(9).strftime('%Y-%m-%dT%H:%M')})
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+
+    def test_cancelled_slot_can_be_rebooked(self):
+        slot = self.at(9)
+        first = book(self.patient, self.doctor, slot, 'IN_PERSON')
+        first.status = 'CANCELLED'
+        first.save()
+        book(self.other, self.doctor, slot, 'IN_PERSON')
+        self.assertEqual(Appointment.objects.filter(status__in=Appointment.ACTIVE_STATUSES).count(), 1)
+
+    async def test_async_booking_endpoint(self):
+        url = reverse('doctor_book', args=[self.doctor.pk])
+        data = {'date_time': self.at(9).strftime('%Y-%m-%dT%H:%M:%S'), 'appointment_type': 'IN_PERSON'}
+        self.assertEqual((await self.async_client.post(url, data)).status_code, 401)
+        await self.async_client.aforce_login(self.patient.user)
+        response = await self.async_client.post(url, data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['status'], 'PENDING')
+
+        await self.async_client.aforce_login(self.other.user)
+        response = await self.async_client.post(url, data)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['alternatives'][:2],
+                         [self.at(9, 30).isoformat(), self.at(10).isoformat()])
+        response = await self.async_client.post(url, {'date_time': 'demain', 'appointment_type': 'X'})
+        self.assertEqual(set(response.json()['errors']), {'date_time', 'appointment_type'})
+        response = await self.async_client.post(url, {**data, 'date_time': '2025-02-30T09:00'})
+        self.assertEqual(set(response.json()['errors']), {'date_time'})
+        response = await self.async_client.post(url, {**data, 'date_time': self.at(9, 17).isoformat()})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['alternatives'][0], self.at(9, 30).isoformat())
+        # Horaire passé: alternatives à partir de maintenant (aujourd'hui compris si c'est un lundi)
+        response = await self.async_client.post(url, {**data, 'date_time': self.past.isoformat()})
+        self.assertEqual(response.status_code, 400)
+        alternatives = [datetime.fromisoformat(alternative) for alternative in response.json()['alternatives']]
+        self.assertTrue(alternatives)
+        self.assertTrue(all(alternative > timezone.now() for alternative in alternatives))
+        self.assertEqual(await Appointment.objects.acount(), 1)
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    def test_no_double_booking_under_threads(self):
+        doctor = make_doctor(availability={'Lundi': ['09:00-10:00']})
+        patients = [make_patient(f'pat{i}') for i in range(4)]
+        monday = timezone.make_aware(datetime.combine(next_monday(), datetime.min.time()))
+        slots = [monday + timedelta(hours=9), monday + timedelta(hours=9, minutes=30)]
+        stats = run_load([doctor], patients, slots, threads=8, attempts=80)
+        self.assertEqual(stats['booked'], 2)
+        self.assertEqual(stats['booked'] + stats['conflicts'] + stats['errors'], 80)
+        self.assertEqual(Appointment.objects.count(), 2)
+
+
+class WaitlistTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor(availability=ALWAYS_AVAILABLE)
+        self.owner = make_patient()
+        self.slot = (timezone.now() + timedelta(days=10)).replace(minute=0, second=0, microsecond=0)
+        self.day = timezone.localdate(self.slot)
+
+    def test_cancellation_goes_to_most_urgent_then_oldest_waiter(self):
+        # Le titulaire du créneau attend aussi (autre jour possible), en tête de liste
+        owner = waitlist.join(self.owner, self.doctor, self.day, self.day + timedelta(days=3), urgency=2)
+        routine = waitlist.join(make_patient('routine'), self.doctor, self.day, self.day)
+        urgent = waitlist.join(make_patient('urgent'), self.doctor, self.day, self.day, urgency=2)
+        waitlist.join(make_patient('later'), self.doctor, self.day + timedelta(days=1), self.day + timedelta(days=5),
+                      urgency=2)
+        User.objects.filter(username='urgent').update(email='urgent@example.org')
+        self.assertEqual(waitlist.position(urgent), 2)
+        self.assertEqual(waitlist.position(routine), 4)
+
+        # Le patient qui annule ne reprend pas son propre créneau
+        first = book(self.owner, self.doctor, self.slot, 'IN_PERSON')
+        first.status = 'CANCELLED'
+        first.save()
+        urgent.refresh_from_db()
+        self.assertEqual(urgent.status, 'BOOKED')
+        self.assertEqual((urgent.appointment.patient, urgent.appointment.date_time, urgent.appointment.status),
+                         (urgent.patient, self.slot, 'PENDING'))
+        job = Job.objects.get(name='waitlist.notify')
+        self.assertEqual(claim(10), [job.pk])
+        self.assertEqual(execute(job.pk), 'DONE')
+        self.assertEqual(mail.outbox[0].to, ['urgent@example.org'])
+
+        # Créneau refusé: il passe au suivant dont la fenêtre contient ce jour ("later" n'est pas éligible)
+        urgent.appointment.status = 'CANCELLED'
+        urgent.appointment.save()
+        owner.refresh_from_db()
+        self.assertEqual((owner.status, owner.appointment.date_time), ('BOOKED', self.slot))
+        owner.appointment.status = 'CANCELLED'
+        owner.appointment.save()
+        routine.refresh_from_db()
+        self.assertEqual((routine.status, routine.appointment.date_time), ('BOOKED', self.slot))
+
+    def test_slot_already_rebooked_keeps_waiter_queued(self):
+        entry = waitlist.join(make_patient('waiter'), self.doctor, self.day, self.day)
+        first = book(self.owner, self.doctor, self.slot, 'IN_PERSON')
+        Appointment.objects.filter(pk=first.pk).update(status='CANCELLED')
+        book(make_patient('fast'), self.doctor, self.slot, 'REMOTE')
+        self.assertIsNone(waitlist.reallocate(first))
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.appointment), ('WAITING', None))
+
+    def test_join_endpoint(self):
+        url = reverse('doctor_waitlist', args=[self.doctor.pk])
+        data = {'date_to': self.day.isoformat(), 'urgency': '2'}
+        self.assertEqual(self.client.post(url, data).status_code, 401)
+        self.client.force_login(self.owner.user)
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 201)
+        # Le patient ne choisit pas son urgence
+        self.assertEqual((response.json()['position'], response.json()['urgency']), (1, 0))
+        # Nouvelle inscription: mise à jour de la même entrée
+        self.assertEqual(self.client.post(url, data).json()['id'], response.json()['id'])
+        response = self.client.post(url, {'date_to': '2000-01-01', 'appointment_type': 'X'})
+        self.assertEqual(set(response.json()['errors']), {'date_to', 'appointment_type'})
+        # Date bien formée mais impossible: 400 et non 500
+        response = self.client.post(url, {'date_from': '2025-02-30', 'date_to': '2025-02-31'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'date_from', 'date_to'})
+
+    def test_only_doctor_or_admin_sets_urgency(self):
+        entry = waitlist.join(self.owner, self.doctor, self.day, self.day)
+        ahead = waitlist.join(make_patient('ahead'), self.doctor, self.day, self.day)
+        url = reverse('waitlist_urgency', args=[entry.pk])
+        for user in (self.owner.user, make_doctor('doc2').user):
+            self.client.force_login(user)
+            self.assertEqual(self.client.post(url, {'urgency': '2'}).status_code, 403)
+        self.client.force_login(self.doctor.user)
+        self.assertEqual(self.client.post(url, {'urgency': '9'}).status_code, 400)
+        response = self.client.post(url, {'urgency': '2'})
+        self.assertEqual((response.json()['urgency'], response.json()['position']), (2, 1))
+        # Une nouvelle inscription du patient garde l'urgence fixée par le médecin
+        self.assertEqual(waitlist.join(self.owner, self.doctor, self.day, self.day).urgency, 2)
+        self.assertEqual(waitlist.position(ahead), 2)
+        self.client.force_login(User.objects.create(username='admin', role='ADMIN'))
+        self.assertEqual(self.client.post(url, {'urgency': '0'}).json()['urgency'], 0)
+
+
+class AgendaFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        soon = timezone.now().replace(microsecond=0) + timedelta(days=2)
+        self.appointment = Appointment.objects.create(patient=self.patient, doctor=self.doctor, date_time=soon,
+                                                      appointment_type='IN_PERSON', notes="Apporter; les bilans")
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, date_time=soon + timedelta(hours=1),
+                                   appointment_type='REMOTE', status='CANCELLED')
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, date_time=soon + timedelta(days=400),
+                                   appointment_type='REMOTE')
+
+    def feed_url(self, user):
+        self.client.force_login(user)
+        url = self.client.get(reverse('agenda_feed_url')).json()['url']
+        self.client.logout()
+        return url
+
+    def test_feed_is_cached_and_revalidated_with_one_query(self):
+        url = self.feed_url(self.doctor.user)
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        body = response.content.decode()
+        self.assertEqual(body.count('BEGIN:VEVENT'), 1)
+        self.assertIn(f'UID:appointment-{self.appointment.pk}@testserver\r\n', body)
+        self.assertIn('SUMMARY:RDV Marie Pat\r\n', body)
+        self.assertIn('DESCRIPTION:Présentiel\\nApporter\\; les bilans\r\n', body)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in body.split('\r\n')))
+
+        # Client à jour: une seule requête (le jeton), aucune lecture des rendez-vous
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        # Corps inchangé servi depuis le cache
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).content, response.content)
+
+        self.appointment.status = 'CONFIRMED'
+        self.appointment.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertIn('STATUS:CONFIRMED', changed.content.decode())
+
+    def test_patient_feed_and_token_rotation(self):
+        url = self.feed_url(self.patient.user)
+        body = self.client.get(url).content.decode()
+        self.assertIn('SUMMARY:RDV Dr Jean Doc', body)
+        self.assertNotIn('bilans', body)
+        self.client.force_login(self.patient.user)
+        rotated = self.client.post(reverse('agenda_feed_url')).json()['url']
+        self.assertNotEqual(rotated, url)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(rotated).status_code, 200)
+
+
+class PharmacyIndexTests(TestCase):
+    def test_nearest_matches_brute_force(self):
+        rng = random.Random(1)
+        rows = [(pk, rng.uniform(14, 15), rng.uniform(-17, -16), rng.random() < 0.2) for pk in range(2000)]
+        index = PharmacyIndex(cell_degrees=0.02)
+        index.load(rows)
+        for _ in range(20):
+            lat, lon = rng.uniform(13.8, 15.2), rng.uniform(-17.2, -15.8)
+            expected = sorted((haversine_km(lat, lon, plat, plon), pk) for pk, plat, plon, duty in rows if duty)[:5]
+            self.assertEqual([pk for _, pk in index.nearest(lat, lon, k=5, on_duty=True)],
+                             [pk for _, pk in expected])
+            expected = sorted((haversine_km(lat, lon, plat, plon), pk) for pk, plat, plon, _ in rows)
+            self.assertEqual([pk for _, pk in index.within(lat, lon, 3)],
+                             [pk for distance, pk in expected if distance <= 3])
+
+    def test_endpoint_follows_saves_and_deletes(self):
+        pharmacy_index.clear()
+        near = Pharmacy.objects.create(name='Centre', address='a', phone='1', latitude=14.69, longitude=-17.44)
+        far = Pharmacy.objects.create(name='Loin', address='b', phone='2', latitude=14.80, longitude=-17.30,
+                                      is_on_duty=True)
+        url = reverse('pharmacy_nearest')
+        results = self.client.get(url, {'lat': 14.69, 'lng': -17.44, 'k': 2}).json()['results']
+        self.assertEqual([r['id'] for r in results], [near.pk, far.pk])
+        results = self.client.get(url, {'lat': 14.69, 'lng': -17.44, 'on_duty': '1'}).json()['results']
+        self.assertEqual([r['id'] for r in results], [far.pk])
+        far.delete()
+        near.latitude = 15.0
+        near.save()
+        results = self.client.get(url, {'lat': 14.69, 'lng': -17.44, 'radius': 10}).json()['results']
+        self.assertEqual(results, [])
+        self.assertEqual(self.client.get(url).status_code, 400)
+        for params in ({'lat': 'nan', 'lng': 0}, {'lat': 91, 'lng': 0}, {'lat': 0, 'lng': 'inf'},
+                       {'lat': 0, 'lng': 0, 'radius': 'nan'}):
+            self.assertEqual(self.client.get(url, params).status_code, 400)
+        # k=0 ramené à une pharmacie
+        self.assertEqual(len(self.client.get(url, {'lat': 15.0, 'lng': -17.44, 'k': 0}).json()['results']), 1)
+        self.assertEqual(pharmacy_index.nearest(15.0, -17.44, k=0), [])
+
+    def test_other_processes_reload_changed_pharmacies(self):
+        # Index d'un autre processus; pharmacies créées sans passer par les signaux de celui-ci
+        other = PharmacyIndex()
+        self.assertEqual(other.nearest(14.69, -17.44), [])
+        Pharmacy.objects.bulk_create([Pharmacy(name='Centre', address='a', phone='1', latitude=14.69,
+                                               longitude=-17.44)])
+        with self.settings(INDEX_VERSION_CHECK_SECONDS=0):
+            self.assertEqual(other.nearest(14.69, -17.44), [])
+            versions.bump(geo.VERSION_NAME)
+            self.assertEqual([pk for _, pk in other.nearest(14.69, -17.44)], [Pharmacy.objects.get().pk])
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        # Compteurs mis à jour à la validation de la transaction de l'écriture
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor = make_doctor()
+            self.patient = make_patient()
+
+    def test_counters_follow_saves_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = Appointment.objects.create(patient=self.patient, doctor=self.doctor,
+                                                     date_time=aware(2025, 1, 6, 9, 0), appointment_type='REMOTE')
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.status = 'CONFIRMED'
+            appointment.save()
+        with self.assertNumQueries(1):
+            totals, deltas = counters.snapshot()
+        self.assertEqual(totals[counters.DOCTORS], 1)
+        self.assertEqual(totals[counters.PATIENTS], 1)
+        self.assertEqual(totals[counters.APPOINTMENTS], 1)
+        self.assertEqual(totals[counters.status_key('PENDING')], 0)
+        self.assertEqual(totals[counters.status_key('CONFIRMED')], 1)
+        self.assertEqual(deltas[counters.APPOINTMENTS], 1)
+
+        # La suppression du médecin supprime aussi ses rendez-vous en cascade
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.delete()
+        totals, _ = counters.snapshot()
+        self.assertEqual(totals[counters.DOCTORS], 0)
+        self.assertEqual(totals[counters.APPOINTMENTS], 0)
+        self.assertEqual(totals[counters.status_key('CONFIRMED')], 0)
+
+    def test_counter_rows_are_not_locked_by_the_write(self):
+        with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as queries:
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor,
+                                       date_time=aware(2025, 1, 6, 9, 0), appointment_type='REMOTE')
+        # Aucune écriture de compteur dans la transaction de la réservation
+        self.assertFalse([query for query in queries if 'core_statcounter' in query['sql']])
+        self.assertEqual(counters.snapshot()[0][counters.APPOINTMENTS], 0)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(counters.snapshot()[0][counters.APPOINTMENTS], 1)
+
+        # Écriture annulée: rien n'est compté
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Appointment.objects.create(patient=self.patient, doctor=self.doctor,
+                                           date_time=aware(2025, 1, 6, 10, 0), appointment_type='REMOTE')
+                transaction.set_rollback(True)
+        self.assertEqual(counters.snapshot()[0][counters.APPOINTMENTS], 1)
+
+    def test_reconcile_repairs_drift(self):
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor,
+                                   date_time=aware(2025, 1, 6, 9, 0), appointment_type='REMOTE')
+        # QuerySet.update contourne les signaux
+        Appointment.objects.update(status='COMPLETED')
+        call_command('reconcile_counters', stdout=StringIO())
+        totals, _ = counters.snapshot()
+        self.assertEqual(totals[counters.status_key('PENDING')], 0)
+        self.assertEqual(totals[counters.status_key('COMPLETED')], 1)
+        self.assertEqual(counters.reconcile(), {})
+
+    def test_migration_seeds_existing_rows(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor,
+                                       date_time=aware(2025, 1, 6, 9, 0), appointment_type='REMOTE')
+        expected, _ = counters.snapshot()
+        StatCounter.objects.all().delete()
+        migration = import_module('core.migrations.0003_statcounter')
+        migration.seed_counters(django_apps, None)
+        self.assertEqual(counters.snapshot()[0], expected)
+        self.assertEqual(counters.reconcile(), {})
+
+
+class KeysetListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cardio = Speciality.objects.create(name='Cardiologie')
+        for i in range(30):
+            user = User.objects.create(username=f'doc{i:02d}', first_name='Jean', last_name=f'Nom{i:02d}',
+                                       role='DOCTOR')
+            Doctor.objects.create(user=user, license_number=str(i), speciality=cls.cardio if i % 2 else None)
+            user = User.objects.create(username=f'pat{i:02d}', first_name='Marie', last_name=f'Nom{i:02d}')
+            Patient.objects.create(user=user, birth_date=date(1990, 1, 1), blood_group='A+')
+        cls.admin = User.objects.create(username='admin', role='ADMIN')
+
+    def setUp(self):
+        # Les pages de l'annuaire sont en cache (locmem partagé entre les tests)
+        cache.clear()
+
+    def walk(self, url, params=None):
+        """Parcourt toutes les pages et renvoie les pk dans l'ordre"""
+        params, seen = dict(params or {}), []
+        while True:
+            response = self.client.get(url, params)
+            page = response.context['page_obj']
+            seen.extend(obj.pk for obj in page)
+            if not page.has_next():
+                return seen
+            params['cursor'] = page.next_cursor
+
+    def test_doctor_pages_use_constant_queries(self):
+        # Liste des médecins + liste des spécialités, quelle que soit la taille de la page
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('doctor_list'))
+        self.assertEqual(len(response.context['doctors']), 25)
+        self.assertContains(response, 'Dr. Jean Nom00')
+
+    def test_patient_pages_use_constant_queries(self):
+        self.client.force_login(self.admin)
+        # Session et utilisateur, puis la page de patients
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('patient_list'))
+        self.assertContains(response, 'Marie Nom00')
+
+    def test_patient_list_is_restricted_to_care_relationships(self):
+        url = reverse('patient_list')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(Patient.objects.first().user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        doctor = Doctor.objects.first()
+        doctor.patients.add(*Patient.objects.filter(user__last_name__in=['Nom03', 'Nom12']))
+        self.client.force_login(doctor.user)
+        self.assertEqual(self.walk(url), list(doctor.patients.order_by('user__last_name').values_list('pk', flat=True)))
+        self.assertEqual(len(self.walk(url, {'q': 'nom1'})), 1)
+
+    def test_walk_is_complete_and_stable_under_inserts(self):
+        url = reverse('doctor_list')
+        first = self.client.get(url).context['page_obj']
+        # Insertion avant le curseur: la page suivante ne doit ni répéter ni sauter de ligne
+        user = User.objects.create(username='early', first_name='A', last_name='Aaa', role='DOCTOR')
+        Doctor.objects.create(user=user, license_number='x')
+        rest = self.walk(url, {'cursor': first.next_cursor})
+        expected = list(Doctor.objects.exclude(user=user)
+                        .order_by('user__last_name', 'user__first_name', 'pk').values_list('pk', flat=True))
+        self.assertEqual([d.pk for d in first] + rest, expected)
+
+    def test_filters(self):
+        found = self.walk(reverse('doctor_list'), {'speciality': self.cardio.pk})
+        self.assertEqual(len(found), 15)
+        self.client.force_login(self.admin)
+        found = self.walk(reverse('patient_list'), {'q': 'nom1'})
+        self.assertEqual(len(found), 10)
+        self.assertEqual(self.client.get(reverse('patient_list'), {'cursor': '!!'}).status_code, 404)
+
+
+class CareAccessTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.other_doctor = make_doctor('doc2')
+        self.patient = make_patient()
+        self.stranger = make_patient('pat2')
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor,
+                                   date_time=aware(2025, 1, 6, 9, 0), appointment_type='REMOTE')
+        self.record = MedicalRecord.objects.create(patient=self.patient, doctor=self.other_doctor,
+                                                   record_type='LAB', title='NFS', description='-')
+
+    def request_for(self, user):
+        request = RequestFactory().get('/')
+        request.user = User.objects.select_related('doctor_profile', 'patient_profile').get(pk=user.pk)
+        return request
+
+    def test_relationships_follow_history(self):
+        self.assertQuerySetEqual(self.doctor.patients.all(), [self.patient])
+        self.assertQuerySetEqual(self.patient.doctors.order_by('pk'), [self.doctor, self.other_doctor])
+        self.assertEqual(CareRelationship.objects.count(), 2)
+
+    def test_access_is_memoized_per_request(self):
+        request = self.request_for(self.doctor.user)
+        access = care_access(request)
+        with self.assertNumQueries(1):
+            access.prefetch([self.patient.pk, self.stranger.pk])
+            self.assertTrue(access.can_view_patient(self.patient.pk))
+            self.assertFalse(access.can_view_patient(self.stranger.pk))
+            self.assertTrue(care_access(request).can_view_record(self.record))
+
+    def test_record_views_use_care_relationship(self):
+        view = MedicalRecordListView(request=self.request_for(self.doctor.user),
+                                     kwargs={'patient_id': self.stranger.pk})
+        self.assertFalse(view.get_queryset().exists())
+        view.kwargs = {'patient_id': self.patient.pk}
+        self.assertQuerySetEqual(view.get_queryset(), [self.record])
+
+        view = MedicalRecordDetailView(request=self.request_for(self.patient.user), kwargs={'pk': self.record.pk})
+        self.assertTrue(view.test_func())
+        view = MedicalRecordDetailView(request=self.request_for(self.stranger.user), kwargs={'pk': self.record.pk})
+        self.assertFalse(view.test_func())
+
+    def test_doctors_cannot_create_records_for_other_patients(self):
+        self.client.force_login(self.doctor.user)
+        data = {'record_type': 'LAB', 'title': 'NFS', 'description': '-', 'date': '2025-01-06'}
+        response = self.client.post(reverse('medical_record_create', args=[self.stranger.pk]), data)
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(self.doctor.patients.filter(pk=self.stranger.pk).exists())
+        self.assertFalse(MedicalRecord.objects.filter(patient=self.stranger).exists())
+
+
+class RecordFileDownloadTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.patient = make_patient()
+        self.stranger = make_patient('pat2')
+        self.record = MedicalRecord(patient=self.patient, record_type='IMAGING', title='IRM', description='-')
+        self.record.file.save('irm.bin', ContentFile(bytes(range(256)) * 40))
+        self.url = reverse('medical_record_file', args=[self.record.pk])
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_partial_and_conditional(self):
+        self.client.force_login(self.patient.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], '10240')
+        self.assertEqual(self.content(response), bytes(range(256)) * 40)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/10240')
+        self.assertEqual(self.content(response), bytes(range(10, 20)))
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(self.content(response), bytes(range(252, 256)))
+
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # If-Range périmé: fichier entier
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"autre"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=99999-').status_code, 416)
+
+    def test_only_safe_types_are_shown_inline(self):
+        self.client.force_login(self.patient.user)
+        for title, extension, disposition in (('IRM', '.bin', 'attachment'), ('Page', '.html', 'attachment'),
+                                              ('Logo', '.svg', 'attachment'), ('Compte rendu', '.pdf', 'inline')):
+            record = MedicalRecord(patient=self.patient, record_type='LAB', title=title, description='-')
+            record.file.save('upload' + extension, ContentFile(b'<script>alert(1)</script>'))
+            response = self.client.get(reverse('medical_record_file', args=[record.pk]))
+            self.assertTrue(response['Content-Disposition'].startswith(disposition + ';'), title)
+            self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+    def test_access_rules(self):
+        self.client.force_login(self.stranger.user)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    @override_settings(MEDICAL_FILES_OFFLOAD='nginx')
+    def test_offload_header(self):
+        self.client.force_login(self.patient.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.record.file.name)
+        self.assertEqual(response.content, b'')
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.patient = make_patient()
+
+    def record(self, content, name='scan.pdf'):
+        record = MedicalRecord(patient=self.patient, record_type='LAB', title='Bilan', description='-')
+        record.file.save(name, ContentFile(content))
+        return record
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.record(b'%PDF identique')
+        second = self.record(b'%PDF identique', name='autre.pdf')
+        third = self.record(b'%PDF different')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertNotEqual(first.file.name, third.file.name)
+        self.assertTrue(first.file.name.startswith('medical_records/cas/'))
+        self.assertEqual(StoredBlob.objects.get(name=first.file.name).refcount, 2)
+
+    def test_orphans_are_collected(self):
+        first = self.record(b'contenu')
+        second = self.record(b'contenu')
+        name = first.file.name
+        first.delete()
+        call_command('gc_blobs', grace_hours=0, stdout=StringIO())
+        self.assertTrue(content_addressed_storage.exists(name))
+        second.file = None
+        second.save()
+        self.assertEqual(StoredBlob.objects.get(name=name).refcount, 0)
+        call_command('gc_blobs', grace_hours=0, stdout=StringIO())
+        self.assertFalse(content_addressed_storage.exists(name))
+        self.assertFalse(StoredBlob.objects.exists())
+
+    def test_reused_blob_gets_a_new_grace_period(self):
+        first = self.record(b'contenu')
+        first.delete()
+        name = first.file.name
+        StoredBlob.objects.filter(name=name).update(updated_at=timezone.now() - timedelta(days=2))
+        # Nouvel envoi du même contenu, dossier pas encore enregistré: le blob n'a toujours aucune référence
+        self.assertEqual(content_addressed_storage.save('scan.pdf', ContentFile(b'contenu')), name)
+        call_command('gc_blobs', grace_hours=24, stdout=StringIO())
+        self.assertTrue(content_addressed_storage.exists(name))
+        self.assertEqual(StoredBlob.objects.get(name=name).refcount, 0)
+
+    def test_uploads_are_verified_by_a_job(self):
+        doctor = make_doctor()
+        Appointment.objects.create(patient=self.patient, doctor=doctor, date_time=aware(2025, 1, 6, 9, 0),
+                                   appointment_type='REMOTE')
+        self.client.force_login(doctor.user)
+        response = self.client.post(reverse('medical_record_create', args=[self.patient.pk]), {
+            'record_type': 'LAB', 'title': 'NFS', 'description': '-', 'date': '2025-01-06',
+            'file': SimpleUploadedFile('nfs.pdf', b'%PDF nfs'),
+        })
+        self.assertRedirects(response, reverse('medical_record_list', args=[self.patient.pk]),
+                             fetch_redirect_response=False)
+        record = MedicalRecord.objects.get(title='NFS')
+        (pk,) = claim(10)
+        self.assertEqual(execute(pk), 'DONE')
+        self.assertEqual(Job.objects.get(pk=pk).result, {'file': record.file.name, 'intact': True})
+
+        # Blob altéré sur disque: signalé par la tâche
+        with open(record.file.path, 'wb') as handle:
+            handle.write(b'abime')
+        job = enqueue('records.verify_file', {'record_id': record.pk})
+        claim(10)
+        with self.assertLogs('core.tasks', 'ERROR'):
+            self.assertEqual(execute(job.pk), 'DONE')
+        job.refresh_from_db()
+        self.assertFalse(job.result['intact'])
+
+    def test_reconcile_and_verify(self):
+        record = self.record(b'integre')
+        StoredBlob.objects.all().delete()
+        out = StringIO()
+        call_command('gc_blobs', reconcile=True, verify=True, stdout=out)
+        self.assertEqual(StoredBlob.objects.get(name=record.file.name).refcount, 1)
+        self.assertIn('Blobs corrompus: 0', out.getvalue())
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.stranger = make_patient('pat2')
+        self.record = MedicalRecord.objects.create(patient=self.patient, doctor=self.doctor, record_type='IMAGING',
+                                                   title='IRM genou droit', description='Lésion <b>méniscale</b>')
+        Prescription.objects.create(medical_record=self.record, valid_until=date(2025, 2, 1),
+                                    medications=[{'name': 'Amoxicilline', 'dosage': '1g'}])
+        Allergy.objects.create(patient=self.patient, name='Pénicilline', severity='SEVERE',
+                               reaction='Urticaire', onset_date=date(2020, 1, 1))
+        MedicalRecord.objects.create(patient=self.stranger, record_type='IMAGING',
+                                     title='IRM genou gauche', description='-')
+
+    def search(self, user, **params):
+        self.client.force_login(user)
+        return self.client.get(reverse('medical_record_search'), params).json()['results']
+
+    def test_results_are_ranked_highlighted_and_scoped(self):
+        results = self.search(self.patient.user, q='genou droit')
+        self.assertEqual([(r['type'], r['id']) for r in results], [('record', self.record.pk)])
+        self.assertEqual(results[0]['title'], 'IRM <mark>genou</mark> <mark>droit</mark>')
+        self.assertEqual(self.search(self.patient.user, q='meniscale')[0]['snippet'],
+                         'Imagerie médicale Lésion &lt;b&gt;<mark>méniscale</mark>&lt;/b&gt;')
+        self.assertEqual(self.search(self.patient.user, q='amoxi')[0]['type'], 'prescription')
+        self.assertEqual(self.search(self.patient.user, q='penicil')[0]['type'], 'allergy')
+        # Le médecin ne voit que les patients qu'il suit
+        self.assertEqual([r['patient'] for r in self.search(self.doctor.user, q='IRM')], [self.patient.pk])
+        self.assertEqual(self.search(self.doctor.user, q='IRM', patient=self.stranger.pk), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.record.title = 'Radiographie thorax'
+        self.record.save()
+        self.assertEqual([r['type'] for r in self.search(self.patient.user, q='thorax')], ['record'])
+        self.record.delete()
+        self.assertEqual(self.search(self.patient.user, q='thorax'), [])
+        self.assertEqual(self.search(self.patient.user, q='amoxicilline'), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM core_search_fts')
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self.search(self.patient.user, q='genou')), 1)
+        self.assertEqual(len(self.search(self.patient.user, q='urticaire')), 1)
+
+
+class ImportDataTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def write(self, name, content):
+        path = f'{self.tmp}/{name}'
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(content)
+        return path
+
+    def run_import(self, *args, **options):
+        out, err = StringIO(), StringIO()
+        call_command('import_data', *args, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_patients_and_ndjson_doctors_and_appointments(self):
+        patients = self.write('patients.csv', (
+            'username,first_name,last_name,email,birth_date,blood_group\n'
+            'alice,Alice,Martin,alice@example.com,1980-05-02,A+\n'
+            'bob,Bob,Durand,bob@example.com,pas-une-date,B+\n'
+            'alice,Alice,Bis,,1981-01-01,O-\n'
+        ))
+        _, err = self.run_import('patients', patients, batch_size=2)
+        self.assertIn('Ligne 3: birth_date', err)
+        self.assertIn('Ligne 4: username', err)
+        self.assertEqual(list(Patient.objects.values_list('user__username', flat=True)), ['alice'])
+        self.assertFalse(User.objects.get(username='alice').has_usable_password())
+
+        doctors = self.write('doctors.ndjson', (
+            '{"username": "house", "last_name": "House", "speciality": "Diagnostic", "license_number": "L1",'
+            ' "availability": {"monday": ["09:00-10:00"]}}\n'
+        ))
+        self.run_import('doctors', doctors)
+        doctor = Doctor.objects.get(user__username='house')
+        self.assertEqual((doctor.speciality.name, doctor.availability), ('Diagnostic', {'monday': ['09:00-10:00']}))
+
+        appointments = self.write('appointments.ndjson', (
+            '{"patient": "alice", "doctor": "house", "date_time": "2030-01-07 09:00", "appointment_type": "IN_PERSON"}\n'
+            '{"patient": "alice", "doctor": "house", "date_time": "2030-01-07 09:00", "appointment_type": "REMOTE"}\n'
+            '{"patient": "inconnu", "doctor": "house", "date_time": "2030-01-07 09:30", "appointment_type": "REMOTE"}\n'
+            'pas du json\n'
+        ))
+        out, err = self.run_import('appointments', appointments)
+        self.assertIn('1 ligne(s) importée(s), 3 rejetée(s)', out)
+        self.assertIn('Ligne 2: date_time', err)
+        self.assertIn('Ligne 3: patient', err)
+        self.assertIn('Ligne 4: JSON invalide', err)
+        # Les effets des signaux court-circuités sont rattrapés par lot (relations) et en fin d'import (compteurs)
+        self.assertTrue(CareRelationship.objects.filter(doctor=doctor, patient__user__username='alice').exists())
+        self.assertEqual(counters.snapshot()[0][counters.APPOINTMENTS], 1)
+
+    def test_appointment_batches_link_care_and_touch_feeds_before_finalize(self):
+        doctor, patient = make_doctor(), make_patient()
+        feed = agenda.feed_for(doctor.user)
+        CalendarFeed.objects.filter(pk=feed.pk).update(changed_at=timezone.now() - timedelta(days=1))
+        importer = AppointmentImporter()
+        valid, _ = importer.prepare([(1, {'patient': 'pat', 'doctor': 'doc', 'date_time': '2030-01-07 09:00',
+                                          'appointment_type': 'REMOTE'})])
+        # Import interrompu après ce lot: finalize() n'est jamais appelé
+        with transaction.atomic():
+            self.assertEqual(importer.save(valid), (1, []))
+        self.assertQuerySetEqual(doctor.patients.all(), [patient])
+        feed.refresh_from_db()
+        self.assertGreater(feed.changed_at, timezone.now() - timedelta(minutes=1))
+
+    def test_checkpoint_resumes_after_last_committed_line(self):
+        path = self.write('patients.ndjson', ''.join(
+            f'{{"username": "p{i}", "birth_date": "1990-01-01", "blood_group": "O+"}}\n' for i in range(5)
+        ))
+        checkpoint = f'{self.tmp}/checkpoint.json'
+        self.write('checkpoint.json', '{"path": "%s", "line": 3}' % path)
+        out, _ = self.run_import('patients', path, checkpoint=checkpoint, batch_size=1)
+        self.assertIn('Reprise après la ligne 3', out)
+        self.assertEqual(sorted(Patient.objects.values_list('user__username', flat=True)), ['p3', 'p4'])
+        # Une nouvelle exécution n'importe plus rien
+        self.run_import('patients', path, checkpoint=checkpoint)
+        self.assertEqual(Patient.objects.count(), 2)
+
+
+class PatientExportTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.other = make_patient('pat2')
+        self.record = MedicalRecord(patient=self.patient, doctor=self.doctor, record_type='LAB',
+                                    title='Bilan', description='-')
+        self.record.file.save('bilan.pdf', ContentFile(b'%PDF bilan'))
+        Prescription.objects.create(medical_record=self.record, valid_until=date(2025, 2, 1),
+                                    medications=[{'name': 'Doliprane'}])
+        Allergy.objects.create(patient=self.patient, name='Latex', severity='MILD', reaction='-',
+                               onset_date=date(2020, 1, 1))
+        Appointment.objects.create(patient=self.other, doctor=self.doctor, date_time=aware(2030, 1, 7, 9),
+                                   appointment_type='IN_PERSON')
+        self.url = reverse('patient_export', args=[self.patient.pk])
+
+    def export(self, **params):
+        """Demande l'export en tâche de fond (202), l'exécute comme run_jobs et renvoie le téléchargement"""
+        response = self.client.post(f'{self.url}?{urlencode(params)}')
+        self.assertEqual(response.status_code, 202)
+        download = response.json()['url']
+        self.assertEqual(response['Location'], download)
+        self.assertEqual(self.client.get(download).status_code, 202)
+        (pk,) = claim(10)
+        self.assertEqual(execute(pk), 'DONE')
+        return self.client.get(download)
+
+    def test_ndjson_export_is_scoped_to_the_patient(self):
+        self.client.force_login(self.patient.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn(f'patient-{self.patient.pk}.ndjson', response['Content-Disposition'])
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([line['type'] for line in lines], ['patient', 'record', 'prescription', 'allergy'])
+        self.assertEqual(lines[0]['username'], 'pat')
+        self.assertEqual(lines[1]['file'], f'files/{self.record.pk}.pdf')
+        self.assertEqual(lines[2]['medications'], [{'name': 'Doliprane'}])
+
+        # Ni flux, ni demande, ni téléchargement pour un autre patient
+        download = self.client.post(self.url).json()['job']
+        self.client.force_login(self.other.user)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.post(self.url).status_code, 403)
+        self.assertEqual(self.client.get(reverse('export_download', args=[download])).status_code, 403)
+
+    def test_zip_export_streams_attachments(self):
+        self.client.force_login(self.patient.user)
+        for response in (self.client.get(self.url, {'format': 'zip'}), self.export(format='zip')):
+            archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+            self.assertEqual(archive.namelist(), ['export.ndjson', f'files/{self.record.pk}.pdf'])
+            self.assertEqual(archive.read(f'files/{self.record.pk}.pdf'), b'%PDF bilan')
+            self.assertEqual(len(archive.read('export.ndjson').splitlines()), 4)
+
+    def test_pending_export_is_reused(self):
+        self.client.force_login(self.patient.user)
+        first = self.client.post(self.url).json()['job']
+        # Rafraîchissement: même tâche tant qu'elle attend ou tourne
+        self.assertEqual(self.client.post(self.url).json()['job'], first)
+        claim(10)
+        self.assertEqual(self.client.post(self.url).json()['job'], first)
+        # Autre format ou autre demandeur: nouvelle tâche
+        self.assertNotEqual(self.client.post(f'{self.url}?format=zip').json()['job'], first)
+        self.client.force_login(User.objects.create(username='admin', role='ADMIN'))
+        self.assertNotEqual(self.client.post(self.url).json()['job'], first)
+        self.assertEqual(Job.objects.filter(name='exports.patients').count(), 3)
+        # Terminée: une nouvelle demande produit un nouvel export
+        self.assertEqual(execute(first), 'DONE')
+        self.client.force_login(self.patient.user)
+        self.assertNotEqual(self.client.post(self.url).json()['job'], first)
+
+    def test_expired_exports_are_purged(self):
+        self.client.force_login(self.patient.user)
+        self.assertEqual(self.export().status_code, 200)
+        job = Job.objects.get(name='exports.patients')
+        path = default_storage.path(job.result['path'])
+        purge = Job.objects.get(name='exports.purge')
+        self.assertGreater(purge.run_at, timezone.now() + EXPORT_RETENTION)
+
+        # Purge avant l'expiration: rien n'est supprimé
+        Job.objects.filter(pk=purge.pk).update(run_at=timezone.now())
+        claim(10)
+        self.assertEqual(execute(purge.pk), 'DONE')
+        self.assertEqual(Job.objects.get(pk=purge.pk).result, {'deleted': 0})
+        self.assertTrue(os.path.exists(path))
+
+        expired = (timezone.now() - EXPORT_RETENTION - timedelta(minutes=1)).timestamp()
+        os.utime(path, (expired, expired))
+        self.assertEqual(purge_expired(), 1)
+        self.assertFalse(os.path.exists(path))
+        download = reverse('export_download', args=[job.pk])
+        self.assertEqual(self.client.get(download).status_code, 410)
+        # Fichier encore présent mais demande trop ancienne: expiré aussi
+        Job.objects.filter(pk=job.pk).update(finished_at=timezone.now() - EXPORT_RETENTION * 2)
+        self.assertEqual(self.client.get(download).status_code, 410)
+
+    def test_bulk_export_merges_sorted_streams(self):
+        # Une requête par table, quel que soit le nombre de patients
+        with self.assertNumQueries(5):
+            rows = list(export_rows(Patient.objects.all(), chunk_size=1))
+        self.assertEqual([(row['type'], row.get('patient') or row['id']) for row in rows], [
+            ('patient', self.patient.pk), ('record', self.patient.pk), ('prescription', self.patient.pk),
+            ('allergy', self.patient.pk), ('patient', self.other.pk), ('appointment', self.other.pk),
+        ])
+
+
+class DoctorDirectoryCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cardio = Speciality.objects.create(name='Cardiologie')
+        self.doctor = make_doctor(speciality=self.cardio, availability={'lundi': ['09:00-12:00']})
+        self.detail = reverse('doctor_detail', args=[self.doctor.pk])
+
+    def test_pages_are_cached_and_invalidated_by_saves(self):
+        self.assertContains(self.client.get(self.detail), 'Cardiologie')
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(self.detail), '09:00-12:00')
+
+        self.doctor.availability = {'mardi': ['14:00-18:00']}
+        self.doctor.save()
+        self.assertContains(self.client.get(self.detail), '14:00-18:00')
+
+        self.cardio.name = 'Cardiologie interventionnelle'
+        self.cardio.save()
+        self.assertContains(self.client.get(self.detail), 'Cardiologie interventionnelle')
+
+        self.client.get(reverse('doctor_list'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('doctor_list'))
+        self.doctor.user.last_name = 'Renommé'
+        self.doctor.user.save()
+        self.assertContains(self.client.get(reverse('doctor_list')), 'Dr. Jean Renommé')
+        self.assertContains(self.client.get(self.detail), 'Dr. Jean Renommé')
+
+    def test_logged_in_users_get_cached_data_but_fresh_pages(self):
+        self.client.get(self.detail)
+        request = RequestFactory().get(self.detail)
+        request.user = self.doctor.user
+        # Données en cache: aucune requête pour la fiche elle-même
+        with self.assertNumQueries(0):
+            response = DoctorDetailView.as_view()(request, pk=self.doctor.pk)
+        self.assertEqual(response.context_data['doctor'].speciality.name, 'Cardiologie')
+        self.assertEqual(self.client.get(reverse('doctor_detail', args=[0])).status_code, 404)
+
+    def test_cached_doctor_holds_only_public_fields(self):
+        directory.get_doctor(self.doctor.pk)
+        version, = directory.versions(directory.doctor_version_name(self.doctor.pk))
+        cached = cache.get(f'{directory.PREFIX}:doctor:{self.doctor.pk}:{version}')
+        self.assertEqual(cached.user.last_name, 'Doc')
+        self.assertTrue({'password', 'email', 'is_superuser'}.isdisjoint(vars(cached.user)))
+        self.assertNotIn('license_number', vars(cached))
+
+    def test_single_recompute_on_concurrent_miss(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'valeur'
+
+        threads = [threading.Thread(target=directory.get_or_compute, args=('cle', compute)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.get('cle'), 'valeur')
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor('doc', availability={'lundi': ['09:00']})
+        self.other_doctor = make_doctor('doc2')
+        self.patient = make_patient()
+        self.stranger = make_patient('pat2')
+        self.appointment = Appointment.objects.create(patient=self.patient, doctor=self.doctor,
+                                                      date_time=aware(2025, 1, 6, 9, 0), appointment_type='REMOTE')
+        Appointment.objects.create(patient=self.stranger, doctor=self.other_doctor,
+                                   date_time=aware(2025, 1, 6, 9, 0), appointment_type='REMOTE')
+        self.record = MedicalRecord.objects.create(patient=self.patient, doctor=self.doctor, record_type='LAB',
+                                                   title='NFS', description='-', date=date(2025, 1, 6))
+        self.hidden = MedicalRecord.objects.create(patient=self.stranger, record_type='LAB', title='Secret',
+                                                   description='-', date=date(2025, 1, 7))
+        Prescription.objects.create(medical_record=self.record, medications=[{'name': 'Doliprane'}],
+                                    valid_until=date(2025, 2, 1))
+
+    def test_doctor_directory_pagination_fields_and_etag(self):
+        make_doctor('doc3')
+        url = reverse('api-doctor-list')
+        first = self.client.get(url, {'page_size': 2, 'fields': 'id,last_name'}).json()
+        self.assertEqual([set(row) for row in first['results']], [{'id', 'last_name'}] * 2)
+        second = self.client.get(first['next']).json()
+        self.assertEqual([row['last_name'] for row in first['results'] + second['results']],
+                         ['Doc', 'Doc2', 'Doc3'])
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.client.get(url, {'fields': 'id,secret'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'fields': ','}).status_code, 400)
+
+        response = self.client.get(url)
+        # Validateur tiré des versions du cache: 304 sans requête SQL
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.doctor.user.last_name = 'Renommé'
+        self.doctor.user.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Renommé', [row['last_name'] for row in response.json()['results']])
+
+    def test_querysets_follow_roles_and_care_relationships(self):
+        self.assertEqual(self.client.get(reverse('api-appointment-list')).status_code, 403)
+        self.client.force_login(self.patient.user)
+        rows = self.client.get(reverse('api-appointment-list')).json()['results']
+        self.assertEqual([row['id'] for row in rows], [self.appointment.pk])
+        self.assertEqual(rows[0]['doctor_name'], 'Jean Doc')
+        self.assertEqual(self.client.get(reverse('api-appointment-list'), {'from': '2025-02-30'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api-record-detail', args=[self.hidden.pk])).status_code, 404)
+
+        self.client.force_login(self.doctor.user)
+        with self.assertNumQueries(3):
+            rows = self.client.get(reverse('api-record-list')).json()['results']
+        self.assertEqual([(row['id'], row['has_prescription']) for row in rows], [(self.record.pk, True)])
+        rows = self.client.get(reverse('api-prescription-list')).json()['results']
+        self.assertEqual(rows[0]['patient'], self.patient.pk)
+
+        response = self.client.get(reverse('api-record-detail', args=[self.record.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse('api-record-detail', args=[self.record.pk]),
+                                         HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.record.title = 'NFS de contrôle'
+        self.record.save()
+        self.assertEqual(self.client.get(reverse('api-record-detail', args=[self.record.pk]),
+                                         HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class AllergyScreeningTests(TestCase):
+    def setUp(self):
+        allergen_index.clear()
+        # Catalogue vide: saisie libre des médicaments
+        medication_catalogue.clear()
+        self.patient = make_patient()
+        self.record = MedicalRecord.objects.create(patient=self.patient, record_type='CONSULT', title='Angine',
+                                                   description='-')
+        self.allergy = Allergy.objects.create(patient=self.patient, name='Pénicillines', severity='SEVERE',
+                                              reaction='Urticaire', onset_date=date(2020, 1, 1))
+
+    def form(self, *names):
+        data = {'medications': json.dumps([{'name': name, 'dosage': '1g'} for name in names]),
+                'instructions': '', 'valid_until': '2030-01-01'}
+        return PrescriptionForm(data, patient_id=self.patient.pk)
+
+    def test_form_rejects_conflicting_medications(self):
+        form = self.form('Amoxicilline 1g', 'Paracétamol')
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['medications'],
+                         ['Amoxicilline 1g: contre-indiqué, allergie Pénicillines (Sévère)'])
+        self.assertTrue(self.form('Paracétamol').is_valid())
+        self.assertFalse(PrescriptionForm({'medications': '[{"dosage": "1g"}]', 'valid_until': '2030-01-01'},
+                                          patient_id=self.patient.pk).is_valid())
+
+        # Allergie directement nommée et classe apparentée (aspirine -> AINS)
+        Allergy.objects.create(patient=self.patient, name="Allergie à l'aspirine", severity='MILD',
+                               reaction='-', onset_date=date(2020, 1, 1))
+        self.assertFalse(self.form('Ibuprofène').is_valid())
+        self.allergy.active = False
+        self.allergy.save()
+        self.assertTrue(self.form('Augmentin').is_valid())
+
+    def test_index_is_refreshed_when_mappings_change(self):
+        self.assertTrue(self.form('Nouvelcilline').is_valid())
+        DrugAllergen.objects.create(allergen='Pénicilline', substance='Nouvelcilline')
+        self.assertFalse(self.form('Nouvelcilline').is_valid())
+
+    def test_other_processes_reload_changed_mappings(self):
+        # Index d'un autre processus, et correspondance ajoutée sans passer par les signaux de celui-ci
+        other = AllergenIndex()
+        self.assertEqual(other.medication_key('Nouvelcilline')[1], frozenset())
+        DrugAllergen.objects.bulk_create([DrugAllergen(allergen='Pénicilline', substance='Nouvelcilline')])
+        with self.settings(INDEX_VERSION_CHECK_SECONDS=0):
+            self.assertEqual(other.medication_key('Nouvelcilline')[1], frozenset())
+            # Le processus qui a écrit incrémente la version partagée
+            versions.bump(allergies.VERSION_NAME)
+            self.assertIn('penicilline', other.medication_key('Nouvelcilline')[1])
+            self.assertEqual(Screener(other).conflicts([self.allergy], [{'name': 'Nouvelcilline'}]),
+                             [('Nouvelcilline', self.allergy)])
+
+    def test_new_allergy_screens_valid_prescriptions(self):
+        prescription = Prescription.objects.create(medical_record=self.record, medications=[{'name': 'Bactrim'}],
+                                                   valid_until=timezone.localdate() + timedelta(days=10))
+        expired = MedicalRecord.objects.create(patient=self.patient, record_type='CONSULT', title='Ancienne',
+                                               description='-')
+        Prescription.objects.create(medical_record=expired, medications=[{'name': 'Bactrim'}],
+                                    valid_until=date(2020, 1, 1))
+        sulfa = Allergy.objects.create(patient=self.patient, name='Sulfamides', severity='LIFE_THREATENING',
+                                       reaction='-', onset_date=date(2024, 1, 1))
+        self.assertQuerySetEqual(PrescriptionAlert.objects.values_list('prescription', 'allergy', 'medication'),
+                                 [(prescription.pk, sulfa.pk, 'Bactrim')])
+        # Le contrôle en lot retrouve le même conflit sans doublon
+        self.assertEqual(screen()['conflicts'], 1)
+        self.assertEqual(PrescriptionAlert.objects.count(), 1)
+        sulfa.active = False
+        sulfa.save()
+        self.assertFalse(PrescriptionAlert.objects.exists())
+
+
+class MedicationCatalogueTests(TestCase):
+    def setUp(self):
+        medication_catalogue.clear()
+        # Les lignes disparaissent avec la transaction du test, sans signal
+        self.addCleanup(medication_catalogue.clear)
+
+    def import_catalogue(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        with open(f'{tmp}/catalogue.csv', 'w', encoding='utf-8') as handle:
+            handle.write('name,ingredient,form\n'
+                         'Amoxicilline 500 mg,Amoxicilline,gélule\n'
+                         'Augmentin 1 g,Amoxicilline acide clavulanique,comprimé\n'
+                         'Doliprane 1000 mg,Paracétamol,comprimé\n'
+                         'Paracétamol 500 mg,Paracétamol,comprimé\n'
+                         ',Sans nom,\n')
+        err = StringIO()
+        call_command('import_data', 'medications', f'{tmp}/catalogue.csv', stdout=StringIO(), stderr=err)
+        self.assertIn('Ligne 6: name', err.getvalue())
+
+    def test_search_ranks_prefixes_words_ingredients_and_typos(self):
+        catalogue = MedicationCatalogue()
+        catalogue.load([(1, 'Acide acétylsalicylique 100 mg', 'Acide acétylsalicylique', ''),
+                        (2, 'Acétazolamide 250 mg', 'Acétazolamide', ''),
+                        (3, 'Aspégic 1000 mg', 'Acide acétylsalicylique', 'poudre'),
+                        (4, 'Doliprane 1000 mg', 'Paracétamol', '')])
+
+        def names(query, limit=10):
+            return [entry.name for entry in catalogue.search(query, limit)]
+
+        # Début du nom, puis début d'un autre mot du nom, puis substance active
+        self.assertEqual(names('Acé'), ['Acétazolamide 250 mg', 'Acide acétylsalicylique 100 mg',
+                                        'Aspégic 1000 mg'])
+        self.assertEqual(names('ace', limit=1), ['Acétazolamide 250 mg'])
+        self.assertEqual(names('paracetamol'), ['Doliprane 1000 mg'])
+        # Une faute: lettre remplacée, inversée, en trop ou omise
+        for typo in ('dolipranne', 'dolirpane', 'dolpirane', 'dlipran'):
+            self.assertEqual(names(typo), ['Doliprane 1000 mg'], typo)
+        self.assertEqual(names('d'), [])
+        self.assertEqual(names('xyzt'), [])
+        self.assertEqual(catalogue.lookup('ASPEGIC 1000 MG').pk, 3)
+
+    def test_autocomplete_endpoint_is_cacheable_and_follows_imports(self):
+        url = f"{reverse('medication_autocomplete')}?q=amox"
+        self.assertEqual(self.client.get(url).json()['results'], [])
+        self.import_catalogue()
+        response = self.client.get(url)
+        self.assertEqual([item['name'] for item in response.json()['results']],
+                         ['Amoxicilline 500 mg', 'Augmentin 1 g'])
+        self.assertIn('public', response['Cache-Control'])
+        # Version partagée relue au plus une fois par intervalle: aucune requête dans l'intervalle
+        with self.settings(INDEX_VERSION_CHECK_SECONDS=3600), self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        # Réimport: mise à jour par nom, sans doublon; modification unitaire: nouvel ETag
+        self.import_catalogue()
+        self.assertEqual(Medication.objects.count(), 4)
+        Medication.objects.create(name='Amoxicilline 1 g', ingredient='Amoxicilline')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 3)
+
+    def test_other_processes_reload_after_a_change(self):
+        # Catalogue d'un autre processus: seule la version partagée (table IndexVersion) lui signale le changement
+        other = MedicationCatalogue()
+        self.assertIsNone(other.lookup('Doliprane 1000 mg'))
+        self.import_catalogue()
+        with self.settings(INDEX_VERSION_CHECK_SECONDS=3600):
+            # Version pas encore relue: aucune requête, ancien catalogue
+            with self.assertNumQueries(0):
+                self.assertIsNone(other.lookup('Doliprane 1000 mg'))
+        with self.settings(INDEX_VERSION_CHECK_SECONDS=0):
+            self.assertEqual(other.lookup('Doliprane 1000 mg').name, 'Doliprane 1000 mg')
+            # Version inchangée: la relire suffit, pas de rechargement
+            with self.assertNumQueries(1):
+                other.lookup('Doliprane 1000 mg')
+            # Écriture d'un autre processus, sans les signaux de celui-ci
+            Medication.objects.bulk_create([Medication(name='Amoxicilline 1 g', ingredient='Amoxicilline')])
+            self.assertIsNone(other.lookup('amoxicilline 1 G'))
+            versions.bump(medications.VERSION_NAME)
+            self.assertIsNotNone(other.lookup('amoxicilline 1 G'))
+
+    def test_prescription_form_uses_catalogue_names(self):
+        def form(*names):
+            return PrescriptionForm({'medications': json.dumps([{'name': name} for name in names]),
+                                     'valid_until': '2030-01-01'})
+
+        # Catalogue vide: saisie libre
+        self.assertTrue(form('Nom libre').is_valid())
+        self.import_catalogue()
+        valid = form('doliprane 1000 MG')
+        self.assertTrue(valid.is_valid())
+        self.assertEqual(valid.cleaned_data['medications'], [{'name': 'Doliprane 1000 mg'}])
+        invalid = form('Paracétamol 500 mg', 'Dolipranne')
+        self.assertFalse(invalid.is_valid())
+        self.assertEqual(invalid.errors['medications'],
+                         ['Dolipranne: absent du catalogue (suggestions: Doliprane 1000 mg)'])
+
+
+class FlakyEmailBackend(locmem.EmailBackend):
+    """Boîte d'envoi de test qui échoue au-delà de `limit` emails"""
+    limit = None
+
+    def send_messages(self, messages):
+        if self.limit is not None and len(mail.outbox) >= self.limit:
+            raise ConnectionError("serveur indisponible")
+        return super().send_messages(messages)
+
+
+class ReminderTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.now = timezone.now().replace(microsecond=0)
+
+    def book(self, hours, status='PENDING', username='pat'):
+        patient = Patient.objects.filter(user__username=username).first() or make_patient(username)
+        User.objects.filter(pk=patient.user_id).update(email=f'{username}@example.org')
+        return Appointment.objects.create(patient=patient, doctor=self.doctor, status=status,
+                                          date_time=self.now + timedelta(hours=hours), appointment_type='IN_PERSON')
+
+    def test_reminders_are_sent_when_due_and_only_once(self):
+        soon = self.book(20)
+        later = self.book(27)
+        self.book(3, status='CANCELLED')
+        scheduler = ReminderScheduler(hours_before=24, refresh=timedelta(hours=12), poll=timedelta(hours=12))
+        self.assertEqual(scheduler.tick(self.now), 1)
+        self.assertEqual(mail.outbox[0].to, ['pat@example.org'])
+        self.assertIn(f"{timezone.localtime(soon.date_time):%d/%m/%Y à %H:%M}", mail.outbox[0].body)
+        # Le travailleur dort jusqu'à l'échéance suivante
+        self.assertEqual(scheduler.next_wakeup(), later.date_time - timedelta(hours=24))
+        # Un redémarrage ne renvoie rien
+        self.assertEqual(ReminderScheduler(hours_before=24).tick(self.now), 0)
+
+        # Rendez-vous déplacé: pas de rappel à l'ancienne échéance, la relecture de la fenêtre le replanifie
+        Appointment.objects.filter(pk=later.pk).update(date_time=later.date_time + timedelta(hours=2))
+        self.assertEqual(scheduler.tick(self.now + timedelta(hours=3, minutes=1)), 0)
+        self.assertEqual(len(scheduler), 0)
+        self.assertEqual(scheduler.tick(self.now + timedelta(hours=12)), 1)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertFalse(ReminderScheduler.pending().exists())
+
+    @override_settings(EMAIL_BACKEND='core.tests.FlakyEmailBackend')
+    def test_new_bookings_are_batched_and_failed_sends_retried(self):
+        scheduler = ReminderScheduler(hours_before=24, batch_size=2)
+        self.assertEqual(scheduler.tick(self.now), 0)
+        for i in range(5):
+            self.book(i + 1, username=f'p{i}')
+        FlakyEmailBackend.limit = 3
+        self.addCleanup(setattr, FlakyEmailBackend, 'limit', None)
+        # Les nouveaux rendez-vous sont lus à la relève suivante (clé primaire), par lots de 2
+        with self.assertLogs('core.reminders', 'ERROR'):
+            self.assertEqual(scheduler.tick(self.now + timedelta(minutes=1)), 3)
+        self.assertEqual(ReminderScheduler.pending().count(), 2)
+
+        FlakyEmailBackend.limit = None
+        self.assertEqual(scheduler.tick(self.now + timedelta(minutes=2)), 0)
+        self.assertEqual(scheduler.tick(self.now + timedelta(minutes=1) + RETRY_DELAY), 2)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         [f'p{i}@example.org' for i in range(5)])
+
+
+class JobQueueTests(TestCase):
+    def test_claim_order_retries_and_reaping(self):
+        low = enqueue('tests.echo', {'n': 1})
+        high = enqueue('tests.echo', {'n': 2}, priority=5)
+        enqueue('tests.echo', {'n': 3}, delay=timedelta(hours=1))
+        self.assertEqual(claim(10), [high.pk, low.pk])
+        # Déjà réservées: un second travailleur ne les reprend pas
+        self.assertEqual(claim(10), [])
+        self.assertEqual(execute(high.pk), 'DONE')
+        high.refresh_from_db()
+        self.assertEqual((high.status, high.result, high.attempts), ('DONE', {'n': 2}, 1))
+
+        # Échec: nouvelle tentative après un délai croissant, puis abandon
+        failing = enqueue('tests.fail', max_attempts=2)
+        self.assertEqual(claim(10), [failing.pk])
+        with self.assertLogs('core.jobs', 'WARNING'):
+            self.assertEqual(execute(failing.pk), 'QUEUED')
+        failing.refresh_from_db()
+        self.assertIn('RuntimeError: panne', failing.last_error)
+        self.assertGreater(failing.run_at, timezone.now() + jobs.BACKOFF_BASE / 2)
+        self.assertEqual(claim(10), [])
+        self.assertEqual(claim(10, now=timezone.now() + jobs.BACKOFF_BASE * 2), [failing.pk])
+        with self.assertLogs('core.jobs', 'WARNING'):
+            self.assertEqual(execute(failing.pk), 'FAILED')
+
+        # Travailleur disparu: la tâche réservée revient en file
+        Job.objects.filter(pk=low.pk).update(locked_at=timezone.now() - jobs.STALE_AFTER * 2)
+        self.assertEqual(reap(), 1)
+        self.assertEqual(claim(10), [low.pk])
+        # ... sauf si elle a épuisé ses tentatives (tâche qui tue son travailleur)
+        Job.objects.filter(pk=low.pk).update(locked_at=timezone.now() - jobs.STALE_AFTER * 2, attempts=3)
+        self.assertEqual(reap(), 1)
+        low.refresh_from_db()
+        self.assertEqual((low.status, low.locked_by), ('FAILED', ''))
+        self.assertIsNotNone(low.finished_at)
+        self.assertRaises(ValueError, enqueue, 'tests.inconnue')
+
+    def test_mapping_changes_schedule_one_rescreen(self):
+        patient = make_patient()
+        record = MedicalRecord.objects.create(patient=patient, record_type='CONSULT', title='-', description='-')
+        Prescription.objects.create(medical_record=record, medications=[{'name': 'Nouvelcilline'}],
+                                    valid_until=timezone.localdate() + timedelta(days=5))
+        Allergy.objects.create(patient=patient, name='Pénicilline', severity='SEVERE', reaction='-',
+                               onset_date=date(2020, 1, 1))
+        DrugAllergen.objects.create(allergen='Pénicilline', substance='Nouvelcilline')
+        DrugAllergen.objects.create(allergen='Pénicilline', substance='Autrecilline')
+        self.assertFalse(PrescriptionAlert.objects.exists())
+        (pk,) = claim(10)
+        self.assertEqual(execute(pk), 'DONE')
+        self.assertEqual(PrescriptionAlert.objects.get().medication, 'Nouvelcilline')
+
+
+class JobWorkerTests(TransactionTestCase):
+    def test_thread_pool_runs_jobs_concurrently(self):
+        for _ in range(6):
+            enqueue('tests.sleep', {'seconds': 0.2})
+        enqueue('tests.fail', max_attempts=1)
+        started = time.perf_counter()
+        with self.assertLogs('core.jobs', 'WARNING'):
+            stats = Worker(concurrency=3, poll_interval=0.05).run(burst=True)
+        self.assertEqual(stats, {'DONE': 6, 'QUEUED': 0, 'FAILED': 1})
+        self.assertLess(time.perf_counter() - started, 6 * 0.2)
+        threads = set(Job.objects.filter(status='DONE').values_list('result', flat=True))
+        self.assertGreater(len(threads), 1)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    # Hors de la transaction de TestCase: dans une transaction, toutes les lectures vont à la base principale
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def serve(self, request, view=None):
+        """Passe la requête dans le middleware; renvoie (réponse, bases lues avant/après une écriture)"""
+        seen = []
+
+        def get_response(request):
+            if view is not None:
+                middleware.process_view(request, view, (), {})
+            seen.append(self.router.db_for_read(Doctor))
+            seen.append(self.router.db_for_read(Session))
+            if request.method == 'POST' or request.GET.get('write'):
+                self.router.db_for_write(Appointment)
+                seen.append(self.router.db_for_read(Doctor))
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        return middleware(request), seen
+
+    def test_reads_after_a_write_stay_on_primary(self):
+        self.assertIsNone(self.router.db_for_read(Doctor))
+        response, seen = self.serve(self.factory.get('/'))
+        self.assertEqual(seen, ['replica', 'default'])
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+        # Une écriture bascule la suite de la requête et les requêtes suivantes sur la base principale
+        response, seen = self.serve(self.factory.get('/', {'write': 1}))
+        self.assertEqual(seen, ['replica', 'default', 'default'])
+        cookie = response.cookies[STICKY_COOKIE]
+        request = self.factory.get('/')
+        request.COOKIES[STICKY_COOKIE] = cookie.value
+        self.assertEqual(self.serve(request)[1], ['default', 'default'])
+        # Fenêtre expirée
+        request.COOKIES[STICKY_COOKIE] = str(time.time() - 1)
+        self.assertEqual(self.serve(request)[1], ['replica', 'default'])
+
+        response, seen = self.serve(self.factory.post('/'))
+        self.assertEqual(seen[0], 'default')
+        with override_settings(DATABASE_REPLICAS=[]):
+            response, seen = self.serve(self.factory.get('/', {'write': 1}))
+        self.assertEqual(seen, ['default', 'default', 'default'])
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_view_overrides_and_transactions(self):
+        view = use_primary(lambda request: None)
+        self.assertEqual(self.serve(self.factory.get('/'), view)[1], ['default', 'default'])
+
+        def get_response(request):
+            reads = [self.router.db_for_read(Doctor)]
+            with primary():
+                reads.append(self.router.db_for_read(Doctor))
+            with transaction.atomic():
+                reads.append(self.router.db_for_read(Doctor))
+            reads.append(self.router.db_for_read(Doctor))
+            return HttpResponse(json.dumps(reads))
+
+        response = ReplicaRoutingMiddleware(get_response)(self.factory.get('/'))
+        self.assertEqual(json.loads(response.content), ['replica', 'default', 'default', 'replica'])
+
+
+class SQLiteProfileTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def open(self):
+        settings_dict = dict(connection.settings_dict, NAME=f'{self.directory}/lane.sqlite3',
+                             OPTIONS={'pragmas': {'cache_size': -1024}, 'write_lane_timeout': 0.05})
+        wrapper = ProductionSQLite(settings_dict, alias='lane')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_pragmas_and_serialized_write_lane(self):
+        first, second = self.open(), self.open()
+        with first.cursor() as cursor:
+            self.assertEqual(cursor.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(cursor.execute('PRAGMA synchronous').fetchone()[0], 1)  # NORMAL
+            self.assertEqual(cursor.execute('PRAGMA cache_size').fetchone()[0], -1024)
+            cursor.execute('CREATE TABLE t (x integer)')
+        self.assertEqual(first.transaction_mode, 'IMMEDIATE')
+
+        # Une transaction en cours: l'autre connexion attend son tour, puis abandonne passé le délai
+        first.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        with self.assertRaises(OperationalError):
+            second.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        second.set_autocommit(True)
+        with first.cursor() as cursor:
+            cursor.execute('INSERT INTO t VALUES (1)')
+        first.commit()
+        first.set_autocommit(True)
+        second.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        with second.cursor() as cursor:
+            self.assertEqual(cursor.execute('SELECT count(*) FROM t').fetchone()[0], 1)
+        second.rollback()
+        second.set_autocommit(True)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        make_doctor()
+
+    def metric(self, text, prefix):
+        """Valeur de la première ligne commençant par prefix"""
+        line = next(line for line in text.splitlines() if line.startswith(prefix))
+        return float(line.rsplit(' ', 1)[1])
+
+    def test_views_are_measured_and_exported(self):
+        self.client.get(reverse('doctor_list'))
+        self.client.get(reverse('doctor_list'))
+        self.client.get('/inexistant/')
+        with override_settings(METRICS_TOKEN='jeton'):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer jeton')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        text = response.content.decode()
+        self.assertEqual(self.metric(text, 'unisalute_http_requests_total{view="doctor_list",method="GET",'
+                                           'status="200"}'), 2)
+        self.assertEqual(self.metric(text, 'unisalute_http_requests_total{view="<unresolved>",method="GET",'
+                                           'status="404"}'), 1)
+        self.assertEqual(self.metric(text, 'unisalute_http_request_duration_seconds_count{view="doctor_list"}'), 2)
+        self.assertEqual(self.metric(text, 'unisalute_http_request_duration_seconds_bucket{view="doctor_list",'
+                                           'le="+Inf"}'), 2)
+        # Liste + spécialités au premier appel, page en cache au second
+        self.assertEqual(self.metric(text, 'unisalute_db_queries_per_request_sum{view="doctor_list"}'), 2)
+        self.assertGreater(self.metric(text, 'unisalute_template_render_seconds_total{view="doctor_list"}'), 0)
+
+    def test_metrics_require_an_admin_or_the_token(self):
+        url = reverse('metrics')
+        # Adresse autorisée seule (proxy inverse local): refusé
+        self.assertEqual(self.client.get(url).status_code, 404)
+        with override_settings(METRICS_TOKEN='jeton'):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer autre').status_code, 404)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer jeton').status_code, 200)
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.1',
+                                             HTTP_AUTHORIZATION='Bearer jeton').status_code, 404)
+        self.client.force_login(make_patient().user)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(User.objects.create(username='admin', role='ADMIN'))
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.1').status_code, 404)
+
+    async def test_async_views_are_measured(self):
+        doctor = await Doctor.objects.afirst()
+        # Version partagée des créneaux déjà relue: elle ne l'est plus pendant la requête mesurée
+        await slot_index.aweeks([doctor.pk])
+        with self.settings(INDEX_VERSION_CHECK_SECONDS=3600):
+            response = await self.async_client.get(reverse('doctor_slots', args=[doctor.pk]))
+        self.assertEqual(response.status_code, 200)
+        text = registry.render()
+        self.assertEqual(self.metric(text, 'unisalute_http_requests_total{view="doctor_slots",method="GET",'
+                                           'status="200"}'), 1)
+        # Existence du médecin puis rendez-vous de la fenêtre, exécutés dans des threads
+        self.assertEqual(self.metric(text, 'unisalute_db_queries_per_request_sum{view="doctor_slots"}'), 2)
+
+    def test_duplicate_queries_and_slow_request_log(self):
+        def view(request):
+            # N+1 typique: la même requête paramétrée pour chaque élément
+            for pk in range(3):
+                list(User.objects.filter(pk=pk))
+            return HttpResponse()
+
+        with override_settings(METRICS_SLOW_REQUEST_MS=0), self.assertLogs('core.metrics', 'WARNING') as logs:
+            MetricsMiddleware(view)(RequestFactory().get('/'))
+        self.assertIn('3 requêtes SQL', logs.output[0])
+        self.assertIn('x3: SELECT', logs.output[0])
+        text = registry.render()
+        self.assertEqual(self.metric(text, 'unisalute_db_duplicate_queries_total{view="<unresolved>"}'), 2)
+        self.assertEqual(self.metric(text, 'unisalute_db_duplicate_query_max{view="<unresolved>",sql="SELECT'), 3)
+
+
+class SyntheticDataBenchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.generator = Generator(Volume(patients=60, doctors=4, pharmacies=10), seed=1, batch_size=25)
+        cls.generator.run()
+        finalize()
+
+    def test_generated_volumes_are_consistent(self):
+        self.assertEqual(Patient.objects.count(), 60)
+        self.assertEqual(Doctor.objects.exclude(availability={}).count(), 4)
+        self.assertEqual(Appointment.objects.count(), self.generator.appointment_number)
+        self.assertEqual(counters.snapshot()[0][counters.PATIENTS], 60)
+        # Chaque rendez-vous et dossier a sa relation de soins
+        self.assertFalse(Appointment.objects.exclude(
+            patient__care_relationships__doctor=models.F('doctor')).exists())
+        self.assertTrue(User.objects.get(username='patient0').check_password('bench'))
+
+    def test_every_route_is_benchmarked(self):
+        cache.clear()
+        scenarios = build_scenarios(sample_objects())
+        routes = {pattern.name for pattern in get_resolver('core.urls').url_patterns}
+        covered = {resolve(scenario.url.split('?')[0]).url_name for scenario in scenarios}
+        self.assertEqual(routes - covered, set())
+        results = run_sequential([s for s in scenarios if s.name in ('doctor_slots', 'search_doctor')],
+                                 sample_objects(), iterations=3, warmup=0)
+        self.assertEqual(results['doctor_slots']['statuses'], {'200': 3})
+        self.assertEqual(results['search_doctor']['errors'], 0)
+
+    def test_baseline_comparison(self):
+        baseline = {'vue': {'p95_ms': 10.0, 'queries': 3, 'errors': 0}}
+        self.assertEqual(compare({'vue': {'p95_ms': 12.0, 'queries': 3, 'errors': 0}}, baseline, 0.25, 2.0), [])
+        regressions = compare({'vue': {'p95_ms': 20.0, 'queries': 5, 'errors': 1}}, baseline, 0.25, 2.0)
+        self.assertEqual(len(regressions), 3)
+
+
+class QueryPlanTests(TestCase):
+    """
+    Plans d'exécution (EXPLAIN QUERY PLAN) des requêtes de chaque scénario de bench_views
+    Une lecture complète de table ou un tri en mémoire (TEMP B-TREE) fait échouer le test,
+    sauf pour les plans inhérents à la requête listés dans ALLOWED
+    """
+    ALLOWED = {
+        ('pharmacy_nearest', 'SCAN core_pharmacy'): "index géographique chargé en mémoire en une lecture (geo.py)",
+        ('appointment_create', 'SCAN core_doctor'): "liste de choix de tous les médecins du formulaire",
+        ('search_doctor', 'USE TEMP B-TREE FOR ORDER BY'): "tri par pertinence bm25 de la recherche plein texte",
+        ('search_patient', 'USE TEMP B-TREE FOR ORDER BY'): "tri par pertinence bm25 de la recherche plein texte",
+        ('api_record_list', 'USE TEMP B-TREE FOR ORDER BY'): "médecin: fusion des dossiers de tous ses patients",
+        ('api_prescription_list', 'USE TEMP B-TREE FOR ORDER BY'): "médecin: ordonnances de tous ses patients",
+        ('patient_list', 'USE TEMP B-TREE FOR ORDER BY'): "médecin: tri de ses seuls patients (relations de soins)",
+        ('dashboard_admin', 'SCAN core_statcounter'): "compteurs: quelques lignes par jour lues en une requête",
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        Generator(Volume(patients=60, doctors=4, pharmacies=10), seed=1, batch_size=25).run()
+        finalize()
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[3] for row in cursor.fetchall()]
+
+    def test_hot_queries_use_indexes(self):
+        cache.clear()
+        objects = sample_objects()
+        regressions = []
+        for scenario in build_scenarios(objects):
+            with CaptureQueriesContext(connection) as captured:
+                fetch(make_client(scenario, objects), scenario.url, scenario.data)
+            for query in captured.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                for detail in self.plan(query['sql']):
+                    full_scan = detail.startswith('SCAN') and 'INDEX' not in detail
+                    if (full_scan or 'TEMP B-TREE' in detail) and (scenario.name, detail) not in self.ALLOWED:
+                        regressions.append(f"{scenario.name}: {detail}\n{query['sql']}")
+        self.assertEqual(regressions, [])
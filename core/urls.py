@@ -1,5 +1,7 @@
 from django.urls import path
-from . import views
+from rest_framework.routers import SimpleRouter
+
+from . import api, views
 from .views import (MedicalRecordListView, MedicalRecordCreateView,
                     MedicalRecordDetailView, PrescriptionCreateView)
 
@@ -15,23 +17,52 @@ urlpatterns = [
     # Médecins
     path('doctors/', views.DoctorListView.as_view(), name='doctor_list'),
     path('doctors/<int:pk>/', views.DoctorDetailView.as_view(), name='doctor_detail'),
+    path('doctors/<int:pk>/slots/', views.doctor_slots, name='doctor_slots'),
+    path('doctors/<int:pk>/book/', views.doctor_book, name='doctor_book'),
+    path('doctors/<int:pk>/waitlist/', views.doctor_waitlist, name='doctor_waitlist'),
+    path('waitlist/<int:pk>/urgency/', views.waitlist_urgency, name='waitlist_urgency'),
 
     # Patients
     path('patients/', views.PatientListView.as_view(), name='patient_list'),
+    path('patients/<int:pk>/export/', views.patient_export, name='patient_export'),
+    path('exports/<int:pk>/', views.export_download, name='export_download'),
+
+    # Pharmacies
+    path('pharmacies/nearest/', views.nearest_pharmacies, name='pharmacy_nearest'),
+
+    # Catalogue des médicaments
+    path('medications/autocomplete/', views.medication_autocomplete, name='medication_autocomplete'),
 
     # Rendez-vous
     #path('appointments/', views.AppointmentListView.as_view(), name='appointment_list'),
     path('appointments/new/', views.AppointmentCreateView.as_view(), name='appointment_create'),
 
+    # Flux iCalendar des agendas
+    path('agenda/feed/', views.agenda_feed_url, name='agenda_feed_url'),
+    path('agenda/<str:token>.ics', views.agenda_feed, name='agenda_feed'),
+
     # Dossiers médicaux
     path('patients/<int:patient_id>/records/', MedicalRecordListView.as_view(), name='medical_record_list'),
     path('patients/<int:patient_id>/records/new/', MedicalRecordCreateView.as_view(), name='medical_record_create'),
     path('records/<int:pk>/', MedicalRecordDetailView.as_view(), name='medical_record_detail'),
+    path('records/<int:pk>/file/', views.medical_record_file, name='medical_record_file'),
+    path('records/search/', views.search_records, name='medical_record_search'),
 
     # Ordonnances
     path('records/<int:record_id>/prescription/', PrescriptionCreateView.as_view(), name='prescription_create'),
 
+    # Mesures (Prometheus)
+    path('metrics', views.metrics, name='metrics'),
+
     # URLs pour la réinitialisation de mot de passe
     #path('password_reset/',auth_views.PasswordResetView.as_view(template_name='auth/password_reset.html'),
      #    name='password_reset'),
 ]
+
+# API JSON (core/api.py): routes api-<ressource>-list et api-<ressource>-detail
+router = SimpleRouter()
+router.register('api/doctors', api.DoctorViewSet, basename='api-doctor')
+router.register('api/appointments', api.AppointmentViewSet, basename='api-appointment')
+router.register('api/records', api.MedicalRecordViewSet, basename='api-record')
+router.register('api/prescriptions', api.PrescriptionViewSet, basename='api-prescription')
+urlpatterns += router.urls
@@ -0,0 +1,98 @@
+"""
+Versions partagées des index compilés en mémoire
+
+Chaque processus (serveurs web, travailleurs run_jobs, commandes) compile ses
+propres index : catalogue des médicaments, correspondances allergène ->
+substance, grilles de créneaux des médecins, grille des pharmacies. Les
+signaux ne mettent à jour que l'index du processus qui écrit ; pour les
+autres, chaque modification incrémente la version de l'index dans la table
+IndexVersion, dans la transaction même de l'écriture (une écriture annulée
+n'invalide rien, une écriture validée est toujours signalée).
+
+Chaque processus relit la version au plus toutes les INDEX_VERSION_CHECK_SECONDS
+secondes (une requête sur l'index unique) et recharge son index lorsqu'elle a
+changé. La base est le seul stockage commun à tous les processus : le cache
+configuré par défaut (LocMemCache) est propre à chacun.
+
+Version et données sont lues sur la base principale : un réplica en retard
+figerait les anciennes données sous la nouvelle version.
+"""
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import IndexVersion
+from .replicas import primary
+
+# Intervalle par défaut (secondes) entre deux lectures de la version par un processus
+CHECK_SECONDS = 1.0
+
+
+def check_seconds():
+    return getattr(settings, 'INDEX_VERSION_CHECK_SECONDS', CHECK_SECONDS)
+
+
+def bump(name):
+    """Incrémente la version d'un index (dans la transaction courante), en créant sa ligne si besoin"""
+    if IndexVersion.objects.filter(name=name).update(value=F('value') + 1):
+        return
+    try:
+        with transaction.atomic():
+            IndexVersion.objects.create(name=name, value=1)
+    except IntegrityError:
+        # Créée entre-temps par une autre écriture concurrente
+        IndexVersion.objects.filter(name=name).update(value=F('value') + 1)
+
+
+class SharedVersion:
+    """
+    Version partagée d'un index et version avec laquelle le processus l'a chargé
+    Usage: check() (ou acheck()) avant de servir l'index, mark() après l'avoir rechargé
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.loaded = None
+        self._checked = None
+
+    def current(self):
+        """Version courante (0 tant que l'index n'a jamais été modifié)"""
+        with primary():
+            return IndexVersion.objects.filter(name=self.name).values_list('value', flat=True).first() or 0
+
+    async def acurrent(self):
+        """Version asynchrone de current"""
+        with primary():
+            return await IndexVersion.objects.filter(name=self.name).values_list('value', flat=True).afirst() or 0
+
+    def mark(self, version):
+        """L'index vient d'être chargé avec les données de cette version (lue avant les données)"""
+        self.loaded = version
+        self._checked = time.monotonic()
+
+    def _due(self):
+        """La version doit être relue (jamais lue, ou lue il y a plus de check_seconds())"""
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < check_seconds():
+            return False
+        self._checked = now
+        return True
+
+    def check(self):
+        """Nouvelle version si un processus a modifié l'index depuis son chargement, sinon None"""
+        if not self._due():
+            return None
+        version = self.current()
+        return version if version != self.loaded else None
+
+    async def acheck(self):
+        """Version asynchrone de check"""
+        if not self._due():
+            return None
+        version = await self.acurrent()
+        return version if version != self.loaded else None
+
+    def bump(self):
+        bump(self.name)
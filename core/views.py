@@ -1,13 +1,52 @@
+import hashlib
+import hmac
+import math
+import os
+from datetime import timedelta
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.views.generic import ListView, DetailView, CreateView, UpdateView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.exceptions import PermissionDenied
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import etag, require_POST
+from django.db.models import Q
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from .models import MedicalRecord, Prescription, Allergy
 from .models import *  # Importe tous les modèles
 from .forms import *  # Importe tous les formulaires
+from .slots import slot_index
+from .booking import InvalidSlot, SlotUnavailable, abook, reserve
+from .geo import pharmacy_index
+from .medications import medication_catalogue
+from . import agenda, counters, directory, jobs, waitlist
+from .pagination import KeysetPaginationMixin
+from .replicas import use_primary
+from .access import care_access
+from .downloads import serve_file
+from .exports import EXPORT_RETENTION, export_stream
+from .search import get_backend as get_search_backend
+from .metrics import registry as metrics_registry
+
+# Fenêtre maximale (en jours) d'une recherche de créneaux
+MAX_SLOT_WINDOW_DAYS = 90
+# Nombre maximal de pharmacies renvoyées par une recherche de proximité
+MAX_NEAREST_PHARMACIES = 50
+# Nombre maximal de résultats de la recherche plein texte
+MAX_SEARCH_RESULTS = 50
+# Nombre maximal de suggestions de médicaments, et durée de mise en cache HTTP (secondes)
+MAX_MEDICATION_SUGGESTIONS = 20
+MEDICATION_CACHE_SECONDS = 600
 
 def home(request):
     """Vue pour la page d'accueil non authentifiée"""
@@ -22,54 +61,363 @@ def dashboard(request):
     - Admins: voir des statistiques
     """
     context = {}
+    # Rendez-vous actifs à venir, dans l'ordre chronologique (Meta.ordering)
+    upcoming = Appointment.objects.filter(status__in=Appointment.ACTIVE_STATUSES, date_time__gte=timezone.now())
 
     if request.user.role == 'PATIENT':
-        # Affiche les 5 prochains RDV pour les patients
-        appointments = Appointment.objects.filter(patient=request.user.patient_profile)
-        context['appointments'] = appointments[:5]
+        # Affiche les 5 prochains RDV pour les patients (index partiel appointment_patient_active)
+        appointments = upcoming.filter(patient=request.user.patient_profile)
+        context['appointments'] = appointments.select_related('doctor__user')[:5]
 
     elif request.user.role == 'DOCTOR':
-        # Affiche les 5 prochains RDV pour les médecins
-        appointments = Appointment.objects.filter(doctor=request.user.doctor_profile)
-        context['appointments'] = appointments[:5]
+        # Affiche les 5 prochains RDV pour les médecins (index unique_active_doctor_slot)
+        appointments = upcoming.filter(doctor=request.user.doctor_profile)
+        context['appointments'] = appointments.select_related('patient__user')[:5]
 
     elif request.user.role == 'ADMIN':
-        # Affiche des statistiques pour les admins
-        context['doctor_count'] = Doctor.objects.count()
-        context['patient_count'] = Patient.objects.count()
-        context['appointment_count'] = Appointment.objects.count()
+        # Affiche des statistiques pour les admins (compteurs matérialisés, une requête)
+        totals, deltas = counters.snapshot()
+        context['doctor_count'] = totals.get(counters.DOCTORS, 0)
+        context['patient_count'] = totals.get(counters.PATIENTS, 0)
+        context['appointment_count'] = totals.get(counters.APPOINTMENTS, 0)
+        context['appointment_status_counts'] = [
+            (label, totals.get(counters.status_key(status), 0), deltas.get(counters.status_key(status), 0))
+            for status, label in Appointment.STATUS_CHOICES
+        ]
+        context['today_deltas'] = {
+            'doctors': deltas.get(counters.DOCTORS, 0),
+            'patients': deltas.get(counters.PATIENTS, 0),
+            'appointments': deltas.get(counters.APPOINTMENTS, 0),
+        }
 
     return render(request, 'dashboard.html', context)
 
-class DoctorListView(ListView):
-    """Affiche la liste des médecins (accès public)"""
+def filter_by_name(queryset, query):
+    """Filtre un queryset Doctor/Patient sur le début du nom ou du prénom"""
+    query = (query or '').strip()
+    if not query:
+        return queryset
+    return queryset.filter(Q(user__last_name__istartswith=query) | Q(user__first_name__istartswith=query))
+
+class DoctorListView(KeysetPaginationMixin, ListView):
+    """
+    Affiche la liste des médecins (accès public)
+    Paginée par curseur, filtrable par spécialité (?speciality=<id>) et par nom (?q=)
+    """
     model = Doctor
     template_name = 'doctors/list.html'
     context_object_name = 'doctors'  # Nom de la variable dans le template
+    keyset_ordering = ('user__last_name', 'user__first_name', 'user__username')
+
+    def get(self, request, *args, **kwargs):
+        """Page complète en cache pour les visiteurs anonymes"""
+        return directory.cached_page(request, directory.versions(directory.LIST),
+                                     lambda: super(DoctorListView, self).get(request, *args, **kwargs))
+
+    def paginate_queryset(self, queryset, page_size):
+        """Page de résultats en cache, invalidée par toute modification de l'annuaire"""
+        return directory.get_or_compute(
+            directory.list_key('page', self.request.GET.urlencode()),
+            lambda: super(DoctorListView, self).paginate_queryset(queryset, page_size),
+        )
+
+    def get_queryset(self):
+        """Ne charge que les colonnes affichées, utilisateur et spécialité compris"""
+        queryset = (Doctor.objects
+                    .select_related('user', 'speciality')
+                    .only('pk', 'user__first_name', 'user__last_name', 'user__username', 'speciality__name'))
+        speciality = self.request.GET.get('speciality')
+        if speciality and speciality.isdigit():
+            queryset = queryset.filter(speciality_id=speciality)
+        return filter_by_name(queryset, self.request.GET.get('q'))
+
+    def get_context_data(self, **kwargs):
+        """Ajoute la liste des spécialités pour le filtre"""
+        context = super().get_context_data(**kwargs)
+        context['specialities'] = directory.get_or_compute(
+            directory.list_key('specialities'),
+            lambda: list(Speciality.objects.only('pk', 'name').order_by('name')),
+        )
+        return context
 
 class DoctorDetailView(DetailView):
-    """Affiche le détail d'un médecin (accès public)"""
+    """
+    Affiche le détail d'un médecin (accès public)
+    Fiche et spécialité lues depuis le cache de l'annuaire
+    """
     model = Doctor
     template_name = 'doctors/detail.html'
 
-class PatientListView(ListView):
-    """Affiche la liste des patients (accès restreint)"""
+    def get_object(self, queryset=None):
+        doctor = directory.get_doctor(self.kwargs['pk'])
+        if doctor is None:
+            raise Http404("Médecin introuvable")
+        return doctor
+
+    def get(self, request, *args, **kwargs):
+        """Page complète en cache pour les visiteurs anonymes"""
+        self.object = self.get_object()
+        return directory.cached_page(request, directory.doctor_versions(self.object),
+                                     lambda: self.render_to_response(self.get_context_data(object=self.object)))
+
+async def doctor_slots(request, pk):
+    """
+    Renvoie en JSON les créneaux libres d'un médecin (accès public, vue asynchrone)
+    Paramètres GET: start et end au format AAAA-MM-JJ (end exclu)
+    """
+    if not await Doctor.objects.filter(pk=pk).aexists():
+        raise Http404("Médecin introuvable")
+    try:
+        start = parse_date(request.GET.get('start', '')) or timezone.localdate()
+        end = parse_date(request.GET.get('end', '')) or start + timedelta(days=7)
+    except ValueError:
+        # Date bien formée mais inexistante (2025-02-30)
+        return JsonResponse({'error': "Dates start et end au format AAAA-MM-JJ valides requises"}, status=400)
+    # Borne la fenêtre pour garder des réponses de taille raisonnable
+    end = min(end, start + timedelta(days=MAX_SLOT_WINDOW_DAYS))
+    slots = (await slot_index.afree_slots([pk], start, end)).get(pk, [])
+    return JsonResponse({
+        'doctor': pk,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'slots': [slot.isoformat() for slot in slots],
+    })
+
+@require_POST
+async def doctor_book(request, pk):
+    """
+    Réserve un créneau chez un médecin pour le patient connecté (JSON, vue asynchrone)
+    Paramètres POST: date_time (ISO 8601), appointment_type, notes (optionnel)
+    Répond 201 avec le rendez-vous, 409 avec des créneaux alternatifs si le créneau est pris,
+    400 (avec des créneaux libres) si l'horaire est passé ou hors des créneaux du médecin
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'error': "Authentification requise"}, status=401)
+    patient = await Patient.objects.filter(user_id=user.pk).afirst()
+    if patient is None:
+        return JsonResponse({'error': "Réservation réservée aux patients"}, status=403)
+    doctor = await Doctor.objects.select_related('user').filter(pk=pk).afirst()
+    if doctor is None:
+        raise Http404("Médecin introuvable")
+
+    try:
+        date_time = parse_datetime(request.POST.get('date_time', ''))
+    except ValueError:
+        # Date bien formée mais inexistante (2025-02-30T09:00)
+        date_time = None
+    appointment_type = request.POST.get('appointment_type', '')
+    errors = {}
+    if date_time is None:
+        errors['date_time'] = "Date et heure ISO 8601 requises"
+    if appointment_type not in dict(Appointment.TYPE_CHOICES):
+        errors['appointment_type'] = "Type de consultation invalide"
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
+    if timezone.is_naive(date_time):
+        date_time = timezone.make_aware(date_time)
+
+    try:
+        # Créneau vérifié par l'ORM asynchrone; la transaction (API synchrone) s'exécute dans un thread
+        appointment = await abook(patient, doctor, date_time, appointment_type, request.POST.get('notes', ''))
+    except InvalidSlot as exc:
+        return JsonResponse({
+            'errors': {'date_time': "Cet horaire n'est pas un créneau à venir de ce médecin"},
+            'alternatives': [slot.isoformat() for slot in exc.alternatives],
+        }, status=400)
+    except SlotUnavailable as exc:
+        return JsonResponse({
+            'error': "Ce créneau vient d'être réservé, veuillez en choisir un autre.",
+            'alternatives': [slot.isoformat() for slot in exc.alternatives],
+        }, status=409)
+    return JsonResponse({
+        'id': appointment.pk,
+        'doctor': doctor.pk,
+        'date_time': appointment.date_time.isoformat(),
+        'status': appointment.status,
+    }, status=201)
+
+@require_POST
+def doctor_waitlist(request, pk):
+    """
+    Inscrit le patient connecté sur la liste d'attente d'un médecin (JSON)
+    Paramètres POST: date_from et date_to (AAAA-MM-JJ, inclus), appointment_type
+    L'urgence n'est pas choisie par le patient: elle est relevée par le médecin (voir waitlist_urgency)
+    Répond 201 avec l'inscription et son rang; un créneau annulé dans la fenêtre lui sera attribué
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': "Authentification requise"}, status=401)
+    patient = Patient.objects.filter(user_id=request.user.pk).first()
+    if patient is None:
+        return JsonResponse({'error': "Liste d'attente réservée aux patients"}, status=403)
+    doctor = get_object_or_404(Doctor, pk=pk)
+
+    today = timezone.localdate()
+    appointment_type = request.POST.get('appointment_type', 'IN_PERSON')
+    errors = {}
+    # parse_date lève ValueError pour une date bien formée mais impossible (2025-02-30)
+    try:
+        date_from = parse_date(request.POST.get('date_from', '')) or today
+    except ValueError:
+        date_from = today
+        errors['date_from'] = "Date de début invalide"
+    try:
+        date_to = parse_date(request.POST.get('date_to', ''))
+    except ValueError:
+        date_to = None
+    if date_to is None or date_to < max(date_from, today):
+        errors['date_to'] = "Date de fin AAAA-MM-JJ requise, postérieure au début et à aujourd'hui"
+    elif (date_to - date_from).days > MAX_SLOT_WINDOW_DAYS:
+        errors['date_to'] = f"Fenêtre limitée à {MAX_SLOT_WINDOW_DAYS} jours"
+    if appointment_type not in dict(Appointment.TYPE_CHOICES):
+        errors['appointment_type'] = "Type de consultation invalide"
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
+
+    entry = waitlist.join(patient, doctor, max(date_from, today), date_to, appointment_type=appointment_type)
+    return JsonResponse({
+        'id': entry.pk,
+        'doctor': doctor.pk,
+        'date_from': entry.date_from.isoformat(),
+        'date_to': entry.date_to.isoformat(),
+        'urgency': entry.urgency,
+        'position': waitlist.position(entry),
+    }, status=201)
+
+@require_POST
+def waitlist_urgency(request, pk):
+    """
+    Fixe l'urgence (0 à 2) d'une inscription en attente (JSON)
+    Réservé au médecin de la liste d'attente et aux administrateurs; répond avec le nouveau rang
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': "Authentification requise"}, status=401)
+    entry = get_object_or_404(WaitlistEntry.objects.select_related('doctor'), pk=pk)
+    if request.user.role != 'ADMIN' and entry.doctor.user_id != request.user.pk:
+        return JsonResponse({'error': "Urgence fixée par le médecin ou un administrateur"}, status=403)
+    try:
+        urgency = int(request.POST.get('urgency', ''))
+    except ValueError:
+        urgency = None
+    if urgency not in dict(WaitlistEntry.URGENCY_CHOICES):
+        return JsonResponse({'errors': {'urgency': "Urgence invalide"}}, status=400)
+    if not waitlist.set_urgency(entry, urgency):
+        return JsonResponse({'error': "Inscription qui n'est plus en attente"}, status=409)
+    return JsonResponse({'id': entry.pk, 'urgency': entry.urgency, 'position': waitlist.position(entry)})
+
+def nearest_pharmacies(request):
+    """
+    Renvoie en JSON les pharmacies les plus proches d'un point (accès public)
+    Paramètres GET: lat, lng, k (défaut 5), radius en km (optionnel), on_duty=1/0 (optionnel)
+    """
+    try:
+        lat = float(request.GET['lat'])
+        lng = float(request.GET['lng'])
+        k = max(1, min(int(request.GET.get('k', 5)), MAX_NEAREST_PHARMACIES))
+        radius = float(request.GET['radius']) if request.GET.get('radius') else None
+    except (KeyError, ValueError):
+        return JsonResponse({'error': "Paramètres lat et lng numériques requis"}, status=400)
+    # float() accepte nan et inf: coordonnées hors de la sphère refusées
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return JsonResponse({'error': "Coordonnées lat (-90 à 90) et lng (-180 à 180) requises"}, status=400)
+    if radius is not None and not 0 <= radius < math.inf:
+        return JsonResponse({'error': "Rayon radius positif requis"}, status=400)
+    on_duty = {'1': True, 'true': True, '0': False, 'false': False}.get(request.GET.get('on_duty', '').lower())
+
+    if radius is not None and 'k' not in request.GET:
+        found = pharmacy_index.within(lat, lng, radius, on_duty=on_duty)[:MAX_NEAREST_PHARMACIES]
+    else:
+        found = pharmacy_index.nearest(lat, lng, k=k, on_duty=on_duty, radius_km=radius)
+    # Une seule requête pour les détails, dans l'ordre des distances
+    pharmacies = Pharmacy.objects.in_bulk([pk for _, pk in found])
+    return JsonResponse({'results': [
+        {
+            'id': pk,
+            'name': pharmacies[pk].name,
+            'address': pharmacies[pk].address,
+            'phone': pharmacies[pk].phone,
+            'is_on_duty': pharmacies[pk].is_on_duty,
+            'latitude': pharmacies[pk].latitude,
+            'longitude': pharmacies[pk].longitude,
+            'distance_km': round(distance, 3),
+        }
+        for distance, pk in found if pk in pharmacies
+    ]})
+
+
+def medication_etag(request):
+    """Version du catalogue et paramètres: un 304 ne demande aucune recherche"""
+    key = f'{medication_catalogue.version}:{request.get_full_path()}'
+    return hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+
+
+@cache_control(public=True, max_age=MEDICATION_CACHE_SECONDS)
+@etag(medication_etag)
+def medication_autocomplete(request):
+    """
+    Suggestions de médicaments du catalogue en JSON (accès public, mises en cache par les navigateurs et proxys)
+    Paramètres GET: q (2 caractères au moins), limit (défaut 10)
+    """
+    query = request.GET.get('q', '')
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), MAX_MEDICATION_SUGGESTIONS))
+    except ValueError:
+        limit = 10
+    return JsonResponse({'query': query, 'results': [
+        {'id': entry.pk, 'name': entry.name, 'ingredient': entry.ingredient, 'form': entry.form}
+        for entry in medication_catalogue.search(query, limit)
+    ]})
+
+class PatientListView(LoginRequiredMixin, UserPassesTestMixin, KeysetPaginationMixin, ListView):
+    """
+    Affiche la liste des patients
+    Accès réservé aux médecins (leurs patients: relations de soins) et aux admins (tous les patients)
+    Paginée par curseur, filtrable par nom (?q=)
+    """
     model = Patient
     template_name = 'patients/list.html'
     context_object_name = 'patients'
+    keyset_ordering = ('user__last_name', 'user__first_name', 'user__username')
+
+    def test_func(self):
+        """Vérifie que l'utilisateur a les droits nécessaires"""
+        return self.request.user.role in ['DOCTOR', 'ADMIN']
+
+    def get_queryset(self):
+        """Ne charge que les colonnes affichées"""
+        queryset = (Patient.objects
+                    .select_related('user')
+                    .only('pk', 'birth_date', 'blood_group', 'user__first_name', 'user__last_name', 'user__username'))
+        if self.request.user.role == 'DOCTOR':
+            queryset = queryset.filter(doctors__user=self.request.user)
+        return filter_by_name(queryset, self.request.GET.get('q'))
 
 class AppointmentCreateView(CreateView):
     """Permet de créer un nouveau rendez-vous"""
     model = Appointment
     form_class = AppointmentForm  # Formulaire personnalisé
     template_name = 'appointments/create.html'
-    success_url = reverse_lazy('appointment_list')  # Redirection après succès
+    success_url = reverse_lazy('dashboard')  # Redirection après succès: prochains rendez-vous
 
     def form_valid(self, form):
-        """Si c'est un patient qui crée le RDV, on l'associe automatiquement"""
+        """
+        Si c'est un patient qui crée le RDV, on l'associe automatiquement
+        La réservation est atomique: en cas de course perdue on propose d'autres créneaux
+        Un horaire passé ou hors des créneaux du médecin est refusé (400), avec des créneaux libres proposés
+        """
         if self.request.user.role == 'PATIENT':
             form.instance.patient = self.request.user.patient_profile
-        return super().form_valid(form)
+        try:
+            self.object = reserve(form.instance)
+        except InvalidSlot as exc:
+            form.add_error('date_time', "Cet horaire n'est pas un créneau disponible de ce médecin.")
+            context = self.get_context_data(form=form, alternative_slots=exc.alternatives)
+            return self.render_to_response(context, status=400)
+        except SlotUnavailable as exc:
+            form.add_error('date_time', "Ce créneau vient d'être réservé, veuillez en choisir un autre.")
+            context = self.get_context_data(form=form, alternative_slots=exc.alternatives)
+            return self.render_to_response(context, status=409)
+        return redirect(self.get_success_url())
 
 def register(request):
     """Gère l'inscription des nouveaux utilisateurs"""
@@ -121,11 +469,14 @@ class MedicalRecordListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         """Filtre les résultats selon le rôle"""
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('doctor__user')
         if self.request.user.role == 'PATIENT':
             return queryset.filter(patient=self.request.user.patient_profile)
         elif self.request.user.role == 'DOCTOR':
-            return queryset.filter(patient__in=self.request.user.doctor_profile.patients.all())
+            # Un seul EXISTS indexé sur la relation de soins du patient demandé
+            patient_id = self.kwargs['patient_id']
+            if care_access(self.request).can_view_patient(patient_id):
+                return queryset.filter(patient_id=patient_id)
         return queryset.none()  # Retourne aucun résultat par défaut
 
 class MedicalRecordCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
@@ -136,17 +487,31 @@ class MedicalRecordCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateVie
     model = MedicalRecord
     form_class = MedicalRecordForm
     template_name = 'medical_records/create.html'
-    success_url = reverse_lazy('medical_record_list')
 
     def test_func(self):
-        """Vérifie que l'utilisateur a les droits nécessaires"""
-        return self.request.user.role in ['DOCTOR', 'ADMIN']
+        """
+        Vérifie que l'utilisateur a les droits nécessaires
+        Un médecin n'ajoute un dossier qu'à ses patients: le dossier créerait sinon lui-même la relation
+        de soins (signals.link_record_care) et lui ouvrirait tout l'historique du patient
+        """
+        return (self.request.user.role in ['DOCTOR', 'ADMIN']
+                and care_access(self.request).can_view_patient(self.kwargs['patient_id']))
 
     def form_valid(self, form):
-        """Associe automatiquement le médecin et le patient"""
+        """
+        Associe automatiquement le médecin et le patient
+        La relecture du fichier envoyé (contrôle d'intégrité) est confiée à la file de tâches
+        """
         form.instance.doctor = self.request.user.doctor_profile
         form.instance.patient_id = self.kwargs['patient_id']
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        if self.object.file:
+            jobs.enqueue('records.verify_file', {'record_id': self.object.pk})
+        return response
+
+    def get_success_url(self):
+        """Retour aux dossiers du patient"""
+        return reverse('medical_record_list', args=[self.kwargs['patient_id']])
 
 class MedicalRecordDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
     """
@@ -157,15 +522,177 @@ class MedicalRecordDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailVie
     template_name = 'medical_records/detail.html'
     context_object_name = 'record'
 
+    def get_object(self, queryset=None):
+        """Mémorise le dossier: test_func et get() le demandent tous les deux"""
+        if not hasattr(self, '_record'):
+            self._record = super().get_object(queryset)
+        return self._record
+
     def test_func(self):
-        """Vérifie les permissions d'accès"""
-        record = self.get_object()
-        user = self.request.user
-        if user.role == 'PATIENT':
-            return record.patient == user.patient_profile
-        elif user.role == 'DOCTOR':
-            return record.patient in user.doctor_profile.patients.all()
-        return user.role == 'ADMIN'
+        """Vérifie les permissions d'accès (EXISTS indexé pour les médecins)"""
+        return care_access(self.request).can_view_record(self.get_object())
+
+@login_required
+def medical_record_file(request, pk):
+    """
+    Télécharge le fichier joint d'un dossier médical
+    Mêmes règles d'accès que le détail du dossier; diffusion en flux avec Range et ETag
+    """
+    record = get_object_or_404(MedicalRecord.objects.only('pk', 'patient_id', 'title', 'file'), pk=pk)
+    if not care_access(request).can_view_record(record):
+        raise PermissionDenied
+    if not record.file:
+        raise Http404("Aucun fichier joint")
+    try:
+        # Le fichier est rangé sous son empreinte: on le nomme d'après le titre du dossier
+        filename = record.title + os.path.splitext(record.file.name)[1]
+        return serve_file(request, record.file.path, filename=filename, offload_name=record.file.name)
+    except FileNotFoundError:
+        raise Http404("Fichier introuvable")
+
+@login_required
+def search_records(request):
+    """
+    Recherche plein texte (JSON) dans les dossiers, ordonnances et allergies
+    Même filtrage par rôle que MedicalRecordListView; ?patient=<id> restreint à un patient
+    """
+    query = request.GET.get('q', '').strip()
+    patient = request.GET.get('patient')
+    patient_id = int(patient) if patient and patient.isdigit() else None
+    backend = get_search_backend()
+    hits = []
+    if query and request.user.role == 'PATIENT':
+        hits = backend.search(query, patient_ids=[request.user.patient_profile.pk], limit=MAX_SEARCH_RESULTS)
+    elif query and request.user.role == 'DOCTOR':
+        if patient_id is None:
+            hits = backend.search(query, doctor_id=request.user.doctor_profile.pk, limit=MAX_SEARCH_RESULTS)
+        elif care_access(request).can_view_patient(patient_id):
+            hits = backend.search(query, patient_ids=[patient_id], limit=MAX_SEARCH_RESULTS)
+    if patient_id is not None:
+        hits = [hit for hit in hits if hit.patient_id == patient_id]
+    return JsonResponse({'query': query, 'results': [
+        {
+            'type': hit.kind,
+            'id': hit.object_id,
+            'patient': hit.patient_id,
+            'title': hit.title,
+            'snippet': hit.snippet,
+            'url': reverse('medical_record_detail', args=[hit.object_id]) if hit.kind != 'allergy' else None,
+        }
+        for hit in hits
+    ]})
+
+@login_required
+def patient_export(request, pk):
+    """
+    Exporte le dossier complet d'un patient (NDJSON, ou zip avec les fichiers joints)
+    Réservé au patient lui-même, à ses médecins et aux administrateurs
+    GET: export en flux dans la réponse
+    POST: export produit par la file de tâches, réponse 202 avec l'URL de téléchargement (voir export_download);
+    une demande du même utilisateur encore en attente ou en cours est réutilisée
+    """
+    patient = get_object_or_404(Patient.objects.only('pk'), pk=pk)
+    if not care_access(request).can_view_patient(patient.pk):
+        raise PermissionDenied
+    fmt = 'zip' if request.GET.get('format') == 'zip' else 'ndjson'
+    if request.method == 'POST':
+        payload = {'patient_ids': [patient.pk], 'fmt': fmt, 'requested_by': request.user.pk}
+        job = (Job.objects.filter(name='exports.patients', payload=payload, status__in=('QUEUED', 'RUNNING'))
+               .order_by('pk').first()
+               or jobs.enqueue('exports.patients', payload, priority=5))
+        url = reverse('export_download', args=[job.pk])
+        response = JsonResponse({'job': job.pk, 'status': job.status, 'url': url}, status=202)
+        response['Location'] = url
+        return response
+    content_type = 'application/zip' if fmt == 'zip' else 'application/x-ndjson'
+    response = StreamingHttpResponse(export_stream(Patient.objects.filter(pk=patient.pk), fmt),
+                                     content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="patient-{patient.pk}.{fmt}"'
+    response['Cache-Control'] = 'private, no-store'
+    return response
+
+@login_required
+def export_download(request, pk):
+    """
+    Télécharge un export produit par la file de tâches (202 tant qu'il est en préparation, 410 une fois expiré)
+    Mêmes règles d'accès que la demande: tous les patients exportés doivent être visibles
+    """
+    job = get_object_or_404(Job, pk=pk, name='exports.patients')
+    patient_ids = job.payload.get('patient_ids')
+    access = care_access(request)
+    # Export de toute la base (commande enqueue_job): administrateurs seulement
+    allowed = (all(access.can_view_patient(patient_id) for patient_id in patient_ids) if patient_ids
+               else request.user.role == 'ADMIN')
+    if not allowed:
+        raise PermissionDenied
+    if job.status == 'FAILED':
+        return JsonResponse({'job': job.pk, 'status': job.status, 'error': "L'export a échoué"}, status=500)
+    if job.status != 'DONE':
+        response = JsonResponse({'job': job.pk, 'status': job.status}, status=202)
+        response['Retry-After'] = '2'
+        return response
+    expired = JsonResponse({'job': job.pk, 'status': job.status, 'error': "Export expiré"}, status=410)
+    if job.finished_at < timezone.now() - EXPORT_RETENTION:
+        return expired
+    fmt = job.payload.get('fmt', 'ndjson')
+    name = f'patient-{patient_ids[0]}.{fmt}' if patient_ids and len(patient_ids) == 1 else f'patients.{fmt}'
+    content_type = 'application/zip' if fmt == 'zip' else 'application/x-ndjson'
+    try:
+        return serve_file(request, default_storage.path(job.result['path']), filename=name, content_type=content_type)
+    except FileNotFoundError:
+        # Supprimé par la purge
+        return expired
+
+@login_required
+def agenda_feed_url(request):
+    """
+    URL secrète du flux iCalendar de l'agenda de l'utilisateur connecté (JSON)
+    POST: nouveau jeton, l'ancienne URL ne répond plus
+    """
+    if request.user.role not in ('DOCTOR', 'PATIENT'):
+        raise PermissionDenied
+    feed = agenda.feed_for(request.user, rotate=request.method == 'POST')
+    url = request.build_absolute_uri(reverse('agenda_feed', args=[feed.token]))
+    return JsonResponse({'url': url, 'webcal': 'webcal://' + url.split('://', 1)[1]})
+
+@use_primary
+def agenda_feed(request, token):
+    """
+    Flux iCalendar de l'agenda (accès par jeton, sans session)
+    Un client à jour (If-None-Match / If-Modified-Since) reçoit 304 après une seule requête
+    Lu sur la base principale: un jeton révoqué (rotation) ne doit plus répondre, même sur un réplica en retard
+    """
+    feed = CalendarFeed.objects.select_related('user').filter(token=token).first()
+    if feed is None or not feed.user.is_active or feed.user.role not in ('DOCTOR', 'PATIENT'):
+        raise Http404("Flux inconnu")
+    today = timezone.localdate()
+    tag = agenda.etag(feed, today)
+    last_modified = agenda.last_modified(feed, today)
+    response = get_conditional_response(request, etag=tag, last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(agenda.body(feed, request.get_host(), today),
+                                content_type='text/calendar; charset=utf-8')
+        response['Content-Disposition'] = 'inline; filename="agenda.ics"'
+    response['ETag'] = tag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+def metrics(request):
+    """
+    Mesures par vue au format texte Prometheus (agrégats du processus courant)
+    Réservé aux adresses de METRICS_ALLOWED_IPS, et en plus aux administrateurs connectés
+    ou au collecteur qui présente METRICS_TOKEN (en-tête Authorization: Bearer <jeton>)
+    Derrière un proxy inverse, toutes les requêtes viennent de 127.0.0.1: seul le second contrôle compte
+    """
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ()):
+        raise Http404
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    presented = request.META.get('HTTP_AUTHORIZATION', '').removeprefix('Bearer ')
+    if not (getattr(request.user, 'role', None) == 'ADMIN'
+            or token and hmac.compare_digest(presented.encode(), token.encode())):
+        raise Http404
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 class PrescriptionCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
     """
@@ -184,10 +711,22 @@ class PrescriptionCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView
         """Redirige vers le dossier médical après création"""
         return reverse_lazy('medical_record_detail', kwargs={'pk': self.object.medical_record_id})
 
+    def get_medical_record(self):
+        """Dossier médical de l'ordonnance (mémorisé: formulaire et contexte le demandent)"""
+        if not hasattr(self, '_medical_record'):
+            self._medical_record = get_object_or_404(MedicalRecord, pk=self.kwargs['record_id'])
+        return self._medical_record
+
+    def get_form_kwargs(self):
+        """Le formulaire contrôle les médicaments contre les allergies du patient"""
+        kwargs = super().get_form_kwargs()
+        kwargs['patient_id'] = self.get_medical_record().patient_id
+        return kwargs
+
     def get_context_data(self, **kwargs):
         """Ajoute le dossier médical au contexte"""
         context = super().get_context_data(**kwargs)
-        context['medical_record'] = MedicalRecord.objects.get(pk=self.kwargs['record_id'])
+        context['medical_record'] = self.get_medical_record()
         return context
 
     def form_valid(self, form):
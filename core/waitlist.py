@@ -0,0 +1,124 @@
+"""
+Liste d'attente par médecin et réattribution des créneaux annulés
+
+Un patient s'inscrit chez un médecin pour une fenêtre de jours, en urgence
+normale : seuls le médecin et les administrateurs relèvent l'urgence d'une
+inscription (set_urgency). Quand un
+rendez-vous à venir passe à CANCELLED (signal post_save), le créneau libéré
+est attribué au premier patient en attente dont la fenêtre contient ce jour :
+urgence décroissante, puis ancienneté d'inscription.
+
+L'index partiel waitlist_queue (médecin, -urgence, inscription) ne contient
+que les inscriptions en attente et suit exactement cet ordre : la recherche
+descend l'index du médecin et s'arrête à la première fenêtre compatible, sans
+tri ni parcours de toute la liste.
+
+L'attribution est transactionnelle : l'inscription est réservée par un UPDATE
+conditionnel (WAITING -> BOOKED, une autre annulation concurrente ne peut pas
+la prendre), puis le rendez-vous est créé en attente de confirmation (PENDING)
+dans la même transaction. Si le créneau a été repris entre-temps (contrainte
+unique_active_doctor_slot), tout est annulé et l'inscription reste en attente.
+Le patient est prévenu par email en tâche de fond (tâche waitlist.notify).
+"""
+import logging
+
+from django.core.mail import EmailMessage
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import jobs
+from .models import Appointment, WaitlistEntry
+
+logger = logging.getLogger(__name__)
+
+# Inscriptions essayées au plus pour un créneau (les suivantes ont été prises par des attributions concurrentes)
+MAX_CANDIDATES = 5
+
+
+def join(patient, doctor, date_from, date_to, urgency=None, appointment_type='IN_PERSON'):
+    """
+    Inscrit le patient sur la liste d'attente du médecin
+    Une inscription déjà en attente est mise à jour (fenêtre) et garde son ancienneté
+    urgency None: urgence normale à la création, celle fixée par le médecin conservée ensuite (voir set_urgency)
+    """
+    defaults = {'date_from': date_from, 'date_to': date_to, 'appointment_type': appointment_type}
+    if urgency is not None:
+        defaults['urgency'] = urgency
+    entry, _ = WaitlistEntry.objects.update_or_create(
+        patient=patient, doctor=doctor, status='WAITING', defaults=defaults,
+    )
+    return entry
+
+
+def set_urgency(entry, urgency):
+    """Modifie l'urgence d'une inscription en attente (médecin ou administrateur); False si elle n'attend plus"""
+    updated = WaitlistEntry.objects.filter(pk=entry.pk, status='WAITING').update(urgency=urgency)
+    if updated:
+        entry.urgency = urgency
+    return bool(updated)
+
+
+def position(entry):
+    """Rang (à partir de 1) de l'inscription dans la liste d'attente du médecin"""
+    ahead = WaitlistEntry.objects.filter(doctor_id=entry.doctor_id, status='WAITING').filter(
+        Q(urgency__gt=entry.urgency)
+        | Q(urgency=entry.urgency, created_at__lt=entry.created_at)
+        | Q(urgency=entry.urgency, created_at=entry.created_at, pk__lt=entry.pk)
+    )
+    return ahead.count() + 1
+
+
+def candidates(doctor_id, date_time, exclude_patient=None):
+    """Inscriptions en attente dont la fenêtre contient le jour du créneau, dans l'ordre d'attribution"""
+    day = timezone.localdate(date_time)
+    queryset = (WaitlistEntry.objects
+                .filter(doctor_id=doctor_id, status='WAITING', date_from__lte=day, date_to__gte=day)
+                .order_by('-urgency', 'created_at', 'id'))
+    if exclude_patient is not None:
+        queryset = queryset.exclude(patient_id=exclude_patient)
+    return queryset
+
+
+def offer_message(appointment):
+    """Email prévenant le patient du créneau attribué (patient, médecin et utilisateurs chargés)"""
+    when = timezone.localtime(appointment.date_time)
+    doctor = appointment.doctor.user.get_full_name() or appointment.doctor.user.username
+    body = (
+        f"Bonjour {appointment.patient.user.get_full_name()},\n\n"
+        f"Un créneau s'est libéré : un rendez-vous avec le Dr {doctor} vous a été attribué "
+        f"le {when:%d/%m/%Y} à {when:%H:%M}.\n"
+        f"Merci de le confirmer, ou de l'annuler s'il ne vous convient pas afin qu'il soit proposé "
+        f"au patient suivant.\n"
+    )
+    return EmailMessage(f"Créneau disponible le {when:%d/%m/%Y} à {when:%H:%M}", body,
+                        to=[appointment.patient.user.email])
+
+
+def reallocate(appointment):
+    """
+    Attribue le créneau du rendez-vous annulé au premier patient éligible
+    Renvoie le nouveau rendez-vous, ou None (créneau passé, personne en attente, créneau déjà repris)
+    """
+    if appointment.date_time <= timezone.now():
+        return None
+    # Le patient qui annule ne récupère pas son propre créneau
+    entries = candidates(appointment.doctor_id, appointment.date_time, exclude_patient=appointment.patient_id)
+    for entry in entries[:MAX_CANDIDATES]:
+        try:
+            with transaction.atomic():
+                if not WaitlistEntry.objects.filter(pk=entry.pk, status='WAITING').update(status='BOOKED'):
+                    # Attribuée entre-temps par une autre annulation
+                    continue
+                offered = Appointment.objects.create(
+                    patient_id=entry.patient_id, doctor_id=appointment.doctor_id, date_time=appointment.date_time,
+                    appointment_type=entry.appointment_type, notes="Créneau attribué depuis la liste d'attente",
+                )
+                WaitlistEntry.objects.filter(pk=entry.pk).update(appointment=offered)
+                jobs.enqueue('waitlist.notify', {'appointment_id': offered.pk})
+        except IntegrityError:
+            logger.info("Créneau du %s déjà repris chez le médecin #%s",
+                        appointment.date_time, appointment.doctor_id)
+            return None
+        return offered
+    return None